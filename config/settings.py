@@ -58,6 +58,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",  # Agregado para HTMX
+    "control.limite_solicitudes.LimiteSolicitudesMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -144,6 +145,78 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 TAILWIND_APP_NAME = "theme"
 
 
+# ============================================
+# CACHÉ LOCAL Y RENDERIZADO DE PDFs
+# ============================================
+# Directorio para archivos generados (PDFs cacheados, estado de trabajos).
+# Debe ser compartido por todos los procesos del servidor.
+SIGEP_CACHE_DIR = Path(os.environ.get("SIGEP_CACHE_DIR", BASE_DIR / "cache"))
+
+# Hilos dedicados a convertir HTML → PDF en segundo plano (por proceso)
+SIGEP_PDF_WORKERS = int(os.environ.get("SIGEP_PDF_WORKERS", "2"))
+
+# Tamaño máximo de la caché de PDFs; al superarlo se eliminan los menos usados
+SIGEP_PDF_CACHE_MAX_MB = int(os.environ.get("SIGEP_PDF_CACHE_MAX_MB", "512"))
+
+# Caché de fragmentos del rastreo público (búsqueda HTMX y detalle).
+# Se invalida al guardar contenedores/eventos/aprobaciones; el TTL solo es
+# una red de seguridad ante escrituras que no pasan por el ORM.
+SIGEP_TRACKING_CACHE_MAX_ENTRADAS = int(
+    os.environ.get("SIGEP_TRACKING_CACHE_MAX_ENTRADAS", "2000")
+)
+SIGEP_TRACKING_CACHE_TTL = int(os.environ.get("SIGEP_TRACKING_CACHE_TTL", "300"))
+# Guarda también los fragmentos en SIGEP_CACHE_DIR/tracking, compartidos entre
+# procesos (recomendado con varios workers)
+SIGEP_TRACKING_CACHE_ARCHIVOS = os.environ.get(
+    "SIGEP_TRACKING_CACHE_ARCHIVOS", ""
+).lower() in ("1", "true", "si")
+
+# Peticiones simultáneas idénticas (PDF sin caché, consulta SUNAT/IMO, detalle
+# del rastreo) esperan un solo cálculo, también entre procesos. Máximo de
+# segundos que se espera a otro cálculo antes de hacerlo por cuenta propia.
+SIGEP_COALESCENCIA_ESPERA = int(os.environ.get("SIGEP_COALESCENCIA_ESPERA", "60"))
+
+# ============================================
+# LÍMITE DE SOLICITUDES (VISTAS PÚBLICAS)
+# ============================================
+# Token bucket por IP compartido entre procesos (SQLite en SIGEP_CACHE_DIR).
+# Vista (nombre de URL) → (capacidad de la cubeta, fichas recargadas por segundo)
+SIGEP_THROTTLE_ACTIVO = os.environ.get("SIGEP_THROTTLE_ACTIVO", "true").lower() in (
+    "1",
+    "true",
+    "si",
+)
+SIGEP_THROTTLE_REGLAS = {
+    "buscar": (30, 1.0),
+    "validar_contenedor_queja": (20, 0.5),
+    "detalle": (30, 0.5),
+    # El PDF pasa por WeasyPrint si no está en caché: el más restringido
+    "pdf_cliente_contenedor": (5, 0.1),
+    # Encolar también renderiza con WeasyPrint (p. ej. el PDF de tracking)
+    "pdf_trabajo_encolar": (3, 0.05),
+    # Polling del estado del trabajo (una consulta por segundo aprox.)
+    "pdf_trabajo_estado": (60, 2.0),
+    # Hasta rastreo.MAX_CONSULTAS códigos por envío
+    "rastreo_lote": (5, 0.1),
+}
+# Cubeta común a todas las vistas limitadas, por IP
+SIGEP_THROTTLE_POR_IP = (60, 1.0)
+# Cabecera con la IP real detrás de un proxy (p. ej. "HTTP_X_FORWARDED_FOR");
+# vacío usa REMOTE_ADDR. Solo configurar si el proxy la sobrescribe.
+SIGEP_THROTTLE_CABECERA_IP = os.environ.get("SIGEP_THROTTLE_CABECERA_IP", "")
+
+# ============================================
+# PUERTO LOCAL
+# ============================================
+# Ubicación por defecto de los eventos locales (gate, descarga, aduana...)
+# recibidos sin lugar, p. ej. los mensajes EDI de la terminal
+SIGEP_PUERTO_LOCAL = {
+    "pais": "Perú",
+    "puerto": "Chancay",
+    "ciudad": "Chancay",
+}
+
+
 # ============================================
 # CONFIGURACIÓN DE API SUNAT
 # ============================================
@@ -162,6 +235,27 @@ SUNAT_API_TOKEN = os.environ.get(
     "SUNAT_API_TOKEN", "sk_12196.F7IvWizpCvtOaPm8ZFEFWGFcfnL4dizL"
 )
 SUNAT_API_PROVIDER = os.environ.get("SUNAT_API_PROVIDER", "decolecta")
+# URL de consulta del proveedor (vacío = la del proveedor configurado).
+# Permite apuntar a un espejo o a un servidor de pruebas local.
+SUNAT_API_URL = os.environ.get("SUNAT_API_URL", "")
+
+# Presupuesto de latencia por intento (segundos) y reintentos ante errores
+# transitorios (429/5xx, conexión) con backoff exponencial
+SUNAT_API_TIMEOUT = int(os.environ.get("SUNAT_API_TIMEOUT", "6"))
+SUNAT_API_REINTENTOS = int(os.environ.get("SUNAT_API_REINTENTOS", "2"))
+
+# Vigencia en caché de cada campo (segundos). La razón social casi nunca
+# cambia; estado y condición (ACTIVO/HABIDO) sí. Mientras algún campo siga
+# vigente se responde desde la caché y se refresca en segundo plano.
+SUNAT_CACHE_TTL_CAMPOS = {
+    "razon_social": 30 * 24 * 3600,
+    "nombre_comercial": 30 * 24 * 3600,
+    "direccion": 7 * 24 * 3600,
+    "estado": 24 * 3600,
+    "condicion": 24 * 3600,
+}
+# RUC inexistentes: no se vuelven a consultar durante este tiempo
+SUNAT_CACHE_TTL_NO_ENCONTRADO = 24 * 3600
 
 # ============================================
 # SHIP IMO CONFIGURATION
@@ -173,3 +267,52 @@ SUNAT_API_PROVIDER = os.environ.get("SUNAT_API_PROVIDER", "decolecta")
 #   - 9778791 (EVER GIVEN)
 #   - 9461867 (MAERSK MC-KINNEY MOLLER)
 # ============================================
+
+IMO_BASE_URL = os.environ.get("IMO_BASE_URL", "https://www.vesselfinder.com")
+
+# Presupuesto de latencia por intento (segundos) y reintentos ante errores
+# transitorios de VesselFinder (429/5xx, conexión)
+IMO_TIMEOUT = int(os.environ.get("IMO_TIMEOUT", "8"))
+IMO_REINTENTOS = int(os.environ.get("IMO_REINTENTOS", "1"))
+
+# Vigencia en caché (segundos): los datos del buque (nombre, bandera,
+# dimensiones, TEU, call sign) casi no cambian; la navegación (posición,
+# velocidad, destino) se refresca seguido, en segundo plano.
+IMO_CACHE_TTL_ESTATICOS = 30 * 24 * 3600
+IMO_CACHE_TTL_DINAMICOS = 15 * 60
+# IMO inexistentes: no se vuelven a consultar durante este tiempo
+IMO_CACHE_TTL_NO_ENCONTRADO = 24 * 3600
+
+# ============================================
+# CONSULTAS EXTERNAS EN LOTE (RUC / IMO)
+# ============================================
+# Alta de navieras: cientos de RUC e IMO se resuelven en paralelo con un
+# límite de conexiones simultáneas por proveedor y un plazo total por lote.
+# ============================================
+
+# Deja parte de CONSULTAS_EXTERNAS_MAX_SIMULTANEAS libre para las consultas
+# individuales del admin
+CONSULTAS_LOTE_CONCURRENCIA = {"sunat": 4, "imo": 2}
+CONSULTAS_LOTE_PLAZO = 120  # segundos
+CONSULTAS_LOTE_MAX_CLAVES = 1000
+
+# Circuito por proveedor (SUNAT, VesselFinder), por proceso: si en la ventana
+# móvil hay al menos minimo_llamadas y la proporción de errores (429/5xx,
+# timeout, conexión) o de llamadas lentas supera su umbral, las consultas
+# fallan de inmediato (o responden la caché) durante `apertura` segundos;
+# luego una llamada de prueba decide si se cierra.
+CONSULTAS_EXTERNAS_CIRCUITO = {
+    "ventana": 60,  # segundos
+    "minimo_llamadas": 5,
+    "umbral_errores": 0.5,
+    "latencia_lenta_ms": 4000,
+    "umbral_lentas": 0.5,
+    "apertura": 30,  # segundos
+}
+# Llamadas salientes simultáneas (todos los proveedores, por proceso): una
+# ráfaga de consultas no puede ocupar todos los workers del sitio.
+CONSULTAS_EXTERNAS_MAX_SIMULTANEAS = int(
+    os.environ.get("CONSULTAS_EXTERNAS_MAX_SIMULTANEAS", "8")
+)
+# Segundos que una consulta espera un cupo libre antes de rechazarse
+CONSULTAS_EXTERNAS_ESPERA_CUPO = 2
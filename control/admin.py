@@ -1,8 +1,14 @@
 from django import forms
 from django.contrib import admin, messages
-from django.urls import reverse
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.html import format_html
 
+from . import busqueda, importacion, ingesta_eventos
 from .models import (
     AprobacionAduanera,
     AprobacionFinanciera,
@@ -173,6 +179,118 @@ class AprobacionFinancieraForm(forms.ModelForm):
         return list(servicios)
 
 
+# ====== FORMULARIO DE CARGA MASIVA DE CONTENEDORES ======
+class ImportarContenedoresForm(forms.Form):
+    """Carga masiva de contenedores de un arribo desde archivo"""
+
+    archivo = forms.FileField(
+        label="Archivo",
+        help_text="CSV, XLSX o BAPLIE (UN/EDIFACT). En CSV/XLSX la primera fila "
+        "son los encabezados (mismos nombres que la exportación del manifiesto).",
+    )
+    formato = forms.ChoiceField(
+        label="Formato",
+        choices=[
+            ("", "Detectar por extensión"),
+            ("csv", "CSV"),
+            ("xlsx", "XLSX"),
+            ("baplie", "BAPLIE (EDIFACT)"),
+        ],
+        required=False,
+    )
+    direccion = forms.ChoiceField(
+        label="Dirección por defecto",
+        choices=[("", "Según el tipo de operación del arribo")]
+        + Contenedor.DIRECCION_CHOICES,
+        required=False,
+        help_text="Se usa en las filas sin columna de dirección (y en BAPLIE).",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        archivo = cleaned_data.get("archivo")
+        if archivo and not cleaned_data.get("formato"):
+            formato = importacion.detectar_formato(archivo.name)
+            if formato is None:
+                raise forms.ValidationError(
+                    "No se reconoce la extensión del archivo: indique el formato."
+                )
+            cleaned_data["formato"] = formato
+        return cleaned_data
+
+
+# ====== FORMULARIO DE EVENTO MASIVO ======
+class EventoMasivoForm(forms.Form):
+    """Plantilla de evento aplicada a muchos contenedores (p. ej. todo un arribo)"""
+
+    tipo_evento = forms.ChoiceField(
+        label="Tipo de evento", choices=EventoContenedor.TIPO_EVENTO_CHOICES
+    )
+    fecha_hora = forms.DateTimeField(
+        label="Fecha y hora",
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local"}),
+        input_formats=["%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"],
+    )
+    ubicacion_puerto = forms.CharField(
+        label="Lugar",
+        max_length=120,
+        required=False,
+        help_text="Vacío en eventos locales: se usa el puerto local.",
+    )
+    ubicacion_ciudad = forms.CharField(label="Ciudad", max_length=120, required=False)
+    ubicacion_pais = forms.CharField(label="País", max_length=60, required=False)
+    buque = forms.ModelChoiceField(
+        label="Buque",
+        queryset=Buque.objects.all(),
+        required=False,
+        help_text="Vacío en eventos marítimos: se usa el buque del arribo de cada contenedor.",
+    )
+    referencia_viaje = forms.CharField(
+        label="Referencia de viaje", max_length=50, required=False
+    )
+    notas = forms.CharField(
+        label="Notas", required=False, widget=forms.Textarea(attrs={"rows": 2})
+    )
+
+    def datos_evento(self):
+        """Campos de la plantilla en el formato de ingesta_eventos"""
+        datos = dict(self.cleaned_data)
+        buque = datos.pop("buque")
+        datos.pop("direccion", None)
+        datos["imo"] = buque.imo_number if buque else ""
+        return datos
+
+
+class EventoMasivoArriboForm(EventoMasivoForm):
+    """Evento masivo para todos los contenedores de un arribo en una dirección"""
+
+    direccion = forms.ChoiceField(
+        label="Contenedores", choices=Contenedor.DIRECCION_CHOICES
+    )
+
+    field_order = ["direccion"]
+
+
+def _mensajes_evento_masivo(request, resultado, limite=20):
+    """Reporta en el admin el resultado de un registro masivo de eventos"""
+    if resultado.creados:
+        messages.success(
+            request,
+            f"✅ {resultado.creados} eventos registrados "
+            f"({resultado.contenedores_actualizados} contenedores actualizados).",
+        )
+    if resultado.rechazados:
+        messages.warning(
+            request,
+            f"⚠️ {len(resultado.rechazados)} de {resultado.recibidos} contenedores "
+            "rechazaron el evento.",
+        )
+        for error in resultado.rechazados[:limite]:
+            messages.error(request, f"{error['codigo_iso']}: {error['mensaje']}")
+    elif not resultado.recibidos:
+        messages.warning(request, "No hay contenedores a los que aplicar el evento.")
+
+
 # ====== FORMULARIO PARA EVENTOS DE CONTENEDOR ======
 class EventoContenedorForm(forms.ModelForm):
     """
@@ -486,6 +604,7 @@ class ArriboAdmin(admin.ModelAdmin):
         "contenedores_descarga",
         "contenedores_carga",
         "total_contenedores_badge",
+        "importar_contenedores",
         "descargar_manifiesto",
     ]
     list_filter = ["estado", "tipo_operacion", "fecha_eta", "buque__naviera"]
@@ -522,6 +641,102 @@ class ArriboAdmin(admin.ModelAdmin):
     class Media:
         js = ("js/admin_contenedor_popup.js", "js/admin_arribo.js")
 
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:arribo_id>/importar-contenedores/",
+                self.admin_site.admin_view(self.importar_contenedores_view),
+                name="control_arribo_importar_contenedores",
+            ),
+            path(
+                "<int:arribo_id>/evento-masivo/",
+                self.admin_site.admin_view(self.evento_masivo_view),
+                name="control_arribo_evento_masivo",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def evento_masivo_view(self, request, arribo_id):
+        """Registra un mismo evento (ARRIVED, DEPARTED...) a todos los contenedores del arribo"""
+        arribo = get_object_or_404(Arribo.objects.select_related("buque"), pk=arribo_id)
+        if not request.user.has_perm("control.add_eventocontenedor"):
+            raise PermissionDenied
+
+        if request.method == "POST":
+            form = EventoMasivoArriboForm(request.POST)
+            if form.is_valid():
+                codigos = arribo.contenedores.filter(
+                    direccion=form.cleaned_data["direccion"]
+                ).values_list("codigo_iso", flat=True)
+                resultado = ingesta_eventos.registrar_evento_masivo(
+                    codigos, **form.datos_evento()
+                )
+                _mensajes_evento_masivo(request, resultado)
+                return redirect("admin:control_arribo_change", arribo.pk)
+        else:
+            form = EventoMasivoArriboForm(
+                initial={
+                    "direccion": "IMPORT" if arribo.tipo_operacion == "DESCARGA" else "EXPORT",
+                    "buque": arribo.buque_id,
+                }
+            )
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"Evento masivo - {arribo}",
+            "opts": self.model._meta,
+            "original": arribo,
+            "arribo": arribo,
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/control/evento_masivo.html", context)
+
+    def importar_contenedores_view(self, request, arribo_id):
+        """Carga masiva de contenedores (CSV/XLSX/BAPLIE) con reporte de errores por fila"""
+        arribo = get_object_or_404(Arribo.objects.select_related("buque"), pk=arribo_id)
+        if not self.has_change_permission(request, arribo) or not request.user.has_perm(
+            "control.add_contenedor"
+        ):
+            raise PermissionDenied
+
+        resultado = None
+        if request.method == "POST":
+            form = ImportarContenedoresForm(request.POST, request.FILES)
+            if form.is_valid():
+                resultado = importacion.importar_contenedores(
+                    arribo,
+                    form.cleaned_data["archivo"],
+                    form.cleaned_data["formato"],
+                    direccion_por_defecto=form.cleaned_data["direccion"] or None,
+                )
+                if resultado.exitoso:
+                    messages.success(
+                        request,
+                        f"✅ {resultado.creados} contenedores importados al arribo {arribo}.",
+                    )
+                    return redirect("admin:control_arribo_change", arribo.pk)
+                messages.error(
+                    request,
+                    "❌ No se importó ningún contenedor: corrija los errores y "
+                    "vuelva a cargar el archivo.",
+                )
+        else:
+            form = ImportarContenedoresForm()
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"Importar contenedores - {arribo}",
+            "opts": self.model._meta,
+            "original": arribo,
+            "arribo": arribo,
+            "form": form,
+            "resultado": resultado,
+            "registrados": arribo.total_contenedores_registrados,
+        }
+        return TemplateResponse(
+            request, "admin/control/arribo/importar_contenedores.html", context
+        )
+
     def get_readonly_fields(self, request, obj=None):
         """Hacer campos de capacidad declarada de solo lectura después de crear el Arribo"""
         readonly = list(self.readonly_fields)
@@ -532,28 +747,47 @@ class ArriboAdmin(admin.ModelAdmin):
         return readonly
 
     def descargar_manifiesto(self, obj):
-        """Botón para descargar el Manifiesto de Arribo en PDF"""
+        """Botones para descargar el Manifiesto de Arribo (PDF, CSV y XLSX)"""
         url = reverse("control:pdf_manifiesto_arribo", args=[obj.pk])
+        csv_url = reverse("control:exportar_manifiesto_arribo", args=[obj.pk, "csv"])
+        xlsx_url = reverse("control:exportar_manifiesto_arribo", args=[obj.pk, "xlsx"])
         return format_html(
             '<a href="{}" class="button" target="_blank" '
             'style="background-color: #417690; color: white; padding: 5px 10px; '
             'border-radius: 4px; text-decoration: none; font-size: 11px;">'
-            "📄 Manifiesto PDF</a>",
+            "📄 Manifiesto PDF</a> "
+            '<a href="{}" style="font-size: 11px;">CSV</a> · '
+            '<a href="{}" style="font-size: 11px;">XLSX</a>',
+            url,
+            csv_url,
+            xlsx_url,
+        )
+
+    descargar_manifiesto.short_description = "Manifiesto"
+
+    def importar_contenedores(self, obj):
+        """Enlaces a la carga masiva de contenedores y al evento masivo del arribo"""
+        url = reverse("admin:control_arribo_importar_contenedores", args=[obj.pk])
+        evento_url = reverse("admin:control_arribo_evento_masivo", args=[obj.pk])
+        return format_html(
+            '<a href="{}" style="font-size: 11px;">📥 Importar</a> · '
+            '<a href="{}" style="font-size: 11px;">🚢 Evento masivo</a>',
             url,
+            evento_url,
         )
 
-    descargar_manifiesto.short_description = "PDF"
+    importar_contenedores.short_description = "Carga Masiva"
 
     def total_contenedores(self, obj):
         """Total de contenedores registrados en el sistema"""
-        return obj.contenedores.count()
+        return obj.total_contenedores_registrados
 
     total_contenedores.short_description = "Contenedores Registrados"
 
     def total_contenedores_badge(self, obj):
         """Badge visual para contenedores"""
-        total = obj.contenedores.count()
-        declarado = obj.contenedores_descarga + obj.contenedores_carga
+        total = obj.total_contenedores_registrados
+        declarado = obj.total_contenedores_declarados
         color = (
             "green" if total == declarado else "orange" if total < declarado else "red"
         )
@@ -568,9 +802,10 @@ class ArriboAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        # Mensaje informativo sobre contenedores
-        total = obj.contenedores.count()
-        declarado = obj.contenedores_descarga + obj.contenedores_carga
+        # Mensaje informativo sobre contenedores (contadores vigentes en BD)
+        obj.refresh_from_db(fields=Arribo.CAMPOS_CONTADOR)
+        total = obj.total_contenedores_registrados
+        declarado = obj.total_contenedores_declarados
         if total < declarado:
             messages.warning(
                 request, f"Faltan {declarado - total} contenedores por registrar."
@@ -598,6 +833,7 @@ class ContenedorAdmin(admin.ModelAdmin):
         "acciones_pdf",
     ]
     list_filter = [
+        "listo_para_retiro",
         "direccion",
         "tipo_tamaño",
         "mercancia_peligrosa",
@@ -652,6 +888,34 @@ class ContenedorAdmin(admin.ModelAdmin):
             readonly.extend(self._campos_bloqueados_en_edicion)
         return readonly
 
+    def get_queryset(self, request):
+        """
+        Carga en una sola consulta todo lo que muestran los badges del listado:
+        arribo/buque por JOIN y el estado de las tres aprobaciones como anotaciones.
+        El último evento y listo_para_retiro se leen de columnas del contenedor.
+        """
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("arribo__buque")
+            .annotate(
+                aduana_aprobado=F("aprobacion_aduanera__aprobado"),
+                estado_financiero_actual=F("aprobacion_financiera__estado_financiero"),
+                transitario_pagado=F("aprobacion_pago_transitario__pago_realizado"),
+            )
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Busca en el índice FTS5 (código, BL, sellos, DAM, factura, transitario)
+        en lugar de icontains sobre varias columnas y JOINs. Los términos de
+        menos de 3 caracteres usan la búsqueda estándar de search_fields.
+        """
+        filtro = busqueda.filtro_contenedores(search_term)
+        if filtro is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(filtro), False
+
     fieldsets = (
         (
             "📋 Paso 1: Datos Fuente (presione ➡️ para auto-completar)",
@@ -735,18 +999,8 @@ class ContenedorAdmin(admin.ModelAdmin):
         """Botones para descargar PDFs del contenedor"""
         ficha_url = reverse("control:pdf_ficha_contenedor", args=[obj.codigo_iso])
 
-        # Verificar si está listo para Gate Pass
-        aduana_ok = (
-            hasattr(obj, "aprobacion_aduanera") and obj.aprobacion_aduanera.aprobado
-        )
-        financiera_ok = hasattr(
-            obj, "aprobacion_financiera"
-        ) and obj.aprobacion_financiera.estado_financiero in ["PAGADA", "CREDITO"]
-        transitario_ok = (
-            hasattr(obj, "aprobacion_pago_transitario")
-            and obj.aprobacion_pago_transitario.pago_realizado
-        )
-        puede_gate_pass = aduana_ok and financiera_ok and transitario_ok
+        # Listo para Gate Pass (columna persistida)
+        puede_gate_pass = obj.listo_para_retiro
 
         html = f'''
         <div style="display: flex; gap: 5px; flex-wrap: wrap;">
@@ -811,7 +1065,7 @@ class ContenedorAdmin(admin.ModelAdmin):
     sello_principal_badge.short_description = "Sello Principal"
 
     def ultimo_estado_badge(self, obj):
-        """Muestra el último evento/estado del contenedor"""
+        """Muestra el último evento/estado del contenedor (desde el snapshot, sin consultas)"""
         evento = obj.ultimo_evento
         if evento:
             color_map = {
@@ -845,41 +1099,28 @@ class ContenedorAdmin(admin.ModelAdmin):
     ultimo_estado_badge.short_description = "Último Estado"
 
     def aprobaciones_badge(self, obj):
-        """Muestra el estado de aprobaciones"""
+        """Muestra el estado de aprobaciones (desde las anotaciones de get_queryset)"""
         aprobaciones = []
 
         # Aprobación Aduanera
-        if hasattr(obj, "aprobacion_aduanera"):
-            estado = "APROBADO" if obj.aprobacion_aduanera.aprobado else "PENDIENTE"
-            aprobaciones.append(("🛃 Aduana", estado))
-        else:
-            aprobaciones.append(("🛃 Aduana", "PENDIENTE"))
+        estado = "APROBADO" if obj.aduana_aprobado else "PENDIENTE"
+        aprobaciones.append(("🛃 Aduana", estado))
 
         # Aprobación Financiera (ahora usa estado_financiero)
-        if hasattr(obj, "aprobacion_financiera"):
-            ef = obj.aprobacion_financiera.estado_financiero
-            if ef == "PAGADA":
-                estado = "PAGADO"
-            elif ef == "CREDITO":
-                estado = "CRÉDITO"
-            elif ef == "ANULADA":
-                estado = "ANULADA"
-            else:
-                estado = "PENDIENTE"
-            aprobaciones.append(("💰 Financiera", estado))
+        ef = obj.estado_financiero_actual
+        if ef == "PAGADA":
+            estado = "PAGADO"
+        elif ef == "CREDITO":
+            estado = "CRÉDITO"
+        elif ef == "ANULADA":
+            estado = "ANULADA"
         else:
-            aprobaciones.append(("💰 Financiera", "PENDIENTE"))
+            estado = "PENDIENTE"
+        aprobaciones.append(("💰 Financiera", estado))
 
         # Aprobación Pago Transitario
-        if hasattr(obj, "aprobacion_pago_transitario"):
-            estado = (
-                "PAGADO"
-                if obj.aprobacion_pago_transitario.pago_realizado
-                else "PENDIENTE"
-            )
-            aprobaciones.append(("🚚 Transitario", estado))
-        else:
-            aprobaciones.append(("🚚 Transitario", "PENDIENTE"))
+        estado = "PAGADO" if obj.transitario_pagado else "PENDIENTE"
+        aprobaciones.append(("🚚 Transitario", estado))
 
         html = "<div>"
         for nombre, estado in aprobaciones:
@@ -899,19 +1140,8 @@ class ContenedorAdmin(admin.ModelAdmin):
 
     def estado_completo_badge(self, obj):
         """Badge del estado completo del contenedor"""
-        # Verificar si todas las aprobaciones están OK
-        aduana_ok = (
-            hasattr(obj, "aprobacion_aduanera") and obj.aprobacion_aduanera.aprobado
-        )
-        financiera_ok = hasattr(
-            obj, "aprobacion_financiera"
-        ) and obj.aprobacion_financiera.estado_financiero in ["PAGADA", "CREDITO"]
-        transitario_ok = (
-            hasattr(obj, "aprobacion_pago_transitario")
-            and obj.aprobacion_pago_transitario.pago_realizado
-        )
-
-        if aduana_ok and financiera_ok and transitario_ok:
+        # Todas las aprobaciones OK y sin bloqueo (columna persistida)
+        if obj.listo_para_retiro:
             return format_html(
                 '<span style="background-color: green; color: white; padding: 5px 10px; border-radius: 3px; font-weight: bold;">✓ LISTO PARA RETIRO</span>'
             )
@@ -922,29 +1152,11 @@ class ContenedorAdmin(admin.ModelAdmin):
 
     estado_completo_badge.short_description = "Estado General"
 
-    actions = ["marcar_listo_retiro", "verificar_aprobaciones"]
+    actions = ["marcar_listo_retiro", "verificar_aprobaciones", "aplicar_evento_masivo"]
 
     def marcar_listo_retiro(self, request, queryset):
         """Acción para verificar y marcar contenedores listos para retiro"""
-        count = 0
-        for contenedor in queryset:
-            aduana_ok = (
-                hasattr(contenedor, "aprobacion_aduanera")
-                and contenedor.aprobacion_aduanera.aprobado
-            )
-            financiera_ok = hasattr(
-                contenedor, "aprobacion_financiera"
-            ) and contenedor.aprobacion_financiera.estado_financiero in [
-                "PAGADA",
-                "CREDITO",
-            ]
-            transitario_ok = (
-                hasattr(contenedor, "aprobacion_pago_transitario")
-                and contenedor.aprobacion_pago_transitario.pago_realizado
-            )
-
-            if aduana_ok and financiera_ok and transitario_ok:
-                count += 1
+        count = queryset.listos_para_retiro().count()
 
         if count > 0:
             messages.success(
@@ -957,30 +1169,62 @@ class ContenedorAdmin(admin.ModelAdmin):
 
     marcar_listo_retiro.short_description = "Verificar contenedores listos para retiro"
 
+    def aplicar_evento_masivo(self, request, queryset):
+        """Registra un mismo evento en todos los contenedores seleccionados (en lote)"""
+        if not request.user.has_perm("control.add_eventocontenedor"):
+            raise PermissionDenied
+
+        if "aplicar" in request.POST:
+            form = EventoMasivoForm(request.POST)
+            if form.is_valid():
+                resultado = ingesta_eventos.registrar_evento_masivo(
+                    queryset.values_list("codigo_iso", flat=True),
+                    **form.datos_evento(),
+                )
+                _mensajes_evento_masivo(request, resultado)
+                return None
+        else:
+            form = EventoMasivoForm()
+
+        # Página intermedia: plantilla del evento para la selección actual
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Evento masivo para contenedores seleccionados",
+            "opts": self.model._meta,
+            "form": form,
+            "contenedores": queryset.values_list("codigo_iso", flat=True),
+            "seleccionados": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "accion": "aplicar_evento_masivo",
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/control/evento_masivo.html", context)
+
+    aplicar_evento_masivo.short_description = "Registrar un evento en los contenedores seleccionados"
+
     def verificar_aprobaciones(self, request, queryset):
-        """Verificar estado de aprobaciones"""
+        """Verificar estado de aprobaciones (desde las anotaciones de get_queryset)"""
+        estados_financieros = dict(AprobacionFinanciera.ESTADO_FINANCIERO_CHOICES)
         for contenedor in queryset:
             pendientes = []
-            if not hasattr(contenedor, "aprobacion_aduanera"):
+            if contenedor.aduana_aprobado is None:
                 pendientes.append("Aduanera")
-            elif not contenedor.aprobacion_aduanera.aprobado:
+            elif not contenedor.aduana_aprobado:
                 pendientes.append("Aduanera (no aprobada)")
 
-            if not hasattr(contenedor, "aprobacion_financiera"):
+            ef = contenedor.estado_financiero_actual
+            if ef is None:
                 pendientes.append("Financiera")
-            elif contenedor.aprobacion_financiera.estado_financiero not in [
-                "PAGADA",
-                "CREDITO",
-            ]:
-                pendientes.append(
-                    f"Financiera ({contenedor.aprobacion_financiera.get_estado_financiero_display()})"
-                )
+            elif ef not in AprobacionFinanciera.ESTADOS_GATE_PASS:
+                pendientes.append(f"Financiera ({estados_financieros.get(ef, ef)})")
 
-            if not hasattr(contenedor, "aprobacion_pago_transitario"):
+            if contenedor.transitario_pagado is None:
                 pendientes.append("Pago Transitario")
-            elif not contenedor.aprobacion_pago_transitario.pago_realizado:
+            elif not contenedor.transitario_pagado:
                 pendientes.append("Pago Transitario (no pagado)")
 
+            if contenedor.bloqueado_por_evento:
+                pendientes.append("Bloqueado por evento")
+
             if pendientes:
                 messages.warning(
                     request,
@@ -1706,20 +1950,39 @@ class EventoContenedorAdmin(admin.ModelAdmin):
     actions = ["duplicar_evento_para_otros"]
 
     def duplicar_evento_para_otros(self, request, queryset):
-        """Duplicar un evento para múltiples contenedores (útil para eventos masivos)"""
+        """
+        Duplica un evento al resto de contenedores del mismo arribo y dirección
+        (p. ej. el ARRIVED de un contenedor para todo el buque), en lote.
+        """
         if queryset.count() != 1:
             messages.error(request, "Selecciona exactamente UN evento para duplicar.")
             return
 
-        evento_original = queryset.first()
-        messages.info(
-            request,
-            f'Evento "{evento_original.get_tipo_evento_display()}" seleccionado. '
-            f"Usa la función de importación para aplicar a múltiples contenedores.",
+        evento = queryset.select_related("contenedor", "buque").first()
+        codigos = (
+            Contenedor.objects.filter(
+                arribo_id=evento.contenedor.arribo_id,
+                direccion=evento.contenedor.direccion,
+            )
+            .exclude(pk=evento.contenedor_id)
+            .values_list("codigo_iso", flat=True)
+        )
+        resultado = ingesta_eventos.registrar_evento_masivo(
+            codigos,
+            evento.tipo_evento,
+            evento.fecha_hora,
+            ubicacion_puerto=evento.ubicacion_puerto,
+            ubicacion_ciudad=evento.ubicacion_ciudad or "",
+            ubicacion_pais=evento.ubicacion_pais,
+            imo=evento.buque.imo_number if evento.buque else "",
+            referencia_viaje=evento.referencia_viaje or "",
+            medio_transporte=evento.medio_transporte or "",
+            notas=evento.notas,
         )
+        _mensajes_evento_masivo(request, resultado)
 
     duplicar_evento_para_otros.short_description = (
-        "Preparar para duplicar a otros contenedores"
+        "Duplicar a los demás contenedores del arribo"
     )
 
 
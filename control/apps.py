@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ControlConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "control"
+
+    def ready(self):
+        # Invalidación de la caché del rastreo público
+        from . import signals  # noqa: F401
@@ -0,0 +1,285 @@
+"""
+Búsqueda unificada (omnibox) sobre contenedores, BLs, sellos, DAMs, facturas,
+buques y transitarios.
+
+Cada identificador buscable es una fila de DocumentoBusqueda; su texto se
+indexa en la tabla FTS5 control_busqueda_fts (tokenizador trigram, creada en
+la migración 0023) que los triggers SQL mantienen sincronizada. Las filas de
+un registro se reemplazan juntas al guardarlo (control/signals.py) y las
+escrituras masivas que no emiten señales llaman a indexar() a mano.
+
+Una búsqueda es una sola consulta MATCH ordenada por bm25 que no toca las
+tablas de negocio (solo lee las filas del índice por rowid): responde en
+milisegundos con millones de filas.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .models import (
+    AprobacionAduanera,
+    AprobacionFinanciera,
+    Buque,
+    Contenedor,
+    DocumentoBusqueda,
+    Transitario,
+)
+
+# El tokenizador trigram no encuentra términos de menos de 3 caracteres
+LONGITUD_MINIMA = 3
+LIMITE_RESULTADOS = 20
+TAMANO_LOTE = 1000
+
+# El título (código, número) pesa más que el detalle en el ranking bm25
+_CONSULTA = """
+    SELECT d.tipo, d.objeto_id, d.titulo, d.detalle
+    FROM control_busqueda_fts f
+    JOIN control_documentobusqueda d ON d.id = f.rowid
+    WHERE control_busqueda_fts MATCH %s {filtro}
+    ORDER BY (upper(d.titulo) = upper(%s)) DESC, bm25(control_busqueda_fts, 10.0, 1.0)
+    LIMIT %s
+"""
+
+# Vista del admin donde se abre cada tipo de resultado
+_URL_ADMIN = {
+    "contenedor": "admin:control_contenedor_change",
+    "bl": "admin:control_contenedor_change",
+    "sello": "admin:control_contenedor_change",
+    "dam": "admin:control_aprobacionaduanera_change",
+    "factura": "admin:control_aprobacionfinanciera_change",
+    "buque": "admin:control_buque_change",
+    "transitario": "admin:control_transitario_change",
+}
+
+_ETIQUETAS = dict(DocumentoBusqueda.TIPO_CHOICES)
+
+ResultadoBusqueda = namedtuple(
+    "ResultadoBusqueda", ["tipo", "etiqueta", "objeto_id", "titulo", "detalle", "url"]
+)
+
+
+# ====== DOCUMENTOS POR MODELO ======
+def _unir(*partes):
+    return " ".join(parte for parte in partes if parte)
+
+
+def _documentos_contenedor(contenedor):
+    detalle = _unir(
+        contenedor.carrier, contenedor.origen_puerto, contenedor.destino_puerto
+    )
+    documentos = [("contenedor", contenedor.codigo_iso, detalle)]
+    if contenedor.bl_referencia:
+        documentos.append(("bl", contenedor.bl_referencia, contenedor.codigo_iso))
+    documentos.extend(
+        ("sello", sello["codigo"], contenedor.codigo_iso)
+        for sello in contenedor.get_sellos_lista()
+        if sello["codigo"]
+    )
+    return contenedor.pk, documentos
+
+
+def _codigo_contenedor(aprobacion):
+    """Código ISO del contenedor de una aprobación (usa el caché si está cargado)"""
+    if type(aprobacion).contenedor.field.is_cached(aprobacion):
+        return aprobacion.contenedor.codigo_iso
+    return (
+        Contenedor.objects.filter(pk=aprobacion.contenedor_id)
+        .values_list("codigo_iso", flat=True)
+        .first()
+        or ""
+    )
+
+
+def _documentos_aduanera(aprobacion):
+    return aprobacion.contenedor_id, [
+        ("dam", aprobacion.numero_despacho, _codigo_contenedor(aprobacion)),
+    ]
+
+
+def _documentos_financiera(aprobacion):
+    return aprobacion.contenedor_id, [
+        ("factura", aprobacion.numero_factura, _codigo_contenedor(aprobacion)),
+    ]
+
+
+def _documentos_buque(buque):
+    detalle = _unir(f"IMO {buque.imo_number}", buque.callsign, buque.naviera)
+    return None, [("buque", buque.nombre, detalle)]
+
+
+def _documentos_transitario(transitario):
+    detalle = _unir(
+        transitario.nombre_comercial, transitario.identificador_tributario
+    )
+    return None, [("transitario", transitario.razon_social, detalle)]
+
+
+# Modelo → (documentos de una instancia, select_related para reconstruir)
+DOCUMENTOS = {
+    Contenedor: (_documentos_contenedor, ()),
+    AprobacionAduanera: (_documentos_aduanera, ("contenedor",)),
+    AprobacionFinanciera: (_documentos_financiera, ("contenedor",)),
+    Buque: (_documentos_buque, ()),
+    Transitario: (_documentos_transitario, ()),
+}
+
+
+def _origen(instancia):
+    return f"{instancia._meta.model_name}:{instancia.pk}"
+
+
+def _filas(instancia):
+    generar, _relacionados = DOCUMENTOS[type(instancia)]
+    contenedor_id, documentos = generar(instancia)
+    origen = _origen(instancia)
+    return [
+        DocumentoBusqueda(
+            origen=origen,
+            tipo=tipo,
+            objeto_id=instancia.pk,
+            contenedor_id=contenedor_id,
+            titulo=titulo[:200],
+            detalle=(detalle or "")[:300],
+        )
+        for tipo, titulo, detalle in documentos
+        if titulo
+    ]
+
+
+# ====== SINCRONIZACIÓN ======
+def indexar(*instancias):
+    """Reemplaza las filas del índice de los registros (del mismo o distinto modelo)"""
+    if not instancias:
+        return
+    with transaction.atomic():
+        desindexar(*instancias)
+        DocumentoBusqueda.objects.bulk_create(
+            [fila for instancia in instancias for fila in _filas(instancia)],
+            batch_size=TAMANO_LOTE,
+        )
+
+
+def desindexar(*instancias):
+    origenes = [_origen(instancia) for instancia in instancias]
+    for inicio in range(0, len(origenes), TAMANO_LOTE):
+        DocumentoBusqueda.objects.filter(
+            origen__in=origenes[inicio : inicio + TAMANO_LOTE]
+        ).delete()
+
+
+def reconstruir(tamano_lote=TAMANO_LOTE):
+    """
+    Regenera el índice completo desde las tablas de negocio.
+
+    Returns:
+        Número de filas indexadas
+    """
+    total = 0
+    with transaction.atomic():
+        DocumentoBusqueda.objects.all().delete()
+        for modelo, (_generar, relacionados) in DOCUMENTOS.items():
+            lote = []
+            consulta = modelo.objects.select_related(*relacionados).order_by("pk")
+            for instancia in consulta.iterator(chunk_size=tamano_lote):
+                lote.extend(_filas(instancia))
+                if len(lote) >= tamano_lote:
+                    DocumentoBusqueda.objects.bulk_create(lote)
+                    total += len(lote)
+                    lote = []
+            DocumentoBusqueda.objects.bulk_create(lote)
+            total += len(lote)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO control_busqueda_fts (control_busqueda_fts) VALUES ('optimize')"
+            )
+    return total
+
+
+# ====== CONSULTA ======
+def expresion_fts(texto):
+    """
+    Convierte el texto del usuario en una expresión MATCH segura: cada término
+    entre comillas (sin operadores FTS5) y todos obligatorios. None si ningún
+    término alcanza LONGITUD_MINIMA.
+    """
+    terminos = [
+        termino
+        for termino in re.split(r"\s+", (texto or "").strip())
+        if len(termino) >= LONGITUD_MINIMA
+    ]
+    if not terminos:
+        return None
+    return " ".join('"{}"'.format(termino.replace('"', '""')) for termino in terminos)
+
+
+def buscar(texto, tipos=None, limite=LIMITE_RESULTADOS):
+    """
+    Resultados ordenados por relevancia; una coincidencia exacta del título va
+    primero.
+
+    Args:
+        texto: lo que escribió el usuario
+        tipos: lista de tipos a incluir (None = todos)
+
+    Returns:
+        lista de ResultadoBusqueda
+    """
+    expresion = expresion_fts(texto)
+    if expresion is None:
+        return []
+    parametros = [expresion]
+    filtro = ""
+    if tipos:
+        filtro = f"AND d.tipo IN ({', '.join(['%s'] * len(tipos))})"
+        parametros.extend(tipos)
+    parametros.extend([texto.strip(), limite])
+
+    with connection.cursor() as cursor:
+        cursor.execute(_CONSULTA.format(filtro=filtro), parametros)
+        filas = cursor.fetchall()
+    return [
+        ResultadoBusqueda(
+            tipo,
+            _ETIQUETAS.get(tipo, tipo),
+            objeto_id,
+            titulo,
+            detalle,
+            reverse(_URL_ADMIN[tipo], args=[objeto_id]),
+        )
+        for tipo, objeto_id, titulo, detalle in filas
+    ]
+
+
+def filtro_contenedores(texto):
+    """
+    Q para el buscador del admin de contenedores: coincidencias de sus
+    códigos, BL, sellos, DAM o factura, y de su transitario. None si el texto
+    es demasiado corto para el índice.
+    """
+    expresion = expresion_fts(texto)
+    if expresion is None:
+        return None
+    coincidencias = (
+        "SELECT d.{columna} FROM control_busqueda_fts f "
+        "JOIN control_documentobusqueda d ON d.id = f.rowid "
+        "WHERE control_busqueda_fts MATCH %s AND d.tipo IN ({tipos})"
+    )
+    return Q(
+        pk__in=RawSQL(
+            coincidencias.format(
+                columna="contenedor_id",
+                tipos="'contenedor', 'bl', 'sello', 'dam', 'factura'",
+            ),
+            [expresion],
+        )
+    ) | Q(
+        transitario_id__in=RawSQL(
+            coincidencias.format(columna="objeto_id", tipos="'transitario'"),
+            [expresion],
+        )
+    )
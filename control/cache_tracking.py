@@ -0,0 +1,181 @@
+"""
+Caché de fragmentos HTML del rastreo público (resultado de búsqueda y detalle).
+
+El estado de un contenedor cambia pocas veces al día, pero la búsqueda HTMX
+se consulta en cada tecla. Los fragmentos renderizados se guardan por
+(codigo_iso, fragmento) en dos niveles:
+
+- Memoria del proceso: LRU acotado (SIGEP_TRACKING_CACHE_MAX_ENTRADAS) con
+  vencimiento (SIGEP_TRACKING_CACHE_TTL) como red de seguridad.
+- Archivos en SIGEP_CACHE_DIR/tracking (opcional, SIGEP_TRACKING_CACHE_ARCHIVOS):
+  compartidos entre procesos. Con este nivel activo, un acierto en memoria
+  solo es válido si el archivo sigue existiendo, así la invalidación hecha
+  por otro proceso se respeta.
+
+La invalidación la disparan las señales de control/signals.py (y la ingesta
+en lote, que no pasa por save()).
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .pdf_cache import escribir_atomico
+
+FRAGMENTOS = ("resultado", "detalle")
+
+_PATRON_CODIGO = re.compile(r"^[A-Z0-9]{4,20}$")
+
+# (codigo_iso, fragmento) → (guardado_en, html); el orden es el de uso
+_memoria = OrderedDict()
+_contadores = {
+    "aciertos_memoria": 0,
+    "aciertos_archivo": 0,
+    "fallos": 0,
+    "invalidaciones": 0,
+    "desalojos": 0,
+}
+_lock = threading.Lock()
+
+
+def _usa_archivos():
+    return settings.SIGEP_TRACKING_CACHE_ARCHIVOS
+
+
+def directorio():
+    ruta = Path(settings.SIGEP_CACHE_DIR) / "tracking"
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+def _ruta(codigo_iso, fragmento):
+    return directorio() / f"{codigo_iso}.{fragmento}.html"
+
+
+def _contar(contador, cantidad=1):
+    with _lock:
+        _contadores[contador] += cantidad
+
+
+# ====== LECTURA / ESCRITURA ======
+def obtener(codigo_iso, fragmento):
+    """HTML cacheado del fragmento o None (fallo, vencido o invalidado)"""
+    if not _PATRON_CODIGO.match(codigo_iso):
+        return None
+    clave = (codigo_iso, fragmento)
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _memoria.get(clave)
+        if entrada is not None and ahora - entrada[0] > settings.SIGEP_TRACKING_CACHE_TTL:
+            del _memoria[clave]
+            entrada = None
+        if entrada is not None:
+            _memoria.move_to_end(clave)
+
+    if not _usa_archivos():
+        if entrada is None:
+            _contar("fallos")
+            return None
+        _contar("aciertos_memoria")
+        return entrada[1]
+
+    ruta = _ruta(codigo_iso, fragmento)
+    if entrada is not None:
+        if ruta.exists():
+            _contar("aciertos_memoria")
+            return entrada[1]
+        # Otro proceso lo invalidó
+        with _lock:
+            _memoria.pop(clave, None)
+
+    try:
+        html = ruta.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        _contar("fallos")
+        return None
+    _guardar_en_memoria(clave, html)
+    _contar("aciertos_archivo")
+    return html
+
+
+def guardar(codigo_iso, fragmento, html):
+    """Guarda el fragmento renderizado en memoria (y en disco si está activo)"""
+    if not _PATRON_CODIGO.match(codigo_iso):
+        return
+    if _usa_archivos():
+        escribir_atomico(_ruta(codigo_iso, fragmento), html.encode("utf-8"))
+    _guardar_en_memoria((codigo_iso, fragmento), html)
+
+
+def _guardar_en_memoria(clave, html):
+    desalojados = 0
+    with _lock:
+        _memoria[clave] = (time.monotonic(), html)
+        _memoria.move_to_end(clave)
+        while len(_memoria) > settings.SIGEP_TRACKING_CACHE_MAX_ENTRADAS:
+            _memoria.popitem(last=False)
+            desalojados += 1
+    if desalojados:
+        _contar("desalojos", desalojados)
+
+
+# ====== INVALIDACIÓN ======
+def _eliminar(codigos):
+    codigos = [codigo for codigo in codigos if codigo and _PATRON_CODIGO.match(codigo)]
+    with _lock:
+        for codigo in codigos:
+            for fragmento in FRAGMENTOS:
+                _memoria.pop((codigo, fragmento), None)
+    if _usa_archivos():
+        for codigo in codigos:
+            for fragmento in FRAGMENTOS:
+                _ruta(codigo, fragmento).unlink(missing_ok=True)
+    _contar("invalidaciones", len(codigos))
+
+
+def invalidar(*codigos):
+    """
+    Elimina los fragmentos de los contenedores. Se elimina de inmediato y
+    otra vez al confirmar la transacción: una petición concurrente que
+    renderizó datos previos al commit no deja un fragmento obsoleto.
+    """
+    codigos = [codigo.upper() for codigo in codigos if codigo]
+    if not codigos:
+        return
+    _eliminar(codigos)
+    transaction.on_commit(lambda: _eliminar(codigos))
+
+
+def limpiar():
+    """Vacía ambos niveles (p. ej. tras un despliegue de plantillas)"""
+    with _lock:
+        _memoria.clear()
+    if _usa_archivos():
+        for archivo in directorio().glob("*.html"):
+            archivo.unlink(missing_ok=True)
+
+
+def estadisticas():
+    """Contadores del proceso y ocupación de cada nivel"""
+    with _lock:
+        datos = dict(_contadores)
+        datos["entradas_memoria"] = len(_memoria)
+    aciertos = datos["aciertos_memoria"] + datos["aciertos_archivo"]
+    consultas = aciertos + datos["fallos"]
+    datos.update(
+        {
+            "tasa_aciertos": round(aciertos / consultas, 3) if consultas else None,
+            "max_entradas_memoria": settings.SIGEP_TRACKING_CACHE_MAX_ENTRADAS,
+            "ttl_segundos": settings.SIGEP_TRACKING_CACHE_TTL,
+            "archivos": (
+                sum(1 for _ in os.scandir(directorio())) if _usa_archivos() else None
+            ),
+        }
+    )
+    return datos
@@ -0,0 +1,194 @@
+"""
+Coalescencia de operaciones costosas idénticas (single-flight).
+
+Cuando llega un buque muchos usuarios piden a la vez el mismo PDF, el mismo
+RUC/IMO o el mismo detalle de rastreo. ejecutar() hace que, para una misma
+clave, solo una llamada calcule y las demás esperen su resultado:
+
+- En el proceso: la primera llamada (líder) ejecuta la operación; las
+  siguientes esperan y reciben el mismo objeto (o la misma excepción).
+- Entre procesos: el líder de cada proceso toma un turno en un archivo SQLite
+  en SIGEP_CACHE_DIR (modo WAL). Si otro proceso ya lo tiene, espera a que lo
+  suelte y lee de desde_cache() lo que ese proceso guardó; solo si no hay nada
+  calcula él mismo.
+
+El turno vence a los SIGEP_COALESCENCIA_ESPERA segundos (un proceso caído no
+bloquea a los demás) y nadie espera más que eso: al agotarse se calcula igual.
+Si el archivo no está disponible se calcula sin coordinar entre procesos.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se revisa si el otro proceso ya soltó el turno
+INTERVALO_SONDEO = 0.05
+
+_local = threading.local()
+_lock = threading.Lock()
+_vuelos = {}
+_contadores = {
+    "lideres": 0,
+    "compartidas": 0,
+    "compartidas_entre_procesos": 0,
+    "esperas_agotadas": 0,
+}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS turnos (
+    clave TEXT PRIMARY KEY,
+    dueno TEXT NOT NULL,
+    vence REAL NOT NULL
+);
+"""
+
+
+class _Vuelo:
+    """Cálculo en curso de una clave en este proceso"""
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+def _contar(contador):
+    with _lock:
+        _contadores[contador] += 1
+
+
+def estadisticas():
+    """Llamadas que calcularon (líderes) y que reutilizaron un cálculo ajeno"""
+    with _lock:
+        datos = dict(_contadores)
+        datos["en_curso"] = len(_vuelos)
+    return datos
+
+
+# ====== TURNOS ENTRE PROCESOS ======
+def ruta_almacen():
+    directorio = Path(settings.SIGEP_CACHE_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio / "coalescencia.sqlite3"
+
+
+def _conexion():
+    """Conexión SQLite del hilo actual (una por archivo)"""
+    ruta = str(ruta_almacen())
+    conexiones = getattr(_local, "conexiones", None)
+    if conexiones is None:
+        conexiones = _local.conexiones = {}
+    conexion = conexiones.get(ruta)
+    if conexion is None:
+        conexion = sqlite3.connect(ruta, timeout=1, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(_ESQUEMA)
+        conexiones[ruta] = conexion
+    return conexion
+
+
+def tomar_turno(clave, dueno, duracion, ahora=None):
+    """
+    Toma el turno de la clave si está libre o vencido.
+
+    Returns:
+        True si el turno quedó a nombre de dueno
+    """
+    ahora = time.time() if ahora is None else ahora
+    cursor = _conexion().execute(
+        "INSERT INTO turnos (clave, dueno, vence) VALUES (?, ?, ?) "
+        "ON CONFLICT(clave) DO UPDATE SET "
+        "dueno = excluded.dueno, vence = excluded.vence WHERE turnos.vence < ?",
+        (clave, dueno, ahora + duracion, ahora),
+    )
+    return cursor.rowcount == 1
+
+
+def soltar_turno(clave, dueno):
+    _conexion().execute(
+        "DELETE FROM turnos WHERE clave = ? AND dueno = ?", (clave, dueno)
+    )
+
+
+def _ejecutar_con_turno(clave, funcion, desde_cache):
+    """Ejecuta funcion() con el turno de la clave, o reutiliza el de otro proceso"""
+    espera = settings.SIGEP_COALESCENCIA_ESPERA
+    dueno = uuid.uuid4().hex
+    limite = time.monotonic() + espera
+    try:
+        while not tomar_turno(clave, dueno, espera):
+            if time.monotonic() >= limite:
+                _contar("esperas_agotadas")
+                return funcion()
+            time.sleep(INTERVALO_SONDEO)
+    except sqlite3.Error:
+        logger.warning("Coalescencia entre procesos no disponible", exc_info=True)
+        return funcion()
+
+    try:
+        # Otro proceso pudo terminar justo antes de que tomáramos el turno
+        resultado = desde_cache()
+        if resultado is not None:
+            _contar("compartidas_entre_procesos")
+            return resultado
+        return funcion()
+    finally:
+        try:
+            soltar_turno(clave, dueno)
+        except sqlite3.Error:
+            logger.warning(f"No se pudo soltar el turno {clave}", exc_info=True)
+
+
+# ====== API ======
+def ejecutar(clave, funcion, desde_cache=None):
+    """
+    Ejecuta funcion() una sola vez para las llamadas simultáneas con la misma
+    clave. El resultado se comparte entre todas: no debe modificarse.
+
+    Args:
+        clave: identifica la operación (p. ej. "pdf:<huella>", "imo:9839133")
+        funcion: la operación costosa; debe guardar su resultado donde
+            desde_cache() lo encuentre
+        desde_cache: callable que retorna el resultado que guardó otro proceso
+            (o None). Sin él solo se coalesce dentro del proceso.
+
+    Returns:
+        El resultado de funcion() (propio o de la llamada que calculó)
+    """
+    with _lock:
+        vuelo = _vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _vuelos[clave] = _Vuelo()
+            _contadores["lideres"] += 1
+
+    if not lider:
+        if not vuelo.terminado.wait(settings.SIGEP_COALESCENCIA_ESPERA):
+            _contar("esperas_agotadas")
+            return funcion()
+        _contar("compartidas")
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    try:
+        if desde_cache is None:
+            vuelo.resultado = funcion()
+        else:
+            vuelo.resultado = _ejecutar_con_turno(clave, funcion, desde_cache)
+        return vuelo.resultado
+    except Exception as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _lock:
+            _vuelos.pop(clave, None)
+        vuelo.terminado.set()
@@ -0,0 +1,584 @@
+"""
+Infraestructura común de los clientes de servicios externos (SUNAT, IMO).
+
+- Caché persistente de respuestas en la tabla ConsultaExterna (una fila por
+  servicio y clave), compartida por todos los procesos. Guarda también las
+  claves inexistentes (caché negativo).
+- Sesión HTTP por servicio con conexiones keep-alive reutilizadas y reintentos
+  acotados con backoff exponencial (urllib3 Retry) ante errores transitorios.
+- Revalidación en segundo plano (stale-while-revalidate): el cliente responde
+  con el dato vencido y un hilo lo refresca; una clave no se revalida dos
+  veces a la vez.
+- Consulta única (coalescencia): las consultas simultáneas de la misma clave,
+  en hilos o procesos distintos, comparten una sola llamada al servicio.
+- Consultas en lote: claves de uno o varios servicios resueltas en paralelo
+  (un pool acotado por servicio) con un plazo total; los resultados se
+  entregan apenas están listos.
+- Circuito por servicio (cerrado/abierto/semiabierto) sobre una ventana
+  móvil de errores y llamadas lentas, y un cupo global de llamadas salientes
+  simultáneas: con el servicio caído o lento la consulta falla de inmediato
+  (o responde la caché) en vez de bloquear un worker.
+- Contadores por servicio (proceso actual): aciertos, fallos, tasa de
+  aciertos y latencia del servicio externo.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import coalescencia
+from .models import ConsultaExterna
+
+logger = logging.getLogger(__name__)
+
+# Estados informados en el campo _cache de cada respuesta
+FRESCO = "fresco"
+VENCIDO = "vencido"
+NEGATIVO = "negativo"
+EXTERNO = "externo"
+LOCAL = "local"
+
+# Códigos HTTP que se reintentan (con backoff) antes de dar la consulta por fallida
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+# Estados del circuito de cada servicio
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+_lock = threading.Lock()
+_estadisticas = {}
+_executor = None
+_en_revalidacion = set()
+_interruptores = {}
+_cupo = None
+_llamadas_en_curso = 0
+
+
+class ServicioNoDisponible(Exception):
+    """La llamada no se hizo: circuito abierto o cupo de llamadas salientes agotado"""
+
+
+# ====== SESIÓN HTTP ======
+def crear_sesion(reintentos, backoff=0.5, conexiones=10):
+    """
+    Sesión con pool de conexiones keep-alive y reintentos acotados (errores
+    de conexión y respuestas 429/5xx). Los POST de consulta son idempotentes,
+    por eso también se reintentan.
+    """
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(
+        pool_connections=conexiones,
+        pool_maxsize=conexiones,
+        max_retries=Retry(
+            total=reintentos,
+            # Un timeout de lectura ya consumió el presupuesto de latencia
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=ESTADOS_REINTENTABLES,
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        ),
+    )
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+# ====== CACHÉ PERSISTENTE ======
+# Si la base de datos está ocupada (p. ej. escrituras concurrentes de un lote
+# en SQLite) la consulta sigue sin caché: la caché acelera, no debe fallar.
+def leer(servicio, clave):
+    """Fila cacheada (ConsultaExterna) o None"""
+    try:
+        return ConsultaExterna.objects.filter(servicio=servicio, clave=clave).first()
+    except DatabaseError as e:
+        logger.warning(f"Caché no disponible al leer {servicio}:{clave}: {e}")
+        return None
+
+
+def guardar(servicio, clave, datos, encontrado=True):
+    try:
+        ConsultaExterna.objects.update_or_create(
+            servicio=servicio,
+            clave=clave,
+            defaults={
+                "datos": datos,
+                "encontrado": encontrado,
+                "obtenido_en": timezone.now(),
+            },
+        )
+    except DatabaseError as e:
+        logger.warning(f"Caché no disponible al guardar {servicio}:{clave}: {e}")
+
+
+def edad_segundos(consulta):
+    return (timezone.now() - consulta.obtenido_en).total_seconds()
+
+
+def campos_vencidos(edad, ttl_campos):
+    """Campos cuya vigencia (ttl_campos: campo → segundos) ya pasó a esa edad"""
+    return [campo for campo, ttl in ttl_campos.items() if edad > ttl]
+
+
+def con_estado(cacheada, estado, **extra):
+    """Datos cacheados con el campo _cache (estado, edad y extras)"""
+    datos = dict(cacheada.datos)
+    datos["_cache"] = {
+        "estado": estado,
+        "edad_segundos": int(edad_segundos(cacheada)),
+        **extra,
+    }
+    return datos
+
+
+def desde_cache(servicio, cacheada, ttl_campos, ttl_no_encontrado, refrescar):
+    """
+    Respuesta desde la caché, o None si hay que consultar al servicio en línea.
+
+    - Todos los campos vigentes: acierto.
+    - Algunos vencidos: responde igual, marcando los vencidos, y revalida en
+      segundo plano con refrescar().
+    - Ninguno vigente (o caché negativo vencido): None.
+    """
+    edad = edad_segundos(cacheada)
+    if not cacheada.encontrado:
+        if edad > ttl_no_encontrado:
+            return None
+        contar(servicio, "aciertos_negativos")
+        return con_estado(cacheada, NEGATIVO)
+
+    vencidos = campos_vencidos(edad, ttl_campos)
+    if not vencidos:
+        contar(servicio, "aciertos")
+        return con_estado(cacheada, FRESCO)
+    if len(vencidos) == len(ttl_campos):
+        return None
+
+    contar(servicio, "aciertos_vencidos")
+    revalidar(servicio, cacheada.clave, refrescar)
+    return con_estado(cacheada, VENCIDO, campos_vencidos=vencidos)
+
+
+# ====== CONSULTA ÚNICA ======
+def consultar_una_vez(servicio, clave, funcion):
+    """
+    Ejecuta funcion() (consulta al servicio y guarda en caché) una sola vez
+    para las llamadas simultáneas de la clave. Quien esperó a otro proceso
+    recibe lo que ese proceso guardó en la caché.
+    """
+    desde = timezone.now()
+
+    def guardada():
+        cacheada = leer(servicio, clave)
+        if cacheada is None or cacheada.obtenido_en < desde:
+            return None
+        return con_estado(cacheada, FRESCO if cacheada.encontrado else NEGATIVO)
+
+    return coalescencia.ejecutar(f"{servicio}:{clave}", funcion, desde_cache=guardada)
+
+
+# ====== REVALIDACIÓN EN SEGUNDO PLANO ======
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="sigep-consultas"
+            )
+        return _executor
+
+
+def revalidar(servicio, clave, funcion):
+    """
+    Ejecuta funcion() en segundo plano para refrescar la clave. Si ya hay una
+    revalidación en curso para la misma clave, no hace nada.
+    """
+    marca = (servicio, clave)
+    with _lock:
+        if marca in _en_revalidacion:
+            return
+        _en_revalidacion.add(marca)
+
+    def tarea():
+        close_old_connections()
+        try:
+            funcion()
+        except Exception:
+            logger.exception(f"Error al revalidar {servicio}:{clave}")
+        finally:
+            with _lock:
+                _en_revalidacion.discard(marca)
+            close_old_connections()
+
+    _get_executor().submit(tarea)
+
+
+# ====== CONSULTAS EN LOTE ======
+PLAZO_AGOTADO = "Plazo del lote agotado. Intente nuevamente con menos claves."
+
+
+def _en_hilo(funcion, clave):
+    close_old_connections()
+    try:
+        return funcion(clave)
+    finally:
+        close_old_connections()
+
+
+def consultar_lote(lotes, plazo=None):
+    """
+    Resuelve en paralelo las claves de uno o varios servicios y entrega cada
+    resultado apenas termina (generador). Cada servicio tiene su propio pool
+    de hilos, así la concurrencia de uno no consume la del otro.
+
+    Args:
+        lotes: lista de (servicio, claves, funcion, concurrencia), donde
+            funcion(clave) retorna el dict de la consulta
+        plazo: segundos para todo el lote (default: CONSULTAS_LOTE_PLAZO); las
+            claves que no terminaron a tiempo se entregan con error
+            PLAZO_AGOTADO y las que no empezaron se cancelan
+
+    Yields:
+        (servicio, clave, datos) en orden de llegada; claves repetidas se
+        consultan una sola vez
+    """
+    if plazo is None:
+        plazo = settings.CONSULTAS_LOTE_PLAZO
+    pendientes = {}
+    ejecutores = []
+    try:
+        for servicio, claves, funcion, concurrencia in lotes:
+            claves = list(dict.fromkeys(claves))
+            if not claves:
+                continue
+            ejecutor = ThreadPoolExecutor(
+                max_workers=max(1, min(concurrencia, len(claves))),
+                thread_name_prefix=f"sigep-lote-{servicio}",
+            )
+            ejecutores.append(ejecutor)
+            for clave in claves:
+                futuro = ejecutor.submit(_en_hilo, funcion, clave)
+                pendientes[futuro] = (servicio, clave)
+
+        try:
+            for futuro in as_completed(list(pendientes), timeout=plazo):
+                servicio, clave = pendientes.pop(futuro)
+                try:
+                    datos = futuro.result()
+                except Exception as e:
+                    logger.exception(f"Error en consulta en lote {servicio}:{clave}")
+                    datos = {"error": f"Error inesperado: {str(e)}"}
+                yield servicio, clave, datos
+        except TimeoutError:
+            logger.warning(
+                f"Consulta en lote: plazo de {plazo}s agotado con "
+                f"{len(pendientes)} claves pendientes"
+            )
+        for servicio, clave in pendientes.values():
+            yield servicio, clave, {"error": PLAZO_AGOTADO}
+    finally:
+        # También si el cliente corta la descarga a mitad del lote
+        for ejecutor in ejecutores:
+            ejecutor.shutdown(wait=False, cancel_futures=True)
+
+
+# ====== CIRCUITO Y CUPO DE LLAMADAS SALIENTES ======
+class Interruptor:
+    """
+    Circuito de un servicio externo (estado del proceso actual).
+
+    - Cerrado: las llamadas pasan y se registran en una ventana móvil. Si en
+      la ventana hay suficientes llamadas y la proporción de errores o de
+      llamadas lentas supera su umbral, se abre.
+    - Abierto: las llamadas se rechazan sin tocar la red durante `apertura`
+      segundos.
+    - Semiabierto: pasa una llamada de prueba; si sale bien se cierra, si no
+      vuelve a abrirse.
+    """
+
+    def __init__(self, servicio, configuracion):
+        self.servicio = servicio
+        self.configuracion = configuracion
+        self.estado = CERRADO
+        self.abierto_desde = None
+        self.prueba_en_curso = False
+        self.ventana = deque()  # (instante, error, lenta, latencia_ms)
+        self.aperturas = 0
+        self.rechazadas = 0
+        self._lock = threading.Lock()
+
+    def _podar(self, ahora):
+        limite = ahora - self.configuracion["ventana"]
+        while self.ventana and self.ventana[0][0] < limite:
+            self.ventana.popleft()
+
+    def _abrir(self, ahora):
+        self.estado = ABIERTO
+        self.abierto_desde = ahora
+        self.aperturas += 1
+        logger.warning(f"Circuito de {self.servicio} abierto")
+
+    def permitir(self, ahora=None):
+        """Reserva el paso de una llamada o lanza ServicioNoDisponible"""
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            if self.estado == ABIERTO:
+                espera = self.abierto_desde + self.configuracion["apertura"] - ahora
+                if espera > 0:
+                    self.rechazadas += 1
+                    raise ServicioNoDisponible(
+                        f"Servicio {self.servicio} no disponible temporalmente. "
+                        f"Intente nuevamente en {math.ceil(espera)} s."
+                    )
+                self.estado = SEMIABIERTO
+            if self.estado == SEMIABIERTO:
+                if self.prueba_en_curso:
+                    self.rechazadas += 1
+                    raise ServicioNoDisponible(
+                        f"Servicio {self.servicio} en verificación. "
+                        "Intente nuevamente en unos segundos."
+                    )
+                self.prueba_en_curso = True
+
+    def cancelar(self):
+        """La llamada permitida se rechazó antes de hacerse (sin cupo global)"""
+        with self._lock:
+            self.prueba_en_curso = False
+            self.rechazadas += 1
+
+    def registrar(self, error, latencia_ms, ahora=None):
+        """Resultado de una llamada permitida"""
+        ahora = time.monotonic() if ahora is None else ahora
+        lenta = latencia_ms > self.configuracion["latencia_lenta_ms"]
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self.prueba_en_curso = False
+                if error or lenta:
+                    self._abrir(ahora)
+                else:
+                    self.estado = CERRADO
+                    self.ventana.clear()
+                    logger.info(f"Circuito de {self.servicio} cerrado")
+                return
+            self.ventana.append((ahora, error, lenta, latencia_ms))
+            self._podar(ahora)
+            if self.estado == CERRADO and self._supera_umbral():
+                self._abrir(ahora)
+
+    def _supera_umbral(self):
+        llamadas = len(self.ventana)
+        if llamadas < self.configuracion["minimo_llamadas"]:
+            return False
+        errores = sum(1 for _t, error, _lenta, _ms in self.ventana if error)
+        lentas = sum(1 for _t, _error, lenta, _ms in self.ventana if lenta)
+        return (
+            errores / llamadas >= self.configuracion["umbral_errores"]
+            or lentas / llamadas >= self.configuracion["umbral_lentas"]
+        )
+
+    def resumen(self, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            self._podar(ahora)
+            llamadas = len(self.ventana)
+            latencias = sorted(ms for _t, _error, _lenta, ms in self.ventana)
+            datos = {
+                "estado": self.estado,
+                "llamadas_ventana": llamadas,
+                "tasa_errores": round(
+                    sum(1 for registro in self.ventana if registro[1]) / llamadas, 3
+                )
+                if llamadas
+                else None,
+                "tasa_lentas": round(
+                    sum(1 for registro in self.ventana if registro[2]) / llamadas, 3
+                )
+                if llamadas
+                else None,
+                "latencia_p95_ms": round(latencias[int(0.95 * (llamadas - 1))], 1)
+                if llamadas
+                else None,
+                "aperturas": self.aperturas,
+                "rechazadas": self.rechazadas,
+                "reintento_en_segundos": None,
+            }
+            if self.estado == ABIERTO:
+                datos["reintento_en_segundos"] = max(
+                    0,
+                    math.ceil(
+                        self.abierto_desde + self.configuracion["apertura"] - ahora
+                    ),
+                )
+        return datos
+
+
+def interruptor(servicio):
+    with _lock:
+        if servicio not in _interruptores:
+            _interruptores[servicio] = Interruptor(
+                servicio, settings.CONSULTAS_EXTERNAS_CIRCUITO
+            )
+        return _interruptores[servicio]
+
+
+def reiniciar_circuitos():
+    """Cierra todos los circuitos y vuelve a leer la configuración"""
+    global _cupo
+    with _lock:
+        _interruptores.clear()
+        _cupo = None
+
+
+def _cupo_global():
+    global _cupo
+    with _lock:
+        if _cupo is None:
+            _cupo = threading.BoundedSemaphore(
+                settings.CONSULTAS_EXTERNAS_MAX_SIMULTANEAS
+            )
+        return _cupo
+
+
+class _Llamada:
+    """Resultado de la llamada que el cliente informa dentro de llamada_externa()"""
+
+    estado_http = None
+
+    @property
+    def fallida(self):
+        return self.estado_http is not None and (
+            self.estado_http in ESTADOS_REINTENTABLES or self.estado_http >= 500
+        )
+
+
+@contextmanager
+def llamada_externa(servicio):
+    """
+    Envuelve una llamada saliente: la rechaza con ServicioNoDisponible si el
+    circuito está abierto o no hay cupo global, mide su latencia y registra
+    el resultado en el circuito. El cliente informa el código HTTP en
+    llamada.estado_http (429/5xx cuentan como error, igual que una excepción).
+    """
+    global _llamadas_en_curso
+    circuito = interruptor(servicio)
+    circuito.permitir()
+    cupo = _cupo_global()
+    if not cupo.acquire(timeout=settings.CONSULTAS_EXTERNAS_ESPERA_CUPO):
+        circuito.cancelar()
+        raise ServicioNoDisponible(
+            "Demasiadas consultas externas en curso. Intente nuevamente en unos segundos."
+        )
+    with _lock:
+        _llamadas_en_curso += 1
+
+    llamada = _Llamada()
+    inicio = time.perf_counter()
+    error = False
+    try:
+        with medir_llamada(servicio):
+            yield llamada
+    except Exception:
+        error = True
+        raise
+    finally:
+        with _lock:
+            _llamadas_en_curso -= 1
+        cupo.release()
+        circuito.registrar(
+            error or llamada.fallida, (time.perf_counter() - inicio) * 1000
+        )
+
+
+def estado_circuitos():
+    """Estado del circuito de cada servicio y ocupación del cupo global"""
+    with _lock:
+        servicios = list(_interruptores.values())
+        en_curso = _llamadas_en_curso
+    return {
+        "servicios": {
+            circuito.servicio: circuito.resumen() for circuito in servicios
+        },
+        "llamadas_en_curso": en_curso,
+        "max_simultaneas": settings.CONSULTAS_EXTERNAS_MAX_SIMULTANEAS,
+    }
+
+
+# ====== ESTADÍSTICAS ======
+def _contadores(servicio):
+    return _estadisticas.setdefault(
+        servicio,
+        {
+            "aciertos": 0,
+            "aciertos_vencidos": 0,
+            "aciertos_negativos": 0,
+            "aciertos_locales": 0,
+            "fallos": 0,
+            "llamadas_externas": 0,
+            "errores_externos": 0,
+            "latencia_total_ms": 0.0,
+            "latencia_max_ms": 0.0,
+        },
+    )
+
+
+def contar(servicio, contador):
+    with _lock:
+        _contadores(servicio)[contador] += 1
+
+
+@contextmanager
+def medir_llamada(servicio):
+    """Registra la latencia de una llamada al servicio externo y si falló"""
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        with _lock:
+            datos = _contadores(servicio)
+            datos["llamadas_externas"] += 1
+            datos["latencia_total_ms"] += milisegundos
+            datos["latencia_max_ms"] = max(datos["latencia_max_ms"], milisegundos)
+            if error:
+                datos["errores_externos"] += 1
+
+
+def estadisticas():
+    """Contadores por servicio con tasa de aciertos y latencia promedio"""
+    resultado = {}
+    with _lock:
+        copia = {servicio: dict(datos) for servicio, datos in _estadisticas.items()}
+    for servicio, datos in copia.items():
+        aciertos = (
+            datos["aciertos"]
+            + datos["aciertos_vencidos"]
+            + datos["aciertos_negativos"]
+            + datos["aciertos_locales"]
+        )
+        consultas = aciertos + datos["fallos"]
+        llamadas = datos["llamadas_externas"]
+        latencia_total = datos.pop("latencia_total_ms")
+        datos["latencia_max_ms"] = round(datos["latencia_max_ms"], 1)
+        datos["latencia_promedio_ms"] = (
+            round(latencia_total / llamadas, 1) if llamadas else None
+        )
+        datos["tasa_aciertos"] = round(aciertos / consultas, 3) if consultas else None
+        resultado[servicio] = datos
+    return resultado
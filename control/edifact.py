@@ -0,0 +1,64 @@
+"""
+Lectura de intercambios UN/EDIFACT (BAPLIE, COARRI, CODECO).
+
+El tokenizador recorre el texto por trozos, así un archivo grande se procesa
+en streaming: cada segmento se entrega apenas se encuentra su terminador.
+"""
+
+
+def segmentos_edifact(trozos):
+    """
+    Divide un intercambio EDIFACT en segmentos: listas de elementos, cada
+    elemento una lista de componentes. Respeta UNA y el carácter de escape.
+
+    Args:
+        trozos: texto completo o iterable de trozos de texto (archivo abierto)
+    """
+    if isinstance(trozos, str):
+        trozos = [trozos]
+
+    componente, elemento, liberacion, terminador = ":", "+", "?", "'"
+    inicio = True
+    segmento, elementos, actual = [], [], []
+    escapado = False
+    for texto in trozos:
+        if inicio:
+            texto = texto.lstrip()
+            if not texto:
+                continue
+            inicio = False
+            if texto.startswith("UNA") and len(texto) >= 9:
+                componente, elemento = texto[3], texto[4]
+                liberacion, terminador = texto[6], texto[8]
+                texto = texto[9:]
+
+        for caracter in texto:
+            if escapado:
+                actual.append(caracter)
+                escapado = False
+            elif caracter == liberacion:
+                escapado = True
+            elif caracter == componente:
+                elementos.append("".join(actual))
+                actual = []
+            elif caracter == elemento:
+                elementos.append("".join(actual))
+                segmento.append(elementos)
+                elementos, actual = [], []
+            elif caracter == terminador:
+                elementos.append("".join(actual))
+                segmento.append(elementos)
+                if segmento[0][0].strip():
+                    segmento[0][0] = segmento[0][0].strip()
+                    yield segmento
+                segmento, elementos, actual = [], [], []
+            elif caracter not in "\r\n":
+                actual.append(caracter)
+
+
+def componente(segmento, elemento, componente=0):
+    """Componente de un elemento del segmento ('' si no existe)"""
+    try:
+        return segmento[elemento][componente].strip()
+    except IndexError:
+        return ""
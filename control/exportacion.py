@@ -0,0 +1,224 @@
+"""
+Exportación masiva de manifiestos de arribo en streaming (CSV, JSON Lines, XLSX).
+
+Las filas se leen con .values_list().iterator(chunk_size) y se emiten a medida
+que se generan, de modo que el consumo de memoria se mantiene constante sin
+importar cuántos contenedores tenga el viaje.
+
+El XLSX se arma con la librería estándar (zipfile): la hoja se escribe fila
+por fila con cadenas en línea (sin tabla de strings compartidos) y el ZIP usa
+descriptores de datos, por lo que tampoco requiere conocer el tamaño final.
+"""
+
+import csv
+import json
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Contenedor
+
+# Filas leídas de la BD por cada viaje al cursor
+TAMANO_LOTE = 2000
+
+# (campo ORM, encabezado) en el orden de exportación
+COLUMNAS = [
+    ("arribo_id", "arribo_id"),
+    ("arribo__buque__nombre", "buque"),
+    ("arribo__buque__imo_number", "imo"),
+    ("arribo__fecha_eta", "fecha_eta"),
+    ("codigo_iso", "codigo_iso"),
+    ("bl_referencia", "bl_referencia"),
+    ("direccion", "direccion"),
+    ("tipo_tamaño", "tipo_tamano"),
+    ("peso_bruto_kg", "peso_bruto_kg"),
+    ("tara_kg", "tara_kg"),
+    ("numero_sello", "sellos"),
+    ("mercancia_peligrosa", "mercancia_peligrosa"),
+    ("transitario__razon_social", "transitario"),
+    ("consignatario", "consignatario"),
+    ("origen_puerto", "origen_puerto"),
+    ("destino_puerto", "destino_puerto"),
+    ("ultimo_evento_tipo", "ultimo_evento"),
+    ("ultimo_evento_fecha", "ultimo_evento_fecha"),
+    ("listo_para_retiro", "listo_para_retiro"),
+]
+ENCABEZADOS = [encabezado for _, encabezado in COLUMNAS]
+
+
+def filas_manifiesto(arribos, tamano_lote=TAMANO_LOTE):
+    """
+    Itera las filas (tuplas en el orden de COLUMNAS) de los contenedores de
+    los arribos indicados, ordenadas por arribo.
+
+    Args:
+        arribos: queryset de Arribo
+    """
+    return (
+        Contenedor.objects.filter(arribo__in=arribos)
+        .order_by("arribo__fecha_eta", "arribo_id", "direccion", "codigo_iso")
+        .values_list(*(campo for campo, _ in COLUMNAS))
+        .iterator(chunk_size=tamano_lote)
+    )
+
+
+def _valor_texto(valor):
+    """Normaliza un valor para formatos de texto (CSV/JSON)"""
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+# ====== CSV ======
+class _Eco:
+    """Pseudo-archivo que retorna lo escrito (patrón de streaming de Django)"""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(filas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel detecte UTF-8 (tildes y ñ)
+    yield "\ufeff" + escritor.writerow(ENCABEZADOS)
+    for fila in filas:
+        yield escritor.writerow([_valor_texto(valor) for valor in fila])
+
+
+# ====== JSON LINES ======
+def generar_jsonl(filas):
+    for fila in filas:
+        yield (
+            json.dumps(
+                dict(zip(ENCABEZADOS, (_valor_texto(valor) for valor in fila))),
+                ensure_ascii=False,
+            )
+            + "\n"
+        )
+
+
+# ====== XLSX ======
+# Caracteres de control no permitidos en XML 1.0
+_CONTROL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    "</Types>"
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Manifiesto" sheetId="1" r:id="rId1"/></sheets>'
+    "</workbook>"
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    "</Relationships>"
+)
+
+
+class _BufferStreaming:
+    """
+    Destino de escritura del ZIP: acumula lo escrito hasta que el generador lo
+    retira. Solo expone write/tell (sin seek), así zipfile escribe en modo
+    streaming con descriptores de datos.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _celda_xlsx(valor):
+    if valor is None or valor == "":
+        return "<c/>"
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f"<c><v>{valor}</v></c>"
+    texto = _CONTROL_XML.sub("", str(_valor_texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return "<row>" + "".join(_celda_xlsx(valor) for valor in valores) + "</row>"
+
+
+def generar_xlsx(filas, filas_por_bloque=500):
+    buffer = _BufferStreaming()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        libro.writestr("_rels/.rels", _RELS)
+        libro.writestr("xl/workbook.xml", _WORKBOOK)
+        libro.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield buffer.retirar()
+
+        with libro.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            hoja.write(_fila_xlsx(ENCABEZADOS).encode("utf-8"))
+            bloque = []
+            for fila in filas:
+                bloque.append(_fila_xlsx(fila))
+                if len(bloque) >= filas_por_bloque:
+                    hoja.write("".join(bloque).encode("utf-8"))
+                    bloque = []
+                    yield buffer.retirar()
+            hoja.write("".join(bloque).encode("utf-8"))
+            hoja.write(b"</sheetData></worksheet>")
+    yield buffer.retirar()
+
+
+# Formato → (generador, content type, extensión)
+FORMATOS = {
+    "csv": (generar_csv, "text/csv; charset=utf-8", "csv"),
+    "jsonl": (generar_jsonl, "application/x-ndjson; charset=utf-8", "jsonl"),
+    "xlsx": (
+        generar_xlsx,
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "xlsx",
+    ),
+}
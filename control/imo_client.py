@@ -3,13 +3,78 @@ Cliente para consultar información de buques por IMO Number.
 Integra scraping de VesselFinder directamente sin dependencias externas.
 
 Basado en la lógica de api_barcos.rb (Sinatra) pero implementado en Python.
+
+Caché (control/consultas_externas.py):
+    Las fichas se guardan en la tabla ConsultaExterna. Los datos del buque
+    (nombre, bandera, dimensiones, TEU, call sign) valen
+    IMO_CACHE_TTL_ESTATICOS segundos y los de navegación (posición, velocidad,
+    destino) IMO_CACHE_TTL_DINAMICOS: con la navegación vencida se responde
+    desde la caché y se revalida en segundo plano. Un IMO sin caché que ya
+    está registrado en Buque se responde desde el registro local.
+
+Parseo:
+    lxml con expresiones XPath precompiladas sobre las filas de las tablas de
+    detalle (benchmark: python manage.py benchmark_imo_parser).
 """
 
 import json
+import logging
 import re
+import threading
 
 import requests
-from bs4 import BeautifulSoup
+from django.conf import settings
+from lxml import etree
+from lxml import html as lxml_html
+
+from . import consultas_externas
+from .models import Buque
+
+logger = logging.getLogger(__name__)
+
+SERVICIO = "imo"
+
+# Campos normalizados según su vigencia en caché
+CAMPOS_ESTATICOS = (
+    "nombre",
+    "tipo",
+    "bandera",
+    "eslora",
+    "manga",
+    "tonelaje_bruto",
+    "teu",
+    "call_sign",
+    "year_built",
+)
+CAMPOS_DINAMICOS = (
+    "status",
+    "velocidad",
+    "rumbo",
+    "destino",
+    "puerto_actual",
+    "latitud",
+    "longitud",
+    "calado",
+)
+
+
+def _clase(nombre):
+    """Condición XPath equivalente al selector CSS .nombre"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {nombre} ')"
+
+
+# XPath precompilados (se evalúan sin construir un árbol de objetos Python)
+XPATH_NOMBRE = etree.XPath(f"//h1[{_clase('title')}]")
+XPATH_FILAS = etree.XPath(f"//*[{_clase('tpt1')} or {_clase('aparams')}]//tr")
+XPATH_CELDAS = etree.XPath("./td")
+XPATH_POSICION = etree.XPath("//*[@id='djson']/@data-json")
+
+
+def ttl_campos():
+    """Vigencia en caché (segundos) de cada campo normalizado"""
+    ttl = dict.fromkeys(CAMPOS_ESTATICOS, settings.IMO_CACHE_TTL_ESTATICOS)
+    ttl.update(dict.fromkeys(CAMPOS_DINAMICOS, settings.IMO_CACHE_TTL_DINAMICOS))
+    return ttl
 
 
 class ImoClient:
@@ -84,8 +149,29 @@ class ImoClient:
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
             "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         )
-        self.timeout = 15
-        self.base_url = "https://www.vesselfinder.com"
+        self.timeout = settings.IMO_TIMEOUT
+        self.base_url = settings.IMO_BASE_URL
+        self._sesion = None
+        self._lock = threading.Lock()
+
+    @property
+    def sesion(self):
+        """Sesión keep-alive compartida con reintentos acotados"""
+        with self._lock:
+            if self._sesion is None:
+                self._sesion = consultas_externas.crear_sesion(
+                    settings.IMO_REINTENTOS
+                )
+                self._sesion.headers.update(
+                    {
+                        "User-Agent": self.user_agent,
+                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                        "Accept-Language": "en-US,en;q=0.5",
+                        "Accept-Encoding": "gzip, deflate, br",
+                        "Connection": "keep-alive",
+                    }
+                )
+            return self._sesion
 
     def consultar_imo(self, imo: str) -> dict:
         """
@@ -108,14 +194,111 @@ class ImoClient:
             data["_source"] = "DEMO - Para datos reales ingrese un IMO válido"
             return self.normalizar_datos(data)
 
+        cacheada = consultas_externas.leer(SERVICIO, imo)
+        if cacheada is not None:
+            datos = consultas_externas.desde_cache(
+                SERVICIO,
+                cacheada,
+                ttl_campos(),
+                settings.IMO_CACHE_TTL_NO_ENCONTRADO,
+                lambda: self._consultar_y_guardar(imo),
+            )
+            if datos is not None:
+                return datos if "error" in datos else self.normalizar_datos(datos)
+        else:
+            registrado = self._desde_registro(imo)
+            if registrado is not None:
+                return self.normalizar_datos(registrado)
+
         # Intentar scraping de VesselFinder
-        result = self._scrape_vessel_info(imo)
+        consultas_externas.contar(SERVICIO, "fallos")
+        result = self._consultar_y_guardar(imo)
 
         if "error" in result:
+            if cacheada is not None and cacheada.encontrado:
+                # VesselFinder falló: mejor el dato vencido que ninguno
+                return self.normalizar_datos(
+                    consultas_externas.con_estado(
+                        cacheada,
+                        consultas_externas.VENCIDO,
+                        campos_vencidos=list(CAMPOS_DINAMICOS),
+                        aviso=result["error"],
+                    )
+                )
             return result
 
         return self.normalizar_datos(result)
 
+    def consultar_lote(self, imos, plazo=None):
+        """
+        Consulta varios IMO en paralelo (hasta CONSULTAS_LOTE_CONCURRENCIA
+        a la vez) dentro de un plazo total.
+
+        Yields:
+            (imo, datos normalizados o error) en orden de llegada
+        """
+        for _servicio, imo, datos in consultas_externas.consultar_lote(
+            [self.lote(imos)], plazo
+        ):
+            yield imo, datos
+
+    def lote(self, imos):
+        """Lote de IMO para consultas_externas.consultar_lote()"""
+        return (
+            SERVICIO,
+            imos,
+            self.consultar_imo,
+            settings.CONSULTAS_LOTE_CONCURRENCIA[SERVICIO],
+        )
+
+    def _desde_registro(self, imo: str):
+        """
+        Datos del buque ya registrado en el catálogo (Buque), sin consultar a
+        VesselFinder. La navegación no está en el registro: se completa con una
+        consulta en segundo plano. None si el IMO no está registrado.
+        """
+        buque = Buque.objects.filter(imo_number=imo).first()
+        if buque is None:
+            return None
+        consultas_externas.contar(SERVICIO, "aciertos_locales")
+        consultas_externas.revalidar(
+            SERVICIO, imo, lambda: self._consultar_y_guardar(imo)
+        )
+        return {
+            "imo": imo,
+            "name": buque.nombre,
+            "flag": buque.pabellon_bandera,
+            "length": float(buque.eslora_metros),
+            "beam": float(buque.manga_metros),
+            "draught": float(buque.calado_metros),
+            "teu": buque.teu_capacidad,
+            "call_sign": buque.callsign,
+            "_source": "Registro local (Buque)",
+            "_cache": {"estado": consultas_externas.LOCAL},
+        }
+
+    def _consultar_y_guardar(self, imo: str) -> dict:
+        """
+        Consulta VesselFinder y guarda la ficha si es definitiva (datos o IMO
+        inexistente). Los errores transitorios y de parseo no se guardan y se
+        retornan sin el campo _cache. Las consultas simultáneas del mismo IMO
+        (hilos o procesos) comparten una sola descarga.
+        """
+        return consultas_externas.consultar_una_vez(
+            SERVICIO, imo, lambda: self._scrape_y_guardar(imo)
+        )
+
+    def _scrape_y_guardar(self, imo: str) -> dict:
+        datos = self._scrape_vessel_info(imo)
+        estado = datos.pop("_status", None)
+        if "error" not in datos:
+            consultas_externas.guardar(SERVICIO, imo, datos)
+        elif estado == 404:
+            consultas_externas.guardar(SERVICIO, imo, datos, encontrado=False)
+        else:
+            return datos
+        return {**datos, "_cache": {"estado": consultas_externas.EXTERNO}}
+
     def _scrape_vessel_info(self, imo: str) -> dict:
         """
         Realiza scraping de VesselFinder para obtener datos del buque.
@@ -127,19 +310,12 @@ class ImoClient:
             dict con datos crudos o error
         """
         try:
-            headers = {
-                "User-Agent": self.user_agent,
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive",
-            }
-
-            response = requests.get(
-                f"{self.base_url}/vessels/details/{imo}",
-                headers=headers,
-                timeout=self.timeout,
-            )
+            with consultas_externas.llamada_externa(SERVICIO) as llamada:
+                response = self.sesion.get(
+                    f"{self.base_url}/vessels/details/{imo}",
+                    timeout=self.timeout,
+                )
+                llamada.estado_http = response.status_code
 
             if response.status_code == 200:
                 return self._parse_vesselfinder_html(response.text, imo)
@@ -151,10 +327,14 @@ class ImoClient:
                         "Verifica que el IMO sea correcto (7 dígitos)",
                         "Prueba con IMOs de demo: 9839133, 9778791, 9461867",
                     ],
+                    "_status": 404,
                 }
             else:
                 return {"error": f"Error del servidor: HTTP {response.status_code}"}
 
+        except consultas_externas.ServicioNoDisponible as e:
+            logger.warning(f"Consulta de IMO {imo} rechazada: {e}")
+            return {"error": str(e)}
         except requests.exceptions.Timeout:
             return {"error": "Tiempo de espera agotado. Intente nuevamente."}
         except requests.exceptions.ConnectionError:
@@ -164,6 +344,7 @@ class ImoClient:
         except requests.exceptions.RequestException as e:
             return {"error": f"Error de conexión: {str(e)}"}
         except Exception as e:
+            logger.exception(f"Error inesperado al consultar IMO {imo}")
             return {"error": f"Error inesperado: {str(e)}"}
 
     def _parse_vesselfinder_html(self, html: str, imo: str) -> dict:
@@ -177,11 +358,11 @@ class ImoClient:
         Returns:
             dict con datos parseados
         """
-        soup = BeautifulSoup(html, "lxml")
+        arbol = lxml_html.fromstring(html)
 
         # Extraer nombre del barco
-        name_el = soup.select_one("h1.title")
-        name = name_el.text.strip() if name_el else "Unknown"
+        name_el = XPATH_NOMBRE(arbol)
+        name = name_el[0].text_content().strip() if name_el else "Unknown"
 
         # Si no encontramos datos válidos
         if name == "Unknown" or not name:
@@ -194,63 +375,72 @@ class ImoClient:
         }
 
         # Extraer datos de las tablas de detalles
-        for row in soup.select(".tpt1 tr, .aparams tr"):
-            cells = row.select("td")
+        for row in XPATH_FILAS(arbol):
+            cells = XPATH_CELDAS(row)
             if len(cells) >= 2:
-                key = cells[0].text.strip().lower()
-                value = cells[1].text.strip()
-
-                if "ship type" in key:
-                    data["type"] = value
-                elif "flag" in key:
-                    data["flag"] = value
-                elif "gross tonnage" in key:
-                    data["gross_tonnage"] = self._parse_int(value)
-                elif "length overall" in key:
-                    data["length"] = self._parse_float(value)
-                elif "beam" in key:
-                    data["beam"] = self._parse_float(value)
-                elif "year of build" in key:
-                    data["year_built"] = self._parse_int(value)
-                elif key in ("status", "navigation status"):
-                    data["status"] = value
-                elif "current draught" in key:
-                    # Remover 'm' y parsear
-                    data["draught"] = self._parse_float(value.replace("m", ""))
-                elif "callsign" in key:
-                    data["call_sign"] = value
-                elif "teu" in key:
-                    data["teu"] = self._parse_int(value)
-                elif "destination" in key:
-                    data["destination"] = value
-                elif "speed" in key or "course / speed" in key:
-                    # Puede venir como "229.8° / 8.9 kn"
-                    if "/" in value:
-                        parts = value.split("/")
-                        data["course"] = self._parse_float(parts[0].replace("°", ""))
-                        data["speed"] = self._parse_float(
-                            parts[1].replace("kn", "").strip()
-                        )
-                    else:
-                        data["speed"] = self._parse_float(value.replace("kn", ""))
-
-        # Intentar extraer posición del JSON incrustado
-        json_div = soup.select_one("#djson")
-        if json_div and json_div.get("data-json"):
-            try:
-                # Decodificar entidades HTML
-                json_str = json_div["data-json"].replace("&quot;", '"')
-                json_data = json.loads(json_str)
-                data["lat"] = json_data.get("ship_lat")
-                data["lon"] = json_data.get("ship_lon")
-                if "course" not in data:
-                    data["course"] = json_data.get("ship_cog")
-                if data.get("speed", 0) == 0:
-                    data["speed"] = json_data.get("ship_sog", 0)
-            except (json.JSONDecodeError, TypeError):
-                pass  # Ignorar errores de parseo JSON
-
-        # Valores por defecto si faltan
+                self._aplicar_fila(
+                    data,
+                    cells[0].text_content().strip().lower(),
+                    cells[1].text_content().strip(),
+                )
+
+        # Intentar extraer posición del JSON incrustado (lxml ya decodifica
+        # las entidades HTML del atributo)
+        json_attr = XPATH_POSICION(arbol)
+        if json_attr and json_attr[0]:
+            self._aplicar_posicion(data, json_attr[0])
+
+        return self._completar_defaults(data)
+
+    def _aplicar_fila(self, data: dict, key: str, value: str) -> None:
+        """Interpreta una fila (etiqueta en minúsculas, valor) de las tablas de detalle"""
+        if "ship type" in key:
+            data["type"] = value
+        elif "flag" in key:
+            data["flag"] = value
+        elif "gross tonnage" in key:
+            data["gross_tonnage"] = self._parse_int(value)
+        elif "length overall" in key:
+            data["length"] = self._parse_float(value)
+        elif "beam" in key:
+            data["beam"] = self._parse_float(value)
+        elif "year of build" in key:
+            data["year_built"] = self._parse_int(value)
+        elif key in ("status", "navigation status"):
+            data["status"] = value
+        elif "current draught" in key:
+            # Remover 'm' y parsear
+            data["draught"] = self._parse_float(value.replace("m", ""))
+        elif "callsign" in key:
+            data["call_sign"] = value
+        elif "teu" in key:
+            data["teu"] = self._parse_int(value)
+        elif "destination" in key:
+            data["destination"] = value
+        elif "speed" in key or "course / speed" in key:
+            # Puede venir como "229.8° / 8.9 kn"
+            if "/" in value:
+                parts = value.split("/")
+                data["course"] = self._parse_float(parts[0].replace("°", ""))
+                data["speed"] = self._parse_float(parts[1].replace("kn", "").strip())
+            else:
+                data["speed"] = self._parse_float(value.replace("kn", ""))
+
+    def _aplicar_posicion(self, data: dict, json_str: str) -> None:
+        """Posición, rumbo y velocidad del JSON incrustado en #djson"""
+        try:
+            json_data = json.loads(json_str)
+            data["lat"] = json_data.get("ship_lat")
+            data["lon"] = json_data.get("ship_lon")
+            if "course" not in data:
+                data["course"] = json_data.get("ship_cog")
+            if data.get("speed", 0) == 0:
+                data["speed"] = json_data.get("ship_sog", 0)
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            pass  # Ignorar errores de parseo JSON
+
+    def _completar_defaults(self, data: dict) -> dict:
+        """Valores por defecto si faltan"""
         data.setdefault("type", "N/A")
         data.setdefault("flag", "N/A")
         data.setdefault("gross_tonnage", 0)
@@ -265,7 +455,6 @@ class ImoClient:
         data.setdefault("course", 0)
         data.setdefault("lat", 0)
         data.setdefault("lon", 0)
-
         return data
 
     def _parse_int(self, value: str) -> int:
@@ -293,12 +482,12 @@ class ImoClient:
         Normaliza los datos recibidos al formato esperado por el formulario.
 
         Args:
-            data: Datos crudos del scraping o demo
+            data: Datos crudos del scraping, demo, caché o registro local
 
         Returns:
             dict con datos normalizados
         """
-        return {
+        normalizado = {
             # Datos principales
             "imo": data.get("imo", ""),
             "nombre": data.get("name", ""),
@@ -325,6 +514,9 @@ class ImoClient:
             # Metadata
             "_source": data.get("_source", ""),
         }
+        if "_cache" in data:
+            normalizado["_cache"] = data["_cache"]
+        return normalizado
 
 
 # Instancia global del cliente
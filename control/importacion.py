@@ -0,0 +1,619 @@
+"""
+Importación masiva de contenedores de un arribo (CSV, XLSX y BAPLIE).
+
+Todo el lote se valida en memoria antes de escribir: códigos ISO 6346 en lote,
+formato de sellos, tipo/tamaño y tara de TIPOS_CONTENEDOR, duplicados dentro
+del archivo y contra la BD (consultas IN por bloques) y la capacidad declarada
+del arribo, verificada una sola vez. Si alguna fila tiene errores no se
+importa nada y se retorna el reporte por fila; si no, los contenedores y sus
+sellos se insertan con bulk_create por bloques dentro de una transacción.
+
+Los lectores no dependen de librerías externas: el XLSX se lee con zipfile y
+ElementTree, y el BAPLIE (UN/EDIFACT) con el tokenizador de control/edifact.py.
+"""
+
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from decimal import Decimal, InvalidOperation
+from xml.etree import ElementTree
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import busqueda
+from .edifact import componente, segmentos_edifact
+from .iso6346 import validate_iso_6346_many
+from .models import (
+    TIPOS_CONTENEDOR,
+    Arribo,
+    Contenedor,
+    SelloContenedor,
+    Transitario,
+    validate_sellos_format,
+)
+
+# Filas por INSERT y códigos por consulta IN (bajo el límite de variables de SQLite)
+TAMANO_LOTE = 500
+TAMANO_CONSULTA = 900
+
+# Encabezado normalizado → campo del modelo (acepta los del exportador)
+ALIAS_COLUMNAS = {
+    "codigo_iso": "codigo_iso",
+    "codigo": "codigo_iso",
+    "contenedor": "codigo_iso",
+    "direccion": "direccion",
+    "tipo_tamano": "tipo_tamaño",
+    "tipo": "tipo_tamaño",
+    "peso_bruto_kg": "peso_bruto_kg",
+    "peso_bruto": "peso_bruto_kg",
+    "vgm": "peso_bruto_kg",
+    "tara_kg": "tara_kg",
+    "tara": "tara_kg",
+    "sellos": "numero_sello",
+    "numero_sello": "numero_sello",
+    "bl_referencia": "bl_referencia",
+    "bl": "bl_referencia",
+    "mercancia_declarada": "mercancia_declarada",
+    "mercancia": "mercancia_declarada",
+    "mercancia_peligrosa": "mercancia_peligrosa",
+    "imo_dg": "mercancia_peligrosa",
+    "ubicacion_actual": "ubicacion_actual",
+    "transitario": "transitario",
+    "remitente": "remitente",
+    "consignatario": "consignatario",
+    "carrier": "carrier",
+    "origen_pais": "origen_pais",
+    "origen_puerto": "origen_puerto",
+    "origen_ciudad": "origen_ciudad",
+    "destino_pais": "destino_pais",
+    "destino_puerto": "destino_puerto",
+    "destino_ciudad": "destino_ciudad",
+}
+
+# Campos de texto que se copian tal cual (con control de longitud)
+CAMPOS_TEXTO = [
+    "bl_referencia",
+    "mercancia_declarada",
+    "ubicacion_actual",
+    "remitente",
+    "consignatario",
+    "carrier",
+    "origen_pais",
+    "origen_puerto",
+    "origen_ciudad",
+    "destino_pais",
+    "destino_puerto",
+    "destino_ciudad",
+]
+
+# Campos de texto opcionales (null=True): vacío se guarda como NULL
+CAMPOS_OPCIONALES = {
+    campo
+    for campo in CAMPOS_TEXTO
+    if campo in ("remitente", "consignatario", "carrier")
+    or campo.startswith(("origen_", "destino_"))
+}
+
+DIRECCIONES = {
+    "IMPORT": "IMPORT",
+    "IMP": "IMPORT",
+    "DESCARGA": "IMPORT",
+    "EXPORT": "EXPORT",
+    "EXP": "EXPORT",
+    "CARGA": "EXPORT",
+}
+DIRECCION_POR_OPERACION = {"DESCARGA": "IMPORT", "CARGA": "EXPORT"}
+
+VALORES_VERDADEROS = {"1", "true", "si", "sí", "s", "yes", "y", "x"}
+
+MERCANCIA_NO_DECLARADA = "No declarada"
+
+
+class ErrorImportacion(Exception):
+    """El archivo no se puede leer (formato, codificación o estructura)"""
+
+
+class ResultadoImportacion:
+    """Reporte de una importación: filas leídas, creadas y errores por fila"""
+
+    def __init__(self):
+        self.filas_leidas = 0
+        self.creados = 0
+        self.errores = []  # dicts con fila, codigo_iso y mensaje
+        self.errores_generales = []
+
+    @property
+    def exitoso(self):
+        return not self.errores and not self.errores_generales
+
+    def agregar_error(self, fila, codigo_iso, mensaje):
+        self.errores.append(
+            {"fila": fila, "codigo_iso": codigo_iso, "mensaje": mensaje}
+        )
+
+
+def _normalizar_encabezado(encabezado):
+    """'Tipo/Tamaño' → 'tipo_tamano'"""
+    texto = unicodedata.normalize("NFKD", (encabezado or "").strip().lower())
+    texto = texto.encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", texto).strip("_")
+
+
+def _mapear_fila(encabezados, valores):
+    """Dict campo → texto para las columnas reconocidas"""
+    fila = {}
+    for encabezado, valor in zip(encabezados, valores):
+        campo = ALIAS_COLUMNAS.get(encabezado)
+        if campo and campo not in fila:
+            fila[campo] = "" if valor is None else str(valor).strip()
+    return fila
+
+
+# ====== LECTOR CSV ======
+def leer_csv(archivo):
+    """Itera (número de fila, dict) de un CSV con encabezados"""
+    contenido = archivo.read()
+    for codificacion in ("utf-8-sig", "cp1252"):
+        try:
+            texto = contenido.decode(codificacion)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ErrorImportacion("No se pudo decodificar el CSV (use UTF-8)")
+
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(io.StringIO(texto, newline=""), dialecto)
+    encabezados = [_normalizar_encabezado(e) for e in next(lector, [])]
+    for numero, valores in enumerate(lector, start=2):
+        if any(v.strip() for v in valores):
+            yield numero, _mapear_fila(encabezados, valores)
+
+
+# ====== LECTOR XLSX ======
+_NS_XLSX = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REF_CELDA = re.compile(r"([A-Z]+)(\d+)")
+
+
+def _indice_columna(referencia):
+    """'C7' → 2"""
+    letras = _REF_CELDA.match(referencia).group(1)
+    indice = 0
+    for letra in letras:
+        indice = indice * 26 + (ord(letra) - 64)
+    return indice - 1
+
+
+def _texto_xml(elemento):
+    return "".join(t.text or "" for t in elemento.iter(f"{_NS_XLSX}t"))
+
+
+def _valor_celda(celda, compartidos):
+    tipo = celda.get("t")
+    if tipo == "inlineStr":
+        return _texto_xml(celda)
+    valor = celda.findtext(f"{_NS_XLSX}v")
+    if valor is None:
+        return ""
+    if tipo == "s":
+        return compartidos[int(valor)]
+    if tipo == "b":
+        return "1" if valor == "1" else "0"
+    # Números enteros guardados como float ("22000.0")
+    if tipo in (None, "n") and valor.endswith(".0"):
+        return valor[:-2]
+    return valor
+
+
+def leer_xlsx(archivo):
+    """Itera (número de fila, dict) de la primera hoja de un XLSX"""
+    try:
+        libro = zipfile.ZipFile(archivo)
+    except zipfile.BadZipFile:
+        raise ErrorImportacion("El archivo no es un XLSX válido")
+
+    with libro:
+        nombres = libro.namelist()
+        hojas = sorted(
+            n for n in nombres if re.match(r"xl/worksheets/sheet\d+\.xml$", n)
+        )
+        if not hojas:
+            raise ErrorImportacion("El XLSX no contiene hojas")
+        hoja = hojas[0]
+        if "xl/worksheets/sheet1.xml" in nombres:
+            hoja = "xl/worksheets/sheet1.xml"
+
+        compartidos = []
+        if "xl/sharedStrings.xml" in nombres:
+            raiz = ElementTree.fromstring(libro.read("xl/sharedStrings.xml"))
+            compartidos = [_texto_xml(si) for si in raiz.iter(f"{_NS_XLSX}si")]
+
+        encabezados = None
+        with libro.open(hoja) as contenido:
+            # iterparse: la hoja se recorre fila a fila sin cargarla completa
+            for _, elemento in ElementTree.iterparse(contenido):
+                if elemento.tag != f"{_NS_XLSX}row":
+                    continue
+                valores = {}
+                for celda in elemento.iter(f"{_NS_XLSX}c"):
+                    referencia = celda.get("r")
+                    indice = _indice_columna(referencia) if referencia else len(valores)
+                    valores[indice] = _valor_celda(celda, compartidos)
+                numero = int(elemento.get("r") or 0)
+                elemento.clear()
+                if not valores:
+                    continue
+                fila = [valores.get(i, "") for i in range(max(valores) + 1)]
+                if encabezados is None:
+                    encabezados = [_normalizar_encabezado(e) for e in fila]
+                    continue
+                if any(v.strip() for v in fila):
+                    yield numero, _mapear_fila(encabezados, fila)
+
+
+# ====== LECTOR BAPLIE (UN/EDIFACT) ======
+def leer_baplie(archivo):
+    """
+    Itera (número de contenedor, dict) de un BAPLIE. Cada contenedor empieza
+    en su posición de estiba (LOC+147) y toma:
+    EQD+CN (código y tipo), MEA+WT/VGM (peso), LOC+9/11 (carga/descarga),
+    RFF+BM (BL), NAD+CA (naviera), SEL (sellos), FTX+AAA (mercancía), DGS.
+    """
+    texto = archivo.read().decode("latin-1")
+    if "EQD" not in texto:
+        raise ErrorImportacion("El archivo no contiene segmentos EQD de BAPLIE")
+
+    actual, sellos, numero = None, [], 0
+
+    def cerrar():
+        if actual and actual.get("codigo_iso"):
+            if sellos:
+                actual["numero_sello"] = "|".join(
+                    f"NAVIERA:{codigo}{'*' if i == 0 else ''}"
+                    for i, codigo in enumerate(sellos)
+                )
+            return numero, actual
+        return None
+
+    for segmento in segmentos_edifact(texto):
+        etiqueta = segmento[0][0]
+        calificador = componente(segmento, 1)
+        if etiqueta == "LOC" and calificador == "147":
+            registro = cerrar()
+            if registro:
+                yield registro
+            numero += 1
+            actual, sellos = {"ubicacion_actual": f"Bahía {componente(segmento, 2)}"}, []
+        elif etiqueta == "UNT":
+            registro = cerrar()
+            if registro:
+                yield registro
+            actual, sellos = None, []
+        elif actual is None:
+            continue
+        elif etiqueta == "EQD" and calificador == "CN":
+            actual["codigo_iso"] = componente(segmento, 2)
+            actual["tipo_tamaño"] = componente(segmento, 3)
+        elif etiqueta == "MEA" and calificador in ("WT", "VGM", "AAE"):
+            actual["peso_bruto_kg"] = componente(segmento, 3, 1)
+        elif etiqueta == "LOC" and calificador == "9":
+            actual["origen_puerto"] = componente(segmento, 2)
+        elif etiqueta == "LOC" and calificador in ("11", "83"):
+            actual["destino_puerto"] = componente(segmento, 2)
+        elif etiqueta == "RFF" and calificador == "BM":
+            actual["bl_referencia"] = componente(segmento, 1, 1)
+        elif etiqueta == "NAD" and calificador == "CA":
+            actual["carrier"] = componente(segmento, 2)
+        elif etiqueta == "SEL" and componente(segmento, 1):
+            sellos.append(componente(segmento, 1))
+        elif etiqueta == "FTX" and calificador == "AAA":
+            actual["mercancia_declarada"] = componente(segmento, 4)
+        elif etiqueta == "DGS":
+            actual["mercancia_peligrosa"] = "1"
+
+    registro = cerrar()
+    if registro:
+        yield registro
+
+
+# Formato → (lector, extensiones)
+FORMATOS = {
+    "csv": (leer_csv, (".csv", ".txt")),
+    "xlsx": (leer_xlsx, (".xlsx",)),
+    "baplie": (leer_baplie, (".edi", ".baplie", ".edifact")),
+}
+
+
+def detectar_formato(nombre_archivo):
+    """Formato según la extensión del archivo (None si no se reconoce)"""
+    nombre = (nombre_archivo or "").lower()
+    for formato, (_, extensiones) in FORMATOS.items():
+        if nombre.endswith(extensiones):
+            return formato
+    return None
+
+
+# ====== VALIDACIÓN EN LOTE ======
+def _por_bloques(valores, tamano=TAMANO_CONSULTA):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio : inicio + tamano]
+
+
+def _decimal(valor):
+    texto = (valor or "").strip().replace(" ", "")
+    if "," in texto and "." not in texto:
+        texto = texto.replace(",", ".")
+    return Decimal(texto)
+
+
+def _codigos_sello(numero_sello):
+    """Mismo criterio que Contenedor.get_codigos_sello"""
+    return Contenedor(numero_sello=numero_sello).get_codigos_sello()
+
+
+class _Transitarios:
+    """Búsqueda de transitarios por RUC o razón social (una sola consulta)"""
+
+    def __init__(self):
+        self._indice = None
+
+    def buscar(self, valor):
+        if self._indice is None:
+            self._indice = {}
+            for pk, ruc, razon, comercial in Transitario.objects.values_list(
+                "pk", "identificador_tributario", "razon_social", "nombre_comercial"
+            ):
+                for clave in (ruc, razon, comercial):
+                    if clave:
+                        self._indice.setdefault(clave.strip().upper(), pk)
+        return self._indice.get(valor.strip().upper())
+
+
+def _construir(arribo, filas, direccion_por_defecto, resultado):
+    """
+    Valida cada fila por separado y arma los Contenedor en memoria.
+
+    Returns:
+        Lista de (número de fila, Contenedor) de todas las filas, también las
+        que tienen errores: cuentan para duplicados y capacidad
+    """
+    transitarios = _Transitarios()
+    iso = validate_iso_6346_many(fila.get("codigo_iso", "") for _, fila in filas)
+    longitudes = {
+        campo: Contenedor._meta.get_field(campo).max_length for campo in CAMPOS_TEXTO
+    }
+    construidos = []
+
+    for (numero, fila), validacion in zip(filas, iso):
+        errores = []
+        codigo = validacion.codigo
+        if validacion.error:
+            mensaje = validacion.error
+            if validacion.digito_sugerido is not None and len(codigo) == 11:
+                mensaje += f" ¿Quiso decir {codigo[:10]}{validacion.digito_sugerido}?"
+            errores.append(mensaje)
+
+        direccion = DIRECCIONES.get(
+            fila.get("direccion", "").upper(), direccion_por_defecto
+        )
+        if fila.get("direccion") and fila["direccion"].upper() not in DIRECCIONES:
+            errores.append(f"Dirección '{fila['direccion']}' no válida (IMPORT/EXPORT)")
+        elif not direccion:
+            errores.append("Falta la dirección (IMPORT/EXPORT)")
+
+        tipo = fila.get("tipo_tamaño", "").upper()
+        if tipo not in TIPOS_CONTENEDOR:
+            errores.append(f"Tipo/tamaño '{tipo}' no reconocido")
+
+        peso = tara = None
+        try:
+            peso = _decimal(fila.get("peso_bruto_kg"))
+            if peso <= 0:
+                raise InvalidOperation
+        except (InvalidOperation, ValueError):
+            errores.append(f"Peso bruto '{fila.get('peso_bruto_kg', '')}' no válido")
+            peso = None
+        if fila.get("tara_kg"):
+            try:
+                tara = _decimal(fila["tara_kg"])
+            except (InvalidOperation, ValueError):
+                errores.append(f"Tara '{fila['tara_kg']}' no válida")
+        elif tipo in TIPOS_CONTENEDOR:
+            tara = Decimal(TIPOS_CONTENEDOR[tipo]["tara_kg"])
+        if peso is not None and tara is not None and peso < tara:
+            errores.append("El peso bruto no puede ser menor que la tara")
+
+        numero_sello = fila.get("numero_sello", "")
+        try:
+            validate_sellos_format(numero_sello)
+        except ValidationError as e:
+            errores.extend(e.messages)
+
+        textos = {campo: fila.get(campo, "") for campo in CAMPOS_TEXTO}
+        textos["mercancia_declarada"] = (
+            textos["mercancia_declarada"] or MERCANCIA_NO_DECLARADA
+        )
+        textos["ubicacion_actual"] = textos["ubicacion_actual"] or arribo.muelle_berth
+        if not textos["bl_referencia"]:
+            errores.append("Falta el BL de referencia")
+        for campo, valor in textos.items():
+            if len(valor) > longitudes[campo]:
+                errores.append(
+                    f"{Contenedor._meta.get_field(campo).verbose_name}: "
+                    f"máximo {longitudes[campo]} caracteres"
+                )
+
+        transitario_id = None
+        if fila.get("transitario"):
+            transitario_id = transitarios.buscar(fila["transitario"])
+            if transitario_id is None:
+                errores.append(f"Transitario '{fila['transitario']}' no registrado")
+
+        for mensaje in errores:
+            resultado.agregar_error(numero, codigo, mensaje)
+
+        construidos.append(
+            (
+                numero,
+                Contenedor(
+                    arribo=arribo,
+                    transitario_id=transitario_id,
+                    direccion=direccion,
+                    codigo_iso=codigo,
+                    bic_propietario=codigo[:3],
+                    tipo_tamaño=tipo,
+                    peso_bruto_kg=peso,
+                    tara_kg=tara,
+                    numero_sello=numero_sello.strip(),
+                    mercancia_peligrosa=fila.get("mercancia_peligrosa", "").lower()
+                    in VALORES_VERDADEROS,
+                    **{
+                        campo: (valor or None) if campo in CAMPOS_OPCIONALES else valor
+                        for campo, valor in textos.items()
+                    },
+                ),
+            )
+        )
+    return construidos
+
+
+def _validar_duplicados(construidos, resultado):
+    """Códigos y sellos repetidos en el archivo o ya registrados en la BD"""
+    primera_fila, sellos_en_archivo = {}, {}
+    for numero, contenedor in construidos:
+        codigo = contenedor.codigo_iso
+        if codigo in primera_fila:
+            resultado.agregar_error(
+                numero,
+                codigo,
+                f"Código repetido en el archivo (fila {primera_fila[codigo]})",
+            )
+        elif codigo:
+            primera_fila[codigo] = numero
+        for sello in _codigos_sello(contenedor.numero_sello):
+            if sello in sellos_en_archivo:
+                resultado.agregar_error(
+                    numero,
+                    codigo,
+                    f"🚨 El sello '{sello}' se repite en el archivo "
+                    f"(fila {sellos_en_archivo[sello][0]})",
+                )
+            else:
+                sellos_en_archivo[sello] = (numero, codigo)
+
+    for bloque in _por_bloques(primera_fila):
+        for codigo in Contenedor.objects.filter(codigo_iso__in=bloque).values_list(
+            "codigo_iso", flat=True
+        ):
+            resultado.agregar_error(
+                primera_fila[codigo], codigo, "El contenedor ya está registrado"
+            )
+
+    for bloque in _por_bloques(sellos_en_archivo):
+        for sello, codigo_iso in SelloContenedor.objects.filter(
+            codigo__in=bloque
+        ).values_list("codigo", "contenedor__codigo_iso"):
+            numero, codigo = sellos_en_archivo[sello]
+            resultado.agregar_error(
+                numero,
+                codigo,
+                f"🚨 ALERTA: El sello '{sello}' ya está registrado en el "
+                f"contenedor {codigo_iso}.",
+            )
+
+
+def _validar_capacidad(arribo, construidos, resultado):
+    """Registrados + importados no pueden superar lo declarado en el arribo"""
+    nuevos = {}
+    for _, contenedor in construidos:
+        if contenedor.direccion:
+            nuevos[contenedor.direccion] = nuevos.get(contenedor.direccion, 0) + 1
+
+    for direccion, cantidad in nuevos.items():
+        _, campo_capacidad, texto = Arribo.CUPOS_POR_DIRECCION[direccion]
+        capacidad = getattr(arribo, campo_capacidad)
+        existentes = arribo.contenedores_registrados(direccion)
+        if existentes + cantidad > capacidad:
+            resultado.errores_generales.append(
+                f"El arribo '{arribo}' declara {capacidad} contenedores de {texto}: "
+                f"ya tiene {existentes} registrados y el archivo agrega {cantidad}."
+            )
+    return nuevos
+
+
+def importar_contenedores(
+    arribo, archivo, formato, direccion_por_defecto=None, tamano_lote=TAMANO_LOTE
+):
+    """
+    Importa los contenedores de un archivo a un arribo (todo o nada).
+
+    Args:
+        arribo: Arribo de destino
+        archivo: archivo binario (upload de Django o archivo abierto en 'rb')
+        formato: 'csv', 'xlsx' o 'baplie'
+        direccion_por_defecto: IMPORT/EXPORT para filas sin dirección
+            (por defecto, según el tipo de operación del arribo)
+
+    Returns:
+        ResultadoImportacion
+    """
+    resultado = ResultadoImportacion()
+    if formato not in FORMATOS:
+        resultado.errores_generales.append(f"Formato '{formato}' no soportado")
+        return resultado
+    direccion_por_defecto = direccion_por_defecto or DIRECCION_POR_OPERACION.get(
+        arribo.tipo_operacion
+    )
+
+    lector, _ = FORMATOS[formato]
+    try:
+        filas = list(lector(archivo))
+    except (ErrorImportacion, csv.Error, ElementTree.ParseError, KeyError) as e:
+        resultado.errores_generales.append(f"No se pudo leer el archivo: {e}")
+        return resultado
+    resultado.filas_leidas = len(filas)
+    if not filas:
+        resultado.errores_generales.append("El archivo no contiene contenedores")
+        return resultado
+
+    with transaction.atomic():
+        # Bloquea el arribo: dos importaciones simultáneas no superan la capacidad
+        arribo = Arribo.objects.select_for_update().get(pk=arribo.pk)
+        construidos = _construir(arribo, filas, direccion_por_defecto, resultado)
+        _validar_duplicados(construidos, resultado)
+        nuevos = _validar_capacidad(arribo, construidos, resultado)
+        if not resultado.exitoso:
+            resultado.errores.sort(key=lambda error: error["fila"])
+            return resultado
+
+        contenedores = [contenedor for _, contenedor in construidos]
+        Contenedor.objects.bulk_create(contenedores, batch_size=tamano_lote)
+        # bulk_create no pasa por save(): los contadores se actualizan aquí
+        for direccion, cantidad in nuevos.items():
+            Arribo.reservar_cupo(arribo.pk, direccion, cantidad)
+        if any(contenedor.pk is None for contenedor in contenedores):
+            # Backends sin RETURNING en inserciones masivas
+            ids = dict(
+                Contenedor.objects.filter(arribo=arribo).values_list("codigo_iso", "pk")
+            )
+            for contenedor in contenedores:
+                contenedor.pk = ids[contenedor.codigo_iso]
+        SelloContenedor.objects.bulk_create(
+            [
+                sello
+                for contenedor in contenedores
+                for sello in SelloContenedor.desde_contenedor(contenedor)
+            ],
+            batch_size=tamano_lote,
+        )
+        busqueda.indexar(*contenedores)
+        resultado.creados = len(contenedores)
+
+    return resultado
@@ -0,0 +1,489 @@
+"""
+Ingesta de eventos de contenedor en lote (EDIFACT COARRI/CODECO y CSV).
+
+Los mensajes del sistema operativo de la terminal se leen en streaming y se
+agrupan por contenedor. El estado de todos los contenedores afectados (dirección,
+tipos ya registrados, último evento y snapshot de bloqueo) se carga con unas
+pocas consultas por bloques, las reglas de EventoContenedor.validar_reglas se
+evalúan en memoria aplicando los eventos en orden cronológico, y los eventos
+válidos se insertan con bulk_create. El estado de cada contenedor se escribe
+una sola vez (bulk_update), y listo_para_retiro se recalcula solo para los
+contenedores cuyo bloqueo cambió.
+
+A diferencia de la importación de contenedores, la ingesta no es todo o nada:
+los eventos inválidos se rechazan uno por uno y el resto se registra.
+"""
+
+import csv
+import io
+import itertools
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache_tracking
+from .edifact import componente, segmentos_edifact
+from .models import Buque, Contenedor, EventoContenedor
+
+TAMANO_LOTE = 500
+TAMANO_CONSULTA = 900
+TAMANO_TROZO = 64 * 1024  # caracteres por lectura de archivos EDIFACT
+
+# Evento leído de un mensaje; 'error' indica que no se pudo interpretar
+EventoEntrante = namedtuple(
+    "EventoEntrante",
+    [
+        "referencia",
+        "codigo_iso",
+        "tipo_evento",
+        "fecha_hora",
+        "ubicacion_puerto",
+        "ubicacion_ciudad",
+        "ubicacion_pais",
+        "imo",
+        "referencia_viaje",
+        "medio_transporte",
+        "notas",
+        "error",
+    ],
+    defaults=("", None, "", "", "", "", "", "", "", None),
+)
+
+# (tipo de mensaje, código BGM) → (evento con contenedor lleno, evento vacío)
+EVENTOS_EDIFACT = {
+    ("COARRI", "44"): ("DISCHARGED", "DISCHARGED"),  # Discharge report
+    ("COARRI", "46"): ("LOADED", "LOADED"),  # Loading report
+    ("CODECO", "34"): ("GATE_IN_FULL", "GATE_IN_EMPTY"),  # Gate-in report
+    ("CODECO", "36"): ("GATE_OUT_FULL", "GATE_OUT_EMPTY"),  # Gate-out report
+}
+
+# Indicador lleno/vacío de EQD (elemento 6)
+EQD_VACIO = "4"
+
+# Formatos de fecha de DTM (código 2379) → formato strptime
+FORMATOS_DTM = {
+    "102": "%Y%m%d",
+    "203": "%Y%m%d%H%M",
+    "204": "%Y%m%d%H%M%S",
+}
+# Calificadores de fecha de ejecución del movimiento, en orden de preferencia
+CALIFICADORES_DTM = ("203", "7", "178", "132")
+
+
+class ResultadoIngesta:
+    """Reporte de una ingesta: eventos recibidos, registrados y rechazados"""
+
+    def __init__(self):
+        self.recibidos = 0
+        self.creados = 0
+        self.contenedores_actualizados = 0
+        self.rechazados = []  # dicts con referencia, codigo_iso, tipo_evento y mensaje
+
+    def rechazar(self, evento, mensaje):
+        self.rechazados.append(
+            {
+                "referencia": evento.referencia,
+                "codigo_iso": evento.codigo_iso,
+                "tipo_evento": evento.tipo_evento,
+                "mensaje": mensaje,
+            }
+        )
+
+    def a_dict(self):
+        return {
+            "recibidos": self.recibidos,
+            "creados": self.creados,
+            "rechazados": len(self.rechazados),
+            "contenedores_actualizados": self.contenedores_actualizados,
+            "errores": self.rechazados,
+        }
+
+
+def _fecha_local(naive):
+    return timezone.make_aware(naive) if timezone.is_naive(naive) else naive
+
+
+# ====== LECTOR EDIFACT (COARRI / CODECO) ======
+def _fecha_dtm(segmento):
+    valor, formato = componente(segmento, 1, 1), componente(segmento, 1, 2) or "203"
+    if formato not in FORMATOS_DTM:
+        raise ValueError(f"formato DTM '{formato}' no soportado")
+    return _fecha_local(datetime.strptime(valor, FORMATOS_DTM[formato]))
+
+
+def leer_edifact(trozos):
+    """
+    Itera los EventoEntrante de un intercambio COARRI/CODECO: un evento por
+    contenedor (EQD+CN) de cada mensaje (UNH...UNT).
+
+    Args:
+        trozos: texto o iterable de trozos de texto
+    """
+    mensaje = None
+    equipo = None
+
+    def cerrar_equipo():
+        if equipo is None:
+            return None
+        referencia = f"Mensaje {mensaje['referencia']} / {equipo['codigo_iso']}"
+        eventos = EVENTOS_EDIFACT.get((mensaje["tipo"], mensaje["bgm"]))
+        if eventos is None:
+            return EventoEntrante(
+                referencia,
+                equipo["codigo_iso"],
+                error=f"Mensaje {mensaje['tipo']} con BGM '{mensaje['bgm']}' no soportado",
+            )
+        fecha = equipo.get("fecha") or mensaje.get("fecha")
+        error = equipo.get("error") or (
+            mensaje.get("error") if "fecha" not in equipo else None
+        )
+        if error or fecha is None:
+            return EventoEntrante(
+                referencia,
+                equipo["codigo_iso"],
+                error=error or "El mensaje no indica fecha del movimiento",
+            )
+        return EventoEntrante(
+            referencia,
+            equipo["codigo_iso"],
+            eventos[1] if equipo["lleno_vacio"] == EQD_VACIO else eventos[0],
+            fecha,
+            imo=mensaje.get("imo", ""),
+            referencia_viaje=mensaje.get("viaje", ""),
+            notas=f"EDI {mensaje['tipo']} {mensaje.get('documento', '')}".strip(),
+        )
+
+    for segmento in segmentos_edifact(trozos):
+        etiqueta = segmento[0][0]
+        if etiqueta == "UNH":
+            mensaje = {
+                "referencia": componente(segmento, 1),
+                "tipo": componente(segmento, 2).upper(),
+                "bgm": "",
+            }
+            equipo = None
+            continue
+        if mensaje is None:
+            continue
+
+        if etiqueta in ("EQD", "CNT", "UNT"):
+            evento = cerrar_equipo()
+            if evento:
+                yield evento
+            equipo = None
+            if etiqueta == "UNT":
+                mensaje = None
+            elif etiqueta == "EQD" and componente(segmento, 1) == "CN":
+                equipo = {
+                    "codigo_iso": componente(segmento, 2).upper(),
+                    "lleno_vacio": componente(segmento, 6),
+                }
+        elif etiqueta == "BGM":
+            mensaje["bgm"] = componente(segmento, 1)
+            mensaje["documento"] = componente(segmento, 2)
+        elif etiqueta == "TDT":
+            mensaje["viaje"] = componente(segmento, 2)
+            if componente(segmento, 8, 1) in ("146", ""):
+                mensaje["imo"] = componente(segmento, 8)
+        elif etiqueta == "DTM":
+            calificador = componente(segmento, 1)
+            destino = equipo if equipo is not None else mensaje
+            # A nivel de mensaje también sirve la fecha del documento (137)
+            aceptados = CALIFICADORES_DTM + (("137",) if equipo is None else ())
+            if calificador in aceptados and (
+                "fecha" not in destino or calificador == "203"
+            ):
+                try:
+                    destino["fecha"] = _fecha_dtm(segmento)
+                except ValueError as e:
+                    destino["error"] = f"Fecha DTM inválida: {e}"
+
+    evento = cerrar_equipo() if mensaje else None
+    if evento:
+        yield evento
+
+
+# ====== LECTOR CSV ======
+COLUMNAS_CSV = [
+    "codigo_iso",
+    "tipo_evento",
+    "fecha_hora",
+    "ubicacion_puerto",
+    "ubicacion_ciudad",
+    "ubicacion_pais",
+    "imo",
+    "referencia_viaje",
+    "medio_transporte",
+    "notas",
+]
+
+
+def leer_csv(lineas):
+    """
+    Itera los EventoEntrante de un CSV con encabezados (COLUMNAS_CSV).
+    fecha_hora en ISO 8601; sin zona horaria se toma la hora local.
+
+    Args:
+        lineas: texto o iterable de líneas de texto
+    """
+    if isinstance(lineas, str):
+        lineas = io.StringIO(lineas.lstrip("\ufeff"), newline="")
+    for numero, fila in enumerate(csv.DictReader(lineas), start=2):
+        fila = {
+            (clave or "").strip().lstrip("\ufeff").lower(): (valor or "").strip()
+            for clave, valor in fila.items()
+        }
+        if not any(fila.values()):
+            continue
+        datos = {columna: fila.get(columna, "") for columna in COLUMNAS_CSV}
+        datos["codigo_iso"] = datos["codigo_iso"].upper()
+        datos["tipo_evento"] = datos["tipo_evento"].upper()
+        datos["medio_transporte"] = datos["medio_transporte"].upper()
+        try:
+            fecha = parse_datetime(datos["fecha_hora"])
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            yield EventoEntrante(
+                f"Línea {numero}",
+                datos["codigo_iso"],
+                datos["tipo_evento"],
+                error=f"Fecha '{datos['fecha_hora']}' inválida (use ISO 8601)",
+            )
+            continue
+        datos["fecha_hora"] = _fecha_local(fecha)
+        yield EventoEntrante(f"Línea {numero}", **datos)
+
+
+FORMATOS = {"edifact": leer_edifact, "csv": leer_csv}
+
+
+def detectar_formato(inicio):
+    """'edifact' si el contenido empieza con UNA/UNB/UNH, si no 'csv'"""
+    return "edifact" if inicio.lstrip()[:3] in ("UNA", "UNB", "UNH") else "csv"
+
+
+# ====== REGISTRO EN LOTE ======
+def _por_bloques(valores, tamano=TAMANO_CONSULTA):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio : inicio + tamano]
+
+
+def _cargar_estado(codigos):
+    """
+    Estado actual de los contenedores por código ISO, bloqueando sus filas
+    hasta el fin de la transacción. Dos consultas por bloque de códigos.
+    """
+    campos = EventoContenedor.CAMPOS_ESTADO_CONTENEDOR
+    bits = EventoContenedor.TRANSICIONES.bits
+    contenedores = {}
+    for bloque in _por_bloques(codigos):
+        filas = (
+            Contenedor.objects.select_for_update(of=("self",))
+            .filter(codigo_iso__in=bloque)
+            .values("pk", "codigo_iso", "direccion", "arribo__buque_id", *campos)
+        )
+        por_id = {}
+        for fila in filas:
+            por_id[fila["pk"]] = {
+                "pk": fila["pk"],
+                "direccion": fila["direccion"],
+                "buque_arribo_id": fila["arribo__buque_id"],
+                "estado": {campo: fila[campo] for campo in campos},
+                "tipos": 0,  # máscara de tipos registrados (TRANSICIONES)
+                "ultimo": None,
+            }
+            contenedores[fila["codigo_iso"]] = por_id[fila["pk"]]
+
+        for contenedor_id, tipo, fecha in EventoContenedor.objects.filter(
+            contenedor_id__in=por_id
+        ).values_list("contenedor_id", "tipo_evento", "fecha_hora"):
+            datos = por_id[contenedor_id]
+            datos["tipos"] |= bits.get(tipo, 0)
+            if datos["ultimo"] is None or fecha >= datos["ultimo"][1]:
+                datos["ultimo"] = (tipo, fecha)
+    return contenedores
+
+
+def registrar_eventos_en_lote(eventos, tamano_lote=TAMANO_LOTE):
+    """
+    Valida y registra eventos de contenedor en lote.
+
+    Args:
+        eventos: iterable de EventoEntrante (se consume una sola vez)
+
+    Returns:
+        ResultadoIngesta
+    """
+    resultado = ResultadoIngesta()
+    tipos_validos = dict(EventoContenedor.TIPO_EVENTO_CHOICES)
+    medios_validos = dict(EventoContenedor.MEDIO_TRANSPORTE_CHOICES)
+    puerto_local = settings.SIGEP_PUERTO_LOCAL
+
+    por_contenedor = defaultdict(list)
+    for evento in eventos:
+        resultado.recibidos += 1
+        if evento.error:
+            resultado.rechazar(evento, evento.error)
+        elif evento.tipo_evento not in tipos_validos:
+            resultado.rechazar(evento, f"Tipo de evento '{evento.tipo_evento}' no válido")
+        elif evento.medio_transporte and evento.medio_transporte not in medios_validos:
+            resultado.rechazar(
+                evento, f"Medio de transporte '{evento.medio_transporte}' no válido"
+            )
+        else:
+            por_contenedor[evento.codigo_iso].append(evento)
+    if not por_contenedor:
+        return resultado
+
+    imos = {e.imo for lista in por_contenedor.values() for e in lista if e.imo}
+    buques = {}
+    for bloque in _por_bloques(imos):
+        buques.update(
+            Buque.objects.filter(imo_number__in=bloque).values_list("imo_number", "pk")
+        )
+
+    with transaction.atomic():
+        contenedores = _cargar_estado(por_contenedor)
+        nuevos, actualizados, bloqueo_cambiado = [], [], []
+        con_eventos = []
+
+        for codigo_iso, lista in por_contenedor.items():
+            datos = contenedores.get(codigo_iso)
+            if datos is None:
+                for evento in lista:
+                    resultado.rechazar(evento, "Contenedor no registrado")
+                continue
+            registrados_antes = len(nuevos)
+
+            estado_inicial = datos["estado"]
+            estado = estado_inicial
+            # Orden cronológico estable: respeta el orden de llegada en empates
+            for entrante in sorted(lista, key=lambda e: e.fecha_hora):
+                if entrante.imo and entrante.imo not in buques:
+                    resultado.rechazar(
+                        entrante, f"Buque con IMO {entrante.imo} no registrado"
+                    )
+                    continue
+                buque_id = buques.get(entrante.imo) or (
+                    datos["buque_arribo_id"]
+                    if entrante.tipo_evento in EventoContenedor.EVENTOS_MARITIMOS
+                    else None
+                )
+                es_local = entrante.tipo_evento in EventoContenedor.EVENTOS_LOCALES
+                evento = EventoContenedor(
+                    contenedor_id=datos["pk"],
+                    tipo_evento=entrante.tipo_evento,
+                    fecha_hora=entrante.fecha_hora,
+                    ubicacion_puerto=entrante.ubicacion_puerto
+                    or (puerto_local["puerto"] if es_local else ""),
+                    ubicacion_ciudad=entrante.ubicacion_ciudad
+                    or (puerto_local["ciudad"] if es_local else None),
+                    ubicacion_pais=entrante.ubicacion_pais
+                    or (puerto_local["pais"] if es_local else ""),
+                    buque_id=buque_id,
+                    medio_transporte=entrante.medio_transporte or None,
+                    referencia_viaje=entrante.referencia_viaje or None,
+                    notas=entrante.notas,
+                )
+                evento.completar_campos_automaticos()
+
+                errores = EventoContenedor.validar_reglas(
+                    tipo_evento=evento.tipo_evento,
+                    fecha_hora=evento.fecha_hora,
+                    direccion=datos["direccion"],
+                    eventos_existentes=datos["tipos"],
+                    ultimo_evento=datos["ultimo"],
+                    buque_id=evento.buque_id,
+                    medio_transporte=evento.medio_transporte,
+                )
+                if not evento.ubicacion_puerto:
+                    errores["ubicacion_puerto"] = "Falta la ubicación del evento"
+                if errores:
+                    resultado.rechazar(entrante, " | ".join(errores.values()))
+                    continue
+
+                nuevos.append(evento)
+                datos["tipos"] |= EventoContenedor.TRANSICIONES.bits[evento.tipo_evento]
+                datos["ultimo"] = (evento.tipo_evento, evento.fecha_hora)
+                estado = EventoContenedor.aplicar_evento(
+                    estado,
+                    *(getattr(evento, campo) for campo in EventoContenedor.CAMPOS_HISTORIAL),
+                )
+
+            if len(nuevos) > registrados_antes:
+                con_eventos.append(codigo_iso)
+            if estado is not estado_inicial:
+                actualizados.append(Contenedor(pk=datos["pk"], **estado))
+                if estado["bloqueado_por_evento"] != estado_inicial["bloqueado_por_evento"]:
+                    bloqueo_cambiado.append(datos["pk"])
+
+        EventoContenedor.objects.bulk_create(nuevos, batch_size=tamano_lote)
+        # Estado derivado: una escritura por contenedor (en lotes)
+        Contenedor.objects.bulk_update(
+            actualizados,
+            list(EventoContenedor.CAMPOS_ESTADO_CONTENEDOR),
+            batch_size=tamano_lote,
+        )
+        for bloque in _por_bloques(bloqueo_cambiado):
+            Contenedor.objects.filter(pk__in=bloque).recalcular_listo_para_retiro()
+        # bulk_create/bulk_update no emiten señales: invalidar a mano
+        cache_tracking.invalidar(*con_eventos)
+
+    resultado.creados = len(nuevos)
+    resultado.contenedores_actualizados = len(actualizados)
+    return resultado
+
+
+def ingerir_archivo(archivo, formato=None, tamano_lote=TAMANO_LOTE):
+    """
+    Lee un archivo binario en streaming y registra sus eventos en lote.
+
+    Args:
+        archivo: archivo binario abierto (ruta local o UploadedFile)
+        formato: 'edifact' o 'csv'; None lo detecta por el contenido
+
+    Returns:
+        ResultadoIngesta
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", errors="replace", newline="")
+    inicio = texto.read(TAMANO_TROZO)
+    formato = formato or detectar_formato(inicio)
+    if formato == "edifact":
+        entrada = itertools.chain(
+            [inicio], iter(lambda: texto.read(TAMANO_TROZO), "")
+        )
+    else:
+        # El primer trozo puede cortar una línea: se completa con el resto
+        entrada = itertools.chain(
+            io.StringIO(inicio + texto.readline(), newline=""), texto
+        )
+    try:
+        return registrar_eventos_en_lote(FORMATOS[formato](entrada), tamano_lote)
+    finally:
+        # El archivo subyacente lo cierra quien lo abrió
+        texto.detach()
+
+
+def registrar_evento_masivo(codigos_iso, tipo_evento, fecha_hora, **datos):
+    """
+    Aplica una misma plantilla de evento (p. ej. ARRIVED o DEPARTED de un
+    buque) a muchos contenedores, validando y registrando en lote.
+
+    Args:
+        codigos_iso: códigos de los contenedores
+        datos: demás campos de EventoEntrante (ubicacion_*, imo,
+            referencia_viaje, medio_transporte, notas)
+
+    Returns:
+        ResultadoIngesta
+    """
+    return registrar_eventos_en_lote(
+        EventoEntrante("Evento masivo", codigo_iso, tipo_evento, fecha_hora, **datos)
+        for codigo_iso in codigos_iso
+    )
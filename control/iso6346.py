@@ -0,0 +1,175 @@
+"""
+Motor de validación ISO 6346 (códigos de contenedor) con tablas precalculadas.
+
+El aporte de cada carácter a la suma de control, (valor × 2^posición) mód 11,
+se calcula una sola vez por posición al importar el módulo, así validar un
+código se reduce a 10 búsquedas en diccionarios y una suma.
+
+validate_iso_6346_many valida lotes completos (manifiestos de miles de
+contenedores) y, si NumPy está instalado, calcula los dígitos verificadores
+del lote en forma vectorizada.
+"""
+
+import re
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa la ruta en Python puro
+    np = None
+
+# Tabla de equivalencias ISO 6346 para letras
+# Las letras tienen valores específicos (saltando múltiplos de 11)
+VALORES_LETRAS = {
+    "A": 10,
+    "B": 12,
+    "C": 13,
+    "D": 14,
+    "E": 15,
+    "F": 16,
+    "G": 17,
+    "H": 18,
+    "I": 19,
+    "J": 20,
+    "K": 21,
+    "L": 23,
+    "M": 24,
+    "N": 25,
+    "O": 26,
+    "P": 27,
+    "Q": 28,
+    "R": 29,
+    "S": 30,
+    "T": 31,
+    "U": 32,
+    "V": 34,
+    "W": 35,
+    "X": 36,
+    "Y": 37,
+    "Z": 38,
+}
+VALORES = {**VALORES_LETRAS, **{str(d): d for d in range(10)}}
+
+# Peso de cada una de las 10 posiciones que entran en la suma (2^posición)
+PESOS = tuple(2**i for i in range(10))
+
+# Aporte a la suma mód 11 de cada carácter en cada posición
+_APORTES = tuple(
+    {caracter: (valor * peso) % 11 for caracter, valor in VALORES.items()}
+    for peso in PESOS
+)
+
+# Misma tabla indexada por código ASCII, para la ruta vectorizada
+if np is not None:
+    _VALORES_ASCII = np.zeros(128, dtype=np.int64)
+    for _caracter, _valor in VALORES.items():
+        _VALORES_ASCII[ord(_caracter)] = _valor
+    _PESOS_NUMPY = np.array(PESOS, dtype=np.int64)
+
+CATEGORIAS = ("U", "J", "Z")
+
+# Lotes desde este tamaño usan NumPy (si está disponible)
+UMBRAL_NUMPY = 256
+
+_PREFIJO = re.compile(r"[A-Z]{4}[0-9]{6}")
+_FORMATO = re.compile(r"[A-Z]{4}[0-9]{7}")
+
+# Resultado de validar un código:
+# - codigo: código normalizado (mayúsculas, sin espacios)
+# - error: mensaje de error o None si el código es válido
+# - digito_sugerido: dígito verificador correcto para los 10 primeros
+#   caracteres, o None si estos no tienen el formato AAAANNNNNN
+ResultadoISO6346 = namedtuple(
+    "ResultadoISO6346", ["codigo", "error", "digito_sugerido"]
+)
+
+
+def digito_verificador(prefijo):
+    """
+    Dígito verificador de los 10 primeros caracteres (propietario + serie).
+    Si el residuo es 10, el dígito es 0.
+    """
+    return sum(map(dict.__getitem__, _APORTES, prefijo)) % 11 % 10
+
+
+def _digitos_numpy(prefijos):
+    """Dígitos verificadores de una lista de prefijos ASCII en una operación"""
+    matriz = np.frombuffer(
+        "".join(prefijos).encode("ascii"), dtype=np.uint8
+    ).reshape(-1, 10)
+    return (_VALORES_ASCII[matriz] @ _PESOS_NUMPY) % 11 % 10
+
+
+def _resultado(codigo, digito):
+    """Arma el resultado de un código normalizado dado su dígito calculado"""
+    if not _FORMATO.fullmatch(codigo):
+        return ResultadoISO6346(
+            codigo,
+            f"El código '{codigo}' no tiene el formato ISO 6346 válido. "
+            "Debe ser 4 letras seguidas de 7 números (ej: MSKU9070323)",
+            digito,
+        )
+
+    categoria = codigo[3]
+    if categoria not in CATEGORIAS:
+        return ResultadoISO6346(
+            codigo,
+            f"La 4ta letra debe ser U (contenedor de carga), J (equipo auxiliar) "
+            f"o Z (trailer/chasis). Recibido: '{categoria}'",
+            digito,
+        )
+
+    proporcionado = int(codigo[10])
+    if digito != proporcionado:
+        return ResultadoISO6346(
+            codigo,
+            f"El código '{codigo}' tiene un dígito verificador inválido. "
+            f"Esperado: {digito}, Proporcionado: {proporcionado}. "
+            "Este código no cumple con la norma ISO 6346.",
+            digito,
+        )
+
+    return ResultadoISO6346(codigo, None, digito)
+
+
+def revisar(codigo):
+    """Valida un solo código y retorna su ResultadoISO6346"""
+    codigo = codigo.upper().strip()
+    digito = digito_verificador(codigo) if _PREFIJO.match(codigo) else None
+    return _resultado(codigo, digito)
+
+
+def validate_iso_6346_many(codigos, usar_numpy=None):
+    """
+    Valida un lote de códigos ISO 6346.
+
+    Args:
+        codigos: iterable de códigos (se normalizan a mayúsculas sin espacios)
+        usar_numpy: True/False para forzar la ruta; None decide según el
+            tamaño del lote y si NumPy está instalado
+
+    Returns:
+        Lista de ResultadoISO6346 en el mismo orden que la entrada
+    """
+    normalizados = [codigo.upper().strip() for codigo in codigos]
+    con_prefijo = [
+        i for i, codigo in enumerate(normalizados) if _PREFIJO.match(codigo)
+    ]
+
+    if usar_numpy is None:
+        usar_numpy = np is not None and len(con_prefijo) >= UMBRAL_NUMPY
+    elif usar_numpy and np is None:
+        raise ImportError("NumPy no está instalado")
+
+    digitos = [None] * len(normalizados)
+    if usar_numpy and con_prefijo:
+        calculados = _digitos_numpy([normalizados[i][:10] for i in con_prefijo])
+        for i, digito in zip(con_prefijo, calculados.tolist()):
+            digitos[i] = digito
+    else:
+        for i in con_prefijo:
+            digitos[i] = digito_verificador(normalizados[i])
+
+    return [
+        _resultado(codigo, digito) for codigo, digito in zip(normalizados, digitos)
+    ]
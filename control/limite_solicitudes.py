@@ -0,0 +1,217 @@
+"""
+Límite de solicitudes (token bucket) para las vistas públicas sin autenticación.
+
+Cada vista limitada tiene una cubeta por IP (SIGEP_THROTTLE_REGLAS) y además
+cada IP tiene una cubeta común a todas ellas (SIGEP_THROTTLE_POR_IP). Una
+solicitud pasa si ambas tienen al menos una ficha; las fichas se recargan de
+forma continua a la tasa configurada.
+
+Las cubetas viven en un archivo SQLite en SIGEP_CACHE_DIR (modo WAL), así los
+límites son los mismos para todos los procesos del servidor sin depender de un
+servicio externo. La lectura y el descuento de fichas ocurren en una sola
+transacción BEGIN IMMEDIATE. Si el archivo no está disponible la solicitud se
+deja pasar: el límite protege, no debe tumbar el sitio.
+
+Las solicitudes rechazadas reciben un 429 con Retry-After antes de llegar a la
+vista (sin consultas a la base de datos ni renderizado).
+"""
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántas solicitudes (por proceso) se eliminan cubetas inactivas
+LIMPIEZA_CADA = 1000
+# Una cubeta sin uso por este tiempo ya estaría llena: se puede borrar
+INACTIVIDAD_SEGUNDOS = 3600
+
+_local = threading.local()
+_lock = threading.Lock()
+_solicitudes = 0
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cubetas (
+    clave TEXT PRIMARY KEY,
+    fichas REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contadores (
+    ruta TEXT PRIMARY KEY,
+    permitidas INTEGER NOT NULL DEFAULT 0,
+    limitadas INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def ruta_almacen():
+    directorio = Path(settings.SIGEP_CACHE_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio / "limite_solicitudes.sqlite3"
+
+
+def _conexion():
+    """Conexión SQLite del hilo actual (una por archivo)"""
+    ruta = str(ruta_almacen())
+    conexiones = getattr(_local, "conexiones", None)
+    if conexiones is None:
+        conexiones = _local.conexiones = {}
+    conexion = conexiones.get(ruta)
+    if conexion is None:
+        conexion = sqlite3.connect(ruta, timeout=1, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(_ESQUEMA)
+        conexiones[ruta] = conexion
+    return conexion
+
+
+def _toca_limpieza():
+    global _solicitudes
+    with _lock:
+        _solicitudes += 1
+        return _solicitudes % LIMPIEZA_CADA == 0
+
+
+# ====== CUBETAS ======
+def consumir(ruta, cubetas, ahora=None):
+    """
+    Descuenta una ficha de cada cubeta si todas tienen al menos una.
+
+    Args:
+        ruta: nombre de la vista (para los contadores)
+        cubetas: lista de (clave, capacidad, fichas_por_segundo)
+        ahora: instante en segundos (por defecto time.time())
+
+    Returns:
+        Segundos a esperar: 0 si la solicitud pasa.
+    """
+    ahora = time.time() if ahora is None else ahora
+    conexion = _conexion()
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        claves = [clave for clave, _capacidad, _tasa in cubetas]
+        guardadas = dict(
+            (clave, (fichas, actualizado))
+            for clave, fichas, actualizado in conexion.execute(
+                "SELECT clave, fichas, actualizado FROM cubetas "
+                f"WHERE clave IN ({','.join('?' * len(claves))})",
+                claves,
+            )
+        )
+        disponibles = {}
+        espera = 0
+        for clave, capacidad, tasa in cubetas:
+            fichas, actualizado = guardadas.get(clave, (capacidad, ahora))
+            fichas = min(capacidad, fichas + max(0.0, ahora - actualizado) * tasa)
+            disponibles[clave] = fichas
+            if fichas < 1:
+                espera = max(espera, (1 - fichas) / tasa)
+
+        if not espera:
+            conexion.executemany(
+                "INSERT INTO cubetas (clave, fichas, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET "
+                "fichas = excluded.fichas, actualizado = excluded.actualizado",
+                [(clave, fichas - 1, ahora) for clave, fichas in disponibles.items()],
+            )
+        columna = "limitadas" if espera else "permitidas"
+        conexion.execute(
+            f"INSERT INTO contadores (ruta, {columna}) VALUES (?, 1) "
+            f"ON CONFLICT(ruta) DO UPDATE SET {columna} = {columna} + 1",
+            (ruta,),
+        )
+        if _toca_limpieza():
+            conexion.execute(
+                "DELETE FROM cubetas WHERE actualizado < ?",
+                (ahora - INACTIVIDAD_SEGUNDOS,),
+            )
+        conexion.execute("COMMIT")
+    except BaseException:
+        conexion.execute("ROLLBACK")
+        raise
+    return espera
+
+
+def estadisticas():
+    """Solicitudes permitidas/limitadas por vista (todos los procesos)"""
+    conexion = _conexion()
+    rutas = {
+        ruta: {"permitidas": permitidas, "limitadas": limitadas}
+        for ruta, permitidas, limitadas in conexion.execute(
+            "SELECT ruta, permitidas, limitadas FROM contadores ORDER BY ruta"
+        )
+    }
+    (cubetas,) = conexion.execute("SELECT COUNT(*) FROM cubetas").fetchone()
+    return {
+        "rutas": rutas,
+        "limitadas": sum(datos["limitadas"] for datos in rutas.values()),
+        "cubetas_activas": cubetas,
+    }
+
+
+# ====== MIDDLEWARE ======
+def ip_cliente(request):
+    """
+    IP del cliente. Detrás de un proxy se toma de la cabecera configurada en
+    SIGEP_THROTTLE_CABECERA_IP (p. ej. HTTP_X_FORWARDED_FOR, primer valor).
+    """
+    cabecera = settings.SIGEP_THROTTLE_CABECERA_IP
+    if cabecera and request.META.get(cabecera):
+        return request.META[cabecera].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class LimiteSolicitudesMiddleware:
+    """Responde 429 a las IPs que superan el límite de las vistas públicas"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.SIGEP_THROTTLE_ACTIVO:
+            return None
+        if request.resolver_match.app_name != "control":
+            return None
+        ruta = request.resolver_match.url_name
+        regla = settings.SIGEP_THROTTLE_REGLAS.get(ruta)
+        if regla is None:
+            return None
+        # El personal del puerto no se limita (la sesión solo se lee aquí)
+        if request.user.is_authenticated and request.user.is_staff:
+            return None
+
+        ip = ip_cliente(request)
+        capacidad, tasa = regla
+        capacidad_ip, tasa_ip = settings.SIGEP_THROTTLE_POR_IP
+        try:
+            espera = consumir(
+                ruta,
+                [
+                    (f"{ruta}:{ip}", capacidad, tasa),
+                    (f"*:{ip}", capacidad_ip, tasa_ip),
+                ],
+            )
+        except sqlite3.Error:
+            logger.warning("Límite de solicitudes no disponible", exc_info=True)
+            return None
+        if not espera:
+            return None
+
+        respuesta = HttpResponse(
+            "Demasiadas solicitudes. Intente nuevamente en unos segundos.",
+            status=429,
+            content_type="text/plain; charset=utf-8",
+        )
+        respuesta["Retry-After"] = str(math.ceil(espera))
+        return respuesta
@@ -0,0 +1,111 @@
+"""
+Mide el parseo de una ficha de VesselFinder guardada en disco:
+
+- BeautifulSoup (árbol completo de objetos Python + selectores CSS), como
+  parseaba ImoClient antes.
+- lxml con XPath precompilados (ImoClient._parse_vesselfinder_html).
+
+Uso:
+    python manage.py benchmark_imo_parser
+    python manage.py benchmark_imo_parser --archivo pagina.html --iteraciones 200
+"""
+
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand, CommandError
+
+from control.imo_client import ImoClient
+
+FIXTURE = (
+    Path(__file__).resolve().parents[2]
+    / "tests"
+    / "fixtures"
+    / "vesselfinder_9839133.html"
+)
+
+
+def _medir(funcion, iteraciones):
+    """Tiempo promedio por llamada en milisegundos"""
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    return (time.perf_counter() - inicio) * 1000 / iteraciones
+
+
+def _parse_beautifulsoup(cliente, html, imo):
+    """Parseo anterior: BeautifulSoup sobre lxml y selectores CSS"""
+    soup = BeautifulSoup(html, "lxml")
+    name_el = soup.select_one("h1.title")
+    data = {"imo": imo, "name": name_el.text.strip() if name_el else "Unknown"}
+    for row in soup.select(".tpt1 tr, .aparams tr"):
+        cells = row.select("td")
+        if len(cells) >= 2:
+            cliente._aplicar_fila(
+                data, cells[0].text.strip().lower(), cells[1].text.strip()
+            )
+    json_div = soup.select_one("#djson")
+    if json_div and json_div.get("data-json"):
+        cliente._aplicar_posicion(data, json_div["data-json"])
+    return cliente._completar_defaults(data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el parseo de una ficha de VesselFinder con BeautifulSoup "
+        "contra lxml con XPath precompilados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iteraciones",
+            type=int,
+            default=100,
+            help="Repeticiones por medición (default: 100).",
+        )
+        parser.add_argument(
+            "--archivo",
+            default=str(FIXTURE),
+            help="HTML de VesselFinder guardado (default: fixture de MSC GULSUN).",
+        )
+        parser.add_argument(
+            "--imo",
+            default="9839133",
+            help="IMO del buque de la página (default: 9839133).",
+        )
+
+    def handle(self, *args, **options):
+        iteraciones = options["iteraciones"]
+        if iteraciones < 1:
+            raise CommandError("--iteraciones debe ser mayor a 0")
+        archivo = Path(options["archivo"])
+        if not archivo.is_file():
+            raise CommandError(f"No existe el archivo {archivo}")
+
+        html = archivo.read_text(encoding="utf-8")
+        imo = options["imo"]
+        cliente = ImoClient()
+
+        xpath = cliente._parse_vesselfinder_html(html, imo)
+        if "error" in xpath:
+            raise CommandError(f"{archivo.name}: {xpath['error']}")
+        soup = _parse_beautifulsoup(cliente, html, imo)
+        if {k: v for k, v in soup.items() if k != "_source"} != {
+            k: v for k, v in xpath.items() if k != "_source"
+        }:
+            self.stdout.write(
+                self.style.WARNING("Los dos parsers no extraen los mismos datos")
+            )
+
+        antes = _medir(lambda: _parse_beautifulsoup(cliente, html, imo), iteraciones)
+        despues = _medir(
+            lambda: cliente._parse_vesselfinder_html(html, imo), iteraciones
+        )
+        ahorro = antes - despues
+        porcentaje = (ahorro / antes * 100) if antes else 0
+        self.stdout.write(
+            f"{archivo.name} ({len(html) / 1024:.0f} KB): "
+            f"BeautifulSoup {antes:.3f} ms | lxml XPath {despues:.3f} ms | "
+            f"ahorro {ahorro:.3f} ms/ficha ({porcentaje:.1f}%)"
+        )
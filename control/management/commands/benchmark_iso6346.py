@@ -0,0 +1,136 @@
+"""
+Compara la validación ISO 6346 por código (algoritmo anterior: tabla de letras
+reconstruida y 2**i en cada llamada) con el motor de tablas precalculadas
+(control/iso6346.py), uno por uno y en lote, sobre un manifiesto sintético.
+
+Uso:
+    python manage.py benchmark_iso6346
+    python manage.py benchmark_iso6346 --cantidad 20000 --iteraciones 5
+"""
+
+import random
+import re
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control import iso6346
+
+
+def _validar_legado(value):
+    """Algoritmo previo de validate_iso_6346, conservado como línea base"""
+    value = value.upper().strip()
+    if not re.match(r"^[A-Z]{4}\d{7}$", value):
+        return False
+    if value[3] not in ["U", "J", "Z"]:
+        return False
+    letter_values = {
+        "A": 10, "B": 12, "C": 13, "D": 14, "E": 15, "F": 16, "G": 17,
+        "H": 18, "I": 19, "J": 20, "K": 21, "L": 23, "M": 24, "N": 25,
+        "O": 26, "P": 27, "Q": 28, "R": 29, "S": 30, "T": 31, "U": 32,
+        "V": 34, "W": 35, "X": 36, "Y": 37, "Z": 38,
+    }  # fmt: skip
+    total = 0
+    for i, char in enumerate(value[:10]):
+        if char.isalpha():
+            char_value = letter_values[char]
+        else:
+            char_value = int(char)
+        total += char_value * (2**i)
+    remainder = total % 11
+    check_digit = 0 if remainder == 10 else remainder
+    return check_digit == int(value[10])
+
+
+def _medir(funcion, iteraciones):
+    """Tiempo promedio por ejecución en milisegundos"""
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    return (time.perf_counter() - inicio) * 1000 / iteraciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la validación ISO 6346 de un manifiesto: algoritmo por llamada "
+        "anterior vs. tablas precalculadas y validación en lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cantidad",
+            type=int,
+            default=10000,
+            help="Códigos del manifiesto sintético (default: 10000).",
+        )
+        parser.add_argument(
+            "--iteraciones",
+            type=int,
+            default=5,
+            help="Repeticiones por medición (default: 5).",
+        )
+        parser.add_argument(
+            "--semilla", type=int, default=6346, help="Semilla aleatoria."
+        )
+
+    def handle(self, *args, **options):
+        cantidad = options["cantidad"]
+        iteraciones = options["iteraciones"]
+        if cantidad < 1 or iteraciones < 1:
+            raise CommandError("--cantidad y --iteraciones deben ser mayores a 0")
+
+        codigos = self._generar_codigos(cantidad, random.Random(options["semilla"]))
+
+        # Las rutas deben coincidir antes de comparar tiempos
+        legado = [_validar_legado(codigo) for codigo in codigos]
+        lote = [r.error is None for r in iso6346.validate_iso_6346_many(codigos)]
+        if legado != lote:
+            raise CommandError("La validación en lote difiere del algoritmo anterior")
+        self.stdout.write(
+            f"{cantidad} códigos ({legado.count(False)} inválidos), "
+            f"{iteraciones} iteraciones"
+        )
+
+        base = _medir(lambda: [_validar_legado(c) for c in codigos], iteraciones)
+        self._reportar("Por llamada (anterior)", base, base)
+        self._reportar(
+            "Por llamada (tablas)",
+            base,
+            _medir(lambda: [iso6346.revisar(c) for c in codigos], iteraciones),
+        )
+        self._reportar(
+            "Lote (Python)",
+            base,
+            _medir(
+                lambda: iso6346.validate_iso_6346_many(codigos, usar_numpy=False),
+                iteraciones,
+            ),
+        )
+        if iso6346.np is None:
+            self.stdout.write(self.style.WARNING("Lote (NumPy): omitido, no instalado"))
+        else:
+            self._reportar(
+                "Lote (NumPy)",
+                base,
+                _medir(
+                    lambda: iso6346.validate_iso_6346_many(codigos, usar_numpy=True),
+                    iteraciones,
+                ),
+            )
+
+    def _generar_codigos(self, cantidad, aleatorio):
+        """Manifiesto sintético con ~10% de dígitos verificadores erróneos"""
+        codigos = []
+        for _ in range(cantidad):
+            propietario = "".join(aleatorio.choices(string.ascii_uppercase, k=3)) + "U"
+            serie = f"{aleatorio.randrange(10**6):06d}"
+            digito = iso6346.digito_verificador(propietario + serie)
+            if aleatorio.random() < 0.1:
+                digito = (digito + 1) % 10
+            codigos.append(f"{propietario}{serie}{digito}")
+        return codigos
+
+    def _reportar(self, titulo, base, medido):
+        aceleracion = base / medido if medido else 0
+        self.stdout.write(f"{titulo}: {medido:.2f} ms (x{aceleracion:.1f})")
@@ -0,0 +1,129 @@
+"""
+Mide la latencia por PDF que ahorra el registro de recursos precargados
+(control/pdf_assets.py) frente a la preparación por petición:
+
+- Logos: lectura de disco + base64 en cada PDF vs. registro en memoria.
+- Renderizado (si WeasyPrint está disponible): CSS embebido en el HTML y
+  FontConfiguration nueva en cada PDF vs. hoja parseada y fuentes reutilizadas.
+
+Uso:
+    python manage.py benchmark_pdf_recursos
+    python manage.py benchmark_pdf_recursos --codigo MSKU9070323 --iteraciones 50
+"""
+
+import base64
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control.models import Contenedor
+from control.pdf_assets import CSS_ADMIN, LOGO_ADMIN, LOGO_CLIENTE, recursos
+from control.views import DOCUMENTOS_PDF
+
+
+def _medir(funcion, iteraciones):
+    """Tiempo promedio por llamada en milisegundos"""
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    return (time.perf_counter() - inicio) * 1000 / iteraciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la latencia por PDF con recursos precargados (logos, CSS, "
+        "fuentes) contra la carga por petición."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iteraciones",
+            type=int,
+            default=20,
+            help="Repeticiones por medición (default: 20).",
+        )
+        parser.add_argument(
+            "--codigo",
+            help="Código ISO del contenedor cuya ficha se renderiza "
+            "(default: el primero registrado).",
+        )
+
+    def handle(self, *args, **options):
+        iteraciones = options["iteraciones"]
+        if iteraciones < 1:
+            raise CommandError("--iteraciones debe ser mayor a 0")
+
+        self._benchmark_logos(iteraciones)
+        self._benchmark_renderizado(iteraciones, options["codigo"])
+
+    def _reportar(self, titulo, por_peticion, precargado):
+        ahorro = por_peticion - precargado
+        porcentaje = (ahorro / por_peticion * 100) if por_peticion else 0
+        self.stdout.write(
+            f"{titulo}: por petición {por_peticion:.3f} ms | "
+            f"precargado {precargado:.3f} ms | "
+            f"ahorro {ahorro:.3f} ms/PDF ({porcentaje:.1f}%)"
+        )
+
+    def _benchmark_logos(self, iteraciones):
+        logos = [LOGO_ADMIN, LOGO_CLIENTE]
+        rutas = [recursos.directorio_imagenes / logo for logo in logos]
+
+        def por_peticion():
+            for ruta in rutas:
+                base64.b64encode(ruta.read_bytes()).decode("utf-8")
+
+        def precargado():
+            for logo in logos:
+                recursos.logo_base64(logo)
+
+        precargado()  # Primera carga fuera de la medición
+        self._reportar(
+            "Logos", _medir(por_peticion, iteraciones), _medir(precargado, iteraciones)
+        )
+
+    def _benchmark_renderizado(self, iteraciones, codigo):
+        try:
+            from weasyprint import HTML
+            from weasyprint.text.fonts import FontConfiguration
+        except (ImportError, OSError) as e:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Renderizado omitido: WeasyPrint no disponible ({e})"
+                )
+            )
+            return
+
+        if codigo is None:
+            codigo = (
+                Contenedor.objects.order_by("pk")
+                .values_list("codigo_iso", flat=True)
+                .first()
+            )
+            if codigo is None:
+                raise CommandError("No hay contenedores registrados para renderizar")
+
+        documento = DOCUMENTOS_PDF["ficha"](codigo)
+        html_content = documento["generar_html"]()
+
+        # Versión "por petición": el CSS viaja embebido y se parsea en cada PDF
+        css = (recursos.directorio_css / CSS_ADMIN).read_text(encoding="utf-8")
+        html_embebido = html_content.replace(
+            "</head>", f"<style>{css}</style></head>", 1
+        )
+
+        def por_peticion():
+            HTML(string=html_embebido).write_pdf(font_config=FontConfiguration())
+
+        def precargado():
+            HTML(string=html_content).write_pdf(
+                stylesheets=[recursos.hoja_estilos(CSS_ADMIN)],
+                font_config=recursos.font_config(),
+            )
+
+        precargado()  # Calentamiento: parseo inicial de hoja y fuentes
+        self._reportar(
+            f"Ficha {codigo}",
+            _medir(por_peticion, iteraciones),
+            _medir(precargado, iteraciones),
+        )
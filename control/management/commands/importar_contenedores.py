@@ -0,0 +1,80 @@
+"""
+Importa los contenedores de un archivo (CSV, XLSX o BAPLIE) a un arribo.
+Valida todo el lote antes de escribir: si hay errores no importa nada y los
+lista por fila.
+
+Uso:
+    python manage.py importar_contenedores 12 lista_descarga.csv
+    python manage.py importar_contenedores 12 bayplan.edi --formato baplie --direccion IMPORT
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control import importacion
+from control.models import Arribo
+
+
+class Command(BaseCommand):
+    help = "Carga masiva de contenedores a un arribo desde CSV, XLSX o BAPLIE."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arribo_id", type=int, help="ID del arribo de destino.")
+        parser.add_argument("archivo", help="Ruta del archivo a importar.")
+        parser.add_argument(
+            "--formato",
+            choices=sorted(importacion.FORMATOS),
+            help="Formato del archivo (default: según la extensión).",
+        )
+        parser.add_argument(
+            "--direccion",
+            choices=["IMPORT", "EXPORT"],
+            help="Dirección para filas sin columna de dirección "
+            "(default: según el tipo de operación del arribo).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=importacion.TAMANO_LOTE,
+            help=f"Filas por INSERT (default: {importacion.TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            arribo = Arribo.objects.select_related("buque").get(pk=options["arribo_id"])
+        except Arribo.DoesNotExist:
+            raise CommandError(f"No existe el arribo {options['arribo_id']}")
+
+        formato = options["formato"] or importacion.detectar_formato(options["archivo"])
+        if formato is None:
+            raise CommandError("No se reconoce la extensión del archivo: use --formato")
+
+        try:
+            with open(options["archivo"], "rb") as archivo:
+                resultado = importacion.importar_contenedores(
+                    arribo,
+                    archivo,
+                    formato,
+                    direccion_por_defecto=options["direccion"],
+                    tamano_lote=options["lote"],
+                )
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir el archivo: {e}")
+
+        if resultado.exitoso:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{resultado.creados} contenedores importados al arribo {arribo}"
+                )
+            )
+            return
+
+        for error in resultado.errores_generales:
+            self.stderr.write(error)
+        for error in resultado.errores:
+            self.stderr.write(
+                f"Fila {error['fila']} [{error['codigo_iso'] or '-'}]: {error['mensaje']}"
+            )
+        raise CommandError(
+            f"No se importó ningún contenedor ({len(resultado.errores)} errores en "
+            f"{resultado.filas_leidas} filas)"
+        )
@@ -0,0 +1,53 @@
+"""
+Registra los eventos de contenedor de un archivo EDIFACT (COARRI/CODECO) o CSV.
+Los eventos inválidos se rechazan uno por uno y se listan al final; el resto
+se registra.
+
+Uso:
+    python manage.py ingerir_eventos descargas.edi
+    python manage.py ingerir_eventos eventos.csv --formato csv --lote 1000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control import ingesta_eventos
+
+
+class Command(BaseCommand):
+    help = "Ingesta en lote de eventos de contenedor desde EDIFACT COARRI/CODECO o CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del archivo de eventos.")
+        parser.add_argument(
+            "--formato",
+            choices=sorted(ingesta_eventos.FORMATOS),
+            help="Formato del archivo (default: según el contenido).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=ingesta_eventos.TAMANO_LOTE,
+            help=f"Eventos por INSERT (default: {ingesta_eventos.TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["archivo"], "rb") as archivo:
+                resultado = ingesta_eventos.ingerir_archivo(
+                    archivo, options["formato"], tamano_lote=options["lote"]
+                )
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir el archivo: {e}")
+
+        for error in resultado.rechazados:
+            self.stderr.write(
+                f"{error['referencia']} [{error['codigo_iso'] or '-'}]: {error['mensaje']}"
+            )
+        estilo = self.style.SUCCESS if not resultado.rechazados else self.style.WARNING
+        self.stdout.write(
+            estilo(
+                f"{resultado.creados} de {resultado.recibidos} eventos registrados "
+                f"({len(resultado.rechazados)} rechazados, "
+                f"{resultado.contenedores_actualizados} contenedores actualizados)"
+            )
+        )
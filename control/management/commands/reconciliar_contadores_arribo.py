@@ -0,0 +1,84 @@
+"""
+Recalcula los contadores de contenedores registrados de cada arribo
+(import/export) a partir de la tabla de contenedores y corrige desviaciones,
+p. ej. tras cargas con bulk_create o UPDATE masivos fuera del ORM.
+
+Uso:
+    python manage.py reconciliar_contadores_arribo
+    python manage.py reconciliar_contadores_arribo --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from control.models import Arribo, Contenedor
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los contadores de contenedores de cada arribo con los "
+        "contenedores realmente registrados y corrige las desviaciones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo reporta desviaciones, sin corregirlas.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        campos = {
+            direccion: contador
+            for direccion, (contador, _, _) in Arribo.CUPOS_POR_DIRECCION.items()
+        }
+
+        revisados = 0
+        desviados = 0
+        with transaction.atomic():
+            # Bloquea los arribos: los contadores no cambian mientras se comparan
+            persistidos = {
+                fila["pk"]: fila
+                for fila in Arribo.objects.select_for_update()
+                .order_by("pk")
+                .values("pk", *Arribo.CAMPOS_CONTADOR)
+            }
+            reales = {}
+            for arribo_id, direccion, total in (
+                Contenedor.objects.values_list("arribo_id", "direccion")
+                .annotate(total=Count("pk"))
+                .order_by()
+            ):
+                if direccion in campos:
+                    reales.setdefault(arribo_id, {})[campos[direccion]] = total
+
+            for arribo_id, persistido in persistidos.items():
+                revisados += 1
+                esperado = {
+                    campo: reales.get(arribo_id, {}).get(campo, 0)
+                    for campo in Arribo.CAMPOS_CONTADOR
+                }
+                diferencias = [
+                    f"{campo}: {persistido[campo]} → {esperado[campo]}"
+                    for campo in Arribo.CAMPOS_CONTADOR
+                    if persistido[campo] != esperado[campo]
+                ]
+                if not diferencias:
+                    continue
+
+                desviados += 1
+                self.stdout.write(
+                    self.style.WARNING(f"  Arribo {arribo_id}: {'; '.join(diferencias)}")
+                )
+                if not dry_run:
+                    Arribo.objects.filter(pk=arribo_id).update(**esperado)
+
+        resumen = f"Arribos revisados: {revisados} | Con desviación: {desviados}"
+        if desviados and dry_run:
+            self.stdout.write(self.style.WARNING(f"{resumen} (sin corregir, --dry-run)"))
+        elif desviados:
+            self.stdout.write(self.style.SUCCESS(f"{resumen} (corregidos)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(resumen))
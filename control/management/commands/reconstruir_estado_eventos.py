@@ -0,0 +1,104 @@
+"""
+Reconstruye desde cero el estado derivado de eventos de cada contenedor
+(bloqueo, total de eventos y snapshot del último evento) y reporta desviaciones
+respecto al estado persistido.
+
+Uso:
+    python manage.py reconstruir_estado_eventos
+    python manage.py reconstruir_estado_eventos --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from control.models import Contenedor, EventoContenedor
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el estado de bloqueo/eventos de todos los contenedores "
+        "reproduciendo su historial y reporta las desviaciones encontradas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo reporta desviaciones, sin corregirlas.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=2000,
+            help="Cantidad de contenedores procesados por lote (default: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        tamano_lote = options["lote"]
+        campos = EventoContenedor.CAMPOS_ESTADO_CONTENEDOR
+
+        revisados = 0
+        desviados = 0
+
+        ids = Contenedor.objects.order_by("pk").values_list("pk", flat=True)
+        lote = []
+        for contenedor_id in ids.iterator(chunk_size=tamano_lote):
+            lote.append(contenedor_id)
+            if len(lote) >= tamano_lote:
+                desviados += self._procesar_lote(lote, campos, dry_run)
+                revisados += len(lote)
+                lote = []
+        if lote:
+            desviados += self._procesar_lote(lote, campos, dry_run)
+            revisados += len(lote)
+
+        resumen = f"Contenedores revisados: {revisados} | Con desviación: {desviados}"
+        if desviados and dry_run:
+            self.stdout.write(self.style.WARNING(f"{resumen} (sin corregir, --dry-run)"))
+        elif desviados:
+            self.stdout.write(self.style.SUCCESS(f"{resumen} (corregidos)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(resumen))
+
+    def _procesar_lote(self, ids, campos, dry_run):
+        """Recalcula un lote de contenedores y retorna cuántos estaban desviados"""
+        persistidos = {
+            fila["pk"]: fila
+            for fila in Contenedor.objects.filter(pk__in=ids).values(
+                "pk", "codigo_iso", *campos
+            )
+        }
+
+        historiales = {contenedor_id: [] for contenedor_id in ids}
+        for contenedor_id, *evento in (
+            EventoContenedor.objects.filter(contenedor_id__in=ids)
+            .order_by("contenedor_id", "fecha_hora", "pk")
+            .values_list("contenedor_id", *EventoContenedor.CAMPOS_HISTORIAL)
+        ):
+            historiales[contenedor_id].append(evento)
+
+        desviados = 0
+        with transaction.atomic():
+            for contenedor_id, historial in historiales.items():
+                persistido = persistidos.get(contenedor_id)
+                if persistido is None:
+                    continue
+                esperado = EventoContenedor.estado_desde_historial(historial)
+                diferencias = [
+                    f"{campo}: {persistido[campo]!r} → {esperado[campo]!r}"
+                    for campo in campos
+                    if persistido[campo] != esperado[campo]
+                ]
+                if not diferencias:
+                    continue
+
+                desviados += 1
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"  {persistido['codigo_iso']}: {'; '.join(diferencias)}"
+                    )
+                )
+                if not dry_run:
+                    Contenedor.objects.filter(pk=contenedor_id).update(**esperado)
+        return desviados
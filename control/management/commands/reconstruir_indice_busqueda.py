@@ -0,0 +1,36 @@
+"""
+Regenera el índice de búsqueda unificada (omnibox) desde las tablas de
+contenedores, aprobaciones, buques y transitarios, p. ej. tras cargar datos
+con loaddata o con UPDATE masivos fuera del ORM.
+
+Uso:
+    python manage.py reconstruir_indice_busqueda
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from control import busqueda
+
+
+class Command(BaseCommand):
+    help = "Regenera el índice FTS5 de la búsqueda unificada."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=busqueda.TAMANO_LOTE,
+            help=f"Filas por inserción (por defecto {busqueda.TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = busqueda.reconstruir(tamano_lote=options["lote"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Índice de búsqueda regenerado: {total} filas "
+                f"en {time.perf_counter() - inicio:.1f}s"
+            )
+        )
@@ -0,0 +1,137 @@
+"""
+Resumen del manifiesto de un arribo calculado en la base de datos.
+
+Una sola consulta agrupada por transitario obtiene totales de import/export,
+TEU, liberaciones aduaneras, pagos y contenedores listos para retiro; los
+totales del arribo se suman a partir de esos grupos (uno por transitario).
+Lo usan el PDF del manifiesto y la API JSON de resumen.
+"""
+
+from django.db.models import BooleanField, Case, Count, IntegerField, Q, Sum, Value, When
+
+from .models import TEU_POR_LONGITUD, Contenedor
+
+# Mismas condiciones que Contenedor.esta_liberado_aduana / Contenedor.esta_pagado
+Q_LIBERADO_ADUANA = Q(
+    aprobacion_aduanera__aprobado=True,
+    aprobacion_aduanera__fecha_levante__isnull=False,
+)
+Q_PAGADO = Q(aprobacion_financiera__fecha_pago__isnull=False)
+
+
+def expresion_teu():
+    """TEU de cada contenedor según la longitud de su código tipo/tamaño"""
+    return Case(
+        *[
+            When(tipo_tamaño__startswith=longitud, then=Value(teu))
+            for longitud, teu in TEU_POR_LONGITUD.items()
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _booleano(condicion):
+    return Case(
+        When(condicion, then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+
+
+def contenedores_manifiesto(arribo):
+    """
+    Contenedores del arribo para el listado del manifiesto, con el estado de
+    aduana y pago anotado (sin cargar los objetos de aprobación).
+    """
+    return (
+        arribo.contenedores.select_related("transitario")
+        .annotate(
+            liberado_aduana=_booleano(Q_LIBERADO_ADUANA),
+            pagado=_booleano(Q_PAGADO),
+        )
+        .order_by("direccion", "codigo_iso")
+    )
+
+
+def _ratio(parte, total):
+    return round(parte / total, 3) if total else None
+
+
+def resumen_manifiesto(arribo):
+    """
+    Resumen del manifiesto de un arribo.
+
+    Returns:
+        dict con totales (total, total_import, total_export, teu_total,
+        liberados_aduana, pagados, listos_para_retiro), ratios de avance
+        (ratio_aduana, ratio_pago, ratio_listos) y el desglose por transitario
+    """
+    grupos = (
+        Contenedor.objects.filter(arribo=arribo)
+        .values(
+            "transitario_id",
+            "transitario__razon_social",
+            "transitario__nombre_comercial",
+        )
+        .annotate(
+            total=Count("pk"),
+            total_import=Count("pk", filter=Q(direccion="IMPORT")),
+            total_export=Count("pk", filter=Q(direccion="EXPORT")),
+            teu=Sum(expresion_teu()),
+            liberados_aduana=Count("pk", filter=Q_LIBERADO_ADUANA),
+            pagados=Count("pk", filter=Q_PAGADO),
+            listos_para_retiro=Count("pk", filter=Q(listo_para_retiro=True)),
+        )
+        .order_by("transitario__razon_social")
+    )
+
+    campos = [
+        "total",
+        "total_import",
+        "total_export",
+        "teu",
+        "liberados_aduana",
+        "pagados",
+        "listos_para_retiro",
+    ]
+    totales = dict.fromkeys(campos, 0)
+    transitarios = []
+    for grupo in grupos:
+        for campo in campos:
+            totales[campo] += grupo[campo] or 0
+        if grupo["transitario_id"]:
+            nombre = (
+                grupo["transitario__nombre_comercial"]
+                or grupo["transitario__razon_social"]
+            )
+        else:
+            nombre = "Sin transitario"
+        transitarios.append(
+            {
+                "id": grupo["transitario_id"],
+                "nombre": nombre,
+                "total": grupo["total"],
+                "import": grupo["total_import"],
+                "export": grupo["total_export"],
+                "teu": grupo["teu"] or 0,
+                "liberados_aduana": grupo["liberados_aduana"],
+                "pagados": grupo["pagados"],
+                "listos_para_retiro": grupo["listos_para_retiro"],
+            }
+        )
+
+    total = totales["total"]
+    return {
+        "total": total,
+        "total_import": totales["total_import"],
+        "total_export": totales["total_export"],
+        "teu_total": totales["teu"],
+        "liberados_aduana": totales["liberados_aduana"],
+        "pagados": totales["pagados"],
+        "listos_para_retiro": totales["listos_para_retiro"],
+        "ratio_aduana": _ratio(totales["liberados_aduana"], total),
+        "ratio_pago": _ratio(totales["pagados"], total),
+        "ratio_listos": _ratio(totales["listos_para_retiro"], total),
+        "transitarios": transitarios,
+    }
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_sellos(apps, schema_editor):
+    """Backfill: genera una fila de SelloContenedor por cada sello de numero_sello"""
+    Contenedor = apps.get_model("control", "Contenedor")
+    SelloContenedor = apps.get_model("control", "SelloContenedor")
+
+    lote = []
+    for contenedor_id, numero_sello in (
+        Contenedor.objects.values_list("id", "numero_sello").iterator(chunk_size=2000)
+    ):
+        for sello in (numero_sello or "").split("|"):
+            sello = sello.strip()
+            if ":" not in sello:
+                continue
+            tipo, codigo = sello.split(":", 1)
+            es_principal = codigo.endswith("*")
+            codigo = codigo.replace("*", "").strip().upper()
+            if codigo:
+                lote.append(
+                    SelloContenedor(
+                        contenedor_id=contenedor_id,
+                        codigo=codigo,
+                        tipo=tipo.strip().upper(),
+                        es_principal=es_principal,
+                    )
+                )
+        if len(lote) >= 2000:
+            SelloContenedor.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        SelloContenedor.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0017_ubicacion_pais_optional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SelloContenedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=100, verbose_name='Código de Sello')),
+                ('tipo', models.CharField(max_length=20, verbose_name='Tipo de Sello')),
+                ('es_principal', models.BooleanField(default=False, verbose_name='Sello Principal')),
+                ('contenedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sellos', to='control.contenedor', verbose_name='Contenedor')),
+            ],
+            options={
+                'verbose_name': 'Sello de Contenedor',
+                'verbose_name_plural': 'Sellos de Contenedores',
+                'ordering': ['contenedor', '-es_principal', 'codigo'],
+                'indexes': [models.Index(fields=['codigo'], name='control_sel_codigo_a489e2_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_sellos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:42
+
+from django.db import migrations, models
+
+EVENTOS_BLOQUEO = {"CUSTOMS_HOLD", "DAMAGED", "INSPECTION"}
+EVENTOS_LIBERACION = {"CUSTOMS_RELEASED"}
+
+
+def poblar_estado_eventos(apps, schema_editor):
+    """Backfill: reproduce una vez el historial de cada contenedor con eventos"""
+    Contenedor = apps.get_model("control", "Contenedor")
+    EventoContenedor = apps.get_model("control", "EventoContenedor")
+
+    def guardar(contenedor_id, estado):
+        Contenedor.objects.filter(pk=contenedor_id).update(**estado)
+
+    contenedor_actual = None
+    estado = None
+    for contenedor_id, tipo_evento, fecha_hora in (
+        EventoContenedor.objects.order_by("contenedor_id", "fecha_hora", "pk")
+        .values_list("contenedor_id", "tipo_evento", "fecha_hora")
+        .iterator(chunk_size=2000)
+    ):
+        if contenedor_id != contenedor_actual:
+            if contenedor_actual is not None:
+                guardar(contenedor_actual, estado)
+            contenedor_actual = contenedor_id
+            estado = {
+                "bloqueado_por_evento": False,
+                "total_eventos": 0,
+                "ultimo_evento_tipo": "",
+                "ultimo_evento_fecha": None,
+            }
+        if tipo_evento in EVENTOS_BLOQUEO:
+            estado["bloqueado_por_evento"] = True
+        elif tipo_evento in EVENTOS_LIBERACION:
+            estado["bloqueado_por_evento"] = False
+        estado["total_eventos"] += 1
+        estado["ultimo_evento_tipo"] = tipo_evento
+        estado["ultimo_evento_fecha"] = fecha_hora
+    if contenedor_actual is not None:
+        guardar(contenedor_actual, estado)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0018_sello_contenedor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contenedor',
+            name='total_eventos',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total de Eventos'),
+        ),
+        migrations.AddField(
+            model_name='contenedor',
+            name='ultimo_evento_fecha',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Fecha del Último Evento'),
+        ),
+        migrations.AddField(
+            model_name='contenedor',
+            name='ultimo_evento_tipo',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='Tipo del Último Evento'),
+        ),
+        migrations.RunPython(poblar_estado_eventos, migrations.RunPython.noop),
+    ]
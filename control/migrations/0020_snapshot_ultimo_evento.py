@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def poblar_snapshot(apps, schema_editor):
+    """Backfill: copia lugar, país y buque del último evento de cada contenedor"""
+    Contenedor = apps.get_model("control", "Contenedor")
+    EventoContenedor = apps.get_model("control", "EventoContenedor")
+
+    ultimo = EventoContenedor.objects.filter(contenedor=OuterRef("pk")).order_by(
+        "-fecha_hora", "-pk"
+    )
+    Contenedor.objects.filter(total_eventos__gt=0).update(
+        ultimo_evento_ubicacion_puerto=Subquery(
+            ultimo.values("ubicacion_puerto")[:1]
+        ),
+        ultimo_evento_ubicacion_pais=Subquery(ultimo.values("ubicacion_pais")[:1]),
+        ultimo_evento_buque=Subquery(ultimo.values("buque")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0019_estado_incremental_eventos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contenedor',
+            name='ultimo_evento_buque',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='control.buque', verbose_name='Buque del Último Evento'),
+        ),
+        migrations.AddField(
+            model_name='contenedor',
+            name='ultimo_evento_ubicacion_pais',
+            field=models.CharField(blank=True, editable=False, max_length=60, verbose_name='País del Último Evento'),
+        ),
+        migrations.AddField(
+            model_name='contenedor',
+            name='ultimo_evento_ubicacion_puerto',
+            field=models.CharField(blank=True, editable=False, max_length=120, verbose_name='Lugar del Último Evento'),
+        ),
+        migrations.RunPython(poblar_snapshot, migrations.RunPython.noop),
+    ]
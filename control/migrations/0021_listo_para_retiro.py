@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:47
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def poblar_listo_para_retiro(apps, schema_editor):
+    """Backfill: marca los contenedores que ya cumplen las condiciones de retiro"""
+    Contenedor = apps.get_model("control", "Contenedor")
+    AprobacionAduanera = apps.get_model("control", "AprobacionAduanera")
+    AprobacionFinanciera = apps.get_model("control", "AprobacionFinanciera")
+    AprobacionPagoTransitario = apps.get_model("control", "AprobacionPagoTransitario")
+
+    Contenedor.objects.filter(
+        Exists(
+            AprobacionAduanera.objects.filter(contenedor=OuterRef("pk"), aprobado=True)
+        ),
+        Exists(
+            AprobacionFinanciera.objects.filter(
+                contenedor=OuterRef("pk"),
+                estado_financiero__in=["PAGADA", "CREDITO"],
+            )
+        ),
+        Exists(
+            AprobacionPagoTransitario.objects.filter(
+                contenedor=OuterRef("pk"), pago_realizado=True
+            )
+        ),
+        bloqueado_por_evento=False,
+    ).update(listo_para_retiro=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0020_snapshot_ultimo_evento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contenedor',
+            name='listo_para_retiro',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Aduana aprobada, factura pagada/crédito, transitario pagado y sin bloqueo', verbose_name='Listo para Retiro'),
+        ),
+        migrations.RunPython(poblar_listo_para_retiro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:14
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_contadores(apps, schema_editor):
+    """Backfill: cuenta los contenedores ya registrados en cada arribo"""
+    Arribo = apps.get_model("control", "Arribo")
+    Contenedor = apps.get_model("control", "Contenedor")
+    campos = {
+        "IMPORT": "contenedores_import_registrados",
+        "EXPORT": "contenedores_export_registrados",
+    }
+    for arribo_id, direccion, total in (
+        Contenedor.objects.values_list("arribo_id", "direccion")
+        .annotate(total=Count("pk"))
+        .order_by()
+    ):
+        if direccion in campos:
+            Arribo.objects.filter(pk=arribo_id).update(**{campos[direccion]: total})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0021_listo_para_retiro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arribo',
+            name='contenedores_export_registrados',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Contenedores Export Registrados'),
+        ),
+        migrations.AddField(
+            model_name='arribo',
+            name='contenedores_import_registrados',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Contenedores Import Registrados'),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
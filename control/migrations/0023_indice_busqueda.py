@@ -0,0 +1,112 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+# Tabla FTS5 de contenido externo sobre control_documentobusqueda: el trigram
+# permite buscar fragmentos de códigos (p. ej. "9070" dentro de MSKU9070323)
+CREAR_FTS = [
+    """
+    CREATE VIRTUAL TABLE control_busqueda_fts USING fts5(
+        titulo, detalle,
+        content='control_documentobusqueda', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER control_busqueda_ai AFTER INSERT ON control_documentobusqueda BEGIN
+        INSERT INTO control_busqueda_fts (rowid, titulo, detalle)
+        VALUES (new.id, new.titulo, new.detalle);
+    END
+    """,
+    """
+    CREATE TRIGGER control_busqueda_ad AFTER DELETE ON control_documentobusqueda BEGIN
+        INSERT INTO control_busqueda_fts (control_busqueda_fts, rowid, titulo, detalle)
+        VALUES ('delete', old.id, old.titulo, old.detalle);
+    END
+    """,
+    """
+    CREATE TRIGGER control_busqueda_au AFTER UPDATE ON control_documentobusqueda BEGIN
+        INSERT INTO control_busqueda_fts (control_busqueda_fts, rowid, titulo, detalle)
+        VALUES ('delete', old.id, old.titulo, old.detalle);
+        INSERT INTO control_busqueda_fts (rowid, titulo, detalle)
+        VALUES (new.id, new.titulo, new.detalle);
+    END
+    """,
+]
+
+BORRAR_FTS = [
+    "DROP TRIGGER IF EXISTS control_busqueda_au",
+    "DROP TRIGGER IF EXISTS control_busqueda_ad",
+    "DROP TRIGGER IF EXISTS control_busqueda_ai",
+    "DROP TABLE IF EXISTS control_busqueda_fts",
+]
+
+# Backfill en SQL (mismos documentos que control/busqueda.py)
+POBLAR = [
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'contenedor:' || id, 'contenedor', id, id, codigo_iso,
+           trim(ifnull(carrier, '') || ' ' || ifnull(origen_puerto, '') || ' ' || ifnull(destino_puerto, ''))
+    FROM control_contenedor
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'contenedor:' || id, 'bl', id, id, bl_referencia, codigo_iso
+    FROM control_contenedor WHERE bl_referencia != ''
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'contenedor:' || c.id, 'sello', c.id, c.id, s.codigo, c.codigo_iso
+    FROM control_sellocontenedor s JOIN control_contenedor c ON c.id = s.contenedor_id
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'aprobacionaduanera:' || a.id, 'dam', a.id, c.id, a.numero_despacho, c.codigo_iso
+    FROM control_aprobacionaduanera a JOIN control_contenedor c ON c.id = a.contenedor_id
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'aprobacionfinanciera:' || f.id, 'factura', f.id, c.id, f.numero_factura, c.codigo_iso
+    FROM control_aprobacionfinanciera f JOIN control_contenedor c ON c.id = f.contenedor_id
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'buque:' || id, 'buque', id, NULL, nombre,
+           trim('IMO ' || imo_number || ' ' || callsign || ' ' || naviera)
+    FROM control_buque
+    """,
+    """
+    INSERT INTO control_documentobusqueda (origen, tipo, objeto_id, contenedor_id, titulo, detalle)
+    SELECT 'transitario:' || id, 'transitario', id, NULL, razon_social,
+           trim(nombre_comercial || ' ' || identificador_tributario)
+    FROM control_transitario
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0022_contadores_arribo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(db_index=True, max_length=50)),
+                ('tipo', models.CharField(choices=[('contenedor', 'Contenedor'), ('bl', 'BL'), ('sello', 'Sello'), ('dam', 'DAM'), ('factura', 'Factura'), ('buque', 'Buque'), ('transitario', 'Transitario')], max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('contenedor_id', models.PositiveBigIntegerField(db_index=True, null=True)),
+                ('titulo', models.CharField(max_length=200)),
+                ('detalle', models.CharField(blank=True, max_length=300)),
+            ],
+            options={
+                'verbose_name': 'Documento de Búsqueda',
+                'verbose_name_plural': 'Documentos de Búsqueda',
+            },
+        ),
+        migrations.RunSQL(CREAR_FTS, BORRAR_FTS),
+        migrations.RunSQL(POBLAR, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0023_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaExterna',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('servicio', models.CharField(max_length=20)),
+                ('clave', models.CharField(max_length=50)),
+                ('encontrado', models.BooleanField(default=True)),
+                ('datos', models.JSONField(default=dict)),
+                ('obtenido_en', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Consulta Externa (caché)',
+                'verbose_name_plural': 'Consultas Externas (caché)',
+                'unique_together': {('servicio', 'clave')},
+            },
+        ),
+    ]
@@ -2,7 +2,10 @@ import re
 
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
-from django.db import models
+from django.db import models, transaction
+
+from . import iso6346
+from .transiciones import TablaTransiciones
 
 # from django.utils.translation import gettext_lazy as _
 
@@ -42,6 +45,10 @@ TIPO_CONTENEDOR_CHOICES = [
     for codigo, info in TIPOS_CONTENEDOR.items()
 ]
 
+# TEU según el primer carácter del código ISO (longitud): 20' = 1 TEU, 40' = 2 TEU.
+# Los 45' se cuentan como 2 TEU, igual que los 40'.
+TEU_POR_LONGITUD = {"2": 1, "4": 2, "L": 2}
+
 
 # ====== CONSTANTES PARA SELLOS ======
 TIPOS_SELLO = {
@@ -184,81 +191,10 @@ def validate_iso_6346(value):
 
     Ejemplos válidos: MSKU9070323, HLXU8142385, CSQU3054383
     """
-    value = value.upper().strip()
-
-    # Validar formato básico: 4 letras + 7 números (incluyendo check digit)
-    pattern = r"^[A-Z]{4}\d{7}$"
-    if not re.match(pattern, value):
-        raise ValidationError(
-            f"El código '{value}' no tiene el formato ISO 6346 válido. "
-            "Debe ser 4 letras seguidas de 7 números (ej: MSKU9070323)"
-        )
-
-    # Validar que la 4ta letra sea U, J o Z (categoría de equipo)
-    categoria = value[3]
-    if categoria not in ["U", "J", "Z"]:
-        raise ValidationError(
-            f"La 4ta letra debe ser U (contenedor de carga), J (equipo auxiliar) "
-            f"o Z (trailer/chasis). Recibido: '{categoria}'"
-        )
-
-    # Tabla de equivalencias ISO 6346 para letras
-    # Las letras tienen valores específicos (saltando múltiplos de 11)
-    letter_values = {
-        "A": 10,
-        "B": 12,
-        "C": 13,
-        "D": 14,
-        "E": 15,
-        "F": 16,
-        "G": 17,
-        "H": 18,
-        "I": 19,
-        "J": 20,
-        "K": 21,
-        "L": 23,
-        "M": 24,
-        "N": 25,
-        "O": 26,
-        "P": 27,
-        "Q": 28,
-        "R": 29,
-        "S": 30,
-        "T": 31,
-        "U": 32,
-        "V": 34,
-        "W": 35,
-        "X": 36,
-        "Y": 37,
-        "Z": 38,
-    }
-
-    # Calcular el check digit
-    total = 0
-    for i, char in enumerate(value[:10]):  # Solo los primeros 10 caracteres
-        if char.isalpha():
-            char_value = letter_values[char]
-        else:
-            char_value = int(char)
-
-        # Multiplicar por 2^posición
-        total += char_value * (2**i)
-
-    # Calcular el dígito verificador
-    remainder = total % 11
-    check_digit = 0 if remainder == 10 else remainder
-
-    # Validar contra el dígito proporcionado
-    provided_check_digit = int(value[10])
-
-    if check_digit != provided_check_digit:
-        raise ValidationError(
-            f"El código '{value}' tiene un dígito verificador inválido. "
-            f"Esperado: {check_digit}, Proporcionado: {provided_check_digit}. "
-            "Este código no cumple con la norma ISO 6346."
-        )
-
-    return value
+    resultado = iso6346.revisar(value)
+    if resultado.error:
+        raise ValidationError(resultado.error)
+    return resultado.codigo
 
 
 def calculate_iso_6346_check_digit(owner_code, serial_number):
@@ -272,47 +208,7 @@ def calculate_iso_6346_check_digit(owner_code, serial_number):
     Returns:
         El dígito verificador (0-9)
     """
-    letter_values = {
-        "A": 10,
-        "B": 12,
-        "C": 13,
-        "D": 14,
-        "E": 15,
-        "F": 16,
-        "G": 17,
-        "H": 18,
-        "I": 19,
-        "J": 20,
-        "K": 21,
-        "L": 23,
-        "M": 24,
-        "N": 25,
-        "O": 26,
-        "P": 27,
-        "Q": 28,
-        "R": 29,
-        "S": 30,
-        "T": 31,
-        "U": 32,
-        "V": 34,
-        "W": 35,
-        "X": 36,
-        "Y": 37,
-        "Z": 38,
-    }
-
-    code = (owner_code + serial_number).upper()
-    total = 0
-
-    for i, char in enumerate(code):
-        if char.isalpha():
-            char_value = letter_values[char]
-        else:
-            char_value = int(char)
-        total += char_value * (2**i)
-
-    remainder = total % 11
-    return 0 if remainder == 10 else remainder
+    return iso6346.digito_verificador((owner_code + serial_number).upper())
 
 
 # ====== CUN02: BUQUES (Catálogo) ======
@@ -521,9 +417,39 @@ class Arribo(models.Model):
         default="PROGRAMADO",
         verbose_name="Estado",
     )
+    # Contenedores registrados por dirección (desnormalizado). Solo se
+    # modifican con UPDATE condicionales (ver reservar_cupo / liberar_cupo)
+    contenedores_import_registrados = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Contenedores Import Registrados",
+    )
+    contenedores_export_registrados = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Contenedores Export Registrados",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Dirección del contenedor → (contador de registrados, capacidad declarada, texto)
+    CUPOS_POR_DIRECCION = {
+        "IMPORT": (
+            "contenedores_import_registrados",
+            "contenedores_descarga",
+            "importación (descarga)",
+        ),
+        "EXPORT": (
+            "contenedores_export_registrados",
+            "contenedores_carga",
+            "exportación (carga)",
+        ),
+    }
+    CAMPOS_CONTADOR = (
+        "contenedores_import_registrados",
+        "contenedores_export_registrados",
+    )
+
     class Meta:
         verbose_name = "Arribo"
         verbose_name_plural = "Arribos"
@@ -581,11 +507,129 @@ class Arribo(models.Model):
             # Limpiar campo de descarga (no aplica)
             self.contenedores_descarga = 0
 
+    def save(self, *args, **kwargs):
+        # Un guardado completo no debe pisar los contadores con los valores
+        # leídos al cargar el arribo (otro usuario pudo registrar contenedores)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                campo.name
+                for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_CONTADOR
+            ]
+        super().save(*args, **kwargs)
+
+    # ══════ CONTADORES DE CAPACIDAD ══════
+    @property
+    def total_contenedores_registrados(self):
+        return self.contenedores_import_registrados + self.contenedores_export_registrados
+
+    @property
+    def total_contenedores_declarados(self):
+        return self.contenedores_descarga + self.contenedores_carga
+
+    def contenedores_registrados(self, direccion):
+        """Contenedores registrados (según el contador) para una dirección"""
+        return getattr(self, self.CUPOS_POR_DIRECCION[direccion][0])
+
+    def mensaje_capacidad_excedida(self, direccion, registrados=None):
+        contador, capacidad, texto = self.CUPOS_POR_DIRECCION[direccion]
+        if registrados is None:
+            registrados = getattr(self, contador)
+        return (
+            f"El arribo '{self}' ya tiene {registrados} de {getattr(self, capacidad)} "
+            f"contenedores de {texto} registrados. No se pueden agregar más."
+        )
+
+    @classmethod
+    def reservar_cupo(cls, arribo_id, direccion, cantidad=1):
+        """
+        Suma 'cantidad' contenedores al contador de la dirección solo si no
+        supera la capacidad declarada. Es un único UPDATE condicional: la
+        fila queda bloqueada y dos reservas simultáneas no pueden pasar
+        ambas el límite.
+
+        Raises:
+            ValidationError: si la capacidad declarada se excedería
+        """
+        contador, capacidad, _ = cls.CUPOS_POR_DIRECCION[direccion]
+        actualizados = cls.objects.filter(
+            pk=arribo_id,
+            **{f"{contador}__lte": models.F(capacidad) - cantidad},
+        ).update(**{contador: models.F(contador) + cantidad})
+        if not actualizados:
+            arribo = cls.objects.select_related("buque").get(pk=arribo_id)
+            raise ValidationError(
+                {"direccion": arribo.mensaje_capacidad_excedida(direccion)}
+            )
+
+    @classmethod
+    def liberar_cupo(cls, arribo_id, direccion, cantidad=1):
+        """Resta 'cantidad' contenedores al contador de la dirección"""
+        contador = cls.CUPOS_POR_DIRECCION[direccion][0]
+        cls.objects.filter(pk=arribo_id, **{f"{contador}__gte": cantidad}).update(
+            **{contador: models.F(contador) - cantidad}
+        )
+
     def __str__(self):
         return f"{self.buque.nombre} - {self.fecha_eta.strftime('%Y-%m-%d %H:%M')}"
 
 
 # ====== CUN03: CONTENEDOR ======
+class ContenedorQuerySet(models.QuerySet):
+    """Consultas de contenedores basadas en el estado de retiro persistido"""
+
+    def listos_para_retiro(self):
+        """Contenedores habilitados para Gate Pass (usa la columna indexada)"""
+        return self.filter(listo_para_retiro=True)
+
+    def delete(self):
+        """Eliminación masiva: descuenta los contenedores de cada arribo"""
+        with transaction.atomic():
+            por_arribo = list(
+                self.values_list("arribo_id", "direccion")
+                .annotate(total=models.Count("pk"))
+                .order_by()
+            )
+            resultado = super().delete()
+            for arribo_id, direccion, total in por_arribo:
+                if arribo_id and direccion in Arribo.CUPOS_POR_DIRECCION:
+                    Arribo.liberar_cupo(arribo_id, direccion, total)
+        return resultado
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def recalcular_listo_para_retiro(self):
+        """
+        Recalcula listo_para_retiro en un único UPDATE para todo el queryset.
+        Listo = aduana aprobada + factura PAGADA/CRÉDITO + transitario pagado
+        + sin bloqueo por eventos.
+        """
+        aduana_ok = AprobacionAduanera.objects.filter(
+            contenedor=models.OuterRef("pk"), aprobado=True
+        )
+        financiera_ok = AprobacionFinanciera.objects.filter(
+            contenedor=models.OuterRef("pk"),
+            estado_financiero__in=AprobacionFinanciera.ESTADOS_GATE_PASS,
+        )
+        transitario_ok = AprobacionPagoTransitario.objects.filter(
+            contenedor=models.OuterRef("pk"), pago_realizado=True
+        )
+        return self.update(
+            listo_para_retiro=models.Case(
+                models.When(
+                    models.Q(bloqueado_por_evento=False)
+                    & models.Exists(aduana_ok)
+                    & models.Exists(financiera_ok)
+                    & models.Exists(transitario_ok),
+                    then=models.Value(True),
+                ),
+                default=models.Value(False),
+                output_field=models.BooleanField(),
+            )
+        )
+
+
 class Contenedor(models.Model):
     """Contenedores individuales manejados en el puerto (import y export)"""
 
@@ -730,9 +774,56 @@ class Contenedor(models.Model):
         verbose_name="Bloqueado por Evento",
         help_text="Se activa automáticamente por eventos como Customs Hold, Damaged o Inspection",
     )
+    # === Estado de retiro (mantenido por las aprobaciones y los eventos) ===
+    listo_para_retiro = models.BooleanField(
+        default=False,
+        editable=False,
+        db_index=True,
+        verbose_name="Listo para Retiro",
+        help_text="Aduana aprobada, factura pagada/crédito, transitario pagado y sin bloqueo",
+    )
+    # === Estado incremental de eventos (mantenido por EventoContenedor.save) ===
+    total_eventos = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Total de Eventos"
+    )
+    ultimo_evento_tipo = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        verbose_name="Tipo del Último Evento",
+    )
+    ultimo_evento_fecha = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Fecha del Último Evento",
+    )
+    ultimo_evento_ubicacion_puerto = models.CharField(
+        max_length=120,
+        blank=True,
+        editable=False,
+        verbose_name="Lugar del Último Evento",
+    )
+    ultimo_evento_ubicacion_pais = models.CharField(
+        max_length=60,
+        blank=True,
+        editable=False,
+        verbose_name="País del Último Evento",
+    )
+    ultimo_evento_buque = models.ForeignKey(
+        Buque,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        verbose_name="Buque del Último Evento",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ContenedorQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Contenedor"
         verbose_name_plural = "Contenedores"
@@ -762,30 +853,25 @@ class Contenedor(models.Model):
             self.bic_propietario = self.codigo_iso[:3].upper()
 
         # ====== VALIDACIÓN DE CAPACIDAD DEL ARRIBO ======
-        # No permitir registrar más contenedores de los declarados en el Arribo
-        if self.arribo and self.direccion:
-            # Contar contenedores ya registrados (excluyendo el actual si es edición)
-            contenedores_existentes = Contenedor.objects.filter(
-                arribo=self.arribo, direccion=self.direccion
+        # No permitir registrar más contenedores de los declarados en el Arribo.
+        # Usa los contadores del arribo; save() vuelve a verificar con un UPDATE
+        # condicional, que es el que garantiza el límite ante guardados simultáneos
+        if self.arribo and self.direccion in Arribo.CUPOS_POR_DIRECCION:
+            cantidad_registrada = self.arribo.contenedores_registrados(self.direccion)
+            # Si es edición sin cambiar de arribo/dirección, excluir el registro actual
+            if self._cupo_original == (self.arribo_id, self.direccion):
+                cantidad_registrada -= 1
+
+            capacidad_declarada = getattr(
+                self.arribo, Arribo.CUPOS_POR_DIRECCION[self.direccion][1]
             )
-            if self.pk:  # Si es edición, excluir el registro actual
-                contenedores_existentes = contenedores_existentes.exclude(pk=self.pk)
-
-            cantidad_registrada = contenedores_existentes.count()
-
-            if self.direccion == "IMPORT":
-                capacidad_declarada = self.arribo.contenedores_descarga
-                tipo_texto = "importación (descarga)"
-            else:  # EXPORT
-                capacidad_declarada = self.arribo.contenedores_carga
-                tipo_texto = "exportación (carga)"
-
             # Validar que no se exceda la capacidad
             if cantidad_registrada >= capacidad_declarada:
                 raise ValidationError(
                     {
-                        "direccion": f"El arribo '{self.arribo}' ya tiene {cantidad_registrada} de {capacidad_declarada} "
-                        f"contenedores de {tipo_texto} registrados. No se pueden agregar más."
+                        "direccion": self.arribo.mensaje_capacidad_excedida(
+                            self.direccion, cantidad_registrada
+                        )
                     }
                 )
 
@@ -822,21 +908,106 @@ class Contenedor(models.Model):
                     )
 
         # Validar duplicidad de sellos con otros contenedores activos
+        # Una sola consulta indexada sobre SelloContenedor (codigo IN (...))
         if self.numero_sello:
             mis_codigos = self.get_codigos_sello()
-            # Buscar contenedores con sellos duplicados (excluyendo este)
-            contenedores = Contenedor.objects.exclude(pk=self.pk)
-            for contenedor in contenedores:
-                otros_codigos = contenedor.get_codigos_sello()
-                duplicados = mis_codigos.intersection(otros_codigos)
-                if duplicados:
-                    raise ValidationError(
-                        {
-                            "numero_sello": f"🚨 ALERTA: El sello '{', '.join(duplicados)}' ya está registrado "
-                            f"en el contenedor {contenedor.codigo_iso}. "
-                            "Esto podría indicar un error de tipeo o un intento de fraude."
-                        }
-                    )
+            coincidencias = (
+                SelloContenedor.objects.filter(codigo__in=mis_codigos)
+                .exclude(contenedor_id=self.pk)
+                .order_by("contenedor_id", "codigo")
+                .values_list("codigo", "contenedor__codigo_iso")
+            )
+            por_contenedor = {}
+            for codigo, codigo_iso in coincidencias:
+                por_contenedor.setdefault(codigo_iso, []).append(codigo)
+            if por_contenedor:
+                codigo_iso, duplicados = next(iter(por_contenedor.items()))
+                raise ValidationError(
+                    {
+                        "numero_sello": f"🚨 ALERTA: El sello '{', '.join(duplicados)}' ya está registrado "
+                        f"en el contenedor {codigo_iso}. "
+                        "Esto podría indicar un error de tipeo o un intento de fraude."
+                    }
+                )
+
+    # (arribo_id, direccion) con que se cargó o guardó por última vez
+    _cupo_original = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Arribo y dirección con los que se cargó: clean() no cuenta dos veces
+        # el propio contenedor al editarlo
+        instancia._cupo_original = (
+            instancia.__dict__.get("arribo_id"),
+            instancia.__dict__.get("direccion"),
+        )
+        return instancia
+
+    def save(self, *args, **kwargs):
+        es_nuevo = self._state.adding
+        with transaction.atomic():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None or {"arribo", "direccion"} & set(update_fields):
+                self._actualizar_cupo_arribo(es_nuevo)
+            super().save(*args, **kwargs)
+            if update_fields is None or "numero_sello" in update_fields:
+                self._sincronizar_sellos()
+            # Un guardado completo reescribe listo_para_retiro con el valor en
+            # memoria, que puede estar desactualizado: se recalcula en BD
+            if not es_nuevo and update_fields is None:
+                self.recalcular_listo_para_retiro()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            anterior = (
+                Contenedor.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values_list("arribo_id", "direccion")
+                .first()
+            )
+            resultado = super().delete(*args, **kwargs)
+            if anterior and anterior[0] and anterior[1] in Arribo.CUPOS_POR_DIRECCION:
+                Arribo.liberar_cupo(*anterior)
+        return resultado
+
+    def _actualizar_cupo_arribo(self, es_nuevo):
+        """
+        Mantiene los contadores del arribo: reserva el cupo al crear y, si
+        el contenedor cambia de arribo o dirección, libera el anterior.
+        """
+        anterior = None
+        if not es_nuevo:
+            # Valor actual en BD (bloqueado), no el leído al cargar la instancia
+            anterior = (
+                Contenedor.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values_list("arribo_id", "direccion")
+                .first()
+            )
+        actual = (self.arribo_id, self.direccion)
+        if anterior == actual:
+            return
+        if actual[0] and actual[1] in Arribo.CUPOS_POR_DIRECCION:
+            Arribo.reservar_cupo(*actual)
+        if anterior and anterior[0] and anterior[1] in Arribo.CUPOS_POR_DIRECCION:
+            Arribo.liberar_cupo(*anterior)
+        self._cupo_original = actual
+
+    def recalcular_listo_para_retiro(self):
+        """Recalcula listo_para_retiro en BD y lo refleja en esta instancia"""
+        contenedores = Contenedor.objects.filter(pk=self.pk)
+        contenedores.recalcular_listo_para_retiro()
+        self.listo_para_retiro = bool(
+            contenedores.values_list("listo_para_retiro", flat=True).first()
+        )
+
+    def _sincronizar_sellos(self):
+        """Reemplaza las filas de SelloContenedor según el valor actual de numero_sello"""
+        SelloContenedor.objects.filter(contenedor_id=self.pk).delete()
+        SelloContenedor.objects.bulk_create(
+            SelloContenedor.desde_contenedor(self)
+        )
 
     def get_codigos_sello(self):
         """Extrae todos los códigos de sello como un set (sin tipo ni marcador principal)"""
@@ -922,20 +1093,84 @@ class Contenedor(models.Model):
 
     @property
     def ultimo_evento(self):
-        """Retorna el último evento registrado del contenedor"""
-        return self.eventos.order_by("-fecha_hora").first()
+        """
+        Retorna el último evento registrado del contenedor, reconstruido desde
+        el snapshot denormalizado (no consulta la tabla de eventos).
+        Instancia de solo lectura: para editarlo, obtenerlo desde self.eventos.
+        """
+        if not self.total_eventos:
+            return None
+        evento = EventoContenedor(
+            contenedor=self,
+            tipo_evento=self.ultimo_evento_tipo,
+            fecha_hora=self.ultimo_evento_fecha,
+            ubicacion_puerto=self.ultimo_evento_ubicacion_puerto,
+            ubicacion_pais=self.ultimo_evento_ubicacion_pais,
+            buque_id=self.ultimo_evento_buque_id,
+        )
+        if Contenedor.ultimo_evento_buque.is_cached(self):
+            evento.buque = self.ultimo_evento_buque
+        return evento
 
     @property
     def ultimo_estado(self):
         """Retorna el tipo del último evento como estado actual"""
-        evento = self.ultimo_evento
-        return evento.get_tipo_evento_display() if evento else "Sin movimientos"
+        if not self.total_eventos:
+            return "Sin movimientos"
+        return dict(EventoContenedor.TIPO_EVENTO_CHOICES).get(
+            self.ultimo_evento_tipo, self.ultimo_evento_tipo
+        )
 
     def __str__(self):
         direccion_label = "IMP" if self.direccion == "IMPORT" else "EXP"
         return f"{self.codigo_iso} ({direccion_label}) - {self.bl_referencia}"
 
 
+# ====== ÍNDICE DE SELLOS (1 fila por sello) ======
+class SelloContenedor(models.Model):
+    """
+    Índice normalizado de los sellos declarados en Contenedor.numero_sello.
+    Se sincroniza al guardar el contenedor y permite detectar sellos
+    duplicados con una consulta indexada en lugar de recorrer la tabla.
+    """
+
+    contenedor = models.ForeignKey(
+        Contenedor,
+        on_delete=models.CASCADE,
+        related_name="sellos",
+        verbose_name="Contenedor",
+    )
+    codigo = models.CharField(max_length=100, verbose_name="Código de Sello")
+    tipo = models.CharField(max_length=20, verbose_name="Tipo de Sello")
+    es_principal = models.BooleanField(default=False, verbose_name="Sello Principal")
+
+    class Meta:
+        verbose_name = "Sello de Contenedor"
+        verbose_name_plural = "Sellos de Contenedores"
+        ordering = ["contenedor", "-es_principal", "codigo"]
+        indexes = [
+            models.Index(fields=["codigo"]),
+        ]
+
+    @classmethod
+    def desde_contenedor(cls, contenedor):
+        """Construye (sin guardar) las filas de sello de un contenedor"""
+        return [
+            cls(
+                contenedor_id=contenedor.pk,
+                codigo=sello["codigo"],
+                tipo=sello["tipo"],
+                es_principal=sello["es_principal"],
+            )
+            for sello in contenedor.get_sellos_lista()
+            if sello["codigo"]
+        ]
+
+    def __str__(self):
+        marca = " ⭐" if self.es_principal else ""
+        return f"{self.tipo}:{self.codigo}{marca}"
+
+
 # ====== CUN07: EVENTOS/TRACKING DE CONTENEDOR ======
 class EventoContenedor(models.Model):
     """Registro de eventos/movimientos del contenedor para tracking"""
@@ -1101,6 +1336,37 @@ class EventoContenedor(models.Model):
         "DAMAGED",
     ]
 
+    # Eventos del flujo normal que solo pueden ocurrir una vez por contenedor
+    EVENTOS_NO_REPETIBLES = [
+        "GATE_OUT_EMPTY",
+        "GATE_IN_FULL",
+        "LOADED",
+        "DEPARTED",
+        "ARRIVED",
+        "DISCHARGED",
+        "GATE_OUT_FULL",
+        "DELIVERED",
+        "GATE_IN_EMPTY",
+    ]
+
+    # Mapeo de eventos a medio de transporte requerido
+    MEDIO_POR_EVENTO = {
+        # Eventos marítimos → VESSEL
+        "LOADED": "VESSEL",
+        "DEPARTED": "VESSEL",
+        "IN_TRANSIT": "VESSEL",
+        "TRANSSHIPMENT": "VESSEL",
+        "ARRIVED": "VESSEL",
+        "DISCHARGED": "VESSEL",
+        # Eventos terrestres → TRUCK
+        "GATE_OUT_EMPTY": "TRUCK",
+        "GATE_IN_FULL": "TRUCK",
+        "GATE_OUT_FULL": "TRUCK",
+        "GATE_IN_EMPTY": "TRUCK",
+        "DELIVERED": "TRUCK",
+        # Eventos especiales → mantener el valor actual o TRUCK por defecto
+    }
+
     # Eventos de alerta (bloquean Gate Pass)
     EVENTOS_BLOQUEO = ["CUSTOMS_HOLD", "DAMAGED", "INSPECTION"]
 
@@ -1153,6 +1419,31 @@ class EventoContenedor(models.Model):
         "CUSTOMS_RELEASED": ["CUSTOMS_HOLD"],
     }
 
+    # Reglas de secuencia compiladas por dirección (una vez, al importar)
+    NOMBRES_EVENTO = dict(TIPO_EVENTO_CHOICES)
+    TRANSICIONES = TablaTransiciones(
+        tipos=[tipo for tipo, _ in TIPO_EVENTO_CHOICES],
+        nombres=NOMBRES_EVENTO,
+        secuencia=SECUENCIA_EVENTOS,
+        prerrequisitos=PRERREQUISITOS_EVENTOS,
+        eventos_por_direccion={
+            "IMPORT": EVENTOS_IMPORTACION,
+            "EXPORT": EVENTOS_EXPORTACION,
+        },
+        no_repetibles=EVENTOS_NO_REPETIBLES,
+    )
+
+    # Campos de Contenedor que guardan el estado derivado de sus eventos
+    CAMPOS_ESTADO_CONTENEDOR = (
+        "bloqueado_por_evento",
+        "total_eventos",
+        "ultimo_evento_tipo",
+        "ultimo_evento_fecha",
+        "ultimo_evento_ubicacion_puerto",
+        "ultimo_evento_ubicacion_pais",
+        "ultimo_evento_buque_id",
+    )
+
     class Meta:
         verbose_name = "Evento de Contenedor"
         verbose_name_plural = "Eventos de Contenedores"
@@ -1166,165 +1457,200 @@ class EventoContenedor(models.Model):
     def clean(self):
         from django.core.exceptions import ValidationError
 
+        # Estado actual del contenedor (excluyendo este evento si es edición)
+        direccion = None
+        eventos_existentes = 0
+        ultimo_evento = None
+        if self.contenedor_id:
+            direccion = self.contenedor.direccion
+            previos = EventoContenedor.objects.filter(
+                contenedor_id=self.contenedor_id
+            ).exclude(pk=self.pk)
+            if self.fecha_hora:
+                ultimo_evento = (
+                    previos.order_by("-fecha_hora")
+                    .values_list("tipo_evento", "fecha_hora")
+                    .first()
+                )
+            if self.tipo_evento:
+                eventos_existentes = self.mascara_eventos(
+                    previos.order_by()
+                    .values_list("tipo_evento", flat=True)
+                    .distinct()
+                )
+
+        errors = self.validar_reglas(
+            tipo_evento=self.tipo_evento,
+            fecha_hora=self.fecha_hora,
+            direccion=direccion,
+            eventos_existentes=eventos_existentes,
+            ultimo_evento=ultimo_evento,
+            buque_id=self.buque_id,
+            medio_transporte=self.medio_transporte,
+        )
+        if errors:
+            raise ValidationError(errors)
+
+    @classmethod
+    def mascara_eventos(cls, tipos):
+        """Resume un conjunto de tipos de evento en la máscara de bits de TRANSICIONES"""
+        return cls.TRANSICIONES.mascara(tipos)
+
+    @classmethod
+    def validar_reglas(
+        cls,
+        tipo_evento,
+        fecha_hora,
+        direccion,
+        eventos_existentes,
+        ultimo_evento,
+        buque_id=None,
+        medio_transporte=None,
+    ):
+        """
+        Reglas de cronología, secuencia, tipo de transporte y dirección de un
+        evento nuevo, evaluadas sobre el estado del contenedor recibido (sin
+        consultas). La usan clean() y la ingesta de eventos en lote.
+
+        Las reglas de secuencia se consultan en la tabla compilada
+        (TRANSICIONES): tiempo constante sin importar el historial.
+
+        Args:
+            direccion: dirección del contenedor (None si aún no se conoce)
+            eventos_existentes: máscara de bits (mascara_eventos) o conjunto
+                de tipos ya registrados para el contenedor
+            ultimo_evento: (tipo_evento, fecha_hora) del último evento o None
+
+        Returns:
+            dict campo → mensaje (vacío si el evento es válido)
+        """
+        if not isinstance(eventos_existentes, int):
+            eventos_existentes = cls.mascara_eventos(eventos_existentes)
+
         errors = {}
         tiene_error_cronologico = False
+        nombres = cls.NOMBRES_EVENTO
+        nombre_evento = nombres.get(tipo_evento, tipo_evento)
 
         # Validación cronológica: el evento no puede ser anterior al último evento
-        if self.contenedor_id and self.fecha_hora:
-            ultimo_evento = (
-                EventoContenedor.objects.filter(contenedor_id=self.contenedor_id)
-                .exclude(pk=self.pk)
-                .order_by("-fecha_hora")
-                .first()
-            )
-            if ultimo_evento and self.fecha_hora < ultimo_evento.fecha_hora:
+        if direccion and fecha_hora and ultimo_evento:
+            tipo_ultimo, fecha_ultimo = ultimo_evento
+            if fecha_hora < fecha_ultimo:
                 errors["fecha_hora"] = (
                     f"Cronología incoherente: Este evento no puede ser anterior al último evento "
-                    f"({ultimo_evento.get_tipo_evento_display()} - {ultimo_evento.fecha_hora.strftime('%d/%m/%Y %H:%M')})"
+                    f"({nombres.get(tipo_ultimo, tipo_ultimo)} - {fecha_ultimo.strftime('%d/%m/%Y %H:%M')})"
                 )
                 tiene_error_cronologico = True
 
+        transicion = cls.TRANSICIONES.transicion(direccion, tipo_evento)
+
         # ══════ VALIDACIÓN DE SECUENCIA LÓGICA ══════
         # Solo validar secuencia si NO hay error cronológico (evita mensajes confusos duplicados)
-        if self.contenedor_id and self.tipo_evento and not tiene_error_cronologico:
-            eventos_existentes = set(
-                EventoContenedor.objects.filter(contenedor_id=self.contenedor_id)
-                .exclude(pk=self.pk)
-                .values_list("tipo_evento", flat=True)
-            )
-
-            # 1. Verificar prerrequisitos (considerando dirección del contenedor)
-            if self.tipo_evento in self.PRERREQUISITOS_EVENTOS:
-                prerrequisitos = self.PRERREQUISITOS_EVENTOS[self.tipo_evento]
-                direccion = self.contenedor.direccion
-                
-                # Para IMPORT: filtrar prerrequisitos que sean válidos para importación
-                # Esto permite que ARRIVED sea el primer evento sin requerir DEPARTED
-                if direccion == "IMPORT":
-                    prerrequisitos_validos = [
-                        p for p in prerrequisitos if p in self.EVENTOS_IMPORTACION
-                    ]
-                else:
-                    prerrequisitos_validos = prerrequisitos
-                
-                # Solo validar si quedan prerrequisitos válidos para esta dirección
-                if prerrequisitos_validos:
-                    if not any(prereq in eventos_existentes for prereq in prerrequisitos_validos):
-                        prereq_nombres = [
-                            dict(self.TIPO_EVENTO_CHOICES).get(p, p) for p in prerrequisitos_validos
-                        ]
-                        errors["tipo_evento"] = (
-                            f"Secuencia inválida: Para registrar '{self.get_tipo_evento_display()}' "
-                            f"primero debe existir alguno de estos eventos: {', '.join(prereq_nombres)}"
-                        )
+        if transicion and not tiene_error_cronologico:
+            # 1. Verificar prerrequisitos (ya filtrados según la dirección)
+            if transicion.prerrequisitos and not (
+                eventos_existentes & transicion.prerrequisitos
+            ):
+                errors["tipo_evento"] = (
+                    f"Secuencia inválida: Para registrar '{nombre_evento}' "
+                    f"primero debe existir alguno de estos eventos: {transicion.texto_prerrequisitos}"
+                )
 
-            # 2. Verificar que no se salten eventos en la secuencia numérica
-            # Para IMPORT: la secuencia válida inicia en 7 (ARRIVED)
-            # Para EXPORT: la secuencia válida inicia en 1 (GATE_OUT_EMPTY)
-            num_evento_nuevo = self.SECUENCIA_EVENTOS.get(self.tipo_evento)
-            direccion = self.contenedor.direccion
-            
-            # Definir el número mínimo de secuencia según dirección
-            num_minimo = 7 if direccion == "IMPORT" else 1
-            
-            if num_evento_nuevo and num_evento_nuevo >= num_minimo:
-                for evento_existente in eventos_existentes:
-                    num_existente = self.SECUENCIA_EVENTOS.get(evento_existente)
-                    # Solo comparar con eventos que son válidos para esta dirección
-                    if num_existente and num_existente >= num_minimo and num_existente > num_evento_nuevo:
-                        # Hay un evento posterior ya registrado
-                        nombre_existente = dict(self.TIPO_EVENTO_CHOICES).get(
-                            evento_existente, evento_existente
-                        )
-                        errors["tipo_evento"] = (
-                            f"Secuencia inválida: No puede registrar '{self.get_tipo_evento_display()}' "
-                            f"porque ya existe un evento posterior: '{nombre_existente}'"
-                        )
-                        break
+            # 2. Verificar que no exista ya un evento posterior en la secuencia
+            posteriores = eventos_existentes & transicion.posteriores
+            if posteriores:
+                existente = cls.TRANSICIONES.tipo_de_bit(posteriores)
+                errors["tipo_evento"] = (
+                    f"Secuencia inválida: No puede registrar '{nombre_evento}' "
+                    f"porque ya existe un evento posterior: '{nombres.get(existente, existente)}'"
+                )
 
             # 3. Evitar eventos duplicados (excepto los especiales que pueden repetirse)
-            eventos_no_repetibles = [
-                "GATE_OUT_EMPTY",
-                "GATE_IN_FULL",
-                "LOADED",
-                "DEPARTED",
-                "ARRIVED",
-                "DISCHARGED",
-                "GATE_OUT_FULL",
-                "DELIVERED",
-                "GATE_IN_EMPTY",
-            ]
-            if (
-                self.tipo_evento in eventos_no_repetibles
-                and self.tipo_evento in eventos_existentes
-            ):
+            if eventos_existentes & transicion.repetido:
                 errors["tipo_evento"] = (
                     f"Este evento ya fue registrado para este contenedor. "
-                    f"'{self.get_tipo_evento_display()}' solo puede ocurrir una vez."
+                    f"'{nombre_evento}' solo puede ocurrir una vez."
                 )
 
         # Validar que eventos marítimos tengan buque
-        if self.tipo_evento in self.EVENTOS_MARITIMOS and not self.buque_id:
+        if tipo_evento in cls.EVENTOS_MARITIMOS and not buque_id:
             errors["buque"] = "Los eventos marítimos requieren seleccionar un buque"
 
         # Validar que eventos terrestres NO tengan buque ni medio=VESSEL
-        if self.tipo_evento in self.EVENTOS_TERRESTRES:
-            if self.buque_id:
+        if tipo_evento in cls.EVENTOS_TERRESTRES:
+            if buque_id:
                 errors["buque"] = (
-                    f"El evento '{self.get_tipo_evento_display()}' es terrestre y no puede tener un buque asignado"
+                    f"El evento '{nombre_evento}' es terrestre y no puede tener un buque asignado"
                 )
-            if self.medio_transporte == "VESSEL":
+            if medio_transporte == "VESSEL":
                 errors["medio_transporte"] = (
-                    f"El evento '{self.get_tipo_evento_display()}' es terrestre. "
+                    f"El evento '{nombre_evento}' es terrestre. "
                     f"Use Camión, Ferrocarril o Barcaza en su lugar."
                 )
 
         # ══════ VALIDACIÓN DE EVENTOS SEGÚN DIRECCIÓN DEL CONTENEDOR ══════
-        if self.contenedor_id and self.tipo_evento:
-            direccion = self.contenedor.direccion
-            
+        if transicion and not transicion.permitido:
             if direccion == "IMPORT":
                 # Importación: solo eventos 7-11 + especiales
-                if self.tipo_evento not in self.EVENTOS_IMPORTACION:
-                    errors["tipo_evento"] = (
-                        f"El evento '{self.get_tipo_evento_display()}' no es válido para contenedores de IMPORTACIÓN. "
-                        f"Solo se permiten: Arrived, Discharged, Gate Out Full, Delivered, Gate In Empty y eventos especiales."
-                    )
-            elif direccion == "EXPORT":
-                # Exportación: todos los eventos
-                if self.tipo_evento not in self.EVENTOS_EXPORTACION:
-                    errors["tipo_evento"] = (
-                        f"El evento '{self.get_tipo_evento_display()}' no es válido para contenedores de EXPORTACIÓN."
-                    )
-
-        if errors:
-            raise ValidationError(errors)
+                errors["tipo_evento"] = (
+                    f"El evento '{nombre_evento}' no es válido para contenedores de IMPORTACIÓN. "
+                    f"Solo se permiten: Arrived, Discharged, Gate Out Full, Delivered, Gate In Empty y eventos especiales."
+                )
+            else:
+                errors["tipo_evento"] = (
+                    f"El evento '{nombre_evento}' no es válido para contenedores de EXPORTACIÓN."
+                )
 
-    def save(self, *args, **kwargs):
-        # ══════ AUTO-ASIGNACIÓN DE CAMPOS SEGÚN TIPO DE EVENTO ══════
-        # Esto soluciona el problema de campos deshabilitados por JS que no se envían
+        return errors
 
-        # Mapeo de eventos a medio de transporte requerido
-        MEDIO_POR_EVENTO = {
-            # Eventos marítimos → VESSEL
-            "LOADED": "VESSEL",
-            "DEPARTED": "VESSEL",
-            "IN_TRANSIT": "VESSEL",
-            "TRANSSHIPMENT": "VESSEL",
-            "ARRIVED": "VESSEL",
-            "DISCHARGED": "VESSEL",
-            # Eventos terrestres → TRUCK
-            "GATE_OUT_EMPTY": "TRUCK",
-            "GATE_IN_FULL": "TRUCK",
-            "GATE_OUT_FULL": "TRUCK",
-            "GATE_IN_EMPTY": "TRUCK",
-            "DELIVERED": "TRUCK",
-            # Eventos especiales → mantener el valor actual o TRUCK por defecto
-        }
+    @classmethod
+    def validar_secuencia(
+        cls, direccion, eventos, eventos_existentes=0, ultimo_evento=None
+    ):
+        """
+        Valida en una pasada una secuencia ordenada de eventos propuestos
+        para un contenedor. Cada evento válido se suma al estado antes de
+        evaluar el siguiente; los inválidos no lo modifican.
+
+        Args:
+            direccion: dirección del contenedor
+            eventos: iterable ordenado de tuplas
+                (tipo_evento, fecha_hora[, buque_id[, medio_transporte]])
+            eventos_existentes: máscara o conjunto de tipos ya registrados
+            ultimo_evento: (tipo_evento, fecha_hora) del último evento o None
+
+        Returns:
+            Lista con un dict de errores por evento (vacío si es válido)
+        """
+        if not isinstance(eventos_existentes, int):
+            eventos_existentes = cls.mascara_eventos(eventos_existentes)
+
+        resultados = []
+        for tipo_evento, fecha_hora, *transporte in eventos:
+            errores = cls.validar_reglas(
+                tipo_evento,
+                fecha_hora,
+                direccion,
+                eventos_existentes,
+                ultimo_evento,
+                *transporte,
+            )
+            resultados.append(errores)
+            if not errores:
+                eventos_existentes |= cls.TRANSICIONES.bits.get(tipo_evento, 0)
+                ultimo_evento = (tipo_evento, fecha_hora)
+        return resultados
 
+    def completar_campos_automaticos(self):
+        """
+        Auto-asignación de campos según tipo de evento (medio de transporte,
+        buque en eventos terrestres, ubicación en tránsito). La aplica save()
+        y la ingesta en lote antes de bulk_create.
+        """
+        # Esto soluciona el problema de campos deshabilitados por JS que no se envían
         # Asignar medio de transporte automáticamente según tipo de evento
-        if self.tipo_evento in MEDIO_POR_EVENTO:
-            self.medio_transporte = MEDIO_POR_EVENTO[self.tipo_evento]
+        if self.tipo_evento in self.MEDIO_POR_EVENTO:
+            self.medio_transporte = self.MEDIO_POR_EVENTO[self.tipo_evento]
         elif not self.medio_transporte:
             # Para eventos especiales sin medio asignado, usar TRUCK por defecto
             self.medio_transporte = "TRUCK"
@@ -1340,38 +1666,184 @@ class EventoContenedor(models.Model):
             if not self.ubicacion_pais:
                 self.ubicacion_pais = "Aguas Internacionales"
 
-        super().save(*args, **kwargs)
-        # Actualizar estado de bloqueo del contenedor después de guardar
-        self._actualizar_bloqueo_contenedor()
+    def save(self, *args, **kwargs):
+        # ══════ AUTO-ASIGNACIÓN DE CAMPOS SEGÚN TIPO DE EVENTO ══════
+        self.completar_campos_automaticos()
+
+        es_nuevo = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Actualizar estado de bloqueo del contenedor después de guardar
+            self._actualizar_bloqueo_contenedor(es_nuevo=es_nuevo)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # Al quitar un evento del historial se recalcula desde cero
+            self._actualizar_bloqueo_contenedor()
+        return resultado
+
+    # ══════ MÁQUINA DE ESTADOS DE BLOQUEO ══════
+    @classmethod
+    def estado_inicial(cls):
+        """Estado de un contenedor sin eventos"""
+        return {
+            "bloqueado_por_evento": False,
+            "total_eventos": 0,
+            "ultimo_evento_tipo": "",
+            "ultimo_evento_fecha": None,
+            "ultimo_evento_ubicacion_puerto": "",
+            "ultimo_evento_ubicacion_pais": "",
+            "ultimo_evento_buque_id": None,
+        }
+
+    @classmethod
+    def aplicar_evento(
+        cls,
+        estado,
+        tipo_evento,
+        fecha_hora,
+        ubicacion_puerto="",
+        ubicacion_pais="",
+        buque_id=None,
+    ):
+        """
+        Transición incremental: aplica un único evento (posterior a los ya
+        aplicados) sobre el estado persistido y retorna el nuevo estado,
+        incluyendo el snapshot del último evento.
+        """
+        bloqueado = estado["bloqueado_por_evento"]
+        if tipo_evento in cls.EVENTOS_BLOQUEO:
+            bloqueado = True
+        elif tipo_evento in cls.EVENTOS_LIBERACION:
+            bloqueado = False
+        return {
+            "bloqueado_por_evento": bloqueado,
+            "total_eventos": estado["total_eventos"] + 1,
+            "ultimo_evento_tipo": tipo_evento,
+            "ultimo_evento_fecha": fecha_hora,
+            "ultimo_evento_ubicacion_puerto": ubicacion_puerto or "",
+            "ultimo_evento_ubicacion_pais": ubicacion_pais or "",
+            "ultimo_evento_buque_id": buque_id,
+        }
+
+    @classmethod
+    def estado_desde_historial(cls, eventos):
+        """
+        Reproduce desde cero un historial ordenado cronológicamente.
+
+        Args:
+            eventos: iterable de tuplas con los CAMPOS_HISTORIAL de cada evento
+        """
+        estado = cls.estado_inicial()
+        for evento in eventos:
+            estado = cls.aplicar_evento(estado, *evento)
+        return estado
+
+    # Campos (en orden) que consume aplicar_evento al reproducir historiales
+    CAMPOS_HISTORIAL = (
+        "tipo_evento",
+        "fecha_hora",
+        "ubicacion_puerto",
+        "ubicacion_pais",
+        "buque_id",
+    )
 
-    def _actualizar_bloqueo_contenedor(self):
-        """Actualiza el estado de bloqueo del contenedor según eventos"""
+    @classmethod
+    def historial_contenedor(cls, contenedor_id):
+        """Historial de un contenedor en orden cronológico estable"""
+        return (
+            cls.objects.filter(contenedor_id=contenedor_id)
+            .order_by("fecha_hora", "pk")
+            .values_list(*cls.CAMPOS_HISTORIAL)
+        )
+
+    def _actualizar_bloqueo_contenedor(self, es_nuevo=False):
+        """
+        Actualiza el estado de bloqueo del contenedor.
+
+        Un evento nuevo posterior al último registrado se aplica de forma
+        incremental (O(1)). Ediciones, eliminaciones o eventos retroactivos
+        recalculan el estado reproduciendo el historial completo.
+        """
         if not self.contenedor_id:
             return
 
-        # Verificar si hay eventos de bloqueo activos sin liberación posterior
-        eventos = EventoContenedor.objects.filter(
-            contenedor_id=self.contenedor_id
-        ).order_by("fecha_hora")
+        actual = (
+            Contenedor.objects.select_for_update()
+            .filter(pk=self.contenedor_id)
+            .values(*self.CAMPOS_ESTADO_CONTENEDOR)
+            .first()
+        )
+        if actual is None:
+            return
 
-        bloqueado = False
-        for evento in eventos:
-            if evento.tipo_evento in self.EVENTOS_BLOQUEO:
-                bloqueado = True
-            elif evento.tipo_evento in self.EVENTOS_LIBERACION:
-                bloqueado = False
+        fecha_ultimo = actual["ultimo_evento_fecha"]
+        es_incremental = es_nuevo and (
+            (fecha_ultimo is None and actual["total_eventos"] == 0)
+            or (fecha_ultimo is not None and self.fecha_hora >= fecha_ultimo)
+        )
+        if es_incremental:
+            nuevo = self.aplicar_evento(
+                actual, *(getattr(self, campo) for campo in self.CAMPOS_HISTORIAL)
+            )
+        else:
+            nuevo = self.estado_desde_historial(
+                self.historial_contenedor(self.contenedor_id)
+            )
 
         # Actualizar el contenedor
-        Contenedor.objects.filter(pk=self.contenedor_id).update(
-            bloqueado_por_evento=bloqueado
-        )
+        Contenedor.objects.filter(pk=self.contenedor_id).update(**nuevo)
+
+        # Mantener coherente la instancia de contenedor ya cargada en memoria
+        if EventoContenedor.contenedor.is_cached(self):
+            for campo, valor in nuevo.items():
+                setattr(self.contenedor, campo, valor)
+
+        # El bloqueo forma parte de la condición de retiro
+        if nuevo["bloqueado_por_evento"] != actual["bloqueado_por_evento"]:
+            if EventoContenedor.contenedor.is_cached(self):
+                self.contenedor.recalcular_listo_para_retiro()
+            else:
+                Contenedor.objects.filter(
+                    pk=self.contenedor_id
+                ).recalcular_listo_para_retiro()
 
     def __str__(self):
         return f"{self.contenedor.codigo_iso} - {self.get_tipo_evento_display()} - {self.fecha_hora.strftime('%Y-%m-%d %H:%M')}"
 
 
+# ====== APROBACIONES: SINCRONIZACIÓN DEL ESTADO DE RETIRO ======
+class RecalculaListoParaRetiroMixin:
+    """
+    Mantiene Contenedor.listo_para_retiro al guardar o eliminar una de las
+    tres aprobaciones que lo condicionan.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._recalcular_listo_para_retiro()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            self._recalcular_listo_para_retiro()
+        return resultado
+
+    def _recalcular_listo_para_retiro(self):
+        if not self.contenedor_id:
+            return
+        if type(self).contenedor.is_cached(self):
+            self.contenedor.recalcular_listo_para_retiro()
+        else:
+            Contenedor.objects.filter(
+                pk=self.contenedor_id
+            ).recalcular_listo_para_retiro()
+
+
 # ====== CUN04: PERMISOS ADUANEROS (1-1 opcional) ======
-class AprobacionAduanera(models.Model):
+class AprobacionAduanera(RecalculaListoParaRetiroMixin, models.Model):
     """Registro de aprobaciones aduaneras por contenedor"""
 
     contenedor = models.OneToOneField(
@@ -1530,7 +2002,7 @@ class AprobacionAduanera(models.Model):
 
 
 # ====== CUN05: REGISTRO FACTURAS AL CLIENTE (1-1 opcional) ======
-class AprobacionFinanciera(models.Model):
+class AprobacionFinanciera(RecalculaListoParaRetiroMixin, models.Model):
     """Registro de facturas emitidas al cliente por contenedor"""
 
     ESTADO_FINANCIERO_CHOICES = [
@@ -1539,6 +2011,8 @@ class AprobacionFinanciera(models.Model):
         ("CREDITO", "🔵 Crédito Aprobado"),
         ("ANULADA", "🔴 Anulada"),
     ]
+    # Estados que liberan el Gate Pass
+    ESTADOS_GATE_PASS = ("PAGADA", "CREDITO")
 
     # Servicios tarifados predefinidos
     SERVICIOS_DISPONIBLES = [
@@ -1689,7 +2163,7 @@ class AprobacionFinanciera(models.Model):
     @property
     def permite_gate_pass(self):
         """Indica si el estado financiero permite liberar el Gate Pass"""
-        return self.estado_financiero in ["PAGADA", "CREDITO"]
+        return self.estado_financiero in self.ESTADOS_GATE_PASS
 
     def get_servicios_display(self):
         """Retorna los servicios facturados como texto legible"""
@@ -1706,7 +2180,7 @@ class AprobacionFinanciera(models.Model):
 
 
 # ====== APROBACIÓN PAGO TRANSITARIO (1-1 opcional) ======
-class AprobacionPagoTransitario(models.Model):
+class AprobacionPagoTransitario(RecalculaListoParaRetiroMixin, models.Model):
     """Registro de pagos realizados por transitarios al puerto"""
 
     contenedor = models.OneToOneField(
@@ -1917,3 +2391,62 @@ class QuejaContenedor(models.Model):
 
     def __str__(self):
         return f"Queja #{self.queja.id} - {self.contenedor.codigo_iso}"
+
+
+# ====== ÍNDICE DE BÚSQUEDA UNIFICADA (omnibox) ======
+class DocumentoBusqueda(models.Model):
+    """
+    Fila del índice de búsqueda: un identificador buscable (código ISO, BL,
+    sello, DAM, factura, buque o transitario). El texto se indexa en la tabla
+    FTS5 control_busqueda_fts (tokenizador trigram), sincronizada con esta por
+    triggers SQL; el contenido lo mantiene control/busqueda.py.
+    """
+
+    TIPO_CHOICES = [
+        ("contenedor", "Contenedor"),
+        ("bl", "BL"),
+        ("sello", "Sello"),
+        ("dam", "DAM"),
+        ("factura", "Factura"),
+        ("buque", "Buque"),
+        ("transitario", "Transitario"),
+    ]
+
+    # Registro que generó la fila ("<modelo>:<pk>"): se reemplazan juntas
+    origen = models.CharField(max_length=50, db_index=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    objeto_id = models.PositiveBigIntegerField()
+    # Contenedor relacionado (filtra el buscador del admin de contenedores)
+    contenedor_id = models.PositiveBigIntegerField(null=True, db_index=True)
+    titulo = models.CharField(max_length=200)
+    detalle = models.CharField(max_length=300, blank=True)
+
+    class Meta:
+        verbose_name = "Documento de Búsqueda"
+        verbose_name_plural = "Documentos de Búsqueda"
+
+    def __str__(self):
+        return f"{self.tipo}: {self.titulo}"
+
+
+# ====== CACHÉ DE CONSULTAS EXTERNAS (SUNAT, IMO) ======
+class ConsultaExterna(models.Model):
+    """
+    Última respuesta de un servicio externo para una clave (RUC, IMO).
+    La mantiene control/consultas_externas.py; encontrado=False guarda las
+    claves inexistentes (caché negativo) para no volver a consultarlas.
+    """
+
+    servicio = models.CharField(max_length=20)
+    clave = models.CharField(max_length=50)
+    encontrado = models.BooleanField(default=True)
+    datos = models.JSONField(default=dict)
+    obtenido_en = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Consulta Externa (caché)"
+        verbose_name_plural = "Consultas Externas (caché)"
+        unique_together = ["servicio", "clave"]
+
+    def __str__(self):
+        return f"{self.servicio}:{self.clave}"
@@ -0,0 +1,98 @@
+"""
+Registro de recursos compartidos por los PDFs (logos, hojas de estilo, fuentes).
+
+Los logos se leen y codifican en base64 una sola vez por proceso, y las hojas de
+estilo se parsean una vez y se reutilizan en cada renderizado, junto con la
+configuración de fuentes de WeasyPrint. Cada recurso se recarga solo si su
+archivo cambió en disco (fecha de modificación y tamaño).
+
+La configuración de fuentes y las hojas parseadas de WeasyPrint se guardan por
+hilo, ya que el pool de pdf_jobs renderiza en paralelo.
+"""
+
+import base64
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+# Logos y hojas de estilo de cada familia de documentos
+LOGO_ADMIN = "SigepAdminLogo.jpeg"
+LOGO_CLIENTE = "NuevoLogo.png"
+CSS_ADMIN = "pdf_admin.css"
+CSS_CLIENTE = "pdf_cliente.css"
+
+
+class RegistroRecursos:
+    """Caché de recursos en memoria con recarga por cambios en disco"""
+
+    def __init__(self, directorio_imagenes=None, directorio_css=None):
+        estaticos = Path(settings.BASE_DIR) / "theme" / "static"
+        self.directorio_imagenes = Path(directorio_imagenes or estaticos / "images")
+        self.directorio_css = Path(directorio_css or estaticos / "css")
+        self._logos = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _ruta(self, nombre):
+        if nombre.endswith(".css"):
+            return self.directorio_css / nombre
+        return self.directorio_imagenes / nombre
+
+    def _firma_archivo(self, ruta):
+        """(mtime_ns, tamaño) o None si el archivo no existe"""
+        try:
+            info = ruta.stat()
+        except FileNotFoundError:
+            return None
+        return (info.st_mtime_ns, info.st_size)
+
+    def version(self, *nombres):
+        """Firma de los archivos indicados, para incluir en la huella de un PDF"""
+        return [
+            [nombre, self._firma_archivo(self._ruta(nombre))] for nombre in nombres
+        ]
+
+    # ====== LOGOS ======
+    def logo_base64(self, nombre):
+        """Logo codificado en base64 (None si el archivo no existe)"""
+        ruta = self._ruta(nombre)
+        firma = self._firma_archivo(ruta)
+        if firma is None:
+            return None
+        with self._lock:
+            guardado = self._logos.get(nombre)
+            if guardado and guardado[0] == firma:
+                return guardado[1]
+        codificado = base64.b64encode(ruta.read_bytes()).decode("utf-8")
+        with self._lock:
+            self._logos[nombre] = (firma, codificado)
+        return codificado
+
+    # ====== WEASYPRINT (por hilo) ======
+    def font_config(self):
+        """FontConfiguration reutilizada por todos los renderizados del hilo"""
+        from weasyprint.text.fonts import FontConfiguration
+
+        if getattr(self._local, "font_config", None) is None:
+            self._local.font_config = FontConfiguration()
+            self._local.hojas = {}
+        return self._local.font_config
+
+    def hoja_estilos(self, nombre):
+        """Hoja de estilo parseada (weasyprint.CSS), recargada si cambió"""
+        from weasyprint import CSS
+
+        font_config = self.font_config()
+        ruta = self._ruta(nombre)
+        firma = self._firma_archivo(ruta)
+        guardada = self._local.hojas.get(nombre)
+        if guardada and guardada[0] == firma:
+            return guardada[1]
+        hoja = CSS(filename=str(ruta), font_config=font_config)
+        self._local.hojas[nombre] = (firma, hoja)
+        return hoja
+
+
+# Instancia global del registro
+recursos = RegistroRecursos()
@@ -0,0 +1,270 @@
+"""
+Caché en disco de PDFs generados.
+
+Cada documento se identifica por una huella (SHA-256) de su plantilla y de los
+registros que lo alimentan. Mientras ningún registro cambie la huella es la
+misma, y el PDF se sirve desde disco sin volver a pasar por WeasyPrint.
+La misma huella sirve como ETag para responder 304 a los navegadores.
+
+El directorio tiene un tamaño máximo (SIGEP_PDF_CACHE_MAX_MB): al superarlo se
+eliminan los PDFs usados hace más tiempo (LRU por fecha de modificación, que
+se renueva en cada acierto).
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, Max, Sum
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+_PATRON_CLAVE = re.compile(r"^[0-9a-f]{64}$")
+
+# Fuente de huella con los valores de columnas de cada fila: para columnas
+# que se escriben con QuerySet.update() (no renuevan updated_at), p. ej. el
+# estado de los contenedores derivado de sus eventos
+Columnas = namedtuple("Columnas", ["queryset", "campos"])
+
+# Contadores del proceso actual
+_contadores = {"aciertos": 0, "fallos": 0, "no_modificados": 0, "desalojos": 0}
+_lock = threading.Lock()
+
+
+def directorio():
+    """Directorio donde se guardan los PDFs y el estado de los trabajos"""
+    ruta = Path(settings.SIGEP_CACHE_DIR) / "pdf"
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+def es_clave_valida(clave):
+    """Las claves son hashes hex: evita rutas arbitrarias desde la URL"""
+    return bool(_PATRON_CLAVE.match(clave or ""))
+
+
+# ====== HUELLA DE CONTENIDO ======
+def _plantillas_usadas(nombre, vistas):
+    """
+    Nombre y archivo de la plantilla y de las que extiende o incluye
+    (recursivo). Los nombres dinámicos ({% include variable %}) no se siguen.
+    """
+    if nombre in vistas:
+        return []
+    vistas.add(nombre)
+    plantilla = get_template(nombre)
+    usadas = [(nombre, plantilla.origin.name)]
+    nodos = plantilla.template.nodelist.get_nodes_by_type(
+        ExtendsNode
+    ) + plantilla.template.nodelist.get_nodes_by_type(IncludeNode)
+    for nodo in nodos:
+        expresion = nodo.parent_name if isinstance(nodo, ExtendsNode) else nodo.template
+        if isinstance(expresion.var, str) and not expresion.filters:
+            usadas.extend(_plantillas_usadas(expresion.var, vistas))
+    return usadas
+
+
+def _firma_plantilla(nombre):
+    """
+    Nombre y fecha de modificación de la plantilla y de su cadena de
+    extends/include: editar cualquiera invalida sus PDFs
+    """
+    return [
+        [usada, os.path.getmtime(origen)]
+        for usada, origen in _plantillas_usadas(nombre, set())
+    ]
+
+
+def _firma_instancia(obj):
+    """Valores de todas las columnas ya cargadas en memoria (sin consultas)"""
+    return [
+        obj._meta.label,
+        [
+            [campo.attname, getattr(obj, campo.attname)]
+            for campo in obj._meta.concrete_fields
+        ],
+    ]
+
+
+def _firma_queryset(queryset):
+    """
+    Resumen de un conjunto de filas en una sola consulta agregada:
+    cantidad, última modificación y suma de ids (detecta altas, bajas y ediciones).
+    """
+    resumen = queryset.order_by().aggregate(
+        total=Count("pk"), ultimo=Max("updated_at"), ids=Sum("pk")
+    )
+    return [
+        queryset.model._meta.label,
+        resumen["total"],
+        resumen["ultimo"],
+        resumen["ids"],
+    ]
+
+
+def columnas(queryset, *campos):
+    """Fuente de huella: valores de 'campos' de cada fila del queryset"""
+    return Columnas(queryset, campos)
+
+
+def _firma_columnas(fuente):
+    """Valores de las columnas por pk, en una sola consulta (solo esas columnas)"""
+    filas = fuente.queryset.order_by("pk").values_list("pk", *fuente.campos)
+    return [fuente.queryset.model._meta.label, list(fuente.campos), list(filas)]
+
+
+def huella(plantilla, *fuentes):
+    """
+    Calcula la clave de caché de un documento.
+
+    Args:
+        plantilla: nombre de la plantilla HTML del PDF
+        fuentes: instancias de modelo, querysets (con updated_at), columnas()
+            o valores simples
+    """
+    partes = [_firma_plantilla(plantilla)]
+    for fuente in fuentes:
+        if isinstance(fuente, Columnas):
+            partes.append(_firma_columnas(fuente))
+        elif isinstance(fuente, models.QuerySet):
+            partes.append(_firma_queryset(fuente))
+        elif isinstance(fuente, models.Model):
+            partes.append(_firma_instancia(fuente))
+        else:
+            partes.append(fuente)
+    datos = json.dumps(partes, default=str, sort_keys=True)
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+# ====== ALMACENAMIENTO ======
+def ruta_pdf(clave):
+    return directorio() / f"{clave}.pdf"
+
+
+def etag(clave):
+    """ETag fuerte: la huella cambia si y solo si cambia el contenido"""
+    return f'"{clave}"'
+
+
+def _contar(contador, cantidad=1):
+    with _lock:
+        _contadores[contador] += cantidad
+
+
+def registrar_no_modificado():
+    """Cuenta una respuesta 304 (el cliente ya tenía el documento)"""
+    _contar("no_modificados")
+
+
+def existe(clave):
+    """Consulta sin efectos: no cuenta aciertos ni renueva la antigüedad"""
+    return ruta_pdf(clave).exists()
+
+
+def obtener(clave):
+    """
+    Ruta del PDF cacheado o None si aún no se generó.
+    Un acierto renueva la fecha de modificación (orden LRU del desalojo).
+    """
+    ruta = ruta_pdf(clave)
+    try:
+        os.utime(ruta)
+    except FileNotFoundError:
+        _contar("fallos")
+        return None
+    _contar("aciertos")
+    return ruta
+
+
+def leer(clave):
+    """Contenido del PDF cacheado o None (sin contar aciertos ni fallos)"""
+    try:
+        return ruta_pdf(clave).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def guardar(clave, contenido):
+    """Guarda el PDF de forma atómica, aplica el límite de tamaño y retorna su ruta"""
+    ruta = ruta_pdf(clave)
+    escribir_atomico(ruta, contenido)
+    desalojar()
+    return ruta
+
+
+def _archivos_pdf():
+    """(mtime, tamaño, ruta) de cada PDF cacheado"""
+    archivos = []
+    with os.scandir(directorio()) as entradas:
+        for entrada in entradas:
+            if not entrada.name.endswith(".pdf"):
+                continue
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, Path(entrada.path)))
+    return archivos
+
+
+def desalojar(limite_bytes=None):
+    """
+    Elimina los PDFs menos usados hasta quedar bajo el límite.
+
+    Returns:
+        Cantidad de PDFs eliminados
+    """
+    if limite_bytes is None:
+        limite_bytes = settings.SIGEP_PDF_CACHE_MAX_MB * 1024 * 1024
+    archivos = _archivos_pdf()
+    total = sum(tamano for _, tamano, _ in archivos)
+    eliminados = 0
+    for _, tamano, ruta in sorted(archivos, key=lambda a: a[0]):
+        if total <= limite_bytes:
+            break
+        ruta.unlink(missing_ok=True)
+        # Estado del trabajo asociado (ver pdf_jobs)
+        ruta.with_suffix(".json").unlink(missing_ok=True)
+        total -= tamano
+        eliminados += 1
+    if eliminados:
+        _contar("desalojos", eliminados)
+    return eliminados
+
+
+def estadisticas():
+    """Contadores del proceso y ocupación actual del directorio"""
+    archivos = _archivos_pdf()
+    with _lock:
+        datos = dict(_contadores)
+    consultas = datos["aciertos"] + datos["fallos"]
+    datos.update(
+        {
+            "tasa_aciertos": round(datos["aciertos"] / consultas, 3)
+            if consultas
+            else None,
+            "archivos": len(archivos),
+            "bytes": sum(tamano for _, tamano, _ in archivos),
+            "limite_bytes": settings.SIGEP_PDF_CACHE_MAX_MB * 1024 * 1024,
+        }
+    )
+    return datos
+
+
+def escribir_atomico(ruta, contenido):
+    """Escribe en un temporal y lo renombra: nunca se lee un archivo a medias"""
+    fd, temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,137 @@
+"""
+Cola local de renderizado de PDFs (sin broker externo).
+
+La vista arma el HTML (consultas y plantilla) en el hilo de la petición y
+entrega a un pool de hilos solo la conversión HTML → PDF de WeasyPrint, que es
+la parte costosa. El trabajo se identifica por la huella del documento, así que
+pedir dos veces el mismo manifiesto no lo renderiza dos veces. Su estado vive
+en disco junto al PDF para que cualquier proceso del servidor pueda consultarlo.
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import pdf_cache
+from .pdf_assets import recursos
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = "pendiente"
+LISTO = "listo"
+ERROR = "error"
+DESCONOCIDO = "desconocido"
+
+# Un trabajo pendiente sin novedades en este tiempo se da por perdido
+# (por ejemplo, si el proceso que lo ejecutaba se reinició)
+EXPIRACION_PENDIENTE_SEGUNDOS = 15 * 60
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SIGEP_PDF_WORKERS,
+                thread_name_prefix="sigep-pdf",
+            )
+        return _executor
+
+
+def renderizar_pdf(html_content, hojas_estilo=()):
+    """
+    Convierte HTML a PDF con WeasyPrint, reutilizando la configuración de
+    fuentes y las hojas de estilo ya parseadas del registro de recursos.
+    """
+    from weasyprint import HTML
+
+    return HTML(string=html_content).write_pdf(
+        stylesheets=[recursos.hoja_estilos(nombre) for nombre in hojas_estilo],
+        font_config=recursos.font_config(),
+    )
+
+
+# ====== ESTADO EN DISCO ======
+def _ruta_estado(clave):
+    return pdf_cache.directorio() / f"{clave}.json"
+
+
+def _escribir_estado(clave, **datos):
+    datos["actualizado"] = time.time()
+    pdf_cache.escribir_atomico(
+        _ruta_estado(clave), json.dumps(datos).encode("utf-8")
+    )
+
+
+def _leer_estado(clave):
+    try:
+        return json.loads(_ruta_estado(clave).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def estado(clave):
+    """
+    Estado de un trabajo: dict con 'estado' (pendiente/listo/error/desconocido),
+    'filename' y, si falló, 'error'.
+    """
+    datos = _leer_estado(clave) or {}
+    if pdf_cache.existe(clave):
+        return {"estado": LISTO, "filename": datos.get("filename")}
+    if not datos:
+        return {"estado": DESCONOCIDO}
+    if (
+        datos.get("estado") == PENDIENTE
+        and time.time() - datos["actualizado"] > EXPIRACION_PENDIENTE_SEGUNDOS
+    ):
+        return {"estado": DESCONOCIDO}
+    return {k: v for k, v in datos.items() if k != "actualizado"}
+
+
+def encolar(clave, filename, generar_html, hojas_estilo=()):
+    """
+    Encola el renderizado de un documento si no está listo ni en curso.
+
+    Args:
+        clave: huella del documento (ver pdf_cache.huella)
+        filename: nombre de descarga del PDF
+        generar_html: callable que retorna el HTML; se ejecuta en el hilo
+            actual solo si hay que renderizar (usa la BD y las plantillas)
+        hojas_estilo: nombres de las hojas de pdf_assets que usa el documento
+
+    Returns:
+        El estado del trabajo tras encolarlo
+    """
+    with _lock:
+        actual = estado(clave)
+        if actual["estado"] in (LISTO, PENDIENTE):
+            return actual
+        _escribir_estado(clave, estado=PENDIENTE, filename=filename)
+
+    try:
+        html_content = generar_html()
+    except Exception:
+        _ruta_estado(clave).unlink(missing_ok=True)
+        raise
+
+    _get_executor().submit(
+        _ejecutar, clave, filename, html_content, tuple(hojas_estilo)
+    )
+    return estado(clave)
+
+
+def _ejecutar(clave, filename, html_content, hojas_estilo):
+    try:
+        pdf = renderizar_pdf(html_content, hojas_estilo)
+        pdf_cache.guardar(clave, pdf)
+        _escribir_estado(clave, estado=LISTO, filename=filename)
+    except Exception as e:
+        logger.exception(f"Error al renderizar PDF {clave}")
+        _escribir_estado(clave, estado=ERROR, filename=filename, error=str(e))
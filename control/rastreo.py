@@ -0,0 +1,111 @@
+"""
+Rastreo de contenedores por lote para transitarios.
+
+Recibe hasta MAX_CONSULTAS códigos ISO 6346 y/o números de BL pegados en un
+texto, valida los códigos en lote (iso6346.validate_iso_6346_many) y resuelve
+todos con una sola consulta: el contenedor trae su arribo, buque y el snapshot
+denormalizado del último evento, así no hace falta consultar la tabla de
+eventos por contenedor.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .iso6346 import validate_iso_6346_many
+from .models import Contenedor
+
+MAX_CONSULTAS = 500
+
+# Separadores aceptados al pegar una lista (espacios, saltos, comas, punto y coma)
+_SEPARADORES = re.compile(r"[\s,;]+")
+# Forma aproximada de un código de contenedor: se valida con ISO 6346 (y
+# reporta el error) en lugar de buscarse como BL
+_FORMA_CODIGO = re.compile(r"[A-Z]{4}[0-9]{6,8}")
+
+# Una fila del reporte:
+# - consulta: código o BL tal como se pidió (normalizado)
+# - contenedor: Contenedor encontrado o None
+# - error: mensaje si el código es inválido o no se encontró
+FilaRastreo = namedtuple("FilaRastreo", ["consulta", "contenedor", "error"])
+
+
+class ResultadoRastreo:
+    """Filas del reporte en el orden de la consulta, y avisos generales"""
+
+    def __init__(self):
+        self.filas = []
+        self.avisos = []
+
+    @property
+    def encontrados(self):
+        return sum(1 for fila in self.filas if fila.contenedor is not None)
+
+
+def separar_consultas(texto):
+    """Códigos/BL únicos del texto, en mayúsculas y en el orden en que aparecen"""
+    vistos = dict.fromkeys(
+        token for token in _SEPARADORES.split((texto or "").upper()) if token
+    )
+    return list(vistos)
+
+
+def rastrear_lote(texto):
+    """
+    Resuelve un lote de códigos ISO 6346 y/o BL.
+
+    Los tokens con forma de código de contenedor se validan con ISO 6346; el
+    resto se buscan como número de BL (un BL puede agrupar varios contenedores).
+
+    Returns:
+        ResultadoRastreo
+    """
+    resultado = ResultadoRastreo()
+    consultas = separar_consultas(texto)
+    if len(consultas) > MAX_CONSULTAS:
+        resultado.avisos.append(
+            f"Se consultan los primeros {MAX_CONSULTAS} de {len(consultas)} códigos."
+        )
+        consultas = consultas[:MAX_CONSULTAS]
+
+    codigos = [c for c in consultas if _FORMA_CODIGO.fullmatch(c)]
+    bls = {c for c in consultas if not _FORMA_CODIGO.fullmatch(c)}
+
+    errores = {}
+    for revision in validate_iso_6346_many(codigos):
+        if revision.error:
+            errores[revision.codigo] = revision.error
+    validos = [codigo for codigo in codigos if codigo not in errores]
+
+    por_codigo = {}
+    por_bl = {}
+    if validos or bls:
+        for contenedor in (
+            Contenedor.objects.filter(
+                Q(codigo_iso__in=validos) | Q(bl_referencia__in=bls)
+            )
+            .select_related("arribo__buque", "ultimo_evento_buque")
+            .order_by("codigo_iso")
+        ):
+            por_codigo[contenedor.codigo_iso] = contenedor
+            por_bl.setdefault(contenedor.bl_referencia.upper(), []).append(contenedor)
+
+    for consulta in consultas:
+        if consulta in errores:
+            resultado.filas.append(FilaRastreo(consulta, None, errores[consulta]))
+        elif consulta in bls:
+            contenedores = por_bl.get(consulta)
+            if not contenedores:
+                resultado.filas.append(
+                    FilaRastreo(consulta, None, "No hay contenedores con este BL")
+                )
+            for contenedor in contenedores or ():
+                resultado.filas.append(FilaRastreo(consulta, contenedor, None))
+        elif consulta in por_codigo:
+            resultado.filas.append(FilaRastreo(consulta, por_codigo[consulta], None))
+        else:
+            resultado.filas.append(
+                FilaRastreo(consulta, None, "Contenedor no registrado en el puerto")
+            )
+    return resultado
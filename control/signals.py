@@ -0,0 +1,115 @@
+"""
+Sincronización de datos derivados al guardar/eliminar registros:
+
+- Caché de fragmentos del rastreo público (cache_tracking): cualquier cambio
+  que se vea en la búsqueda o en el detalle de un contenedor (el contenedor,
+  sus eventos, sus aprobaciones, y el arribo/buque/transitario que muestra)
+  elimina sus fragmentos. Si se edita el código ISO de un contenedor se
+  eliminan también los fragmentos del código anterior.
+- Índice de búsqueda unificada (busqueda): contenedores, aprobaciones, buques
+  y transitarios reemplazan sus filas del índice.
+
+Las escrituras masivas que no pasan por save()/delete() (bulk_create,
+bulk_update, update) sincronizan a mano.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import busqueda, cache_tracking
+from .models import (
+    AprobacionAduanera,
+    AprobacionFinanciera,
+    AprobacionPagoTransitario,
+    Arribo,
+    Buque,
+    Contenedor,
+    EventoContenedor,
+    Transitario,
+)
+
+
+# ====== CACHÉ DEL RASTREO PÚBLICO ======
+@receiver(pre_save, sender=Contenedor)
+def recordar_codigo_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda el código ISO en BD para invalidarlo si el guardado lo cambia"""
+    instance._codigo_iso_anterior = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and "codigo_iso" not in update_fields:
+        return
+    instance._codigo_iso_anterior = (
+        Contenedor.objects.filter(pk=instance.pk)
+        .values_list("codigo_iso", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Contenedor)
+@receiver(post_delete, sender=Contenedor)
+def invalidar_contenedor(sender, instance, **kwargs):
+    codigos = {instance.codigo_iso, getattr(instance, "_codigo_iso_anterior", None)}
+    cache_tracking.invalidar(*(codigo for codigo in codigos if codigo))
+
+
+@receiver(post_save, sender=EventoContenedor)
+@receiver(post_delete, sender=EventoContenedor)
+@receiver(post_save, sender=AprobacionAduanera)
+@receiver(post_delete, sender=AprobacionAduanera)
+@receiver(post_save, sender=AprobacionFinanciera)
+@receiver(post_delete, sender=AprobacionFinanciera)
+@receiver(post_save, sender=AprobacionPagoTransitario)
+@receiver(post_delete, sender=AprobacionPagoTransitario)
+def invalidar_por_contenedor(sender, instance, **kwargs):
+    """Modelos que cuelgan de un contenedor"""
+    codigo_iso = (
+        Contenedor.objects.filter(pk=instance.contenedor_id)
+        .values_list("codigo_iso", flat=True)
+        .first()
+    )
+    cache_tracking.invalidar(codigo_iso)
+
+
+def _invalidar_contenedores(**filtro):
+    cache_tracking.invalidar(
+        *Contenedor.objects.filter(**filtro).values_list("codigo_iso", flat=True)
+    )
+
+
+@receiver(post_save, sender=Arribo)
+def invalidar_arribo(sender, instance, created, **kwargs):
+    if not created:
+        _invalidar_contenedores(arribo=instance)
+
+
+@receiver(post_save, sender=Buque)
+def invalidar_buque(sender, instance, created, **kwargs):
+    if not created:
+        _invalidar_contenedores(arribo__buque=instance)
+
+
+@receiver(post_save, sender=Transitario)
+def invalidar_transitario(sender, instance, created, **kwargs):
+    if not created:
+        _invalidar_contenedores(transitario=instance)
+
+
+# ====== ÍNDICE DE BÚSQUEDA ======
+@receiver(post_save, sender=Contenedor)
+@receiver(post_save, sender=AprobacionAduanera)
+@receiver(post_save, sender=AprobacionFinanciera)
+@receiver(post_save, sender=Buque)
+@receiver(post_save, sender=Transitario)
+def indexar_busqueda(sender, instance, raw=False, **kwargs):
+    # Carga de fixtures: el índice se regenera con reconstruir_indice_busqueda
+    if not raw:
+        busqueda.indexar(instance)
+
+
+@receiver(post_delete, sender=Contenedor)
+@receiver(post_delete, sender=AprobacionAduanera)
+@receiver(post_delete, sender=AprobacionFinanciera)
+@receiver(post_delete, sender=Buque)
+@receiver(post_delete, sender=Transitario)
+def desindexar_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(instance)
@@ -10,16 +10,37 @@ Proveedores soportados:
     1. apis.net.pe - Regístrate en https://apis.net.pe/
     2. apiperu.dev - Regístrate en https://apiperu.dev/
     3. decolecta.com - Regístrate en https://decolecta.com/
+
+Caché (control/consultas_externas.py):
+    Las respuestas se guardan en la tabla ConsultaExterna. Cada campo tiene su
+    vigencia (SUNAT_CACHE_TTL_CAMPOS): mientras alguno siga vigente se responde
+    desde la caché y, si otro ya venció, se revalida en segundo plano. Los RUC
+    inexistentes se recuerdan SUNAT_CACHE_TTL_NO_ENCONTRADO segundos.
 """
 
 import logging
 import os
+import threading
 
 import requests
 from django.conf import settings
 
+from . import consultas_externas
+
 logger = logging.getLogger(__name__)
 
+SERVICIO = "sunat"
+
+# Respuestas del proveedor que significan "el RUC no existe" (caché negativo)
+ESTADOS_NO_ENCONTRADO = (404, 422)
+
+# URL de consulta de cada proveedor (SUNAT_API_URL la reemplaza)
+URLS_PROVEEDOR = {
+    "apis.net.pe": "https://api.apis.net.pe/v2/sunat/ruc",
+    "apiperu.dev": "https://apiperu.dev/api/ruc",
+    "decolecta": "https://api.decolecta.com/v1/sunat/ruc",
+}
+
 
 # Datos de demostración para RUCs conocidos (cuando no hay token)
 DEMO_DATA = {
@@ -75,7 +96,22 @@ class SunatClient:
             or os.environ.get("SUNAT_API_PROVIDER")
             or "apis.net.pe"
         )
-        self.timeout = 10  # segundos
+        self.api_url = getattr(settings, "SUNAT_API_URL", None) or os.environ.get(
+            "SUNAT_API_URL"
+        )
+        self.timeout = settings.SUNAT_API_TIMEOUT  # segundos
+        self._sesion = None
+        self._lock = threading.Lock()
+
+    @property
+    def sesion(self):
+        """Sesión keep-alive compartida con reintentos acotados"""
+        with self._lock:
+            if self._sesion is None:
+                self._sesion = consultas_externas.crear_sesion(
+                    settings.SUNAT_API_REINTENTOS
+                )
+            return self._sesion
 
     def consultar(self, ruc: str) -> dict:
         """
@@ -96,16 +132,91 @@ class SunatClient:
         if not self.token:
             return self._demo_data(ruc)
 
-        # Consultar según el proveedor configurado
+        cacheada = consultas_externas.leer(SERVICIO, ruc)
+        if cacheada is not None:
+            datos = consultas_externas.desde_cache(
+                SERVICIO,
+                cacheada,
+                settings.SUNAT_CACHE_TTL_CAMPOS,
+                settings.SUNAT_CACHE_TTL_NO_ENCONTRADO,
+                lambda: self._consultar_y_guardar(ruc),
+            )
+            if datos is not None:
+                return datos
+
+        consultas_externas.contar(SERVICIO, "fallos")
+        datos = self._consultar_y_guardar(ruc)
+        if "_cache" not in datos and cacheada is not None and cacheada.encontrado:
+            # El servicio falló: mejor el dato vencido que ninguno
+            return consultas_externas.con_estado(
+                cacheada,
+                consultas_externas.VENCIDO,
+                campos_vencidos=list(settings.SUNAT_CACHE_TTL_CAMPOS),
+                aviso=datos.get("error"),
+            )
+        return datos
+
+    def consultar_lote(self, rucs, plazo=None):
+        """
+        Consulta varios RUC en paralelo (hasta CONSULTAS_LOTE_CONCURRENCIA
+        a la vez) dentro de un plazo total.
+
+        Yields:
+            (ruc, datos normalizados o error) en orden de llegada
+        """
+        for _servicio, ruc, datos in consultas_externas.consultar_lote(
+            [self.lote(rucs)], plazo
+        ):
+            yield ruc, datos
+
+    def lote(self, rucs):
+        """Lote de RUC para consultas_externas.consultar_lote()"""
+        return (
+            SERVICIO,
+            rucs,
+            lambda ruc: self.normalizar_datos(self.consultar(ruc)),
+            settings.CONSULTAS_LOTE_CONCURRENCIA[SERVICIO],
+        )
+
+    def _consultar_y_guardar(self, ruc: str) -> dict:
+        """
+        Consulta al proveedor y guarda la respuesta si es definitiva (datos o
+        RUC inexistente). Los errores transitorios no se guardan y se
+        retornan sin el campo _cache. Las consultas simultáneas del mismo RUC
+        (hilos o procesos) comparten una sola llamada al proveedor.
+        """
+        return consultas_externas.consultar_una_vez(
+            SERVICIO, ruc, lambda: self._consultar_proveedor_y_guardar(ruc)
+        )
+
+    def _consultar_proveedor_y_guardar(self, ruc: str) -> dict:
+        datos = self._consultar_proveedor(ruc)
+        estado = datos.pop("_status", None)
+        if "error" not in datos:
+            consultas_externas.guardar(SERVICIO, ruc, datos)
+        elif estado in ESTADOS_NO_ENCONTRADO:
+            consultas_externas.guardar(SERVICIO, ruc, datos, encontrado=False)
+        else:
+            return datos
+        return {**datos, "_cache": {"estado": consultas_externas.EXTERNO}}
+
+    def _consultar_proveedor(self, ruc: str) -> dict:
+        """Consulta según el proveedor configurado"""
         try:
-            if self.provider == "apis.net.pe":
-                return self._consultar_apis_net_pe(ruc)
-            elif self.provider == "apiperu.dev":
-                return self._consultar_apiperu_dev(ruc)
-            elif self.provider == "decolecta":
-                return self._consultar_decolecta(ruc)
-            else:
-                return self._consultar_apis_net_pe(ruc)
+            with consultas_externas.llamada_externa(SERVICIO) as llamada:
+                if self.provider == "apis.net.pe":
+                    datos = self._consultar_apis_net_pe(ruc)
+                elif self.provider == "apiperu.dev":
+                    datos = self._consultar_apiperu_dev(ruc)
+                elif self.provider == "decolecta":
+                    datos = self._consultar_decolecta(ruc)
+                else:
+                    datos = self._consultar_apis_net_pe(ruc)
+                llamada.estado_http = datos.get("_status")
+                return datos
+        except consultas_externas.ServicioNoDisponible as e:
+            logger.warning(f"Consulta de RUC {ruc} rechazada: {e}")
+            return {"error": str(e)}
         except requests.exceptions.Timeout:
             logger.error(f"Timeout al consultar RUC {ruc}")
             return {"error": "Tiempo de espera agotado. Intente nuevamente."}
@@ -134,27 +245,30 @@ class SunatClient:
                 ],
             }
 
+    def _url(self, provider: str) -> str:
+        return self.api_url or URLS_PROVEEDOR[provider]
+
     def _consultar_apis_net_pe(self, ruc: str) -> dict:
         """Consulta usando apis.net.pe"""
-        url = f"https://api.apis.net.pe/v2/sunat/ruc?numero={ruc}"
+        url = f"{self._url('apis.net.pe')}?numero={ruc}"
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Referer": "https://apis.net.pe/api-consulta-ruc",
         }
 
-        response = requests.get(url, headers=headers, timeout=self.timeout)
+        response = self.sesion.get(url, headers=headers, timeout=self.timeout)
         return self._handle_response(response)
 
     def _consultar_apiperu_dev(self, ruc: str) -> dict:
         """Consulta usando apiperu.dev"""
-        url = "https://apiperu.dev/api/ruc"
+        url = self._url("apiperu.dev")
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
         }
         payload = {"ruc": ruc}
 
-        response = requests.post(
+        response = self.sesion.post(
             url, json=payload, headers=headers, timeout=self.timeout
         )
         result = self._handle_response(response)
@@ -166,10 +280,10 @@ class SunatClient:
 
     def _consultar_decolecta(self, ruc: str) -> dict:
         """Consulta usando decolecta.com"""
-        url = f"https://api.decolecta.com/v1/sunat/ruc?numero={ruc}"
+        url = f"{self._url('decolecta')}?numero={ruc}"
         headers = {"Authorization": f"Bearer {self.token}"}
 
-        response = requests.get(url, headers=headers, timeout=self.timeout)
+        response = self.sesion.get(url, headers=headers, timeout=self.timeout)
         return self._handle_response(response)
 
     def _handle_response(self, response: requests.Response) -> dict:
@@ -181,6 +295,7 @@ class SunatClient:
             return {
                 "error": f"Error {response.status_code}",
                 "message": response.text,
+                "_status": response.status_code,
             }
 
     def normalizar_datos(self, data: dict) -> dict:
@@ -232,6 +347,7 @@ class SunatClient:
             "es_buen_contribuyente": data.get("es_buen_contribuyente", False),
             "ubigeo": data.get("ubigeo") or "",
             "_modo": data.get("_modo"),
+            "_cache": data.get("_cache"),
         }
 
 
@@ -0,0 +1,753 @@
+"""
+Tests de Aceptación - Clientes de Servicios Externos
+Casos de Prueba: CP-030, CP-031, CP-032, CP-033, CP-034
+"""
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from control import coalescencia, consultas_externas
+from control.imo_client import ImoClient
+from control.models import Buque, ConsultaExterna
+from control.sunat_client import SunatClient
+
+
+RUC = "20100070970"
+DATOS_RUC = {
+    "numeroDocumento": RUC,
+    "nombre": "SUPERMERCADOS PERUANOS SOCIEDAD ANONIMA",
+    "estado": "ACTIVO",
+    "condicion": "HABIDO",
+}
+
+IMO = "9839133"
+HTML_VESSELFINDER = (
+    Path(__file__).resolve().parent / "fixtures" / "vesselfinder_9839133.html"
+).read_text(encoding="utf-8")
+
+
+def respuesta_http(status=200, datos=None, texto=""):
+    respuesta = mock.Mock(status_code=status, ok=status < 400, text=texto)
+    respuesta.json.return_value = datos or {}
+    return respuesta
+
+
+class TestCacheSunat(TestCase):
+    """CP-030: Caché persistente, sesión con reintentos y estadísticas de SunatClient"""
+
+    def setUp(self):
+        consultas_externas.reiniciar_circuitos()
+        self.cliente = SunatClient()
+        self.cliente.token = "token-de-prueba"
+        self.cliente.provider = "decolecta"
+        self.cliente._sesion = mock.Mock()
+        self.cliente._sesion.get.return_value = respuesta_http(datos=DATOS_RUC)
+        # La revalidación en segundo plano se ejecuta en línea en los tests
+        revalidar = mock.patch(
+            "control.consultas_externas.revalidar",
+            side_effect=lambda servicio, clave, funcion: funcion(),
+        )
+        self.revalidar = revalidar.start()
+        self.addCleanup(revalidar.stop)
+
+    def _envejecer(self, **delta):
+        ConsultaExterna.objects.filter(servicio="sunat", clave=RUC).update(
+            obtenido_en=timezone.now() - timedelta(**delta)
+        )
+
+    # ===== HAPPY PATH =====
+    def test_segunda_consulta_desde_cache(self):
+        """La segunda consulta del mismo RUC no llama al proveedor"""
+        primera = self.cliente.consultar(RUC)
+        segunda = self.cliente.consultar(RUC)
+
+        self.assertEqual(self.cliente._sesion.get.call_count, 1)
+        self.assertEqual(primera["_cache"]["estado"], "externo")
+        self.assertEqual(segunda["_cache"]["estado"], "fresco")
+        self.assertEqual(segunda["nombre"], DATOS_RUC["nombre"])
+        normalizado = self.cliente.normalizar_datos(segunda)
+        self.assertEqual(normalizado["razon_social"], DATOS_RUC["nombre"])
+        self.assertEqual(normalizado["_cache"]["estado"], "fresco")
+
+    def test_campos_vencidos_se_revalidan(self):
+        """Con estado/condición vencidos responde la caché y revalida en segundo plano"""
+        self.cliente.consultar(RUC)
+        self._envejecer(days=2)
+        self.cliente._sesion.get.return_value = respuesta_http(
+            datos={**DATOS_RUC, "estado": "BAJA DE OFICIO"}
+        )
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertEqual(datos["_cache"]["estado"], "vencido")
+        self.assertEqual(datos["_cache"]["campos_vencidos"], ["estado", "condicion"])
+        self.assertEqual(datos["estado"], "ACTIVO")
+        self.revalidar.assert_called_once()
+        self.assertEqual(self.cliente.consultar(RUC)["estado"], "BAJA DE OFICIO")
+
+    def test_todos_los_campos_vencidos(self):
+        """Si ningún campo sigue vigente se consulta al proveedor en línea"""
+        self.cliente.consultar(RUC)
+        self._envejecer(days=31)
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertEqual(datos["_cache"]["estado"], "externo")
+        self.assertEqual(self.cliente._sesion.get.call_count, 2)
+        self.revalidar.assert_not_called()
+
+    def test_ruc_inexistente_cache_negativo(self):
+        """Un RUC inexistente (404) se recuerda y no se vuelve a consultar"""
+        self.cliente._sesion.get.return_value = respuesta_http(status=404)
+
+        self.assertIn("error", self.cliente.consultar(RUC))
+        datos = self.cliente.consultar(RUC)
+
+        self.assertEqual(datos["_cache"]["estado"], "negativo")
+        self.assertEqual(self.cliente._sesion.get.call_count, 1)
+        self.assertFalse(ConsultaExterna.objects.get(clave=RUC).encontrado)
+
+    def test_sesion_con_reintentos(self):
+        """La sesión reutiliza conexiones y reintenta errores transitorios con backoff"""
+        with self.settings(SUNAT_API_REINTENTOS=3):
+            sesion = SunatClient().sesion
+        reintentos = sesion.get_adapter("https://api.decolecta.com").max_retries
+        self.assertEqual(reintentos.total, 3)
+        self.assertIn(503, reintentos.status_forcelist)
+        self.assertIn("POST", reintentos.allowed_methods)
+
+    def test_estadisticas_staff(self):
+        """El staff consulta tasa de aciertos y latencia del proveedor"""
+        self.cliente.consultar(RUC)
+        self.cliente.consultar(RUC)
+        staff = User.objects.create_user('staff', 'staff@test.com', 'staff123', is_staff=True)
+        self.client.force_login(staff)
+
+        datos = self.client.get(reverse('control:consultas_externas_estadisticas')).json()
+
+        sunat = datos["servicios"]["sunat"]
+        self.assertGreaterEqual(sunat["aciertos"], 1)
+        self.assertGreaterEqual(sunat["llamadas_externas"], 1)
+        self.assertIsNotNone(sunat["latencia_promedio_ms"])
+        self.assertIsNotNone(sunat["tasa_aciertos"])
+
+    # ===== ERROR PATH =====
+    def test_error_transitorio_no_se_guarda(self):
+        """Error: un 503 o un corte de conexión no se cachean"""
+        self.cliente._sesion.get.return_value = respuesta_http(status=503)
+        self.assertEqual(self.cliente.consultar(RUC)["error"], "Error 503")
+
+        self.cliente._sesion.get.side_effect = requests.exceptions.ConnectionError()
+        self.assertIn("error", self.cliente.consultar(RUC))
+        self.assertFalse(ConsultaExterna.objects.exists())
+
+    def test_dato_vencido_si_el_proveedor_falla(self):
+        """Error: con el proveedor caído se responde el dato vencido con aviso"""
+        self.cliente.consultar(RUC)
+        self._envejecer(days=31)
+        self.cliente._sesion.get.side_effect = requests.exceptions.Timeout()
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertEqual(datos["nombre"], DATOS_RUC["nombre"])
+        self.assertEqual(datos["_cache"]["estado"], "vencido")
+        self.assertIn("Tiempo de espera", datos["_cache"]["aviso"])
+
+    def test_ruc_invalido_no_consulta(self):
+        """Error: un RUC mal formado se rechaza sin tocar caché ni proveedor"""
+        self.assertIn("error", self.cliente.consultar("123"))
+        self.cliente._sesion.get.assert_not_called()
+        self.assertFalse(ConsultaExterna.objects.exists())
+
+
+class TestCacheImo(TestCase):
+    """CP-031: Caché por vigencia de campos, registro local y parseo lxml de ImoClient"""
+
+    def setUp(self):
+        consultas_externas.reiniciar_circuitos()
+        self.cliente = ImoClient()
+        # El IMO del fixture también es un buque demo: se consulta como real
+        self.cliente.DEMO_SHIPS = {}
+        self.cliente._sesion = mock.Mock()
+        self.cliente._sesion.get.return_value = respuesta_http(texto=HTML_VESSELFINDER)
+        revalidar = mock.patch(
+            "control.consultas_externas.revalidar",
+            side_effect=lambda servicio, clave, funcion: funcion(),
+        )
+        self.revalidar = revalidar.start()
+        self.addCleanup(revalidar.stop)
+
+    def _envejecer(self, **delta):
+        ConsultaExterna.objects.filter(servicio="imo", clave=IMO).update(
+            obtenido_en=timezone.now() - timedelta(**delta)
+        )
+
+    # ===== HAPPY PATH =====
+    def test_parseo_ficha_vesselfinder(self):
+        """Las tablas de detalle y la posición se extraen con XPath"""
+        datos = self.cliente._parse_vesselfinder_html(HTML_VESSELFINDER, IMO)
+
+        self.assertEqual(datos["name"], "MSC GULSUN")
+        self.assertEqual(datos["flag"], "Panama")
+        self.assertEqual(datos["type"], "Container Ship")
+        self.assertEqual(datos["gross_tonnage"], 232618)
+        self.assertEqual(datos["teu"], 23756)
+        self.assertEqual(datos["length"], 399.9)
+        self.assertEqual(datos["call_sign"], "3FZB9")
+        self.assertEqual(datos["destination"], "Rotterdam, Netherlands")
+        self.assertEqual((datos["course"], datos["speed"]), (285.0, 18.5))
+        self.assertEqual((datos["lat"], datos["lon"]), (1.2655, 103.8263))
+
+    def test_segunda_consulta_desde_cache(self):
+        """La segunda consulta del mismo IMO no descarga la ficha"""
+        primera = self.cliente.consultar_imo(IMO)
+        segunda = self.cliente.consultar_imo(IMO)
+
+        self.assertEqual(self.cliente._sesion.get.call_count, 1)
+        self.assertEqual(primera["_cache"]["estado"], "externo")
+        self.assertEqual(segunda["_cache"]["estado"], "fresco")
+        self.assertEqual(segunda["nombre"], "MSC GULSUN")
+        self.assertEqual(segunda["latitud"], 1.2655)
+
+    def test_navegacion_vencida_se_revalida(self):
+        """Con la navegación vencida responde la caché y revalida en segundo plano"""
+        self.cliente.consultar_imo(IMO)
+        self._envejecer(hours=1)
+
+        datos = self.cliente.consultar_imo(IMO)
+
+        self.assertEqual(datos["_cache"]["estado"], "vencido")
+        self.assertIn("latitud", datos["_cache"]["campos_vencidos"])
+        self.assertNotIn("nombre", datos["_cache"]["campos_vencidos"])
+        self.revalidar.assert_called_once()
+        self.assertEqual(self.cliente._sesion.get.call_count, 2)
+
+    def test_buque_registrado_sin_consulta_externa(self):
+        """Un IMO del catálogo de buques responde desde el registro local"""
+        Buque.objects.create(
+            nombre="MSC GULSUN",
+            imo_number=IMO,
+            pabellon_bandera="Panamá",
+            naviera="MSC",
+            puerto_registro="Panama City",
+            callsign="3FZB9",
+            eslora_metros=Decimal("399.90"),
+            manga_metros=Decimal("61.50"),
+            teu_capacidad=23756,
+            calado_metros=Decimal("14.50"),
+        )
+        with mock.patch("control.consultas_externas.revalidar") as revalidar:
+            datos = self.cliente.consultar_imo(IMO)
+
+        self.assertEqual(datos["_cache"]["estado"], "local")
+        self.assertEqual(datos["bandera"], "Panamá")
+        self.assertEqual(datos["eslora"], 399.9)
+        self.cliente._sesion.get.assert_not_called()
+        revalidar.assert_called_once()
+
+    # ===== ERROR PATH =====
+    def test_imo_inexistente_cache_negativo(self):
+        """Error: un IMO inexistente (404) se recuerda y no se vuelve a consultar"""
+        self.cliente._sesion.get.return_value = respuesta_http(status=404)
+
+        self.assertEqual(self.cliente.consultar_imo(IMO)["error"], "Buque no encontrado")
+        datos = self.cliente.consultar_imo(IMO)
+
+        self.assertEqual(datos["_cache"]["estado"], "negativo")
+        self.assertEqual(self.cliente._sesion.get.call_count, 1)
+
+    def test_pagina_sin_datos_no_se_guarda(self):
+        """Error: una página que no se puede parsear no se cachea"""
+        self.cliente._sesion.get.return_value = respuesta_http(texto="<html></html>")
+
+        self.assertIn("error", self.cliente.consultar_imo(IMO))
+        self.assertFalse(ConsultaExterna.objects.exists())
+
+    def test_dato_vencido_si_vesselfinder_falla(self):
+        """Error: con VesselFinder caído se responde la ficha vencida con aviso"""
+        self.cliente.consultar_imo(IMO)
+        self._envejecer(days=31)
+        self.cliente._sesion.get.side_effect = requests.exceptions.ConnectionError()
+
+        datos = self.cliente.consultar_imo(IMO)
+
+        self.assertEqual(datos["nombre"], "MSC GULSUN")
+        self.assertEqual(datos["_cache"]["estado"], "vencido")
+        self.assertIn("VesselFinder", datos["_cache"]["aviso"])
+
+
+class ProveedorSimulado(BaseHTTPRequestHandler):
+    """
+    Servidor HTTP local que responde como SUNAT (decolecta) y VesselFinder.
+    El RUC 20999999999 tarda 3 s en responder (para probar el plazo del lote).
+    """
+
+    RUC_LENTO = "20999999999"
+    activas = 0
+    max_activas = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            ProveedorSimulado.activas += 1
+            ProveedorSimulado.max_activas = max(
+                ProveedorSimulado.max_activas, ProveedorSimulado.activas
+            )
+        try:
+            url = urlparse(self.path)
+            if url.path.startswith("/vessels/details/"):
+                self._responder(200, HTML_VESSELFINDER, "text/html")
+                return
+            ruc = parse_qs(url.query)["numero"][0]
+            time.sleep(3 if ruc == self.RUC_LENTO else 0.05)
+            if ruc.startswith("10"):
+                self._responder(404, "{}", "application/json")
+            else:
+                datos = {**DATOS_RUC, "numeroDocumento": ruc}
+                self._responder(200, json.dumps(datos), "application/json")
+        finally:
+            with self.lock:
+                ProveedorSimulado.activas -= 1
+
+    def _responder(self, status, cuerpo, content_type):
+        cuerpo = cuerpo.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConsultaEnLote(TransactionTestCase):
+    """CP-032: Consulta concurrente de RUC e IMO en lote contra un proveedor local"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(("127.0.0.1", 0), ProveedorSimulado)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.servidor.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        consultas_externas.reiniciar_circuitos()
+        ProveedorSimulado.max_activas = 0
+        ajustes = self.settings(
+            SUNAT_API_TOKEN="token-de-prueba",
+            SUNAT_API_PROVIDER="decolecta",
+            SUNAT_API_URL=f"{self.url}/v1/sunat/ruc",
+            SUNAT_API_REINTENTOS=0,
+            IMO_BASE_URL=self.url,
+            IMO_REINTENTOS=0,
+            CONSULTAS_LOTE_CONCURRENCIA={"sunat": 4, "imo": 2},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.sunat = SunatClient()
+        self.imo = ImoClient()
+        self.imo.DEMO_SHIPS = {}
+        for nombre, cliente in (("sunat_client", self.sunat), ("imo_client", self.imo)):
+            parche = mock.patch(f"control.views.{nombre}", cliente)
+            parche.start()
+            self.addCleanup(parche.stop)
+        staff = User.objects.create_user('staff', 'staff@test.com', 'staff123', is_staff=True)
+        self.client.force_login(staff)
+
+    def _rucs(self, cantidad):
+        return [f"20{i:09d}" for i in range(1, cantidad + 1)]
+
+    def _lineas(self, response):
+        return [
+            json.loads(linea)
+            for linea in b"".join(response.streaming_content).decode().splitlines()
+        ]
+
+    # ===== HAPPY PATH =====
+    def test_lote_concurrente_con_limite(self):
+        """Los RUC se consultan en paralelo sin superar la concurrencia del proveedor"""
+        rucs = self._rucs(12)
+        inicio = time.perf_counter()
+        resultados = dict(self.sunat.consultar_lote(rucs))
+        duracion = time.perf_counter() - inicio
+
+        self.assertEqual(set(resultados), set(rucs))
+        self.assertEqual(resultados[rucs[0]]["razon_social"], DATOS_RUC["nombre"])
+        self.assertGreater(ProveedorSimulado.max_activas, 1)
+        self.assertLessEqual(ProveedorSimulado.max_activas, 4)
+        # 12 consultas de 50 ms en 4 conexiones: bastante menos que en serie
+        self.assertLess(duracion, 12 * 0.05)
+
+    def test_plazo_entrega_resultados_parciales(self):
+        """Al vencer el plazo se entregan los terminados y los pendientes con error"""
+        rucs = self._rucs(3) + [ProveedorSimulado.RUC_LENTO]
+        inicio = time.perf_counter()
+        resultados = list(self.sunat.consultar_lote(rucs, plazo=1))
+
+        self.assertLess(time.perf_counter() - inicio, 2)
+        self.assertEqual(len(resultados), 4)
+        # Los rápidos llegan primero; el lento queda con error de plazo
+        self.assertEqual(resultados[-1][0], ProveedorSimulado.RUC_LENTO)
+        self.assertEqual(
+            resultados[-1][1]["error"], consultas_externas.PLAZO_AGOTADO
+        )
+        self.assertTrue(all("error" not in datos for _ruc, datos in resultados[:3]))
+
+    def test_endpoint_ndjson_ruc_e_imo(self):
+        """El staff recibe RUC e IMO como JSON Lines con un resumen al final"""
+        response = self.client.post(
+            reverse('control:consultas_externas_lote'),
+            data=json.dumps({"rucs": self._rucs(2) + ["10000000001"], "imos": ["9839133"]}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lineas = self._lineas(response)
+        resultados = {(l["servicio"], l["clave"]): l["datos"] for l in lineas[:-1]}
+        self.assertEqual(resultados[("imo", "9839133")]["nombre"], "MSC GULSUN")
+        self.assertIn("error", resultados[("sunat", "10000000001")])
+        self.assertEqual(
+            lineas[-1]["resumen"],
+            {**lineas[-1]["resumen"], "total": 4, "encontradas": 3, "errores": 1},
+        )
+
+    def test_endpoint_planilla(self):
+        """Los RUC e IMO se extraen de una planilla CSV subida"""
+        planilla = SimpleUploadedFile(
+            "naviera.csv",
+            "ruc;buque;imo\n20000000001;MSC GULSUN;IMO 9839133\n".encode("utf-8"),
+        )
+        response = self.client.post(
+            reverse('control:consultas_externas_lote'), {"archivo": planilla}
+        )
+
+        claves = {(l["servicio"], l["clave"]) for l in self._lineas(response)[:-1]}
+        self.assertEqual(claves, {("sunat", "20000000001"), ("imo", "9839133")})
+
+    # ===== ERROR PATH =====
+    def test_endpoint_sin_claves(self):
+        """Error: un pedido vacío o que excede el máximo se rechaza"""
+        url = reverse('control:consultas_externas_lote')
+        vacio = self.client.post(url, data="{}", content_type="application/json")
+        self.assertEqual(vacio.status_code, 400)
+
+        with self.settings(CONSULTAS_LOTE_MAX_CLAVES=2):
+            excedido = self.client.post(
+                url,
+                data=json.dumps({"rucs": self._rucs(3)}),
+                content_type="application/json",
+            )
+        self.assertEqual(excedido.status_code, 400)
+        self.assertIn("Máximo 2", excedido.json()["error"])
+
+    def test_endpoint_solo_staff(self):
+        """Error: un usuario sin staff no puede consultar en lote"""
+        self.client.logout()
+        response = self.client.post(
+            reverse('control:consultas_externas_lote'),
+            data=json.dumps({"rucs": self._rucs(1)}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class TestCoalescencia(TestCase):
+    """CP-033: Peticiones simultáneas idénticas comparten un solo cálculo"""
+
+    def setUp(self):
+        consultas_externas.reiniciar_circuitos()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        ajustes = self.settings(SIGEP_CACHE_DIR=self.cache_dir, SIGEP_COALESCENCIA_ESPERA=5)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _en_paralelo(self, funcion, hilos=6):
+        """Ejecuta funcion() en varios hilos a la vez y retorna (resultados, errores)"""
+        barrera = threading.Barrier(hilos)
+        resultados, errores = [], []
+
+        def tarea():
+            barrera.wait()
+            try:
+                resultados.append(funcion())
+            except Exception as e:
+                errores.append(e)
+
+        trabajadores = [threading.Thread(target=tarea) for _ in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        return resultados, errores
+
+    def _lenta(self, resultado, llamadas):
+        def funcion():
+            llamadas.append(1)
+            time.sleep(0.2)
+            return resultado
+        return funcion
+
+    # ===== HAPPY PATH =====
+    def test_hilos_comparten_un_calculo(self):
+        """Seis llamadas simultáneas de la misma clave ejecutan la operación una vez"""
+        llamadas = []
+        funcion = self._lenta({"pdf": "contenido"}, llamadas)
+
+        resultados, errores = self._en_paralelo(
+            lambda: coalescencia.ejecutar("pdf:prueba", funcion)
+        )
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(len(resultados), 6)
+        self.assertTrue(all(r is resultados[0] for r in resultados))
+
+    def test_claves_distintas_no_se_esperan(self):
+        """Operaciones de claves distintas se ejecutan cada una"""
+        llamadas = []
+        contador = iter(range(100))
+
+        self._en_paralelo(
+            lambda: coalescencia.ejecutar(
+                f"imo:{next(contador)}", self._lenta(1, llamadas)
+            ),
+            hilos=3,
+        )
+        self.assertEqual(len(llamadas), 3)
+
+    def test_otro_proceso_con_turno(self):
+        """Con el turno en otro proceso se espera y se usa lo que este guardó"""
+        guardado = {}
+        self.assertTrue(coalescencia.tomar_turno("pdf:abc", "otro-proceso", 5))
+
+        def otro_proceso():
+            time.sleep(0.2)
+            guardado["pdf"] = b"%PDF renderizado por otro proceso"
+            coalescencia.soltar_turno("pdf:abc", "otro-proceso")
+
+        threading.Thread(target=otro_proceso).start()
+        funcion = mock.Mock(return_value=b"%PDF propio")
+
+        resultado = coalescencia.ejecutar(
+            "pdf:abc", funcion, desde_cache=lambda: guardado.get("pdf")
+        )
+
+        self.assertEqual(resultado, b"%PDF renderizado por otro proceso")
+        funcion.assert_not_called()
+
+    def test_consultas_imo_simultaneas(self):
+        """Consultas simultáneas del mismo IMO descargan la ficha una sola vez"""
+        cliente = ImoClient()
+        cliente.DEMO_SHIPS = {}
+        cliente._sesion = mock.Mock()
+
+        def descargar(*args, **kwargs):
+            time.sleep(0.2)
+            return respuesta_http(texto=HTML_VESSELFINDER)
+
+        cliente._sesion.get.side_effect = descargar
+        # La caché en BD se prueba en CP-031: aquí solo la coalescencia
+        with mock.patch("control.consultas_externas.leer", return_value=None), \
+                mock.patch("control.consultas_externas.guardar"):
+            resultados, errores = self._en_paralelo(lambda: cliente.consultar_imo(IMO))
+
+        self.assertEqual(errores, [])
+        self.assertEqual(cliente._sesion.get.call_count, 1)
+        self.assertTrue(all(r["nombre"] == "MSC GULSUN" for r in resultados))
+
+    # ===== ERROR PATH =====
+    def test_error_se_comparte(self):
+        """Error: si la operación falla, quienes esperaban reciben la misma excepción"""
+        llamadas = []
+
+        def falla():
+            llamadas.append(1)
+            time.sleep(0.2)
+            raise ValueError("WeasyPrint falló")
+
+        resultados, errores = self._en_paralelo(
+            lambda: coalescencia.ejecutar("pdf:error", falla), hilos=4
+        )
+
+        self.assertEqual(resultados, [])
+        self.assertEqual(len(errores), 4)
+        self.assertEqual(len(llamadas), 1)
+        # El error no queda cacheado: la siguiente llamada vuelve a intentar
+        self.assertEqual(coalescencia.ejecutar("pdf:error", lambda: "ok"), "ok")
+
+    def test_turno_vencido_de_proceso_caido(self):
+        """Error: el turno de un proceso caído vence y otro proceso lo toma"""
+        ahora = time.time()
+        self.assertTrue(coalescencia.tomar_turno("pdf:caido", "caido", 5, ahora=ahora))
+        self.assertFalse(coalescencia.tomar_turno("pdf:caido", "vivo", 5, ahora=ahora + 1))
+        self.assertTrue(coalescencia.tomar_turno("pdf:caido", "vivo", 5, ahora=ahora + 6))
+
+
+class TestCircuitoServiciosExternos(TestCase):
+    """CP-034: Circuito por proveedor y cupo global de llamadas salientes"""
+
+    CONFIGURACION = {
+        "ventana": 60,
+        "minimo_llamadas": 4,
+        "umbral_errores": 0.5,
+        "latencia_lenta_ms": 1000,
+        "umbral_lentas": 0.5,
+        "apertura": 30,
+    }
+
+    def setUp(self):
+        ajustes = self.settings(
+            CONSULTAS_EXTERNAS_CIRCUITO=self.CONFIGURACION,
+            CONSULTAS_EXTERNAS_MAX_SIMULTANEAS=1,
+            CONSULTAS_EXTERNAS_ESPERA_CUPO=0.1,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        consultas_externas.reiniciar_circuitos()
+        self.addCleanup(consultas_externas.reiniciar_circuitos)
+        self.circuito = consultas_externas.Interruptor("prueba", self.CONFIGURACION)
+
+        self.cliente = SunatClient()
+        self.cliente.token = "token-de-prueba"
+        self.cliente.provider = "decolecta"
+        self.cliente._sesion = mock.Mock()
+        self.cliente._sesion.get.return_value = respuesta_http(status=503)
+
+    def _registrar(self, errores, lentas=0, correctas=0, ahora=0):
+        for _ in range(errores):
+            self.circuito.registrar(True, 100, ahora=ahora)
+        for _ in range(lentas):
+            self.circuito.registrar(False, 5000, ahora=ahora)
+        for _ in range(correctas):
+            self.circuito.registrar(False, 100, ahora=ahora)
+
+    # ===== HAPPY PATH =====
+    def test_se_abre_por_tasa_de_errores(self):
+        """Con la mitad de las llamadas fallidas en la ventana el circuito se abre"""
+        self._registrar(errores=1, correctas=2)
+        self.assertEqual(self.circuito.estado, "cerrado")
+        self._registrar(errores=1)
+
+        self.assertEqual(self.circuito.estado, "abierto")
+        with self.assertRaises(consultas_externas.ServicioNoDisponible):
+            self.circuito.permitir(ahora=10)
+        self.assertEqual(self.circuito.resumen(ahora=10)["reintento_en_segundos"], 20)
+
+    def test_se_abre_por_llamadas_lentas(self):
+        """Llamadas exitosas pero lentas también abren el circuito"""
+        self._registrar(errores=0, lentas=2, correctas=2)
+        self.assertEqual(self.circuito.estado, "abierto")
+
+    def test_errores_fuera_de_la_ventana_no_cuentan(self):
+        """La ventana es móvil: errores viejos no abren el circuito"""
+        self._registrar(errores=3, ahora=0)
+        self._registrar(errores=0, correctas=3, ahora=100)
+        self.assertEqual(self.circuito.estado, "cerrado")
+        self.assertEqual(self.circuito.resumen(ahora=100)["llamadas_ventana"], 3)
+
+    def test_semiabierto_prueba_exitosa_cierra(self):
+        """Tras la apertura pasa una sola llamada de prueba; si sale bien se cierra"""
+        self._registrar(errores=4)
+        self.circuito.permitir(ahora=31)
+        self.assertEqual(self.circuito.estado, "semiabierto")
+        with self.assertRaises(consultas_externas.ServicioNoDisponible):
+            self.circuito.permitir(ahora=31)
+
+        self.circuito.registrar(False, 100, ahora=32)
+        self.assertEqual(self.circuito.estado, "cerrado")
+        self.circuito.permitir(ahora=32)
+
+    def test_estado_visible_para_staff(self):
+        """El staff ve el estado de cada circuito y el cupo de llamadas"""
+        for _ in range(4):
+            self.cliente.consultar(RUC)
+        staff = User.objects.create_user('staff', 'staff@test.com', 'staff123', is_staff=True)
+        self.client.force_login(staff)
+
+        datos = self.client.get(reverse('control:consultas_externas_estadisticas')).json()
+
+        sunat = datos["circuitos"]["servicios"]["sunat"]
+        self.assertEqual(sunat["estado"], "abierto")
+        self.assertEqual(sunat["tasa_errores"], 1.0)
+        self.assertEqual(datos["circuitos"]["max_simultaneas"], 1)
+
+    # ===== ERROR PATH =====
+    def test_semiabierto_prueba_fallida_reabre(self):
+        """Error: si la llamada de prueba falla el circuito vuelve a abrirse"""
+        self._registrar(errores=4)
+        self.circuito.permitir(ahora=31)
+        self.circuito.registrar(True, 100, ahora=31)
+
+        self.assertEqual(self.circuito.estado, "abierto")
+        self.assertEqual(self.circuito.aperturas, 2)
+
+    def test_circuito_abierto_falla_rapido(self):
+        """Error: con el circuito abierto no se llama al proveedor"""
+        for _ in range(4):
+            self.assertEqual(self.cliente.consultar(RUC)["error"], "Error 503")
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertIn("no disponible temporalmente", datos["error"])
+        self.assertEqual(self.cliente._sesion.get.call_count, 4)
+
+    def test_circuito_abierto_responde_cache(self):
+        """Error: con el circuito abierto se responde el dato cacheado con aviso"""
+        consultas_externas.guardar("sunat", RUC, DATOS_RUC)
+        ConsultaExterna.objects.update(obtenido_en=timezone.now() - timedelta(days=31))
+        for _ in range(4):
+            consultas_externas.interruptor("sunat").registrar(True, 100)
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertEqual(datos["nombre"], DATOS_RUC["nombre"])
+        self.assertEqual(datos["_cache"]["estado"], "vencido")
+        self.assertIn("no disponible", datos["_cache"]["aviso"])
+        self.cliente._sesion.get.assert_not_called()
+
+    def test_cupo_global_agotado(self):
+        """Error: sin cupo de llamadas salientes la consulta se rechaza sin esperar al proveedor"""
+        ocupado = threading.Event()
+        soltar = threading.Event()
+
+        def llamada_lenta():
+            with consultas_externas.llamada_externa("imo"):
+                ocupado.set()
+                soltar.wait(5)
+
+        hilo = threading.Thread(target=llamada_lenta)
+        hilo.start()
+        self.addCleanup(hilo.join)
+        self.addCleanup(soltar.set)
+        ocupado.wait(5)
+
+        datos = self.cliente.consultar(RUC)
+
+        self.assertIn("Demasiadas consultas externas", datos["error"])
+        self.cliente._sesion.get.assert_not_called()
+        self.assertEqual(consultas_externas.estado_circuitos()["llamadas_en_curso"], 1)
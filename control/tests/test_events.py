@@ -1,13 +1,27 @@
 """
 Tests Unitarios - Eventos de Contenedor
-Casos de Prueba: CP-009
+Casos de Prueba: CP-009, CP-022, CP-024, CP-025
 """
+import os
+import tempfile
+from datetime import datetime, timedelta
 from decimal import Decimal
+from io import StringIO
 
-from django.test import TestCase
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from control import ingesta_eventos, iso6346
+from control.admin import EventoContenedorAdmin
 from control.models import (
     Buque,
     Arribo,
@@ -115,3 +129,564 @@ class TestEventosContenedor(TestCase):
         )
         with self.assertRaises(ValidationError):
             evento.full_clean()
+
+
+class TestEstadoBloqueoIncremental(TestCase):
+    """CP-009: Estado de bloqueo mantenido de forma incremental"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=self.arribo,
+            codigo_iso="CSQU3054383",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:HL345678*",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-003"
+        )
+        self.inicio = timezone.now() - timedelta(days=1)
+    
+    def _evento(self, tipo, horas):
+        return EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento=tipo,
+            fecha_hora=self.inicio + timedelta(hours=horas),
+            ubicacion_puerto="Terminal Chancay",
+            ubicacion_pais="PE"
+        )
+    
+    # ===== HAPPY PATH =====
+    def test_hold_y_liberacion_actualizan_estado(self):
+        """CUSTOMS_HOLD bloquea y CUSTOMS_RELEASED libera sin reprocesar historial"""
+        self._evento("DISCHARGED", 1)
+        self._evento("CUSTOMS_HOLD", 2)
+        self.contenedor.refresh_from_db()
+        self.assertTrue(self.contenedor.bloqueado_por_evento)
+        
+        self._evento("CUSTOMS_RELEASED", 3)
+        self.contenedor.refresh_from_db()
+        self.assertFalse(self.contenedor.bloqueado_por_evento)
+        self.assertEqual(self.contenedor.total_eventos, 3)
+        self.assertEqual(self.contenedor.ultimo_evento_tipo, "CUSTOMS_RELEASED")
+    
+    def test_eliminar_evento_recalcula_estado(self):
+        """Eliminar la liberación vuelve a dejar el contenedor bloqueado"""
+        self._evento("INSPECTION", 1)
+        liberacion = self._evento("CUSTOMS_RELEASED", 2)
+        liberacion.delete()
+        self.contenedor.refresh_from_db()
+        self.assertTrue(self.contenedor.bloqueado_por_evento)
+        self.assertEqual(self.contenedor.total_eventos, 1)
+    
+    def test_snapshot_ultimo_evento_sin_consultas(self):
+        """El último evento se lee del snapshot del contenedor sin consultar eventos"""
+        self._evento("DISCHARGED", 1)
+        ultimo = self._evento("GATE_OUT_FULL", 2)
+        
+        contenedor = Contenedor.objects.get(pk=self.contenedor.pk)
+        with self.assertNumQueries(0):
+            evento = contenedor.ultimo_evento
+            estado = contenedor.ultimo_estado
+        self.assertEqual(evento.tipo_evento, "GATE_OUT_FULL")
+        self.assertEqual(evento.fecha_hora, ultimo.fecha_hora)
+        self.assertEqual(evento.ubicacion_puerto, "Terminal Chancay")
+        self.assertIn("Gate Out", estado)
+        
+        # Al eliminar el último evento, el snapshot vuelve al anterior
+        ultimo.delete()
+        contenedor.refresh_from_db()
+        self.assertEqual(contenedor.ultimo_evento_tipo, "DISCHARGED")
+    
+    def test_comando_reconstruir_corrige_desviacion(self):
+        """El comando de reconstrucción detecta y repara desviaciones"""
+        self._evento("DAMAGED", 1)
+        Contenedor.objects.filter(pk=self.contenedor.pk).update(
+            bloqueado_por_evento=False, total_eventos=7
+        )
+        
+        salida = StringIO()
+        call_command("reconstruir_estado_eventos", "--dry-run", stdout=salida)
+        self.assertIn("Con desviación: 1", salida.getvalue())
+        self.contenedor.refresh_from_db()
+        self.assertEqual(self.contenedor.total_eventos, 7)
+        
+        call_command("reconstruir_estado_eventos", stdout=StringIO())
+        self.contenedor.refresh_from_db()
+        self.assertTrue(self.contenedor.bloqueado_por_evento)
+        self.assertEqual(self.contenedor.total_eventos, 1)
+
+
+class TestIngestaEventosLote(TestCase):
+    """CP-022: Ingesta de eventos EDIFACT COARRI/CODECO y CSV en lote"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=50,
+            contenedores_carga=50
+        )
+        self.importacion = self._contenedor("CSQU3054383", "IMPORT")
+        self.exportacion = self._contenedor("MSKU9070323", "EXPORT")
+        self.inicio = timezone.make_aware(datetime(2026, 10, 17, 8, 0))
+    
+    def _contenedor(self, codigo_iso, direccion):
+        return Contenedor.objects.create(
+            arribo=self.arribo,
+            codigo_iso=codigo_iso,
+            direccion=direccion,
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello=f"SEL-{codigo_iso}",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-022"
+        )
+    
+    def _arribado(self, contenedor, horas=0):
+        EventoContenedor.objects.create(
+            contenedor=contenedor,
+            tipo_evento="ARRIVED",
+            fecha_hora=self.inicio + timedelta(hours=horas),
+            ubicacion_puerto="Terminal Chancay",
+            ubicacion_pais="Perú",
+            buque=self.buque,
+        )
+    
+    def _mensaje(self, referencia, tipo, bgm, equipos, tdt=""):
+        """Mensaje COARRI/CODECO: equipos = [(codigo, lleno_vacio, AAAAMMDDHHMM)]"""
+        segmentos = [f"UNH+{referencia}+{tipo}:D:95B:UN:ITG14", f"BGM+{bgm}+DOC{referencia}+9"]
+        if tdt:
+            segmentos.append(tdt)
+        for codigo, lleno_vacio, fecha in equipos:
+            segmentos += [f"EQD+CN+{codigo}+22G1:102:5++3+{lleno_vacio}", f"DTM+203:{fecha}:203"]
+        segmentos += [f"CNT+16:{len(equipos)}", f"UNT+{len(segmentos) + 2}+{referencia}"]
+        return "'".join(segmentos) + "'"
+    
+    def _intercambio(self, *mensajes):
+        return "UNA:+.? 'UNB+UNOA:2+TERMINAL+SIGEP+261017:1200+1'" + "".join(mensajes) + "UNZ+1+1'"
+    
+    # ===== HAPPY PATH =====
+    def test_coarri_descarga_registra_evento_con_buque(self):
+        """COARRI 44 registra DISCHARGED con el buque del TDT y ubicación local"""
+        self._arribado(self.importacion)
+        texto = self._intercambio(
+            self._mensaje(
+                "1", "COARRI", "44", [("CSQU3054383", "5", "202610170930")],
+                tdt="TDT+20+VOY22+1++MSC:172:20+++1234567:146:11:TEST SHIP",
+            )
+        )
+        resultado = ingesta_eventos.registrar_eventos_en_lote(
+            ingesta_eventos.leer_edifact(texto)
+        )
+        
+        self.assertEqual((resultado.recibidos, resultado.creados), (1, 1), resultado.rechazados)
+        evento = self.importacion.eventos.order_by("-fecha_hora").first()
+        self.assertEqual(evento.tipo_evento, "DISCHARGED")
+        self.assertEqual(evento.buque_id, self.buque.pk)
+        self.assertEqual(evento.referencia_viaje, "VOY22")
+        self.assertEqual(evento.medio_transporte, "VESSEL")
+        self.assertEqual(evento.ubicacion_puerto, "Chancay")
+        self.importacion.refresh_from_db()
+        self.assertEqual(self.importacion.total_eventos, 2)
+        self.assertEqual(self.importacion.ultimo_evento_tipo, "DISCHARGED")
+    
+    def test_codeco_lleno_y_vacio_en_orden_cronologico(self):
+        """CODECO distingue lleno/vacío (EQD) y aplica los mensajes por fecha"""
+        texto = self._intercambio(
+            # El gate-in llega antes en el archivo pero ocurrió después
+            self._mensaje("2", "CODECO", "34", [("MSKU9070323", "5", "202610171400")]),
+            self._mensaje("1", "CODECO", "36", [("MSKU9070323", "4", "202610170900")]),
+        )
+        resultado = ingesta_eventos.registrar_eventos_en_lote(
+            ingesta_eventos.leer_edifact(texto)
+        )
+        
+        self.assertEqual(resultado.creados, 2, resultado.rechazados)
+        tipos = list(
+            self.exportacion.eventos.order_by("fecha_hora").values_list("tipo_evento", flat=True)
+        )
+        self.assertEqual(tipos, ["GATE_OUT_EMPTY", "GATE_IN_FULL"])
+        self.exportacion.refresh_from_db()
+        self.assertEqual(self.exportacion.ultimo_evento_tipo, "GATE_IN_FULL")
+        self.assertIsNone(self.exportacion.ultimo_evento_buque_id)
+    
+    def test_csv_retencion_aduanera_bloquea_contenedor(self):
+        """CSV: eventos marítimos toman el buque del arribo y CUSTOMS_HOLD bloquea"""
+        texto = (
+            "codigo_iso,tipo_evento,fecha_hora,ubicacion_puerto,imo\n"
+            "CSQU3054383,ARRIVED,2026-10-17T08:00:00,Terminal Chancay,1234567\n"
+            "csqu3054383,discharged,2026-10-17T09:00:00,,\n"
+            "CSQU3054383,CUSTOMS_HOLD,2026-10-17T10:00:00,,\n"
+        )
+        resultado = ingesta_eventos.registrar_eventos_en_lote(ingesta_eventos.leer_csv(texto))
+        
+        self.assertEqual(resultado.creados, 3, resultado.rechazados)
+        self.assertEqual(resultado.contenedores_actualizados, 1)
+        descarga = self.importacion.eventos.get(tipo_evento="DISCHARGED")
+        self.assertEqual(descarga.buque_id, self.buque.pk)
+        self.importacion.refresh_from_db()
+        self.assertTrue(self.importacion.bloqueado_por_evento)
+        self.assertEqual(self.importacion.total_eventos, 3)
+        self.assertEqual(self.importacion.ultimo_evento_tipo, "CUSTOMS_HOLD")
+        self.assertFalse(self.importacion.listo_para_retiro)
+    
+    def test_consultas_acotadas_por_lote(self):
+        """El número de consultas no crece con la cantidad de contenedores"""
+        def ingerir(codigos, hora):
+            filas = "".join(
+                f"{codigo},INSPECTION,2026-10-17T{hora:02d}:00:00,Patio,\n" for codigo in codigos
+            )
+            with CaptureQueriesContext(connection) as consultas:
+                resultado = ingesta_eventos.registrar_eventos_en_lote(
+                    ingesta_eventos.leer_csv("codigo_iso,tipo_evento,fecha_hora,ubicacion_puerto,imo\n" + filas)
+                )
+            self.assertEqual(resultado.creados, len(codigos), resultado.rechazados)
+            return len(consultas)
+        
+        pocos = ["CSQU3054383", "MSKU9070323"]
+        muchos = []
+        for i in range(20):
+            prefijo = f"TSTU{i:06d}"
+            codigo = prefijo + str(iso6346.digito_verificador(prefijo))
+            self._contenedor(codigo, "IMPORT")
+            muchos.append(codigo)
+        
+        self.assertEqual(ingerir(pocos, 9), ingerir(muchos, 10))
+    
+    def test_comando_ingerir_eventos(self):
+        """El comando lee el archivo en streaming y reporta el resultado"""
+        self._arribado(self.importacion)
+        archivo = self._archivo_temporal(
+            self._intercambio(
+                self._mensaje(
+                    "1", "COARRI", "44", [("CSQU3054383", "5", "202610170930")],
+                    tdt="TDT+20+VOY22+1++MSC:172:20+++1234567:146:11:TEST SHIP",
+                )
+            )
+        )
+        salida = StringIO()
+        call_command("ingerir_eventos", archivo, stdout=salida, stderr=StringIO())
+        self.assertIn("1 de 1 eventos registrados", salida.getvalue())
+    
+    def _archivo_temporal(self, contenido):
+        with tempfile.NamedTemporaryFile("w", suffix=".edi", delete=False, encoding="utf-8") as f:
+            f.write(contenido)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+    
+    # ===== ERROR PATH =====
+    def test_eventos_invalidos_se_rechazan_individualmente(self):
+        """Contenedor desconocido, secuencia y cronología se rechazan sin frenar el lote"""
+        self._arribado(self.importacion, horas=2)
+        texto = (
+            "codigo_iso,tipo_evento,fecha_hora,ubicacion_puerto\n"
+            "ZZZU0000000,DISCHARGED,2026-10-17T11:00:00,\n"
+            # Cronología: anterior al ARRIVED ya registrado
+            "CSQU3054383,INSPECTION,2026-10-17T09:00:00,\n"
+            # Secuencia: GATE_OUT_FULL sin DISCHARGED
+            "CSQU3054383,GATE_OUT_FULL,2026-10-17T12:00:00,\n"
+            "CSQU3054383,DISCHARGED,2026-10-17T13:00:00,\n"
+            "CSQU3054383,DISCHARGED,2026-10-17T14:00:00,\n"
+            "CSQU3054383,ARRIVED,fecha-invalida,\n"
+        )
+        resultado = ingesta_eventos.registrar_eventos_en_lote(ingesta_eventos.leer_csv(texto))
+        
+        self.assertEqual(resultado.recibidos, 6)
+        self.assertEqual(resultado.creados, 1)
+        mensajes = " ".join(error["mensaje"] for error in resultado.rechazados)
+        self.assertIn("Contenedor no registrado", mensajes)
+        self.assertIn("Cronología incoherente", mensajes)
+        self.assertIn("Secuencia inválida", mensajes)
+        self.assertIn("solo puede ocurrir una vez", mensajes)
+        self.assertIn("fecha-invalida", mensajes)
+        self.importacion.refresh_from_db()
+        self.assertEqual(self.importacion.total_eventos, 2)
+        self.assertEqual(self.importacion.ultimo_evento_tipo, "DISCHARGED")
+    
+    def test_bgm_no_soportado_se_rechaza(self):
+        """Un COARRI con función BGM desconocida no registra eventos"""
+        texto = self._intercambio(
+            self._mensaje("1", "COARRI", "99", [("MSKU9070323", "5", "202610170930")])
+        )
+        resultado = ingesta_eventos.registrar_eventos_en_lote(
+            ingesta_eventos.leer_edifact(texto)
+        )
+        self.assertEqual(resultado.creados, 0)
+        self.assertIn("no soportado", resultado.rechazados[0]["mensaje"])
+    
+    def test_endpoint_ingesta_solo_staff(self):
+        """La API de ingesta acepta archivos de staff y rechaza otros usuarios"""
+        url = reverse("control:ingerir_eventos")
+        csv = b"codigo_iso,tipo_evento,fecha_hora,ubicacion_puerto\nMSKU9070323,GATE_OUT_EMPTY,2026-10-17T09:00:00,\n"
+        
+        User.objects.create_user(username="cliente", password="x")
+        self.client.login(username="cliente", password="x")
+        respuesta = self.client.post(url, {"archivo": SimpleUploadedFile("e.csv", csv)})
+        self.assertEqual(respuesta.status_code, 302)
+        
+        User.objects.create_superuser(username="admin", password="x", email="a@a.com")
+        self.client.login(username="admin", password="x")
+        respuesta = self.client.post(url, {"archivo": SimpleUploadedFile("e.csv", csv)})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["creados"], 1)
+        
+        respuesta = self.client.post(
+            url + "?formato=xml", data=csv, content_type="text/csv"
+        )
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class TestTablaTransiciones(TestCase):
+    """CP-024: Tabla de transiciones compilada (máscaras de bits)"""
+    
+    def setUp(self):
+        self.inicio = timezone.now() - timedelta(days=1)
+    
+    def _hora(self, horas):
+        return self.inicio + timedelta(hours=horas)
+    
+    # ===== HAPPY PATH =====
+    def test_tabla_compilada_por_direccion(self):
+        """Prerrequisitos de IMPORT filtrados y secuencia posterior precalculada"""
+        tabla = EventoContenedor.TRANSICIONES
+        arribo_import = tabla.transicion("IMPORT", "ARRIVED")
+        self.assertEqual(arribo_import.prerrequisitos, 0)
+        arribo_export = tabla.transicion("EXPORT", "ARRIVED")
+        self.assertEqual(
+            arribo_export.prerrequisitos,
+            tabla.mascara(["DEPARTED", "IN_TRANSIT", "TRANSSHIPMENT"]),
+        )
+        descarga = tabla.transicion("IMPORT", "DISCHARGED")
+        self.assertTrue(descarga.posteriores & tabla.bits["GATE_OUT_FULL"])
+        self.assertFalse(descarga.posteriores & tabla.bits["GATE_IN_FULL"])
+        self.assertFalse(tabla.transicion("IMPORT", "LOADED").permitido)
+        self.assertEqual(tabla.transicion("EXPORT", "CUSTOMS_HOLD").repetido, 0)
+    
+    def test_secuencia_importacion_completa(self):
+        """Una secuencia de importación válida se acepta en una pasada"""
+        tipos = ["ARRIVED", "DISCHARGED", "CUSTOMS_HOLD", "CUSTOMS_RELEASED",
+                 "GATE_OUT_FULL", "DELIVERED", "GATE_IN_EMPTY"]
+        eventos = [
+            (tipo, self._hora(i), 1 if tipo in EventoContenedor.EVENTOS_MARITIMOS else None)
+            for i, tipo in enumerate(tipos)
+        ]
+        with self.assertNumQueries(0):
+            resultados = EventoContenedor.validar_secuencia("IMPORT", eventos)
+        self.assertEqual(resultados, [{}] * len(tipos))
+    
+    def test_mascara_y_conjunto_equivalentes(self):
+        """validar_reglas acepta el historial como máscara o como conjunto"""
+        existentes = {"ARRIVED", "DISCHARGED", "GATE_OUT_FULL"}
+        for tipo, _ in EventoContenedor.TIPO_EVENTO_CHOICES:
+            for direccion in ("IMPORT", "EXPORT"):
+                self.assertEqual(
+                    EventoContenedor.validar_reglas(tipo, None, direccion, existentes, None, 1),
+                    EventoContenedor.validar_reglas(
+                        tipo, None, direccion,
+                        EventoContenedor.mascara_eventos(existentes), None, 1,
+                    ),
+                )
+    
+    # ===== ERROR PATH =====
+    def test_secuencia_con_errores_no_avanza_estado(self):
+        """Los eventos inválidos se reportan y no cuentan para los siguientes"""
+        resultados = EventoContenedor.validar_secuencia(
+            "IMPORT",
+            [
+                ("GATE_OUT_FULL", self._hora(1)),  # falta DISCHARGED
+                ("ARRIVED", self._hora(2), 1),
+                ("DISCHARGED", self._hora(3), 1),
+                ("ARRIVED", self._hora(4), 1),  # repetido
+                ("LOADED", self._hora(5), 1),  # no válido en importación
+                ("CUSTOMS_HOLD", self._hora(0)),  # anterior al último evento
+                ("GATE_OUT_FULL", self._hora(6)),
+            ],
+        )
+        self.assertIn("primero debe existir", resultados[0]["tipo_evento"])
+        self.assertEqual(resultados[1:3], [{}, {}])
+        self.assertIn("solo puede ocurrir una vez", resultados[3]["tipo_evento"])
+        self.assertIn("IMPORTACIÓN", resultados[4]["tipo_evento"])
+        self.assertIn("Cronología incoherente", resultados[5]["fecha_hora"])
+        self.assertEqual(resultados[6], {})
+    
+    def test_evento_anterior_en_secuencia(self):
+        """Error: un evento anterior en la secuencia a uno ya registrado"""
+        errores = EventoContenedor.validar_reglas(
+            "GATE_IN_FULL", None, "EXPORT", {"GATE_OUT_EMPTY", "LOADED"}, None
+        )
+        self.assertIn("ya existe un evento posterior: '3. Loaded", errores["tipo_evento"])
+
+
+class TestEventoMasivo(TestCase):
+    """CP-025: Evento masivo para todos los contenedores de un arribo"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=30
+        )
+        self.codigos = []
+        for i in range(12):
+            prefijo = f"TSTU{i:06d}"
+            codigo = prefijo + str(iso6346.digito_verificador(prefijo))
+            Contenedor.objects.create(
+                arribo=self.arribo,
+                codigo_iso=codigo,
+                direccion="IMPORT",
+                tipo_tamaño="22G1",
+                peso_bruto_kg=25000,
+                mercancia_declarada="Test cargo",
+                ubicacion_actual="PATIO-A",
+                bl_referencia=f"TEST-BL-{i}"
+            )
+            self.codigos.append(codigo)
+        self.admin = User.objects.create_superuser(
+            username="admin", password="x", email="a@a.com"
+        )
+        self.client.login(username="admin", password="x")
+        self.llegada = timezone.now() - timedelta(hours=3)
+    
+    def _plantilla(self, **datos):
+        return {
+            "tipo_evento": "ARRIVED",
+            "fecha_hora": timezone.localtime(self.llegada).strftime("%Y-%m-%dT%H:%M"),
+            "ubicacion_puerto": "Terminal Chancay",
+            "ubicacion_pais": "Perú",
+            **datos,
+        }
+    
+    # ===== HAPPY PATH =====
+    def test_arribo_completo_en_lote(self):
+        """ARRIVED para todo el arribo: un evento por contenedor con el buque del arribo"""
+        url = reverse("admin:control_arribo_evento_masivo", args=[self.arribo.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(url, self._plantilla(direccion="IMPORT"))
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(
+            EventoContenedor.objects.filter(tipo_evento="ARRIVED", buque=self.buque).count(),
+            12,
+        )
+        self.assertEqual(
+            Contenedor.objects.filter(ultimo_evento_tipo="ARRIVED", total_eventos=1).count(),
+            12,
+        )
+        # Sin consultas por contenedor (sesión, permisos, estado y escrituras en lote)
+        self.assertLess(len(consultas), 25)
+    
+    def test_accion_contenedores_seleccionados(self):
+        """La acción del listado registra el evento solo en la selección"""
+        seleccion = list(
+            Contenedor.objects.filter(codigo_iso__in=self.codigos[:3]).values_list("pk", flat=True)
+        )
+        url = reverse("admin:control_contenedor_changelist")
+        datos = {"action": "aplicar_evento_masivo", "_selected_action": seleccion}
+        
+        respuesta = self.client.post(url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, "Registrar evento")
+        
+        respuesta = self.client.post(url, {**datos, "aplicar": "1", **self._plantilla()})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(EventoContenedor.objects.count(), 3)
+    
+    def test_duplicar_evento_al_resto_del_arribo(self):
+        """Un evento existente se duplica a los demás contenedores del arribo"""
+        original = EventoContenedor.objects.create(
+            contenedor=Contenedor.objects.get(codigo_iso=self.codigos[0]),
+            tipo_evento="ARRIVED",
+            fecha_hora=self.llegada,
+            ubicacion_puerto="Terminal Chancay",
+            ubicacion_pais="Perú",
+            buque=self.buque,
+        )
+        modelo_admin = EventoContenedorAdmin(EventoContenedor, admin.site)
+        peticion = RequestFactory().post("/")
+        peticion.user = self.admin
+        peticion.session = {}
+        peticion._messages = FallbackStorage(peticion)
+        modelo_admin.duplicar_evento_para_otros(
+            peticion, EventoContenedor.objects.filter(pk=original.pk)
+        )
+        self.assertEqual(EventoContenedor.objects.filter(tipo_evento="ARRIVED").count(), 12)
+    
+    # ===== ERROR PATH =====
+    def test_rechazos_individuales(self):
+        """Los contenedores que no cumplen la secuencia se informan y el resto se registra"""
+        contenedor = Contenedor.objects.get(codigo_iso=self.codigos[0])
+        EventoContenedor.objects.create(
+            contenedor=contenedor,
+            tipo_evento="ARRIVED",
+            fecha_hora=self.llegada - timedelta(hours=1),
+            ubicacion_puerto="Terminal Chancay",
+            ubicacion_pais="Perú",
+            buque=self.buque,
+        )
+        resultado = ingesta_eventos.registrar_evento_masivo(
+            self.codigos, "ARRIVED", self.llegada, ubicacion_puerto="Terminal Chancay"
+        )
+        self.assertEqual(resultado.creados, 11)
+        self.assertEqual(len(resultado.rechazados), 1)
+        self.assertEqual(resultado.rechazados[0]["codigo_iso"], self.codigos[0])
+    
+    def test_requiere_permiso_de_eventos(self):
+        """Error: un staff sin permiso para crear eventos no puede aplicar el masivo"""
+        User.objects.create_user(username="operador", password="x", is_staff=True)
+        self.client.login(username="operador", password="x")
+        url = reverse("admin:control_arribo_evento_masivo", args=[self.arribo.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
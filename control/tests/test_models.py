@@ -1,10 +1,12 @@
 """
 Tests Unitarios - Modelos
-Casos de Prueba: CP-002, CP-003, CP-010, CP-011, CP-012
+Casos de Prueba: CP-002, CP-003, CP-004, CP-010, CP-011, CP-012, CP-015, CP-023
 """
 from decimal import Decimal
 from datetime import timedelta
+from io import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
@@ -15,8 +17,11 @@ from control.models import (
     Arribo,
     Transitario,
     Contenedor,
+    EventoContenedor,
+    AprobacionAduanera,
     AprobacionFinanciera,
     AprobacionPagoTransitario,
+    SelloContenedor,
 )
 
 
@@ -326,3 +331,327 @@ class TestPagoTransitario(TestCase):
         )
         with self.assertRaises(ValidationError):
             pago.full_clean()
+
+
+class TestSelloContenedor(TestCase):
+    """CP-004: Índice de sellos y detección de sellos duplicados"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=self.arribo,
+            codigo_iso="MSKU9070323",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:HL123456*|ADUANAS:AD789012",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-001"
+        )
+    
+    # ===== HAPPY PATH =====
+    def test_sellos_sincronizados_al_guardar(self):
+        """Cada sello de numero_sello genera una fila indexada"""
+        sellos = set(
+            self.contenedor.sellos.values_list("tipo", "codigo", "es_principal")
+        )
+        self.assertEqual(
+            sellos,
+            {("NAVIERA", "HL123456", True), ("ADUANAS", "AD789012", False)},
+        )
+        
+        self.contenedor.numero_sello = "NAVIERA:HL999999*"
+        self.contenedor.save()
+        self.assertEqual(
+            list(self.contenedor.sellos.values_list("codigo", flat=True)),
+            ["HL999999"],
+        )
+    
+    def test_editar_contenedor_con_sus_propios_sellos(self):
+        """Un contenedor no choca con sus propios sellos al editarse"""
+        self.contenedor.full_clean()
+    
+    # ===== ERROR PATH =====
+    def test_sello_duplicado_en_otro_contenedor_falla(self):
+        """Error: El sello ya está registrado en otro contenedor"""
+        otro = Contenedor(
+            arribo=self.arribo,
+            codigo_iso="HLXU8142385",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:NEW00001*|ADUANAS:ad789012",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-002"
+        )
+        with self.assertRaises(ValidationError) as ctx:
+            otro.full_clean()
+        self.assertIn("AD789012", str(ctx.exception))
+        self.assertIn("MSKU9070323", str(ctx.exception))
+        self.assertEqual(SelloContenedor.objects.count(), 2)
+
+
+class TestListoParaRetiro(TestCase):
+    """CP-015: Estado persistido de listo para retiro (Gate Pass)"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.transitario = Transitario.objects.create(
+            razon_social="Test Transit",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=self.arribo,
+            transitario=self.transitario,
+            codigo_iso="MSKU9070323",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:HL123456*",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-001"
+        )
+    
+    def _aprobar_todo(self):
+        AprobacionAduanera.objects.create(
+            contenedor=self.contenedor,
+            numero_despacho="118-2025-10-012345",
+            fecha_revision=timezone.now(),
+            aprobado=True,
+            fecha_levante=timezone.now(),
+        )
+        self.factura = AprobacionFinanciera.objects.create(
+            contenedor=self.contenedor,
+            numero_factura="F001-00000001",
+            monto_usd=Decimal("100.00"),
+            fecha_emision=timezone.now().date(),
+            estado_financiero="CREDITO",
+        )
+        AprobacionPagoTransitario.objects.create(
+            contenedor=self.contenedor,
+            transitario=self.transitario,
+            pago_realizado=True,
+            monto_pagado=Decimal("50.00"),
+            fecha_pago=timezone.now().date(),
+        )
+    
+    def _listo(self):
+        return Contenedor.objects.filter(
+            pk=self.contenedor.pk, listo_para_retiro=True
+        ).exists()
+    
+    # ===== HAPPY PATH =====
+    def test_listo_con_las_tres_aprobaciones(self):
+        """Las tres aprobaciones marcan el contenedor como listo"""
+        self.assertFalse(self._listo())
+        self._aprobar_todo()
+        self.assertTrue(self._listo())
+        self.assertEqual(
+            list(Contenedor.objects.listos_para_retiro()), [self.contenedor]
+        )
+    
+    def test_guardar_contenedor_no_pisa_el_estado(self):
+        """Un guardado con una instancia desactualizada no revierte el estado"""
+        self._aprobar_todo()
+        self.contenedor.save()
+        self.assertTrue(self.contenedor.listo_para_retiro)
+        self.assertTrue(self._listo())
+    
+    # ===== ERROR PATH =====
+    def test_bloqueo_por_evento_impide_retiro(self):
+        """Customs Hold quita el estado listo y Customs Released lo restaura"""
+        self._aprobar_todo()
+        ahora = timezone.now()
+        EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento="CUSTOMS_HOLD",
+            fecha_hora=ahora - timedelta(hours=2),
+        )
+        self.assertFalse(self._listo())
+        EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento="CUSTOMS_RELEASED",
+            fecha_hora=ahora - timedelta(hours=1),
+        )
+        self.assertTrue(self._listo())
+    
+    def test_factura_anulada_o_eliminada_impide_retiro(self):
+        """Cambiar la factura a ANULADA o eliminarla quita el estado listo"""
+        self._aprobar_todo()
+        self.factura.estado_financiero = "ANULADA"
+        self.factura.save()
+        self.assertFalse(self._listo())
+        
+        self.factura.estado_financiero = "PAGADA"
+        self.factura.save()
+        self.assertTrue(self._listo())
+        
+        self.factura.delete()
+        self.assertFalse(self._listo())
+
+
+class TestContadoresArribo(TestCase):
+    """CP-023: Contadores de contenedores registrados por arribo"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = self._arribo(descarga=2, carga=1)
+        self.otro_arribo = self._arribo(descarga=2, carga=0)
+    
+    def _arribo(self, descarga, carga):
+        return Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=descarga,
+            contenedores_carga=carga
+        )
+    
+    def _contenedor(self, codigo_iso, direccion="IMPORT", arribo=None):
+        return Contenedor(
+            arribo=arribo or self.arribo,
+            codigo_iso=codigo_iso,
+            direccion=direccion,
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-023"
+        )
+    
+    def _contadores(self, arribo):
+        arribo.refresh_from_db()
+        return (arribo.contenedores_import_registrados, arribo.contenedores_export_registrados)
+    
+    # ===== HAPPY PATH =====
+    def test_crear_mover_y_eliminar_actualiza_contadores(self):
+        """Crear, cambiar de arribo/dirección y eliminar mantienen los contadores"""
+        contenedor = self._contenedor("MSKU9070323")
+        contenedor.save()
+        self._contenedor("CSQU3054383", "EXPORT").save()
+        self.assertEqual(self._contadores(self.arribo), (1, 1))
+        
+        # Guardar sin cambiar arribo/dirección no altera los contadores
+        contenedor.ubicacion_actual = "PATIO-B"
+        contenedor.save()
+        self.assertEqual(self._contadores(self.arribo), (1, 1))
+        
+        contenedor.arribo = self.otro_arribo
+        contenedor.save()
+        self.assertEqual(self._contadores(self.arribo), (0, 1))
+        self.assertEqual(self._contadores(self.otro_arribo), (1, 0))
+        
+        contenedor.delete()
+        self.assertEqual(self._contadores(self.otro_arribo), (0, 0))
+        
+        Contenedor.objects.filter(arribo=self.arribo).delete()
+        self.assertEqual(self._contadores(self.arribo), (0, 0))
+    
+    def test_clean_usa_contadores_sin_contar(self):
+        """clean() valida la capacidad con el contador, sin COUNT sobre contenedores"""
+        self._contenedor("MSKU9070323").save()
+        existente = Contenedor.objects.select_related("arribo__buque").get(codigo_iso="MSKU9070323")
+        with self.assertNumQueries(0):
+            existente.clean()
+    
+    def test_guardar_arribo_no_pisa_contadores(self):
+        """Un guardado completo de un arribo leído antes no sobrescribe los contadores"""
+        arribo = Arribo.objects.get(pk=self.arribo.pk)
+        self._contenedor("MSKU9070323").save()
+        arribo.estado = "ATRACADO"
+        arribo.save()
+        self.assertEqual(self._contadores(self.arribo), (1, 0))
+        self.assertEqual(self.arribo.estado, "ATRACADO")
+    
+    def test_comando_reconciliar_corrige_desviacion(self):
+        """El comando de reconciliación detecta y repara contadores desviados"""
+        self._contenedor("MSKU9070323").save()
+        Arribo.objects.filter(pk=self.arribo.pk).update(
+            contenedores_import_registrados=5, contenedores_export_registrados=1
+        )
+        
+        salida = StringIO()
+        call_command("reconciliar_contadores_arribo", "--dry-run", stdout=salida)
+        self.assertIn("Con desviación: 1", salida.getvalue())
+        self.assertEqual(self._contadores(self.arribo), (5, 1))
+        
+        call_command("reconciliar_contadores_arribo", stdout=StringIO())
+        self.assertEqual(self._contadores(self.arribo), (1, 0))
+    
+    # ===== ERROR PATH =====
+    def test_capacidad_completa_en_clean(self):
+        """Error: clean() rechaza un contenedor más de los declarados"""
+        self._contenedor("CSQU3054383", "EXPORT").save()
+        self.arribo.refresh_from_db()
+        with self.assertRaises(ValidationError) as error:
+            self._contenedor("MSKU9070323", "EXPORT").clean()
+        self.assertIn("1 de 1", str(error.exception))
+    
+    def test_guardados_simultaneos_no_exceden_capacidad(self):
+        """Error: dos contenedores validados a la vez no superan la capacidad al guardar"""
+        primero = self._contenedor("MSKU9070323", "EXPORT")
+        segundo = self._contenedor("CSQU3054383", "EXPORT")
+        # Ambos pasan la validación antes de que cualquiera se guarde
+        primero.clean()
+        segundo.clean()
+        primero.save()
+        with self.assertRaises(ValidationError):
+            segundo.save()
+        self.assertEqual(self._contadores(self.arribo), (0, 1))
+        self.assertFalse(Contenedor.objects.filter(codigo_iso="CSQU3054383").exists())
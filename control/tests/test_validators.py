@@ -1,11 +1,13 @@
 """
 Tests Unitarios - Validadores
-Casos de Prueba: CP-001, CP-004, CP-008
+Casos de Prueba: CP-001, CP-004, CP-008, CP-020
 """
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 
+from control import iso6346
 from control.models import (
+    calculate_iso_6346_check_digit,
     validate_iso_6346,
     validate_sellos_format,
 )
@@ -73,3 +75,52 @@ class TestSellosFormat(TestCase):
         """Error: Tipo de sello vacío"""
         with self.assertRaises(ValidationError):
             validate_sellos_format(":CODIGO123*")
+
+
+class TestValidacionISO6346Lote(TestCase):
+    """CP-020: Validación ISO 6346 en lote con tablas precalculadas"""
+
+    # ===== HAPPY PATH =====
+    def test_lote_valido(self):
+        """Códigos válidos en lote (normalizados a mayúsculas)"""
+        resultados = iso6346.validate_iso_6346_many(
+            ["MSKU9070323", " hlxu8142385", "CSQU3054383"]
+        )
+        self.assertEqual([r.error for r in resultados], [None, None, None])
+        self.assertEqual(resultados[1].codigo, "HLXU8142385")
+        self.assertEqual(resultados[0].digito_sugerido, 3)
+
+    def test_coincide_con_calculo_individual(self):
+        """El lote calcula los mismos dígitos que calculate_iso_6346_check_digit"""
+        codigos = [f"TGHU{n:06d}0" for n in range(0, 1000000, 7919)]
+        resultados = iso6346.validate_iso_6346_many(codigos, usar_numpy=False)
+        for codigo, resultado in zip(codigos, resultados):
+            self.assertEqual(
+                resultado.digito_sugerido,
+                calculate_iso_6346_check_digit("TGHU", codigo[4:10]),
+            )
+
+    # ===== ERROR PATH =====
+    def test_errores_por_codigo(self):
+        """Error: Cada código inválido trae su mensaje y el dígito sugerido"""
+        digito, formato, categoria = iso6346.validate_iso_6346_many(
+            ["MSKU9070322", "MSKU907032", "MSKA9070323"]
+        )
+        self.assertIn("dígito verificador inválido", digito.error)
+        self.assertEqual(digito.digito_sugerido, 3)
+        # Falta el dígito verificador: se sugiere igual
+        self.assertIn("formato ISO 6346", formato.error)
+        self.assertEqual(formato.digito_sugerido, 3)
+        self.assertIn("4ta letra", categoria.error)
+
+    def test_sin_prefijo_no_sugiere(self):
+        """Error: Sin propietario y serie válidos no hay dígito sugerido"""
+        resultado, = iso6346.validate_iso_6346_many(["INVALIDO"])
+        self.assertIsNotNone(resultado.error)
+        self.assertIsNone(resultado.digito_sugerido)
+
+    def test_mensaje_igual_al_validador(self):
+        """Error: validate_iso_6346 reporta el mismo mensaje que el lote"""
+        resultado, = iso6346.validate_iso_6346_many(["MSKU9070322"])
+        with self.assertRaisesMessage(ValidationError, resultado.error):
+            validate_iso_6346("MSKU9070322")
@@ -1,22 +1,60 @@
 """
 Tests de Aceptación - Vistas Públicas
-Casos de Prueba: CP-005, CP-006, CP-007
+Casos de Prueba: CP-005, CP-006, CP-007, CP-014, CP-016, CP-017, CP-018, CP-019, CP-021, CP-026, CP-027, CP-028, CP-029
 """
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
 from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from control import (
+    busqueda,
+    cache_tracking,
+    exportacion,
+    importacion,
+    ingesta_eventos,
+    limite_solicitudes,
+    manifiesto,
+    pdf_cache,
+    rastreo,
+    views,
+)
+from control.pdf_assets import RegistroRecursos
 from control.models import (
     Buque,
     Arribo,
     Transitario,
     Contenedor,
+    EventoContenedor,
+    AprobacionAduanera,
+    AprobacionFinanciera,
+    AprobacionPagoTransitario,
     Queja,
+    DocumentoBusqueda,
+    calculate_iso_6346_check_digit,
 )
 
+# Reglas del proyecto (los tests de límite las reemplazan con override_settings)
+REGLAS_THROTTLE = dict(settings.SIGEP_THROTTLE_REGLAS)
+
 
 class TestBusquedaContenedor(TestCase):
     """CP-005: Vista pública de búsqueda de contenedor"""
@@ -219,3 +257,1364 @@ class TestPDFGeneration(TestCase):
         )
         # La vista es pública, retorna el PDF directamente
         self.assertEqual(response.status_code, 200)
+
+
+class TestAdminListadoContenedores(TestCase):
+    """CP-014: Listado de contenedores en el admin sin consultas N+1"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        self.client.login(username='admin', password='admin123')
+
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.transitario = Transitario.objects.create(
+            razon_social="Test Transit",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=50
+        )
+        self.creados = 0
+
+    def _crear_contenedores(self, cantidad):
+        """Crea contenedores con eventos y las tres aprobaciones completas"""
+        for _ in range(cantidad):
+            serial = f"{self.creados:06d}"
+            digito = calculate_iso_6346_check_digit("MSKU", serial)
+            contenedor = Contenedor.objects.create(
+                arribo=self.arribo,
+                transitario=self.transitario,
+                codigo_iso=f"MSKU{serial}{digito}",
+                direccion="IMPORT",
+                tipo_tamaño="22G1",
+                peso_bruto_kg=20000,
+                numero_sello=f"NAVIERA:HL{self.creados:06d}*",
+                mercancia_declarada="Test cargo",
+                bl_referencia=f"TEST-BL-{self.creados:03d}"
+            )
+            EventoContenedor.objects.create(
+                contenedor=contenedor,
+                tipo_evento="DISCHARGED",
+                fecha_hora=timezone.now() - timedelta(hours=1),
+                ubicacion_puerto="Callao",
+                ubicacion_pais="Perú",
+            )
+            AprobacionAduanera.objects.create(
+                contenedor=contenedor,
+                numero_despacho="118-2025-10-012345",
+                fecha_revision=timezone.now(),
+                aprobado=True,
+                fecha_levante=timezone.now(),
+            )
+            AprobacionFinanciera.objects.create(
+                contenedor=contenedor,
+                numero_factura=f"F001-{self.creados:08d}",
+                monto_usd=Decimal("100.00"),
+                fecha_emision=timezone.now().date(),
+                estado_financiero="PAGADA",
+            )
+            AprobacionPagoTransitario.objects.create(
+                contenedor=contenedor,
+                transitario=self.transitario,
+                pago_realizado=True,
+                monto_pagado=Decimal("50.00"),
+                fecha_pago=timezone.now().date(),
+            )
+            self.creados += 1
+
+    def _consultas_listado(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                reverse('admin:control_contenedor_changelist')
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    # ===== HAPPY PATH =====
+    def test_consultas_constantes_por_tamano_de_pagina(self):
+        """El número de consultas no crece con la cantidad de filas"""
+        self._crear_contenedores(2)
+        _, consultas_pocas = self._consultas_listado()
+
+        self._crear_contenedores(8)
+        response, consultas_muchas = self._consultas_listado()
+
+        self.assertEqual(response.context['cl'].result_count, 10)
+        self.assertEqual(consultas_pocas, consultas_muchas)
+
+    def test_badges_leen_anotaciones(self):
+        """Los badges reflejan las aprobaciones y el último evento"""
+        self._crear_contenedores(1)
+        response, _ = self._consultas_listado()
+        self.assertContains(response, 'LISTO PARA RETIRO')
+        self.assertContains(
+            response, reverse('control:pdf_gate_pass', args=['MSKU0000006'])
+        )
+        self.assertContains(response, 'Descargado')
+
+
+class TestColaRenderizadoPDF(TestCase):
+    """CP-016: Cola de renderizado de PDFs con caché por huella de contenido"""
+
+    PDF_FALSO = b"%PDF-1.4 documento de prueba"
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(SIGEP_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        renderizar = mock.patch(
+            "control.pdf_jobs.renderizar_pdf", return_value=self.PDF_FALSO
+        )
+        self.renderizar = renderizar.start()
+        self.addCleanup(renderizar.stop)
+
+        buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        arribo = Arribo.objects.create(
+            buque=buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        transitario = Transitario.objects.create(
+            razon_social="Test Transit",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=arribo,
+            transitario=transitario,
+            codigo_iso="MSKU9070323",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:HL123456*",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-001"
+        )
+
+    def _encolar(self, tipo="ficha", referencia="MSKU9070323"):
+        return self.client.post(
+            reverse('control:pdf_trabajo_encolar', args=[tipo, referencia])
+        )
+
+    def _esperar_listo(self, clave):
+        url = reverse('control:pdf_trabajo_estado', args=[clave])
+        limite = time.monotonic() + 5
+        while time.monotonic() < limite:
+            datos = self.client.get(url).json()
+            if datos['estado'] != 'pendiente':
+                return datos
+            time.sleep(0.02)
+        self.fail("El trabajo no terminó a tiempo")
+
+    # ===== HAPPY PATH =====
+    def test_encolar_y_descargar(self):
+        """El trabajo se procesa en segundo plano y el PDF queda descargable"""
+        response = self._encolar()
+        self.assertIn(response.status_code, (200, 202))
+        clave = response.json()['trabajo']
+
+        datos = self._esperar_listo(clave)
+        self.assertEqual(datos['estado'], 'listo')
+
+        response = self.client.get(datos['descarga_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.PDF_FALSO)
+
+        response = self._encolar("manifiesto", str(self.contenedor.arribo_id))
+        self.assertIn(response.status_code, (200, 202))
+        self.assertNotEqual(response.json()['trabajo'], clave)
+
+    def test_documento_sin_cambios_no_se_vuelve_a_renderizar(self):
+        """La misma huella se sirve desde disco, también en la vista síncrona"""
+        clave = self._encolar().json()['trabajo']
+        self._esperar_listo(clave)
+
+        response = self._encolar()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['trabajo'], clave)
+        self.assertEqual(response.json()['estado'], 'listo')
+
+        response = self.client.get(
+            reverse('control:pdf_ficha_contenedor', args=['MSKU9070323'])
+        )
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self.renderizar.call_count, 1)
+
+    def test_cambio_en_registros_cambia_la_huella(self):
+        """Un evento nuevo invalida el PDF cacheado del contenedor"""
+        clave = self._encolar().json()['trabajo']
+        self._esperar_listo(clave)
+
+        EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento="DISCHARGED",
+            fecha_hora=timezone.now() - timedelta(hours=1),
+        )
+        self.assertNotEqual(self._encolar().json()['trabajo'], clave)
+
+    def test_cambio_de_estado_por_evento_cambia_huella_del_manifiesto(self):
+        """Un evento que bloquea el retiro invalida el manifiesto del arribo"""
+        from control.views import DOCUMENTOS_PDF
+        arribo_id = str(self.contenedor.arribo_id)
+        clave = DOCUMENTOS_PDF["manifiesto"](arribo_id)["clave"]
+        antes = Contenedor.objects.values_list("updated_at", flat=True).get(
+            pk=self.contenedor.pk
+        )
+
+        EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento="CUSTOMS_HOLD",
+            fecha_hora=timezone.now() - timedelta(hours=1),
+        )
+
+        contenedor = Contenedor.objects.get(pk=self.contenedor.pk)
+        self.assertTrue(contenedor.bloqueado_por_evento)
+        # El estado se escribe con update(): updated_at no cambia
+        self.assertEqual(contenedor.updated_at, antes)
+        self.assertNotEqual(DOCUMENTOS_PDF["manifiesto"](arribo_id)["clave"], clave)
+
+    def test_cambio_en_plantilla_base_cambia_la_huella(self):
+        """Editar la plantilla base (extends) invalida los PDFs que la usan"""
+        from control.views import DOCUMENTOS_PDF
+        clave = DOCUMENTOS_PDF["ficha"]("MSKU9070323")["clave"]
+        getmtime = os.path.getmtime
+
+        def base_editada(ruta):
+            extra = 60 if str(ruta).endswith("admin_base.html") else 0
+            return getmtime(ruta) + extra
+
+        with mock.patch("control.pdf_cache.os.path.getmtime", side_effect=base_editada):
+            self.assertNotEqual(DOCUMENTOS_PDF["ficha"]("MSKU9070323")["clave"], clave)
+
+    def test_etag_responde_304_sin_renderizar(self):
+        """If-None-Match con la huella vigente responde 304"""
+        url = reverse('control:pdf_ficha_contenedor', args=['MSKU9070323'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        antes = pdf_cache.estadisticas()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.renderizar.call_count, 1)
+        despues = pdf_cache.estadisticas()
+        self.assertEqual(despues['no_modificados'], antes['no_modificados'] + 1)
+
+        # Un ETag antiguo recibe el PDF desde la caché (acierto)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"otra-version"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.renderizar.call_count, 1)
+        self.assertEqual(
+            pdf_cache.estadisticas()['aciertos'], despues['aciertos'] + 1
+        )
+
+    def test_renderizados_simultaneos_se_coalescen(self):
+        """Peticiones simultáneas del mismo PDF sin caché esperan un solo renderizado"""
+        def renderizar_lento(html_content, hojas_estilo=()):
+            time.sleep(0.2)
+            return self.PDF_FALSO
+
+        self.renderizar.side_effect = renderizar_lento
+        clave = 'd' * 64
+        barrera = threading.Barrier(4)
+        respuestas = []
+
+        def peticion():
+            barrera.wait()
+            respuestas.append(
+                views._generate_pdf_response(lambda: "<html></html>", "ficha.pdf", clave=clave)
+            )
+
+        hilos = [threading.Thread(target=peticion) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(self.renderizar.call_count, 1)
+        self.assertEqual([r.content for r in respuestas], [self.PDF_FALSO] * 4)
+        self.assertEqual(pdf_cache.leer(clave), self.PDF_FALSO)
+
+    def test_desalojo_lru_por_tamano(self):
+        """Al superar el límite se eliminan los PDFs usados hace más tiempo"""
+        claves = ['a' * 64, 'b' * 64, 'c' * 64]
+        for i, clave in enumerate(claves):
+            ruta = pdf_cache.guardar(clave, b"x" * 10)
+            os.utime(ruta, (1000 + i, 1000 + i))
+
+        # Usar la más antigua la convierte en la más reciente
+        self.assertIsNotNone(pdf_cache.obtener(claves[0]))
+
+        self.assertEqual(pdf_cache.desalojar(limite_bytes=20), 1)
+        self.assertTrue(pdf_cache.existe(claves[0]))
+        self.assertFalse(pdf_cache.existe(claves[1]))
+        self.assertTrue(pdf_cache.existe(claves[2]))
+
+    # ===== ERROR PATH =====
+    def test_gate_pass_no_disponible(self):
+        """Error: Gate Pass sin aprobaciones no se encola"""
+        response = self._encolar("gate-pass")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        self.renderizar.assert_not_called()
+
+    def test_trabajo_inexistente_404(self):
+        """Error: Clave inválida o desconocida retorna 404"""
+        response = self.client.get(
+            reverse('control:pdf_trabajo_estado', args=['0' * 64])
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('control:pdf_trabajo_descargar', args=['no-es-una-clave'])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TestRegistroRecursosPDF(TestCase):
+    """CP-017: Logos y hojas de estilo precargados con recarga en caliente"""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        self.registro = RegistroRecursos(
+            directorio_imagenes=self.directorio, directorio_css=self.directorio
+        )
+        self.ruta_logo = os.path.join(self.directorio, "logo.png")
+        with open(self.ruta_logo, "wb") as f:
+            f.write(b"logo-v1")
+
+    # ===== HAPPY PATH =====
+    def test_logo_se_codifica_una_vez(self):
+        """Lecturas repetidas reutilizan el base64 en memoria"""
+        primero = self.registro.logo_base64("logo.png")
+        self.assertEqual(primero, "bG9nby12MQ==")
+        with mock.patch("pathlib.Path.read_bytes") as read_bytes:
+            self.assertIs(self.registro.logo_base64("logo.png"), primero)
+            read_bytes.assert_not_called()
+
+    def test_recarga_si_el_archivo_cambia(self):
+        """Un cambio en disco recarga el logo y cambia su versión"""
+        self.registro.logo_base64("logo.png")
+        version = self.registro.version("logo.png")
+
+        with open(self.ruta_logo, "wb") as f:
+            f.write(b"logo-version-2")
+        os.utime(self.ruta_logo, ns=(10**18, 10**18))
+
+        self.assertEqual(self.registro.logo_base64("logo.png"), "bG9nby12ZXJzaW9uLTI=")
+        self.assertNotEqual(self.registro.version("logo.png"), version)
+
+    # ===== ERROR PATH =====
+    def test_logo_inexistente(self):
+        """Error: Un logo que no existe retorna None"""
+        self.assertIsNone(self.registro.logo_base64("no-existe.png"))
+        self.assertEqual(self.registro.version("no-existe.png"), [["no-existe.png", None]])
+
+
+class TestExportacionManifiesto(TestCase):
+    """CP-018: Exportación de manifiestos en streaming (CSV, JSON Lines, XLSX)"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.codigos = []
+        for i in range(3):
+            serial = f"{i:06d}"
+            codigo = f"MSKU{serial}{calculate_iso_6346_check_digit('MSKU', serial)}"
+            Contenedor.objects.create(
+                arribo=self.arribo,
+                codigo_iso=codigo,
+                direccion="IMPORT",
+                tipo_tamaño="22G1",
+                peso_bruto_kg=20000 + i,
+                numero_sello=f"NAVIERA:HL{i:06d}*",
+                mercancia_declarada="Café & <cacao>",
+                bl_referencia=f"TEST-BL-{i:03d}"
+            )
+            self.codigos.append(codigo)
+        self.client.login(username='admin', password='admin123')
+
+    def _exportar(self, formato):
+        response = self.client.get(
+            reverse('control:exportar_manifiesto_arribo', args=[self.arribo.pk, formato])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    # ===== HAPPY PATH =====
+    def test_exportar_csv(self):
+        """CSV con encabezado y una fila por contenedor"""
+        contenido = self._exportar("csv").decode("utf-8-sig")
+        filas = list(csv.DictReader(io.StringIO(contenido)))
+        self.assertEqual([f['codigo_iso'] for f in filas], self.codigos)
+        self.assertEqual(filas[0]['buque'], "Test Ship")
+        self.assertEqual(filas[2]['peso_bruto_kg'], "20002.00")
+
+    def test_exportar_jsonl(self):
+        """JSON Lines: un objeto por línea"""
+        lineas = self._exportar("jsonl").decode("utf-8").splitlines()
+        registros = [json.loads(linea) for linea in lineas]
+        self.assertEqual([r['codigo_iso'] for r in registros], self.codigos)
+        self.assertIs(registros[0]['listo_para_retiro'], False)
+
+    def test_exportar_xlsx(self):
+        """XLSX válido: ZIP con la hoja y sus celdas"""
+        libro = zipfile.ZipFile(io.BytesIO(self._exportar("xlsx")))
+        self.assertIsNone(libro.testzip())
+        hoja = ElementTree.fromstring(libro.read("xl/worksheets/sheet1.xml"))
+        ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        filas = hoja.findall("m:sheetData/m:row", ns)
+        self.assertEqual(len(filas), 4)  # encabezado + 3 contenedores
+        textos = [t.text for t in hoja.iter(f"{{{ns['m']}}}t")]
+        for codigo in self.codigos:
+            self.assertIn(codigo, textos)
+
+    def test_exportar_rango_de_fechas(self):
+        """Exporta todos los arribos con ETA dentro del rango"""
+        hoy = timezone.localdate().isoformat()
+        response = self.client.get(
+            reverse('control:exportar_manifiestos', args=['jsonl']),
+            {'desde': hoy, 'hasta': hoy}
+        )
+        self.assertEqual(response.status_code, 200)
+        lineas = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lineas), 3)
+
+    # ===== ERROR PATH =====
+    def test_formato_o_rango_invalido(self):
+        """Error: formato desconocido (404) o rango inválido (400)"""
+        response = self.client.get(
+            reverse('control:exportar_manifiesto_arribo', args=[self.arribo.pk, 'pdf'])
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('control:exportar_manifiestos', args=['csv']),
+            {'desde': '2025-12-31', 'hasta': '2025-01-01'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_requiere_staff(self):
+        """Error: Usuario anónimo es redirigido al login"""
+        self.client.logout()
+        response = self.client.get(
+            reverse('control:exportar_manifiesto_arribo', args=[self.arribo.pk, 'csv'])
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class TestResumenManifiesto(TestCase):
+    """CP-019: Resumen del manifiesto de arribo en una consulta agregada"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10,
+            contenedores_carga=10
+        )
+        self.transitario = Transitario.objects.create(
+            razon_social="Test Transit",
+            nombre_comercial="TT",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        # (dirección, tipo, transitario, liberado por aduana, pagado)
+        datos = [
+            ("IMPORT", "22G1", self.transitario, True, True),
+            ("IMPORT", "45G1", self.transitario, True, False),
+            ("EXPORT", "L5G1", self.transitario, False, False),
+            ("IMPORT", "22G1", None, False, False),
+        ]
+        for i, (direccion, tipo, transitario, liberado, pagado) in enumerate(datos):
+            serial = f"{i:06d}"
+            contenedor = Contenedor.objects.create(
+                arribo=self.arribo,
+                codigo_iso=f"MSKU{serial}{calculate_iso_6346_check_digit('MSKU', serial)}",
+                direccion=direccion,
+                tipo_tamaño=tipo,
+                transitario=transitario,
+                peso_bruto_kg=20000,
+                bl_referencia=f"TEST-BL-{i:03d}"
+            )
+            if liberado:
+                AprobacionAduanera.objects.create(
+                    contenedor=contenedor,
+                    numero_despacho=f"118-2025-10-{i:06d}",
+                    fecha_revision=timezone.now(),
+                    aprobado=True,
+                    fecha_levante=timezone.now(),
+                )
+            if pagado:
+                AprobacionFinanciera.objects.create(
+                    contenedor=contenedor,
+                    numero_factura=f"F001-{i:08d}",
+                    monto_usd=Decimal("100.00"),
+                    fecha_emision=timezone.now().date(),
+                    fecha_pago=timezone.now().date(),
+                    estado_financiero="PAGADA",
+                )
+        self.client.login(username='admin', password='admin123')
+
+    # ===== HAPPY PATH =====
+    def test_totales_y_ratios(self):
+        """Totales, TEU y avance de aduana/pago del arribo"""
+        with self.assertNumQueries(1):
+            resumen = manifiesto.resumen_manifiesto(self.arribo)
+        self.assertEqual(resumen['total'], 4)
+        self.assertEqual(resumen['total_import'], 3)
+        self.assertEqual(resumen['total_export'], 1)
+        self.assertEqual(resumen['teu_total'], 6)  # 1 + 2 + 2 + 1
+        self.assertEqual(resumen['liberados_aduana'], 2)
+        self.assertEqual(resumen['pagados'], 1)
+        self.assertEqual(resumen['ratio_aduana'], 0.5)
+        self.assertEqual(resumen['ratio_pago'], 0.25)
+
+    def test_desglose_por_transitario(self):
+        """Un grupo por transitario, incluyendo los contenedores sin transitario"""
+        grupos = {
+            t['nombre']: t
+            for t in manifiesto.resumen_manifiesto(self.arribo)['transitarios']
+        }
+        self.assertEqual(set(grupos), {"TT", "Sin transitario"})
+        self.assertEqual(grupos["TT"]['total'], 3)
+        self.assertEqual(grupos["TT"]['export'], 1)
+        self.assertEqual(grupos["TT"]['teu'], 5)
+        self.assertEqual(grupos["Sin transitario"]['import'], 1)
+
+    def test_listado_anotado(self):
+        """El listado trae el estado de aduana y pago sin consultas por fila"""
+        with self.assertNumQueries(1):
+            contenedores = list(manifiesto.contenedores_manifiesto(self.arribo))
+            nombres = [c.transitario and c.transitario.nombre_comercial for c in contenedores]
+        self.assertEqual(nombres.count("TT"), 3)
+        for c in contenedores:
+            self.assertEqual(c.liberado_aduana, c.esta_liberado_aduana)
+            self.assertEqual(c.pagado, c.esta_pagado)
+
+    def test_api_resumen(self):
+        """La API JSON retorna el mismo resumen"""
+        response = self.client.get(
+            reverse('control:resumen_manifiesto_arribo', args=[self.arribo.pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertTrue(datos['success'])
+        self.assertEqual(datos['resumen']['total'], 4)
+        self.assertEqual(len(datos['resumen']['transitarios']), 2)
+
+    # ===== ERROR PATH =====
+    def test_api_arribo_inexistente(self):
+        """Error: Arribo inexistente retorna 404"""
+        response = self.client.get(
+            reverse('control:resumen_manifiesto_arribo', args=[99999])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_requiere_staff(self):
+        """Error: Usuario anónimo es redirigido al login"""
+        self.client.logout()
+        response = self.client.get(
+            reverse('control:resumen_manifiesto_arribo', args=[self.arribo.pk])
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class TestImportacionContenedores(TestCase):
+    """CP-021: Importación masiva de contenedores (CSV, XLSX, BAPLIE)"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=5
+        )
+        self.transitario = Transitario.objects.create(
+            razon_social="Test Transit",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        self.client.login(username='admin', password='admin123')
+
+    def _codigo(self, n):
+        serial = f"{n:06d}"
+        return f"MSKU{serial}{calculate_iso_6346_check_digit('MSKU', serial)}"
+
+    def _csv(self, filas):
+        encabezado = "codigo_iso,tipo_tamano,peso_bruto_kg,sellos,bl_referencia,transitario\n"
+        return (encabezado + "".join(f"{fila}\n" for fila in filas)).encode("utf-8")
+
+    def _importar(self, contenido, formato):
+        return importacion.importar_contenedores(
+            self.arribo, io.BytesIO(contenido), formato
+        )
+
+    # ===== HAPPY PATH =====
+    def test_importar_csv(self):
+        """CSV: inserta contenedores y sellos con tara por tipo y transitario por RUC"""
+        contenido = self._csv([
+            f"{self._codigo(i)},22G1,20000,NAVIERA:IMP{i:04d}*|ADUANAS:AD{i:04d},BL-{i},20512345678"
+            for i in range(3)
+        ])
+        resultado = self._importar(contenido, "csv")
+        self.assertTrue(resultado.exitoso, resultado.errores)
+        self.assertEqual(resultado.creados, 3)
+        contenedor = Contenedor.objects.get(codigo_iso=self._codigo(1))
+        self.assertEqual(contenedor.direccion, "IMPORT")
+        self.assertEqual(contenedor.tara_kg, Decimal("2200"))
+        self.assertEqual(contenedor.transitario, self.transitario)
+        self.assertEqual(contenedor.ubicacion_actual, "MUELLE-A")
+        self.assertEqual(
+            sorted(contenedor.sellos.values_list("codigo", flat=True)),
+            ["AD0001", "IMP0001"],
+        )
+        self.arribo.refresh_from_db()
+        self.assertEqual(self.arribo.contenedores_import_registrados, 3)
+
+    def test_reimportar_exportacion_xlsx(self):
+        """XLSX: el archivo de la exportación del manifiesto se puede volver a importar"""
+        self._importar(self._csv([
+            f"{self._codigo(i)},45G1,25000,NAVIERA:XL{i:04d}*,BL-{i},Test Transit"
+            for i in range(2)
+        ]), "csv")
+        filas = exportacion.filas_manifiesto(Arribo.objects.filter(pk=self.arribo.pk))
+        contenido = b"".join(exportacion.generar_xlsx(filas))
+        Contenedor.objects.all().delete()
+
+        resultado = self._importar(contenido, "xlsx")
+        self.assertTrue(resultado.exitoso, resultado.errores)
+        self.assertEqual(
+            set(Contenedor.objects.values_list("codigo_iso", flat=True)),
+            {self._codigo(0), self._codigo(1)},
+        )
+
+    def test_importar_baplie(self):
+        """BAPLIE: un contenedor por posición de estiba (LOC+147)"""
+        contenido = (
+            "UNA:+.? 'UNB+UNOA:2+MSK+CALLAO+251017:1200+1'"
+            "UNH+1+BAPLIE:D:95B:UN:SMDG20'BGM++1+9'"
+            "LOC+147+0120682::5'MEA+WT++KGM:21000'LOC+9+CNSHA'LOC+11+PECLL'"
+            f"RFF+BM:MSKBL001'EQD+CN+{self._codigo(7)}+22G1+++5'NAD+CA+MSK:172:20'"
+            "SEL+BP0007+CA'"
+            "LOC+147+0140282::5'MEA+VGM++KGM:18000'LOC+9+CNSHA'LOC+11+PECLL'"
+            f"RFF+BM:MSKBL002'EQD+CN+{self._codigo(8)}+42G1+++5'DGS+IMD+3'"
+            "SEL+BP0008+CA'"
+            "UNT+20+1'UNZ+1+1'"
+        ).encode("latin-1")
+        resultado = self._importar(contenido, "baplie")
+        self.assertTrue(resultado.exitoso, resultado.errores)
+        peligroso = Contenedor.objects.get(codigo_iso=self._codigo(8))
+        self.assertTrue(peligroso.mercancia_peligrosa)
+        self.assertEqual(peligroso.origen_puerto, "CNSHA")
+        self.assertEqual(peligroso.bl_referencia, "MSKBL002")
+        self.assertEqual(peligroso.numero_sello, "NAVIERA:BP0008*")
+
+    def test_vista_admin(self):
+        """La vista del admin importa el archivo y redirige al arribo"""
+        url = reverse('admin:control_arribo_importar_contenedores', args=[self.arribo.pk])
+        self.assertContains(self.client.get(url), "Validar e importar")
+        archivo = SimpleUploadedFile(
+            "descarga.csv",
+            self._csv([f"{self._codigo(9)},22G1,20000,NAVIERA:V0009*,BL-9,"]),
+            content_type="text/csv",
+        )
+        response = self.client.post(url, {'archivo': archivo})
+        self.assertRedirects(
+            response, reverse('admin:control_arribo_change', args=[self.arribo.pk])
+        )
+        self.assertTrue(Contenedor.objects.filter(codigo_iso=self._codigo(9)).exists())
+
+    # ===== ERROR PATH =====
+    def test_errores_por_fila_sin_importar(self):
+        """Error: Una fila inválida impide importar el lote y se reporta por fila"""
+        malo = self._codigo(2)[:-1] + str((int(self._codigo(2)[-1]) + 1) % 10)
+        contenido = self._csv([
+            f"{self._codigo(1)},22G1,20000,NAVIERA:OK0001*,BL-1,",
+            f"{malo},99X9,abc,NAVIERA:OK0001*,BL-2,",
+        ])
+        resultado = self._importar(contenido, "csv")
+        self.assertFalse(resultado.exitoso)
+        self.assertEqual(Contenedor.objects.count(), 0)
+        mensajes = " ".join(e['mensaje'] for e in resultado.errores if e['fila'] == 3)
+        self.assertIn(f"¿Quiso decir {self._codigo(2)}?", mensajes)
+        self.assertIn("Tipo/tamaño '99X9'", mensajes)
+        self.assertIn("Peso bruto", mensajes)
+        self.assertIn("se repite en el archivo", mensajes)
+
+    def test_capacidad_y_duplicados_en_bd(self):
+        """Error: Capacidad declarada excedida y sellos ya registrados"""
+        self._importar(self._csv([f"{self._codigo(0)},22G1,20000,NAVIERA:DUP0*,BL-0,"]), "csv")
+        resultado = self._importar(self._csv([
+            f"{self._codigo(i)},22G1,20000,NAVIERA:{'DUP0' if i == 1 else f'NEW{i}'}*,BL-{i},"
+            for i in range(1, 6)
+        ]), "csv")
+        self.assertFalse(resultado.exitoso)
+        self.assertIn("declara 5 contenedores", resultado.errores_generales[0])
+        self.assertIn("ya está registrado en el contenedor", resultado.errores[0]['mensaje'])
+        self.assertEqual(Contenedor.objects.count(), 1)
+
+    def test_archivo_ilegible(self):
+        """Error: XLSX corrupto se reporta como error general"""
+        resultado = self._importar(b"no es un zip", "xlsx")
+        self.assertFalse(resultado.exitoso)
+        self.assertIn("XLSX", resultado.errores_generales[0])
+
+
+class TestRastreoLote(TestCase):
+    """CP-026: Rastreo de contenedores por lote (códigos ISO o BL)"""
+    
+    def setUp(self):
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=50
+        )
+        self.codigos = []
+        for i in range(30):
+            codigo = self._codigo(i)
+            contenedor = Contenedor.objects.create(
+                arribo=self.arribo,
+                codigo_iso=codigo,
+                direccion="IMPORT",
+                tipo_tamaño="22G1",
+                peso_bruto_kg=25000,
+                mercancia_declarada="Test cargo",
+                ubicacion_actual="PATIO-A",
+                bl_referencia="BL-LOTE-A" if i < 3 else f"BL-{i}"
+            )
+            EventoContenedor.objects.create(
+                contenedor=contenedor,
+                tipo_evento="DISCHARGED",
+                fecha_hora=timezone.now(),
+                ubicacion_puerto="Terminal Chancay",
+                ubicacion_pais="Perú",
+                buque=self.buque,
+            )
+            self.codigos.append(codigo)
+    
+    def _codigo(self, i):
+        prefijo = f"TSTU{i:06d}"
+        return prefijo + str(calculate_iso_6346_check_digit(prefijo[:4], prefijo[4:]))
+    
+    # ===== HAPPY PATH =====
+    def test_consultas_constantes(self):
+        """Todo el lote se resuelve con una consulta, sin importar su tamaño"""
+        for codigos in (self.codigos[:3], self.codigos):
+            with self.assertNumQueries(1):
+                resultado = rastreo.rastrear_lote("\n".join(codigos))
+                estados = [fila.contenedor.ultimo_estado for fila in resultado.filas]
+                buques = {fila.contenedor.arribo.buque.nombre for fila in resultado.filas}
+            self.assertEqual(resultado.encontrados, len(codigos))
+            self.assertEqual(buques, {"Test Ship"})
+            self.assertIn("Discharged", estados[0])
+    
+    def test_codigos_y_bl_en_orden(self):
+        """Códigos válidos, inválidos, no registrados y BL en el orden pedido"""
+        no_registrado = self._codigo(99)
+        invalido = self.codigos[5][:10] + str((int(self.codigos[5][10]) + 1) % 10)
+        texto = f"{self.codigos[4].lower()}, {invalido}; {no_registrado}\nbl-lote-a {self.codigos[4]}"
+        
+        resultado = rastreo.rastrear_lote(texto)
+        self.assertEqual(
+            [(fila.consulta, fila.contenedor is not None) for fila in resultado.filas],
+            [
+                (self.codigos[4], True),
+                (invalido, False),
+                (no_registrado, False),
+                ("BL-LOTE-A", True),
+                ("BL-LOTE-A", True),
+                ("BL-LOTE-A", True),
+            ],
+        )
+        self.assertIn("dígito verificador", resultado.filas[1].error)
+        self.assertIn("no registrado", resultado.filas[2].error)
+    
+    def test_pagina_y_parcial_htmx(self):
+        """La página muestra el formulario y HTMX recibe solo la tabla"""
+        url = reverse("control:rastreo_lote")
+        self.assertContains(self.client.get(url), 'name="codigos"')
+        
+        respuesta = self.client.post(url, {"codigos": " ".join(self.codigos[:2])}, HTTP_HX_REQUEST="true")
+        self.assertContains(respuesta, self.codigos[1])
+        self.assertNotContains(respuesta, "<textarea")
+        
+        respuesta = self.client.post(url, {"codigos": self.codigos[0]})
+        self.assertContains(respuesta, "<textarea")
+        self.assertContains(respuesta, "1</strong> contenedores encontrados")
+    
+    # ===== ERROR PATH =====
+    def test_limite_de_consultas(self):
+        """Error: más de MAX_CONSULTAS códigos se recortan con aviso"""
+        texto = " ".join(f"BL-X{i}" for i in range(rastreo.MAX_CONSULTAS + 5))
+        resultado = rastreo.rastrear_lote(texto)
+        self.assertEqual(len(resultado.filas), rastreo.MAX_CONSULTAS)
+        self.assertEqual(resultado.encontrados, 0)
+        self.assertTrue(resultado.avisos)
+    
+    def test_bl_inexistente(self):
+        """Error: un BL sin contenedores se informa en su fila"""
+        resultado = rastreo.rastrear_lote("BL-NO-EXISTE")
+        self.assertEqual(resultado.filas[0].error, "No hay contenedores con este BL")
+
+
+class TestCacheRastreoPublico(TestCase):
+    """CP-027: Caché de fragmentos del rastreo público con invalidación por señales"""
+    
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(SIGEP_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache_tracking.limpiar()
+        self.addCleanup(cache_tracking.limpiar)
+        
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        self.buque = Buque.objects.create(
+            nombre="Test Ship",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=self.arribo,
+            codigo_iso="MSKU9070323",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="TEST-BL-001"
+        )
+        self.url_buscar = reverse('control:buscar')
+        self.url_detalle = reverse('control:detalle', args=[self.contenedor.codigo_iso])
+    
+    def _consultas_control(self, contexto):
+        return [q["sql"] for q in contexto.captured_queries if "control_" in q["sql"]]
+    
+    # ===== HAPPY PATH =====
+    def test_busqueda_repetida_sin_consultas(self):
+        """La segunda búsqueda del mismo código sale de la caché sin tocar la BD"""
+        primera = self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        
+        with CaptureQueriesContext(connection) as contexto:
+            segunda = self.client.get(self.url_buscar, {'codigo': 'msku9070323'})
+        
+        self.assertEqual(self._consultas_control(contexto), [])
+        self.assertEqual(segunda.content, primera.content)
+        self.assertGreaterEqual(cache_tracking.estadisticas()["aciertos_memoria"], 1)
+    
+    def test_evento_invalida_busqueda(self):
+        """Registrar un evento elimina el fragmento cacheado del contenedor"""
+        self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        
+        EventoContenedor.objects.create(
+            contenedor=self.contenedor,
+            tipo_evento="DISCHARGED",
+            fecha_hora=timezone.now(),
+            ubicacion_puerto="Terminal Chancay",
+            ubicacion_pais="Perú",
+            buque=self.buque,
+        )
+        
+        respuesta = self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        self.assertContains(respuesta, "Terminal Chancay")
+    
+    def test_aprobacion_invalida_detalle(self):
+        """El detalle se cachea y una aprobación aduanera lo invalida"""
+        self.assertContains(self.client.get(self.url_detalle), "Sin registro aduanero")
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(self.url_detalle)
+        self.assertEqual(self._consultas_control(contexto), [])
+        
+        AprobacionAduanera.objects.create(
+            contenedor=self.contenedor,
+            numero_despacho="118-2025-10-012345",
+            fecha_revision=timezone.now(),
+            aprobado=True,
+        )
+        
+        respuesta = self.client.get(self.url_detalle)
+        self.assertContains(respuesta, "118-2025-10-012345")
+        self.assertContains(respuesta, "MSKU9070323 | Detalle de Contenedor")
+    
+    def test_ingesta_en_lote_invalida(self):
+        """La ingesta (bulk_create, sin señales) también invalida"""
+        self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        
+        resultado = ingesta_eventos.registrar_eventos_en_lote([
+            ingesta_eventos.EventoEntrante(
+                "L1",
+                "MSKU9070323",
+                "ARRIVED",
+                timezone.now(),
+                ubicacion_puerto="Terminal Norte",
+                ubicacion_pais="Perú",
+            )
+        ])
+        
+        self.assertEqual(resultado.creados, 1, resultado.rechazados)
+        self.assertIsNone(cache_tracking.obtener("MSKU9070323", "resultado"))
+    
+    def test_nivel_archivos_compartido(self):
+        """Con archivos, otro proceso ve el fragmento y su invalidación"""
+        with override_settings(SIGEP_TRACKING_CACHE_ARCHIVOS=True):
+            cache_tracking.guardar("MSKU9070323", "resultado", "<p>cacheado</p>")
+            ruta = cache_tracking.directorio() / "MSKU9070323.resultado.html"
+            self.assertTrue(ruta.exists())
+            
+            # Otro proceso: memoria vacía, lee el archivo
+            cache_tracking._memoria.clear()
+            self.assertEqual(cache_tracking.obtener("MSKU9070323", "resultado"), "<p>cacheado</p>")
+            self.assertGreaterEqual(cache_tracking.estadisticas()["aciertos_archivo"], 1)
+            
+            # Otro proceso invalidó: el acierto en memoria ya no vale
+            ruta.unlink()
+            self.assertIsNone(cache_tracking.obtener("MSKU9070323", "resultado"))
+    
+    def test_estadisticas_staff(self):
+        """El staff consulta aciertos, fallos e invalidaciones en JSON"""
+        self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        self.client.force_login(self.admin)
+        
+        datos = self.client.get(reverse('control:tracking_cache_estadisticas')).json()
+        
+        self.assertTrue(datos["success"])
+        for campo in ("aciertos_memoria", "fallos", "invalidaciones", "desalojos", "tasa_aciertos"):
+            self.assertIn(campo, datos)
+    
+    # ===== ERROR PATH =====
+    def test_cambio_de_codigo_invalida_el_anterior(self):
+        """Error: al editar el código ISO el código anterior no se sigue sirviendo"""
+        self.assertContains(self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'}), self.url_detalle)
+        self.assertEqual(self.client.get(self.url_detalle).status_code, 200)
+        
+        self.contenedor.codigo_iso = "CSQU3054383"
+        self.contenedor.save()
+        
+        self.assertIsNone(cache_tracking.obtener("MSKU9070323", "resultado"))
+        self.assertIsNone(cache_tracking.obtener("MSKU9070323", "detalle"))
+        respuesta = self.client.get(self.url_buscar, {'codigo': 'MSKU9070323'})
+        self.assertNotContains(respuesta, self.url_detalle)
+        self.assertEqual(self.client.get(self.url_detalle).status_code, 404)
+        self.assertContains(
+            self.client.get(self.url_buscar, {'codigo': 'CSQU3054383'}),
+            reverse('control:detalle', args=["CSQU3054383"]),
+        )
+    
+    def test_lru_acotado(self):
+        """Error: al superar el máximo se desaloja el fragmento menos usado"""
+        with override_settings(SIGEP_TRACKING_CACHE_MAX_ENTRADAS=2):
+            desalojos = cache_tracking.estadisticas()["desalojos"]
+            cache_tracking.guardar("AAAU0000001", "resultado", "a")
+            cache_tracking.guardar("BBBU0000001", "resultado", "b")
+            cache_tracking.obtener("AAAU0000001", "resultado")
+            cache_tracking.guardar("CCCU0000001", "resultado", "c")
+            
+            self.assertIsNone(cache_tracking.obtener("BBBU0000001", "resultado"))
+            self.assertEqual(cache_tracking.obtener("AAAU0000001", "resultado"), "a")
+            self.assertEqual(cache_tracking.estadisticas()["desalojos"], desalojos + 1)
+    
+    def test_vencimiento_ttl(self):
+        """Error: un fragmento más viejo que el TTL no se sirve"""
+        cache_tracking.guardar("MSKU9070323", "resultado", "viejo")
+        with override_settings(SIGEP_TRACKING_CACHE_TTL=0), mock.patch(
+            "control.cache_tracking.time.monotonic", return_value=time.monotonic() + 1
+        ):
+            self.assertIsNone(cache_tracking.obtener("MSKU9070323", "resultado"))
+    
+    def test_estadisticas_requiere_staff(self):
+        """Error: un usuario anónimo no ve las estadísticas"""
+        respuesta = self.client.get(reverse('control:tracking_cache_estadisticas'))
+        self.assertEqual(respuesta.status_code, 302)
+
+
+class TestLimiteSolicitudes(TestCase):
+    """CP-028: Límite de solicitudes (token bucket) en las vistas públicas"""
+    
+    REGLAS = {"buscar": (2, 0.5), "pdf_cliente_contenedor": (1, 0.1)}
+    
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(
+            SIGEP_CACHE_DIR=self.cache_dir,
+            SIGEP_THROTTLE_ACTIVO=True,
+            SIGEP_THROTTLE_REGLAS=self.REGLAS,
+            SIGEP_THROTTLE_POR_IP=(3, 1.0),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        self.url_buscar = reverse('control:buscar')
+    
+    def _buscar(self, ip="10.0.0.1", cliente=None):
+        return (cliente or self.client).get(
+            self.url_buscar, {'codigo': 'MSKU9070323'}, REMOTE_ADDR=ip
+        )
+    
+    # ===== HAPPY PATH =====
+    def test_cubeta_por_ip(self):
+        """Cada IP tiene su propia cubeta: otra IP no se ve afectada"""
+        self.assertEqual(self._buscar().status_code, 200)
+        self.assertEqual(self._buscar().status_code, 200)
+        self.assertEqual(self._buscar().status_code, 429)
+        self.assertEqual(self._buscar(ip="10.0.0.2").status_code, 200)
+    
+    def test_recarga_de_fichas(self):
+        """Las fichas se recargan con el tiempo según la tasa de la vista"""
+        clave = [("buscar:10.0.0.9", 1, 0.5)]
+        self.assertEqual(limite_solicitudes.consumir("buscar", clave, ahora=1000), 0)
+        self.assertEqual(limite_solicitudes.consumir("buscar", clave, ahora=1000.5), 1.5)
+        self.assertEqual(limite_solicitudes.consumir("buscar", clave, ahora=1002), 0)
+    
+    def test_staff_y_vistas_sin_regla(self):
+        """El staff y las vistas sin regla no se limitan"""
+        self.client.force_login(self.admin)
+        for _ in range(4):
+            self.assertEqual(self._buscar().status_code, 200)
+        self.client.logout()
+        for _ in range(4):
+            self.assertEqual(
+                self.client.get(reverse('control:index'), REMOTE_ADDR="10.0.0.1").status_code,
+                200,
+            )
+    
+    def test_estadisticas_staff(self):
+        """El staff ve las solicitudes permitidas y limitadas por vista"""
+        for _ in range(3):
+            self._buscar()
+        self.client.force_login(self.admin)
+        
+        datos = self.client.get(reverse('control:limite_solicitudes_estadisticas')).json()
+        
+        self.assertTrue(datos["success"])
+        self.assertEqual(datos["rutas"]["buscar"], {"permitidas": 2, "limitadas": 1})
+        self.assertEqual(datos["limitadas"], 1)
+    
+    # ===== ERROR PATH =====
+    def test_429_con_retry_after(self):
+        """Error: al agotar la cubeta responde 429 con Retry-After sin consultar la BD"""
+        with override_settings(SIGEP_THROTTLE_REGLAS={"buscar": (1, 0.1)}):
+            self._buscar()
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self._buscar()
+        
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta["Retry-After"], "10")
+        self.assertEqual(len(contexto.captured_queries), 0)
+    
+    def test_cubeta_comun_por_ip(self):
+        """Error: la cubeta común limita a la IP aunque reparta entre vistas"""
+        url_pdf = reverse('control:pdf_cliente_contenedor', args=['MSKU9070323'])
+        self._buscar()
+        self._buscar()
+        self.client.get(url_pdf, REMOTE_ADDR="10.0.0.1")
+        
+        # Las cubetas por vista quedan agotadas y la común también (3 fichas)
+        self.assertEqual(self.client.get(url_pdf, REMOTE_ADDR="10.0.0.1").status_code, 429)
+        with override_settings(SIGEP_THROTTLE_REGLAS={"buscar": (10, 1.0)}):
+            self.assertEqual(self._buscar().status_code, 429)
+    
+    def test_vistas_pdf_y_lote_limitadas(self):
+        """Error: encolar PDF, consultar su estado y el rastreo en lote también se limitan"""
+        self.assertLessEqual(
+            REGLAS_THROTTLE["pdf_trabajo_encolar"][0],
+            REGLAS_THROTTLE["pdf_cliente_contenedor"][0],
+        )
+        peticiones = {
+            "pdf_trabajo_encolar": lambda ip: self.client.post(
+                reverse('control:pdf_trabajo_encolar', args=['tracking', 'NOEXISTE']),
+                REMOTE_ADDR=ip,
+            ),
+            "pdf_trabajo_estado": lambda ip: self.client.get(
+                reverse('control:pdf_trabajo_estado', args=['0' * 64]), REMOTE_ADDR=ip
+            ),
+            "rastreo_lote": lambda ip: self.client.post(
+                reverse('control:rastreo_lote'), {'codigos': ''}, REMOTE_ADDR=ip
+            ),
+        }
+        # Reloj fijo: sin recarga de fichas durante el test
+        with override_settings(
+            SIGEP_THROTTLE_REGLAS=REGLAS_THROTTLE, SIGEP_THROTTLE_POR_IP=(1000, 10.0)
+        ), mock.patch("control.limite_solicitudes.time.time", return_value=1000.0):
+            for i, (ruta, peticion) in enumerate(peticiones.items()):
+                ip = f"10.0.1.{i}"
+                capacidad = REGLAS_THROTTLE[ruta][0]
+                for _ in range(capacidad):
+                    self.assertNotEqual(peticion(ip).status_code, 429, ruta)
+                respuesta = peticion(ip)
+                self.assertEqual(respuesta.status_code, 429, ruta)
+                self.assertGreaterEqual(int(respuesta["Retry-After"]), 1)
+
+
+class TestBusquedaUnificada(TestCase):
+    """CP-029: Búsqueda unificada (FTS5) de contenedores, BLs, sellos, DAMs y facturas"""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'admin123'
+        )
+        self.buque = Buque.objects.create(
+            nombre="Pacific Star",
+            imo_number="1234567",
+            naviera="Test",
+            pabellon_bandera="PA",
+            puerto_registro="Lima",
+            callsign="TESTC",
+            eslora_metros=Decimal("200"),
+            manga_metros=Decimal("30"),
+            calado_metros=Decimal("10"),
+            teu_capacidad=5000
+        )
+        self.transitario = Transitario.objects.create(
+            razon_social="Andes Cargo SAC",
+            identificador_tributario="20512345678",
+            direccion="Test Address",
+            tipo_servicio="NVOCC"
+        )
+        self.arribo = Arribo.objects.create(
+            buque=self.buque,
+            tipo_operacion="DESCARGA",
+            fecha_eta=timezone.now(),
+            muelle_berth="MUELLE-A",
+            servicios_contratados="Descarga",
+            contenedores_descarga=10
+        )
+        self.contenedor = Contenedor.objects.create(
+            arribo=self.arribo,
+            transitario=self.transitario,
+            codigo_iso="MSKU9070323",
+            direccion="IMPORT",
+            tipo_tamaño="22G1",
+            peso_bruto_kg=25000,
+            numero_sello="NAVIERA:HL123456*|ADUANAS:AD789012",
+            mercancia_declarada="Test cargo",
+            ubicacion_actual="PATIO-A",
+            bl_referencia="MAEU-BL-555"
+        )
+        self.aduana = AprobacionAduanera.objects.create(
+            contenedor=self.contenedor,
+            numero_despacho="118-2025-10-012345",
+            fecha_revision=timezone.now(),
+            aprobado=True,
+        )
+        self.factura = AprobacionFinanciera.objects.create(
+            contenedor=self.contenedor,
+            numero_factura="F001-00004242",
+            monto_usd=Decimal("100.00"),
+            fecha_emision=timezone.now().date(),
+            estado_financiero="PAGADA",
+        )
+        self.url = reverse('control:busqueda_omnibox')
+    
+    def _tipos(self, texto, **kwargs):
+        return [(r.tipo, r.titulo) for r in busqueda.buscar(texto, **kwargs)]
+    
+    # ===== HAPPY PATH =====
+    def test_resultados_tipados(self):
+        """Cada identificador se encuentra con su tipo (también por fragmento)"""
+        self.assertEqual(self._tipos("AD789012"), [("sello", "AD789012")])
+        self.assertEqual(self._tipos("maeu-bl"), [("bl", "MAEU-BL-555")])
+        self.assertEqual(self._tipos("012345"), [("dam", "118-2025-10-012345")])
+        self.assertEqual(self._tipos("00004242"), [("factura", "F001-00004242")])
+        self.assertEqual(self._tipos("pacific"), [("buque", "Pacific Star")])
+        self.assertEqual(self._tipos("andes cargo"), [("transitario", "Andes Cargo SAC")])
+    
+    def test_coincidencia_exacta_primero(self):
+        """El contenedor buscado por su código completo va primero"""
+        resultados = busqueda.buscar("MSKU9070323")
+        self.assertEqual((resultados[0].tipo, resultados[0].titulo), ("contenedor", "MSKU9070323"))
+        # Los documentos que lo mencionan en el detalle también aparecen
+        self.assertIn("dam", {r.tipo for r in resultados})
+        self.assertEqual(
+            resultados[0].url,
+            reverse('admin:control_contenedor_change', args=[self.contenedor.pk]),
+        )
+    
+    def test_indice_sincronizado_por_senales(self):
+        """Editar o eliminar un registro actualiza el índice"""
+        self.factura.numero_factura = "F002-00000077"
+        self.factura.save()
+        self.assertEqual(self._tipos("00004242"), [])
+        self.assertEqual(self._tipos("00000077"), [("factura", "F002-00000077")])
+        
+        self.factura.delete()
+        self.assertEqual(self._tipos("00000077"), [])
+    
+    def test_reconstruir(self):
+        """reconstruir() regenera las mismas filas desde las tablas de negocio"""
+        antes = sorted(DocumentoBusqueda.objects.values_list("tipo", "titulo"))
+        DocumentoBusqueda.objects.all().delete()
+        self.assertEqual(self._tipos("AD789012"), [])
+        
+        total = busqueda.reconstruir()
+        
+        self.assertEqual(total, len(antes))
+        self.assertEqual(sorted(DocumentoBusqueda.objects.values_list("tipo", "titulo")), antes)
+        self.assertEqual(self._tipos("AD789012"), [("sello", "AD789012")])
+    
+    def test_endpoint_y_admin(self):
+        """El staff busca desde el omnibox y desde el listado de contenedores"""
+        self.client.force_login(self.admin)
+        
+        datos = self.client.get(self.url, {"q": "012345", "tipo": "dam"}).json()
+        self.assertTrue(datos["success"])
+        self.assertEqual(
+            [(r["tipo"], r["etiqueta"], r["objeto_id"]) for r in datos["resultados"]],
+            [("dam", "DAM", self.aduana.pk)],
+        )
+        
+        changelist = self.client.get(
+            reverse('admin:control_contenedor_changelist'), {"q": "AD789012"}
+        )
+        self.assertEqual(list(changelist.context["cl"].result_list), [self.contenedor])
+        changelist = self.client.get(
+            reverse('admin:control_contenedor_changelist'), {"q": "Andes"}
+        )
+        self.assertEqual(list(changelist.context["cl"].result_list), [self.contenedor])
+    
+    # ===== ERROR PATH =====
+    def test_terminos_cortos_y_operadores(self):
+        """Error: términos de menos de 3 caracteres u operadores FTS5 no rompen la consulta"""
+        self.assertEqual(busqueda.buscar("MS"), [])
+        self.assertEqual(busqueda.buscar('" OR * NEAR('), [])
+        self.assertEqual(self._tipos('AD789012 "'), [("sello", "AD789012")])
+    
+    def test_tipo_invalido_y_permisos(self):
+        """Error: un tipo desconocido es 400 y el anónimo no accede"""
+        self.assertEqual(self.client.get(self.url, {"q": "MSKU"}).status_code, 302)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(self.url, {"q": "MSKU", "tipo": "otro"}).status_code, 400)
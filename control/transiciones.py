@@ -0,0 +1,111 @@
+"""
+Tabla de transiciones compilada para la validación de eventos de contenedor.
+
+Las reglas de EventoContenedor (secuencia numérica, prerrequisitos, eventos
+válidos por dirección y eventos no repetibles) se compilan una sola vez, al
+definir el modelo, en máscaras de bits sobre los tipos de evento. El historial
+de un contenedor se resume en un entero (un bit por tipo ya registrado), así
+validar un evento nuevo son unas pocas operaciones AND sin recorrer eventos.
+"""
+
+from collections import namedtuple
+
+# Reglas compiladas de un tipo de evento para una dirección:
+# - permitido: el tipo es válido para la dirección
+# - prerrequisitos: máscara de eventos de los que debe existir al menos uno
+#   (0 = sin prerrequisitos)
+# - texto_prerrequisitos: nombres de los prerrequisitos para el mensaje de error
+# - posteriores: máscara de eventos posteriores en la secuencia; si alguno
+#   ya existe, el evento llega fuera de orden
+# - repetido: bit del propio tipo si no puede repetirse, si no 0
+Transicion = namedtuple(
+    "Transicion",
+    ["permitido", "prerrequisitos", "texto_prerrequisitos", "posteriores", "repetido"],
+)
+
+# Primer número de la secuencia válido por dirección: la importación inicia
+# en ARRIVED (7), la exportación en GATE_OUT_EMPTY (1)
+INICIO_SECUENCIA = {"IMPORT": 7, "EXPORT": 1}
+
+
+class TablaTransiciones:
+    """Reglas de secuencia de eventos compiladas por dirección"""
+
+    def __init__(
+        self,
+        tipos,
+        nombres,
+        secuencia,
+        prerrequisitos,
+        eventos_por_direccion,
+        no_repetibles,
+    ):
+        """
+        Args:
+            tipos: tipos de evento en orden (definen la posición de cada bit)
+            nombres: tipo → nombre para mensajes
+            secuencia: tipo → número de orden (None para eventos especiales)
+            prerrequisitos: tipo → lista de tipos de los que debe existir uno
+            eventos_por_direccion: dirección → tipos válidos para ella
+            no_repetibles: tipos que solo pueden ocurrir una vez
+        """
+        self.tipos = tuple(tipos)
+        self.bits = {tipo: 1 << i for i, tipo in enumerate(self.tipos)}
+        self.nombres = dict(nombres)
+        self.por_direccion = {
+            direccion: self._compilar(
+                direccion,
+                validos,
+                secuencia,
+                prerrequisitos,
+                no_repetibles,
+            )
+            for direccion, validos in eventos_por_direccion.items()
+        }
+
+    def _compilar(self, direccion, validos, secuencia, prerrequisitos, no_repetibles):
+        validos = set(validos)
+        inicio = INICIO_SECUENCIA.get(direccion, 1)
+        tabla = {}
+        for tipo in self.tipos:
+            # Para IMPORT solo cuentan los prerrequisitos válidos para importación
+            # (permite que ARRIVED sea el primer evento sin requerir DEPARTED)
+            requeridos = [
+                p
+                for p in prerrequisitos.get(tipo, ())
+                if direccion != "IMPORT" or p in validos
+            ]
+            numero = secuencia.get(tipo)
+            posteriores = 0
+            if numero and numero >= inicio:
+                posteriores = self.mascara(
+                    otro
+                    for otro, n in secuencia.items()
+                    if n and n >= inicio and n > numero
+                )
+            tabla[tipo] = Transicion(
+                permitido=tipo in validos,
+                prerrequisitos=self.mascara(requeridos),
+                texto_prerrequisitos=", ".join(
+                    self.nombres.get(p, p) for p in requeridos
+                ),
+                posteriores=posteriores,
+                repetido=self.bits[tipo] if tipo in no_repetibles else 0,
+            )
+        return tabla
+
+    def mascara(self, tipos):
+        """Máscara de bits de un conjunto de tipos de evento"""
+        mascara = 0
+        for tipo in tipos:
+            mascara |= self.bits.get(tipo, 0)
+        return mascara
+
+    def tipo_de_bit(self, mascara):
+        """Tipo de evento del bit menos significativo de la máscara"""
+        return self.tipos[(mascara & -mascara).bit_length() - 1]
+
+    def transicion(self, direccion, tipo_evento):
+        """Reglas compiladas del tipo para la dirección (None si no aplica)"""
+        tabla = self.por_direccion.get(direccion)
+        return tabla.get(tipo_evento) if tabla else None
@@ -7,6 +7,7 @@ app_name = "control"
 urlpatterns = [
     path("", views.index, name="index"),
     path("buscar/", views.buscar_contenedor, name="buscar"),
+    path("rastreo-lote/", views.rastreo_lote, name="rastreo_lote"),
     path("tracking/<str:codigo_iso>/", views.detalle_contenedor, name="detalle"),
     path("sobre-nosotros/", views.sobre_nosotros, name="sobre_nosotros"),
     path("quejas/", views.quejas_sugerencias, name="quejas"),
@@ -37,12 +38,68 @@ urlpatterns = [
         views.pdf_cliente_contenedor,
         name="pdf_cliente_contenedor",
     ),
+    # PDFs - Cola de renderizado en segundo plano
+    path(
+        "pdf/trabajos/<str:tipo>/<str:referencia>/encolar/",
+        views.pdf_trabajo_encolar,
+        name="pdf_trabajo_encolar",
+    ),
+    path(
+        "pdf/trabajos/<str:clave>/",
+        views.pdf_trabajo_estado,
+        name="pdf_trabajo_estado",
+    ),
+    path(
+        "pdf/trabajos/<str:clave>/descargar/",
+        views.pdf_trabajo_descargar,
+        name="pdf_trabajo_descargar",
+    ),
+    path(
+        "pdf/cache/estadisticas/",
+        views.pdf_cache_estadisticas,
+        name="pdf_cache_estadisticas",
+    ),
+    # Caché de fragmentos del rastreo público (solo staff)
+    path(
+        "tracking/cache/estadisticas/",
+        views.tracking_cache_estadisticas,
+        name="tracking_cache_estadisticas",
+    ),
+    # Límite de solicitudes de las vistas públicas (solo staff)
+    path(
+        "limite-solicitudes/estadisticas/",
+        views.limite_solicitudes_estadisticas,
+        name="limite_solicitudes_estadisticas",
+    ),
+    # Exportación masiva de manifiestos - CSV / JSON Lines / XLSX (solo staff)
+    path(
+        "exportar/manifiesto/<int:arribo_id>/<str:formato>/",
+        views.exportar_manifiesto_arribo,
+        name="exportar_manifiesto_arribo",
+    ),
+    path(
+        "exportar/manifiestos/<str:formato>/",
+        views.exportar_manifiestos,
+        name="exportar_manifiestos",
+    ),
     # API - Consulta SUNAT (solo staff)
     path(
         "api/sunat/ruc/<str:ruc>/",
         views.consultar_ruc_sunat,
         name="consultar_ruc_sunat",
     ),
+    # API - Caché y latencia de los servicios externos (solo staff)
+    path(
+        "api/consultas-externas/estadisticas/",
+        views.consultas_externas_estadisticas,
+        name="consultas_externas_estadisticas",
+    ),
+    # API - Consulta en lote de RUC e IMO (solo staff)
+    path(
+        "api/consultas-externas/lote/",
+        views.consultas_externas_lote,
+        name="consultas_externas_lote",
+    ),
     # API - Consulta IMO Buques (solo staff)
     path(
         "api/imo/ship/<str:imo>/",
@@ -55,6 +112,24 @@ urlpatterns = [
         views.obtener_datos_arribo,
         name="obtener_datos_arribo",
     ),
+    # API - Resumen del manifiesto de un arribo (solo staff)
+    path(
+        "api/arribo/<int:arribo_id>/resumen-manifiesto/",
+        views.resumen_manifiesto_arribo,
+        name="resumen_manifiesto_arribo",
+    ),
+    # API - Ingesta de eventos EDIFACT COARRI/CODECO o CSV (solo staff)
+    path(
+        "api/eventos/ingesta/",
+        views.ingerir_eventos,
+        name="ingerir_eventos",
+    ),
+    # API - Búsqueda unificada (omnibox) por código, BL, sello, DAM o factura (solo staff)
+    path(
+        "api/busqueda/",
+        views.busqueda_omnibox,
+        name="busqueda_omnibox",
+    ),
     # API - Datos de Contenedor para auto-llenado de transitario en pago (solo staff)
     path(
         "api/contenedor/<int:contenedor_id>/",
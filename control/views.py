@@ -1,21 +1,57 @@
-import base64
+import io
+import json
 import logging
-from collections import defaultdict
+import re
+import time
 from datetime import timedelta
-from pathlib import Path
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ValidationError
-from django.http import HttpResponse, JsonResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
-from django.views.decorators.http import require_GET
-
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_GET, require_POST
+
+from . import (
+    busqueda,
+    cache_tracking,
+    coalescencia,
+    consultas_externas,
+    exportacion,
+    ingesta_eventos,
+    limite_solicitudes,
+    manifiesto,
+    pdf_cache,
+    pdf_jobs,
+    rastreo,
+)
 from .imo_client import imo_client
-from .models import Arribo, Contenedor, Queja, QuejaContenedor, validate_iso_6346
+from .models import (
+    AprobacionAduanera,
+    AprobacionFinanciera,
+    Arribo,
+    Contenedor,
+    EventoContenedor,
+    Queja,
+    QuejaContenedor,
+    Transitario,
+    validate_iso_6346,
+)
+from .pdf_assets import CSS_ADMIN, CSS_CLIENTE, LOGO_ADMIN, LOGO_CLIENTE, recursos
 from .sunat_client import sunat_client
 
 logger = logging.getLogger(__name__)
@@ -45,37 +81,84 @@ def buscar_contenedor(request):
             {"error": str(e.message) if hasattr(e, "message") else str(e.messages[0])},
         )
 
+    # Fragmento cacheado: se invalida al cambiar el contenedor (control/signals.py)
+    html = cache_tracking.obtener(codigo, "resultado")
+    if html is not None:
+        return HttpResponse(html)
+
     # Buscar contenedor
     try:
-        contenedor = (
-            Contenedor.objects.select_related("arribo", "arribo__buque", "transitario")
-            .prefetch_related("eventos")
-            .get(codigo_iso=codigo)
-        )
+        contenedor = Contenedor.objects.select_related(
+            "arribo", "arribo__buque", "transitario"
+        ).get(codigo_iso=codigo)
 
-        ultimo_evento = contenedor.eventos.order_by("-fecha_hora").first()
+        # Snapshot denormalizado en el contenedor: no consulta la tabla de eventos
+        ultimo_evento = contenedor.ultimo_evento
 
-        return render(
-            request,
+        # Sin request: el fragmento es igual para todos los visitantes
+        html = render_to_string(
             "tracking/partials/_resultado.html",
             {
                 "contenedor": contenedor,
                 "ultimo_evento": ultimo_evento,
             },
         )
+        cache_tracking.guardar(codigo, "resultado", html)
+        return HttpResponse(html)
     except Contenedor.DoesNotExist:
         return render(
             request, "tracking/partials/_no_encontrado.html", {"codigo": codigo}
         )
 
 
+def rastreo_lote(request):
+    """
+    Rastreo de varios contenedores a la vez (cientos de códigos ISO o un BL).
+    GET muestra el formulario; POST responde la tabla de estados (parcial
+    si la petición viene de HTMX).
+    """
+    if request.method != "POST":
+        return render(
+            request, "tracking/lote.html", {"max_consultas": rastreo.MAX_CONSULTAS}
+        )
+
+    texto = request.POST.get("codigos", "")
+    resultado = rastreo.rastrear_lote(texto) if texto.strip() else None
+    contexto = {
+        "resultado": resultado,
+        "codigos": texto,
+        "max_consultas": rastreo.MAX_CONSULTAS,
+    }
+    if request.htmx:
+        return render(request, "tracking/partials/_resultado_lote.html", contexto)
+    return render(request, "tracking/lote.html", contexto)
+
+
 def detalle_contenedor(request, codigo_iso):
     """Página de detalle del contenedor con timeline completo"""
+    codigo_iso = codigo_iso.upper()
+    contenido = cache_tracking.obtener(codigo_iso, "detalle")
+    if contenido is None:
+        # Visitas simultáneas del mismo contenedor esperan un solo renderizado
+        contenido = coalescencia.ejecutar(
+            f"tracking:detalle:{codigo_iso}",
+            lambda: _renderizar_detalle(codigo_iso),
+            desde_cache=lambda: cache_tracking.obtener(codigo_iso, "detalle"),
+        )
+
+    # La plantilla base (navbar, sesión) se renderiza por petición
+    return render(
+        request,
+        "tracking/detalle.html",
+        {"codigo_iso": codigo_iso, "contenido": mark_safe(contenido)},
+    )
+
+
+def _renderizar_detalle(codigo_iso):
+    """Fragmento del detalle (datos y timeline) guardado en cache_tracking"""
     contenedor = get_object_or_404(
-        Contenedor.objects.select_related(
-            "arribo", "arribo__buque", "transitario"
-        ).prefetch_related("eventos"),
-        codigo_iso=codigo_iso.upper(),
+        Contenedor.objects.select_related("arribo", "arribo__buque", "transitario"),
+        codigo_iso=codigo_iso,
     )
 
     eventos = contenedor.eventos.select_related("buque").order_by("-fecha_hora")
@@ -84,9 +167,8 @@ def detalle_contenedor(request, codigo_iso):
     aprobacion_financiera = getattr(contenedor, "aprobacion_financiera", None)
     aprobacion_aduanera = getattr(contenedor, "aprobacion_aduanera", None)
 
-    return render(
-        request,
-        "tracking/detalle.html",
+    contenido = render_to_string(
+        "tracking/partials/_detalle.html",
         {
             "contenedor": contenedor,
             "eventos": eventos,
@@ -94,6 +176,8 @@ def detalle_contenedor(request, codigo_iso):
             "aprobacion_aduanera": aprobacion_aduanera,
         },
     )
+    cache_tracking.guardar(codigo_iso, "detalle", contenido)
+    return contenido
 
 
 def sobre_nosotros(request):
@@ -240,36 +324,95 @@ def quejas_sugerencias(request):
 
 
 def _get_logo_base64(logo_name):
-    """Obtiene el logo como base64 para incrustar en el PDF"""
-    logo_path = Path(settings.BASE_DIR) / "theme" / "static" / "images" / logo_name
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
-    return None
+    """Obtiene el logo como base64 para incrustar en el PDF (codificado una vez por proceso)"""
+    return recursos.logo_base64(logo_name)
 
 
-def _generate_pdf_response(html_content, filename):
-    """Genera una respuesta HTTP con el PDF usando WeasyPrint"""
+def _generate_pdf_response(generar_html, filename, clave=None, hojas_estilo=()):
+    """
+    Genera una respuesta HTTP con el PDF usando WeasyPrint.
+    Si se indica la clave del documento, el PDF queda guardado en la caché y
+    las peticiones simultáneas del mismo documento (en este u otros procesos)
+    esperan un solo renderizado.
+    """
+
+    def renderizar():
+        pdf = pdf_jobs.renderizar_pdf(generar_html(), hojas_estilo)
+        if clave:
+            pdf_cache.guardar(clave, pdf)
+        return pdf
+
     try:
-        from weasyprint import HTML
+        if clave:
+            pdf = coalescencia.ejecutar(
+                f"pdf:{clave}", renderizar, desde_cache=lambda: pdf_cache.leer(clave)
+            )
+        else:
+            pdf = renderizar()
     except ImportError:
         return HttpResponse(
             "WeasyPrint no está instalado. Ejecute: pip install weasyprint",
             status=500,
         )
 
-    pdf = HTML(string=html_content).write_pdf()
-
     response = HttpResponse(pdf, content_type="application/pdf")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
 
-def pdf_ficha_contenedor(request, codigo_iso):
+def _pdf_file_response(ruta, filename):
+    """Sirve un PDF ya generado desde disco"""
+    return FileResponse(
+        open(ruta, "rb"),
+        as_attachment=True,
+        filename=filename,
+        content_type="application/pdf",
+    )
+
+
+def _con_etag(request, clave, generar_respuesta):
     """
-    Genera PDF de Ficha Completa del Contenedor (Admin)
-    Incluye toda la información: datos, origen/destino, aprobaciones, timeline
+    Responde 304 si el cliente ya tiene esta versión del documento
+    (If-None-Match); si no, genera la respuesta y le agrega el ETag.
     """
+    etag = pdf_cache.etag(clave)
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        pdf_cache.registrar_no_modificado()
+        response = HttpResponseNotModified()
+    else:
+        response = generar_respuesta()
+        if response.status_code != 200:
+            return response
+    response["ETag"] = etag
+    # El navegador puede guardar el PDF, pero debe revalidarlo en cada uso
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class DocumentoNoDisponible(Exception):
+    """El documento no puede emitirse en el estado actual del contenedor"""
+
+
+# ====== DOCUMENTOS PDF ======
+# Cada función carga los registros del documento y retorna un dict con:
+#   clave: huella de contenido (pdf_cache.huella) usada como clave de caché
+#   filename: nombre de descarga
+#   generar_html: callable que renderiza la plantilla (solo si no está cacheado)
+#   hojas_estilo: hojas precargadas de pdf_assets que se aplican al renderizar
+
+
+def _aprobaciones(contenedor):
+    return [
+        getattr(contenedor, "aprobacion_aduanera", None),
+        getattr(contenedor, "aprobacion_financiera", None),
+        getattr(contenedor, "aprobacion_pago_transitario", None),
+    ]
+
+
+def _documento_ficha(codigo_iso):
+    """Ficha Completa del Contenedor (Admin)"""
+    plantilla = "pdf/admin_ficha_contenedor.html"
     contenedor = get_object_or_404(
         Contenedor.objects.select_related(
             "arribo",
@@ -278,85 +421,89 @@ def pdf_ficha_contenedor(request, codigo_iso):
             "aprobacion_aduanera",
             "aprobacion_financiera",
             "aprobacion_pago_transitario",
-        ).prefetch_related("eventos"),
+        ),
         codigo_iso=codigo_iso.upper(),
     )
-
     eventos = contenedor.eventos.select_related("buque").order_by("-fecha_hora")
-    logo_base64 = _get_logo_base64("SigepAdminLogo.jpeg")
-
-    html_content = render_to_string(
-        "pdf/admin_ficha_contenedor.html",
-        {
-            "contenedor": contenedor,
-            "eventos": eventos,
-            "logo_base64": logo_base64,
-            "fecha_generacion": timezone.now(),
-        },
-    )
-
-    filename = f"ficha_contenedor_{codigo_iso}_{timezone.now().strftime('%Y%m%d')}.pdf"
-    return _generate_pdf_response(html_content, filename)
 
+    def generar_html():
+        return render_to_string(
+            plantilla,
+            {
+                "contenedor": contenedor,
+                "eventos": eventos,
+                "logo_base64": _get_logo_base64(LOGO_ADMIN),
+                "fecha_generacion": timezone.now(),
+            },
+        )
 
-def pdf_manifiesto_arribo(request, arribo_id):
-    """
-    Genera PDF del Manifiesto de Arribo (Admin)
-    Lista de todos los contenedores asociados al arribo de un buque
-    """
-    arribo = get_object_or_404(
-        Arribo.objects.select_related("buque").prefetch_related(
-            "contenedores",
-            "contenedores__transitario",
-            "contenedores__aprobacion_aduanera",
-            "contenedores__aprobacion_financiera",
+    return {
+        "clave": pdf_cache.huella(
+            plantilla,
+            recursos.version(CSS_ADMIN, LOGO_ADMIN),
+            contenedor,
+            contenedor.arribo,
+            contenedor.arribo.buque,
+            contenedor.transitario,
+            *_aprobaciones(contenedor),
+            contenedor.eventos.all(),
         ),
-        pk=arribo_id,
-    )
-
-    contenedores = arribo.contenedores.all().order_by("direccion", "codigo_iso")
-    total_import = contenedores.filter(direccion="IMPORT").count()
-    total_export = contenedores.filter(direccion="EXPORT").count()
-
-    # Resumen por transitario
-    transitarios_dict = defaultdict(lambda: {"total": 0, "import": 0, "export": 0})
-    for c in contenedores:
-        nombre = c.transitario.nombre_comercial if c.transitario else "Sin transitario"
-        transitarios_dict[nombre]["total"] += 1
-        if c.direccion == "IMPORT":
-            transitarios_dict[nombre]["import"] += 1
-        else:
-            transitarios_dict[nombre]["export"] += 1
-
-    resumen_transitarios = [{"nombre": k, **v} for k, v in transitarios_dict.items()]
-
-    logo_base64 = _get_logo_base64("SigepAdminLogo.jpeg")
-
-    html_content = render_to_string(
-        "pdf/admin_manifiesto_arribo.html",
-        {
-            "arribo": arribo,
-            "contenedores": contenedores,
-            "total_import": total_import,
-            "total_export": total_export,
-            "resumen_transitarios": resumen_transitarios,
-            "logo_base64": logo_base64,
-            "fecha_generacion": timezone.now(),
-        },
-    )
+        "filename": f"ficha_contenedor_{contenedor.codigo_iso}_{timezone.now().strftime('%Y%m%d')}.pdf",
+        "generar_html": generar_html,
+        "hojas_estilo": [CSS_ADMIN],
+    }
+
+
+def _documento_manifiesto(arribo_id):
+    """Manifiesto de Arribo (Admin)"""
+    plantilla = "pdf/admin_manifiesto_arribo.html"
+    if not str(arribo_id).isdigit():
+        raise Http404("Arribo no encontrado")
+    arribo = get_object_or_404(Arribo.objects.select_related("buque"), pk=arribo_id)
+
+    def generar_html():
+        resumen = manifiesto.resumen_manifiesto(arribo)
+        return render_to_string(
+            plantilla,
+            {
+                "arribo": arribo,
+                "contenedores": manifiesto.contenedores_manifiesto(arribo),
+                "resumen": resumen,
+                "resumen_transitarios": resumen["transitarios"],
+                "logo_base64": _get_logo_base64(LOGO_ADMIN),
+                "fecha_generacion": timezone.now(),
+            },
+        )
 
     buque_name = arribo.buque.nombre.replace(" ", "_")
     fecha = arribo.fecha_eta.strftime("%Y%m%d")
-    filename = f"manifiesto_arribo_{buque_name}_{fecha}.pdf"
-    return _generate_pdf_response(html_content, filename)
+    return {
+        "clave": pdf_cache.huella(
+            plantilla,
+            recursos.version(CSS_ADMIN, LOGO_ADMIN),
+            arribo,
+            arribo.buque,
+            arribo.contenedores.all(),
+            # Estado que escriben los eventos y el recálculo de retiro con
+            # update(): no renueva updated_at
+            pdf_cache.columnas(
+                arribo.contenedores.all(),
+                "listo_para_retiro",
+                *EventoContenedor.CAMPOS_ESTADO_CONTENEDOR,
+            ),
+            Transitario.objects.filter(contenedores__arribo=arribo).distinct(),
+            AprobacionAduanera.objects.filter(contenedor__arribo=arribo),
+            AprobacionFinanciera.objects.filter(contenedor__arribo=arribo),
+        ),
+        "filename": f"manifiesto_arribo_{buque_name}_{fecha}.pdf",
+        "generar_html": generar_html,
+        "hojas_estilo": [CSS_ADMIN],
+    }
 
 
-def pdf_gate_pass(request, codigo_iso):
-    """
-    Genera PDF del Gate Pass / Orden de Entrega (Admin)
-    Documento de autorización para retiro del contenedor
-    Solo se genera si todas las aprobaciones están completas
-    """
+def _documento_gate_pass(codigo_iso):
+    """Gate Pass / Orden de Entrega (Admin)"""
+    plantilla = "pdf/admin_gate_pass.html"
     contenedor = get_object_or_404(
         Contenedor.objects.select_related(
             "arribo",
@@ -369,43 +516,49 @@ def pdf_gate_pass(request, codigo_iso):
         codigo_iso=codigo_iso.upper(),
     )
 
-    # Verificar que todas las aprobaciones estén completas
-    aduana_ok = contenedor.esta_liberado_aduana
-    pago_ok = contenedor.esta_pagado
-    transitario_ok = contenedor.transitario_ha_pagado
-
-    if not (aduana_ok and pago_ok and transitario_ok):
-        return HttpResponse(
-            "No se puede generar Gate Pass: faltan aprobaciones pendientes.",
-            status=400,
+    # Verificar que todas las aprobaciones estén completas y sin bloqueo
+    if not contenedor.listo_para_retiro:
+        raise DocumentoNoDisponible(
+            "No se puede generar Gate Pass: faltan aprobaciones pendientes o el contenedor está bloqueado."
         )
 
     fecha_emision = timezone.now()
     horas_validez = 48
-    fecha_vencimiento = fecha_emision + timedelta(hours=horas_validez)
-
-    logo_base64 = _get_logo_base64("SigepAdminLogo.jpeg")
 
-    html_content = render_to_string(
-        "pdf/admin_gate_pass.html",
-        {
-            "contenedor": contenedor,
-            "fecha_emision": fecha_emision,
-            "fecha_vencimiento": fecha_vencimiento,
-            "horas_validez": horas_validez,
-            "logo_base64": logo_base64,
-        },
-    )
+    def generar_html():
+        return render_to_string(
+            plantilla,
+            {
+                "contenedor": contenedor,
+                "fecha_emision": fecha_emision,
+                "fecha_vencimiento": fecha_emision + timedelta(hours=horas_validez),
+                "horas_validez": horas_validez,
+                "logo_base64": _get_logo_base64(LOGO_ADMIN),
+            },
+        )
 
-    filename = f"gate_pass_{codigo_iso}_{fecha_emision.strftime('%Y%m%d')}.pdf"
-    return _generate_pdf_response(html_content, filename)
+    return {
+        # El día de emisión forma parte de la huella: se reemite un Gate Pass
+        # nuevo (con su propia vigencia) como máximo una vez por día
+        "clave": pdf_cache.huella(
+            plantilla,
+            recursos.version(CSS_ADMIN, LOGO_ADMIN),
+            contenedor,
+            contenedor.arribo,
+            contenedor.arribo.buque,
+            contenedor.transitario,
+            *_aprobaciones(contenedor),
+            timezone.localdate(),
+        ),
+        "filename": f"gate_pass_{contenedor.codigo_iso}_{fecha_emision.strftime('%Y%m%d')}.pdf",
+        "generar_html": generar_html,
+        "hojas_estilo": [CSS_ADMIN],
+    }
 
 
-def pdf_cliente_contenedor(request, codigo_iso):
-    """
-    Genera PDF de Ficha del Contenedor para Cliente (Censurado)
-    Versión pública con información sensible oculta
-    """
+def _documento_cliente(codigo_iso):
+    """Ficha del Contenedor para Cliente (Censurado)"""
+    plantilla = "pdf/cliente_ficha_contenedor.html"
     contenedor = get_object_or_404(
         Contenedor.objects.select_related(
             "arribo",
@@ -414,27 +567,302 @@ def pdf_cliente_contenedor(request, codigo_iso):
             "aprobacion_aduanera",
             "aprobacion_financiera",
             "aprobacion_pago_transitario",
-        ).prefetch_related("eventos"),
+            "ultimo_evento_buque",
+        ),
         codigo_iso=codigo_iso.upper(),
     )
 
-    eventos = contenedor.eventos.select_related("buque").order_by("-fecha_hora")[:10]
-    ultimo_evento = contenedor.eventos.order_by("-fecha_hora").first()
-    logo_base64 = _get_logo_base64("NuevoLogo.png")
+    def generar_html():
+        return render_to_string(
+            plantilla,
+            {
+                "contenedor": contenedor,
+                "eventos": contenedor.eventos.select_related("buque").order_by(
+                    "-fecha_hora"
+                )[:10],
+                "ultimo_evento": contenedor.ultimo_evento,
+                "logo_base64": _get_logo_base64(LOGO_CLIENTE),
+                "fecha_generacion": timezone.now(),
+            },
+        )
+
+    return {
+        "clave": pdf_cache.huella(
+            plantilla,
+            recursos.version(CSS_CLIENTE, LOGO_CLIENTE),
+            contenedor,
+            contenedor.arribo,
+            contenedor.arribo.buque,
+            contenedor.transitario,
+            contenedor.ultimo_evento_buque,
+            *_aprobaciones(contenedor),
+            contenedor.eventos.all(),
+        ),
+        "filename": f"seguimiento_{contenedor.codigo_iso}_{timezone.now().strftime('%Y%m%d')}.pdf",
+        "generar_html": generar_html,
+        "hojas_estilo": [CSS_CLIENTE],
+    }
+
+
+# Tipos de documento disponibles en la cola de renderizado
+DOCUMENTOS_PDF = {
+    "ficha": _documento_ficha,
+    "manifiesto": _documento_manifiesto,
+    "gate-pass": _documento_gate_pass,
+    "tracking": _documento_cliente,
+}
+
+
+def _servir_documento(request, documento):
+    """
+    Sirve el PDF desde la caché o lo renderiza (y cachea) en la petición.
+    Responde 304 sin tocar el disco si el navegador ya tiene esta versión.
+    """
+
+    def generar_respuesta():
+        ruta = pdf_cache.obtener(documento["clave"])
+        if ruta:
+            return _pdf_file_response(ruta, documento["filename"])
+        return _generate_pdf_response(
+            documento["generar_html"],
+            documento["filename"],
+            clave=documento["clave"],
+            hojas_estilo=documento["hojas_estilo"],
+        )
+
+    return _con_etag(request, documento["clave"], generar_respuesta)
+
+
+def pdf_ficha_contenedor(request, codigo_iso):
+    """
+    Genera PDF de Ficha Completa del Contenedor (Admin)
+    Incluye toda la información: datos, origen/destino, aprobaciones, timeline
+    """
+    return _servir_documento(request, _documento_ficha(codigo_iso))
+
+
+def pdf_manifiesto_arribo(request, arribo_id):
+    """
+    Genera PDF del Manifiesto de Arribo (Admin)
+    Lista de todos los contenedores asociados al arribo de un buque
+    """
+    return _servir_documento(request, _documento_manifiesto(arribo_id))
+
+
+def pdf_gate_pass(request, codigo_iso):
+    """
+    Genera PDF del Gate Pass / Orden de Entrega (Admin)
+    Documento de autorización para retiro del contenedor
+    Solo se genera si todas las aprobaciones están completas
+    """
+    try:
+        documento = _documento_gate_pass(codigo_iso)
+    except DocumentoNoDisponible as e:
+        return HttpResponse(str(e), status=400)
+    return _servir_documento(request, documento)
+
+
+def pdf_cliente_contenedor(request, codigo_iso):
+    """
+    Genera PDF de Ficha del Contenedor para Cliente (Censurado)
+    Versión pública con información sensible oculta
+    """
+    return _servir_documento(request, _documento_cliente(codigo_iso))
 
-    html_content = render_to_string(
-        "pdf/cliente_ficha_contenedor.html",
+
+# =============================================
+# COLA DE RENDERIZADO DE PDFs
+# =============================================
+
+
+def _estado_trabajo_json(clave, datos, status=200):
+    return JsonResponse(
         {
-            "contenedor": contenedor,
-            "eventos": eventos,
-            "ultimo_evento": ultimo_evento,
-            "logo_base64": logo_base64,
-            "fecha_generacion": timezone.now(),
+            "success": datos["estado"] != pdf_jobs.ERROR,
+            "trabajo": clave,
+            **datos,
+            "estado_url": reverse("control:pdf_trabajo_estado", args=[clave]),
+            "descarga_url": reverse("control:pdf_trabajo_descargar", args=[clave])
+            if datos["estado"] == pdf_jobs.LISTO
+            else None,
         },
+        status=status,
+    )
+
+
+@require_POST
+def pdf_trabajo_encolar(request, tipo, referencia):
+    """
+    Encola la generación de un PDF en segundo plano.
+    Si el documento no cambió desde la última vez, queda listo de inmediato.
+
+    Returns:
+        JsonResponse con el estado del trabajo (202 si quedó pendiente)
+    """
+    constructor = DOCUMENTOS_PDF.get(tipo)
+    if constructor is None:
+        return JsonResponse(
+            {"success": False, "error": "Tipo de documento no válido"}, status=404
+        )
+
+    try:
+        documento = constructor(referencia)
+    except DocumentoNoDisponible as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    datos = pdf_jobs.encolar(
+        documento["clave"],
+        documento["filename"],
+        documento["generar_html"],
+        hojas_estilo=documento["hojas_estilo"],
     )
+    status = 202 if datos["estado"] == pdf_jobs.PENDIENTE else 200
+    return _estado_trabajo_json(documento["clave"], datos, status=status)
 
-    filename = f"seguimiento_{codigo_iso}_{timezone.now().strftime('%Y%m%d')}.pdf"
-    return _generate_pdf_response(html_content, filename)
+
+@require_GET
+def pdf_trabajo_estado(request, clave):
+    """Consulta (polling) el estado de un trabajo de renderizado"""
+    if not pdf_cache.es_clave_valida(clave):
+        raise Http404("Trabajo no encontrado")
+    datos = pdf_jobs.estado(clave)
+    if datos["estado"] == pdf_jobs.DESCONOCIDO:
+        return JsonResponse(
+            {"success": False, "error": "Trabajo no encontrado"}, status=404
+        )
+    return _estado_trabajo_json(clave, datos)
+
+
+@require_GET
+def pdf_trabajo_descargar(request, clave):
+    """Descarga el PDF de un trabajo terminado"""
+    if not pdf_cache.es_clave_valida(clave):
+        raise Http404("Trabajo no encontrado")
+
+    def generar_respuesta():
+        ruta = pdf_cache.obtener(clave)
+        if ruta is None:
+            raise Http404("El PDF aún no está disponible")
+        filename = pdf_jobs.estado(clave).get("filename") or f"{clave}.pdf"
+        return _pdf_file_response(ruta, filename)
+
+    return _con_etag(request, clave, generar_respuesta)
+
+
+@staff_member_required
+@require_GET
+def pdf_cache_estadisticas(request):
+    """Aciertos/fallos de la caché de PDFs (proceso actual) y ocupación en disco"""
+    return JsonResponse({"success": True, **pdf_cache.estadisticas()})
+
+
+@staff_member_required
+@require_GET
+def tracking_cache_estadisticas(request):
+    """Aciertos/fallos/invalidaciones de la caché de fragmentos del rastreo público"""
+    return JsonResponse({"success": True, **cache_tracking.estadisticas()})
+
+
+@staff_member_required
+@require_GET
+def limite_solicitudes_estadisticas(request):
+    """Solicitudes permitidas/limitadas (429) por vista pública"""
+    return JsonResponse({"success": True, **limite_solicitudes.estadisticas()})
+
+
+@staff_member_required
+@require_GET
+def busqueda_omnibox(request):
+    """
+    Búsqueda unificada para el personal: contenedores, BLs, sellos, DAMs,
+    facturas, buques y transitarios, ordenados por relevancia.
+    ?q=texto&tipo=dam&tipo=factura (tipo es opcional y repetible)
+    """
+    texto = request.GET.get("q", "").strip()
+    tipos = request.GET.getlist("tipo")
+    validos = dict(busqueda.DocumentoBusqueda.TIPO_CHOICES)
+    invalidos = [tipo for tipo in tipos if tipo not in validos]
+    if invalidos:
+        return JsonResponse(
+            {"success": False, "error": f"Tipo no válido: {', '.join(invalidos)}"},
+            status=400,
+        )
+    return JsonResponse(
+        {
+            "success": True,
+            "q": texto,
+            "resultados": [
+                resultado._asdict() for resultado in busqueda.buscar(texto, tipos)
+            ],
+        }
+    )
+
+
+# =============================================
+# EXPORTACIÓN MASIVA DE MANIFIESTOS (STREAMING)
+# =============================================
+
+
+def _respuesta_exportacion(arribos, formato, nombre_base):
+    """StreamingHttpResponse con las filas del manifiesto en el formato pedido"""
+    generador, content_type, extension = exportacion.FORMATOS[formato]
+    response = StreamingHttpResponse(
+        generador(exportacion.filas_manifiesto(arribos)), content_type=content_type
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{nombre_base}.{extension}"'
+    )
+    return response
+
+
+@staff_member_required
+@require_GET
+def exportar_manifiesto_arribo(request, arribo_id, formato):
+    """
+    Exporta el manifiesto de un arribo en CSV, JSON Lines o XLSX (solo staff).
+    Las filas se emiten en streaming: la memoria no crece con el tamaño del viaje.
+    """
+    if formato not in exportacion.FORMATOS:
+        raise Http404("Formato no soportado")
+    arribo = get_object_or_404(Arribo.objects.select_related("buque"), pk=arribo_id)
+    buque_name = arribo.buque.nombre.replace(" ", "_")
+    fecha = arribo.fecha_eta.strftime("%Y%m%d")
+    return _respuesta_exportacion(
+        Arribo.objects.filter(pk=arribo.pk),
+        formato,
+        f"manifiesto_arribo_{buque_name}_{fecha}",
+    )
+
+
+@staff_member_required
+@require_GET
+def exportar_manifiestos(request, formato):
+    """
+    Exporta los manifiestos de todos los arribos con ETA en un rango de fechas
+    (?desde=AAAA-MM-DD&hasta=AAAA-MM-DD, ambos inclusive; solo staff).
+    """
+    if formato not in exportacion.FORMATOS:
+        raise Http404("Formato no soportado")
+
+    desde = parse_date(request.GET.get("desde", "") or "")
+    hasta = parse_date(request.GET.get("hasta", "") or "")
+    if not desde or not hasta or desde > hasta:
+        return JsonResponse(
+            {
+                "success": False,
+                "error": "Indique un rango válido: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD",
+            },
+            status=400,
+        )
+
+    arribos = Arribo.objects.filter(
+        fecha_eta__date__gte=desde, fecha_eta__date__lte=hasta
+    )
+    return _respuesta_exportacion(
+        arribos,
+        formato,
+        f"manifiestos_{desde.strftime('%Y%m%d')}_{hasta.strftime('%Y%m%d')}",
+    )
 
 
 # =============================================
@@ -464,6 +892,112 @@ def consultar_ruc_sunat(request, ruc):
     return JsonResponse(datos)
 
 
+@staff_member_required
+@require_GET
+def consultas_externas_estadisticas(request):
+    """
+    Tasa de aciertos de la caché y latencia de los servicios externos (SUNAT,
+    IMO), estado de sus circuitos y peticiones que reutilizaron un cálculo
+    simultáneo (coalescencia)
+    """
+    return JsonResponse(
+        {
+            "success": True,
+            "servicios": consultas_externas.estadisticas(),
+            "circuitos": consultas_externas.estado_circuitos(),
+            "coalescencia": coalescencia.estadisticas(),
+        }
+    )
+
+
+# RUC (11 dígitos) e IMO (7 dígitos) sueltos en una planilla CSV/texto
+_PATRON_RUC = re.compile(r"(?<!\d)\d{11}(?!\d)")
+_PATRON_IMO = re.compile(r"(?<!\d)\d{7}(?!\d)")
+
+
+def _claves_lote(request):
+    """
+    (rucs, imos, plazo) de una consulta en lote: JSON {"rucs": [...],
+    "imos": [...], "plazo": segundos} o una planilla en el campo 'archivo'
+    de la que se extraen los RUC e IMO. ValueError si el pedido no es válido.
+    """
+    archivo = request.FILES.get("archivo")
+    if archivo is not None:
+        texto = archivo.read().decode("utf-8-sig", errors="replace")
+        rucs = _PATRON_RUC.findall(texto)
+        imos = _PATRON_IMO.findall(texto)
+        plazo = None
+    else:
+        try:
+            cuerpo = json.loads(request.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("El cuerpo debe ser JSON o una planilla en 'archivo'")
+        if not isinstance(cuerpo, dict):
+            raise ValueError("El cuerpo debe ser un objeto JSON")
+        rucs = [str(ruc).strip() for ruc in cuerpo.get("rucs") or []]
+        imos = [str(imo).strip() for imo in cuerpo.get("imos") or []]
+        plazo = cuerpo.get("plazo")
+        if plazo is not None:
+            if not isinstance(plazo, (int, float)) or plazo <= 0:
+                raise ValueError("El plazo debe ser un número de segundos mayor a 0")
+            plazo = min(plazo, settings.CONSULTAS_LOTE_PLAZO)
+
+    rucs, imos = list(dict.fromkeys(rucs)), list(dict.fromkeys(imos))
+    if not rucs and not imos:
+        raise ValueError("No se recibieron RUC ni IMO para consultar")
+    if len(rucs) + len(imos) > settings.CONSULTAS_LOTE_MAX_CLAVES:
+        raise ValueError(
+            f"Máximo {settings.CONSULTAS_LOTE_MAX_CLAVES} claves por consulta en lote"
+        )
+    return rucs, imos, plazo
+
+
+def _lineas_lote(lotes, plazo):
+    """NDJSON: una línea por clave resuelta y una línea final con el resumen"""
+    inicio = time.perf_counter()
+    resumen = {"total": 0, "encontradas": 0, "errores": 0, "plazo_agotado": 0}
+    for servicio, clave, datos in consultas_externas.consultar_lote(lotes, plazo):
+        resumen["total"] += 1
+        if datos.get("error") == consultas_externas.PLAZO_AGOTADO:
+            resumen["plazo_agotado"] += 1
+        elif "error" in datos:
+            resumen["errores"] += 1
+        else:
+            resumen["encontradas"] += 1
+        yield json.dumps(
+            {"servicio": servicio, "clave": clave, "datos": datos},
+            ensure_ascii=False,
+            default=str,
+        ) + "\n"
+    resumen["duracion_ms"] = round((time.perf_counter() - inicio) * 1000)
+    yield json.dumps({"resumen": resumen}) + "\n"
+
+
+@staff_member_required
+@require_POST
+def consultas_externas_lote(request):
+    """
+    API interna de consulta en lote de RUC (SUNAT) e IMO (VesselFinder) para
+    el alta de navieras. Las claves se resuelven en paralelo y cada resultado
+    se envía apenas está listo (JSON Lines), sin esperar al resto del lote.
+
+    Returns:
+        StreamingHttpResponse application/x-ndjson; la última línea es el resumen
+    """
+    try:
+        rucs, imos, plazo = _claves_lote(request)
+    except ValueError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        _lineas_lote([sunat_client.lote(rucs), imo_client.lote(imos)], plazo),
+        content_type="application/x-ndjson; charset=utf-8",
+    )
+    # Que un proxy (nginx) no acumule la respuesta antes de reenviarla
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 # =============================================
 # API CONSULTA IMO (BUQUES)
 # =============================================
@@ -531,6 +1065,60 @@ def obtener_datos_arribo(request, arribo_id):
         )
 
 
+@staff_member_required
+@require_GET
+def resumen_manifiesto_arribo(request, arribo_id):
+    """
+    API interna con el resumen del manifiesto de un arribo: totales de
+    import/export, TEU, avance de aduana y pagos, y desglose por transitario.
+
+    Args:
+        arribo_id: ID del arribo
+
+    Returns:
+        JsonResponse con el resumen (mismos datos que el PDF del manifiesto)
+    """
+    try:
+        arribo = Arribo.objects.get(pk=arribo_id)
+    except Arribo.DoesNotExist:
+        return JsonResponse(
+            {"success": False, "error": "Arribo no encontrado"}, status=404
+        )
+
+    return JsonResponse(
+        {
+            "success": True,
+            "arribo_id": arribo.id,
+            "resumen": manifiesto.resumen_manifiesto(arribo),
+        }
+    )
+
+
+@staff_member_required
+@require_POST
+def ingerir_eventos(request):
+    """
+    API interna de ingesta de eventos de contenedor en lote.
+
+    Recibe un archivo EDIFACT (COARRI/CODECO) o CSV en el campo 'archivo'
+    o directamente en el cuerpo de la petición. El formato se toma de
+    ?formato= o se detecta por el contenido.
+
+    Returns:
+        JsonResponse con recibidos, creados, rechazados y el detalle de errores
+    """
+    formato = request.GET.get("formato") or None
+    if formato is not None and formato not in ingesta_eventos.FORMATOS:
+        return JsonResponse(
+            {"success": False, "error": f"Formato '{formato}' no soportado"},
+            status=400,
+        )
+
+    archivo = request.FILES.get("archivo") or io.BytesIO(request.body)
+    resultado = ingesta_eventos.ingerir_archivo(archivo, formato)
+    return JsonResponse({"success": True, **resultado.a_dict()})
+
+
 def api_contenedor_data(request, contenedor_id):
     """
     API interna para obtener datos de un contenedor.